@@ -0,0 +1,154 @@
+-- =====================================================
+-- GROUP CHANGE APPLY (atomic, one round trip)
+-- =====================================================
+-- Applies an approved group meeting change request in a single transaction:
+-- replaces the group's group_plan_blocks in the affected windows, mirrors the
+-- new blocks into every member's weekly plan, marks the request approved and
+-- removes its pending notifications. Either everything is applied or nothing.
+-- Called by the backend via supabase.rpc("apply_group_change", {...}); if the
+-- function is not installed the backend applies the change table by table.
+--
+-- p_member_ids      -> ["<uuid>", ...] members whose weekly plans are updated
+-- p_delete_windows  -> [{"day": 2, "start_time": "10:00", "end_time": "12:00"}]
+--                      group blocks (and members' same-course group blocks)
+--                      overlapping a window are removed; NULL start/end = whole day
+-- p_blocks          -> [{"day_of_week": 2, "start_time": "10:00", "end_time": "11:00"}]
+--                      new hourly group blocks
+-- p_create_missing_plans -> create weekly_plans for members without one
+--                           (resize / new block; a move skips those members)
+-- =====================================================
+
+CREATE OR REPLACE FUNCTION apply_group_change(
+    p_request_id UUID,
+    p_group_id UUID,
+    p_week_start DATE,
+    p_course_number TEXT,
+    p_course_name TEXT,
+    p_created_by UUID,
+    p_member_ids JSONB DEFAULT '[]'::jsonb,
+    p_delete_windows JSONB DEFAULT '[]'::jsonb,
+    p_blocks JSONB DEFAULT '[]'::jsonb,
+    p_create_missing_plans BOOLEAN DEFAULT FALSE,
+    p_plan_source TEXT DEFAULT 'group_update'
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_status TEXT;
+    v_members UUID[];
+    v_group_deleted INTEGER := 0;
+    v_group_created INTEGER := 0;
+    v_plans_created INTEGER := 0;
+    v_member_deleted INTEGER := 0;
+    v_member_created INTEGER := 0;
+    v_notifications INTEGER := 0;
+BEGIN
+    -- Serializes concurrent approvals of the same request (the last approver and a retry)
+    SELECT status INTO v_status
+      FROM group_meeting_change_requests
+     WHERE id = p_request_id
+       FOR UPDATE;
+    IF NOT FOUND THEN
+        RAISE EXCEPTION 'change request % not found', p_request_id USING ERRCODE = 'P0002';
+    END IF;
+    IF v_status = 'approved' THEN
+        RETURN jsonb_build_object('status', 'already_approved');
+    END IF;
+
+    SELECT COALESCE(array_agg(DISTINCT m::UUID), '{}')
+      INTO v_members
+      FROM jsonb_array_elements_text(COALESCE(p_member_ids, '[]'::jsonb)) AS m;
+
+    -- 1) Group blocks: drop the replaced windows, insert the new blocks
+    DELETE FROM group_plan_blocks g
+     USING jsonb_to_recordset(COALESCE(p_delete_windows, '[]'::jsonb)) AS w(day INTEGER, start_time TEXT, end_time TEXT)
+     WHERE g.group_id = p_group_id
+       AND g.week_start = p_week_start
+       AND g.day_of_week = w.day
+       AND (w.start_time IS NULL
+            OR (g.start_time::TIME < w.end_time::TIME AND g.end_time::TIME > w.start_time::TIME));
+    GET DIAGNOSTICS v_group_deleted = ROW_COUNT;
+
+    INSERT INTO group_plan_blocks (group_id, week_start, course_number, day_of_week, start_time, end_time, created_by)
+    SELECT p_group_id, p_week_start, p_course_number, b.day_of_week, b.start_time, b.end_time, p_created_by
+      FROM jsonb_to_recordset(COALESCE(p_blocks, '[]'::jsonb)) AS b(day_of_week INTEGER, start_time TEXT, end_time TEXT);
+    GET DIAGNOSTICS v_group_created = ROW_COUNT;
+
+    -- 2) Member weekly plans
+    IF p_create_missing_plans THEN
+        INSERT INTO weekly_plans (user_id, week_start, source)
+        SELECT m, p_week_start, p_plan_source
+          FROM unnest(v_members) AS m
+         WHERE NOT EXISTS (
+                SELECT 1 FROM weekly_plans p WHERE p.user_id = m AND p.week_start = p_week_start
+               );
+        GET DIAGNOSTICS v_plans_created = ROW_COUNT;
+    END IF;
+
+    DELETE FROM weekly_plan_blocks b
+     USING weekly_plans p,
+           jsonb_to_recordset(COALESCE(p_delete_windows, '[]'::jsonb)) AS w(day INTEGER, start_time TEXT, end_time TEXT)
+     WHERE b.plan_id = p.id
+       AND p.week_start = p_week_start
+       AND p.user_id = ANY(v_members)
+       AND b.work_type = 'group'
+       AND b.course_number = p_course_number
+       AND b.day_of_week = w.day
+       AND (w.start_time IS NULL
+            OR (b.start_time::TIME < w.end_time::TIME AND b.end_time::TIME > w.start_time::TIME));
+    GET DIAGNOSTICS v_member_deleted = ROW_COUNT;
+
+    INSERT INTO weekly_plan_blocks (plan_id, user_id, course_number, course_name, work_type, day_of_week, start_time, end_time, is_locked, source)
+    SELECT mp.id, mp.user_id, p_course_number, COALESCE(p_course_name, p_course_number), 'group',
+           b.day_of_week, b.start_time, b.end_time, FALSE, 'group'
+      FROM (
+            SELECT DISTINCT ON (user_id) id, user_id
+              FROM weekly_plans
+             WHERE week_start = p_week_start
+               AND user_id = ANY(v_members)
+             ORDER BY user_id, generated_at
+           ) mp
+     CROSS JOIN jsonb_to_recordset(COALESCE(p_blocks, '[]'::jsonb)) AS b(day_of_week INTEGER, start_time TEXT, end_time TEXT)
+     WHERE NOT EXISTS (
+            SELECT 1 FROM weekly_plan_blocks x
+             WHERE x.plan_id = mp.id
+               AND x.day_of_week = b.day_of_week
+               AND x.start_time = b.start_time
+               AND x.course_number = p_course_number
+               AND x.work_type = 'group'
+           );
+    GET DIAGNOSTICS v_member_created = ROW_COUNT;
+
+    -- 3) Request resolved; its approval notifications are no longer actionable
+    UPDATE group_meeting_change_requests
+       SET status = 'approved',
+           resolved_at = NOW()
+     WHERE id = p_request_id;
+
+    DELETE FROM notifications
+     WHERE type = 'group_change_request'
+       AND link LIKE '%change_request=' || p_request_id::TEXT || '%';
+    GET DIAGNOSTICS v_notifications = ROW_COUNT;
+
+    RETURN jsonb_build_object(
+        'status', 'applied',
+        'group_blocks_deleted', v_group_deleted,
+        'group_blocks_created', v_group_created,
+        'plans_created', v_plans_created,
+        'member_blocks_deleted', v_member_deleted,
+        'member_blocks_created', v_member_created,
+        'notifications', v_notifications
+    );
+END;
+$$;
+
+-- Only the backend (service_role) applies approved changes
+REVOKE ALL ON FUNCTION apply_group_change(UUID, UUID, DATE, TEXT, TEXT, UUID, JSONB, JSONB, JSONB, BOOLEAN, TEXT) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION apply_group_change(UUID, UUID, DATE, TEXT, TEXT, UUID, JSONB, JSONB, JSONB, BOOLEAN, TEXT) TO service_role;
+
+-- Lookups used by the function
+CREATE INDEX IF NOT EXISTS idx_group_plan_blocks_group_week ON group_plan_blocks(group_id, week_start, day_of_week);
+CREATE INDEX IF NOT EXISTS idx_weekly_plans_week_user ON weekly_plans(week_start, user_id);
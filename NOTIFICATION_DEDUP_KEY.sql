@@ -0,0 +1,33 @@
+-- =====================================================
+-- NOTIFICATIONS: DEDUP KEY (bulk fan-out)
+-- =====================================================
+-- The backend writes notifications in bulk (app/notifications.py). Rows with a
+-- dedup_key are upserted on (user_id, dedup_key), e.g. one plan_ready per user
+-- per week ('plan_ready:<week_start>') and one group_change_request per member
+-- per request, so retries and re-runs never duplicate a notification.
+-- Rows without a key (NULL) never conflict.
+-- Without this column the backend falls back to plain inserts.
+-- =====================================================
+
+ALTER TABLE notifications ADD COLUMN IF NOT EXISTS dedup_key TEXT;
+
+-- 1) Keys for existing notifications that already are one-per-user-per-week/request
+UPDATE notifications
+   SET dedup_key = 'plan_ready:' || substring(link FROM 'week=([0-9]{4}-[0-9]{2}-[0-9]{2})')
+ WHERE type = 'plan_ready'
+   AND dedup_key IS NULL
+   AND link ~ 'week=[0-9]{4}-[0-9]{2}-[0-9]{2}';
+
+-- 2) Remove duplicates (keep the newest per user and key)
+DELETE FROM notifications n
+USING (
+    SELECT id,
+           ROW_NUMBER() OVER (PARTITION BY user_id, dedup_key ORDER BY created_at DESC, id) AS rn
+      FROM notifications
+     WHERE dedup_key IS NOT NULL
+) d
+WHERE n.id = d.id
+  AND d.rn > 1;
+
+-- 3) Upsert target (a full index: ON CONFLICT (user_id, dedup_key) cannot use a partial one)
+CREATE UNIQUE INDEX IF NOT EXISTS uq_notifications_user_dedup_key ON notifications(user_id, dedup_key);
@@ -0,0 +1,88 @@
+-- =====================================================
+-- USER PENDING ACTIONS (invitations + change requests)
+-- =====================================================
+-- One row per thing a user can approve or reject, with the group and course
+-- denormalized:
+--   kind = 'invitation'      -> group_invitations addressed to the user
+--                               (pending, or accepted while the group is not
+--                               created yet); for a group that does not exist
+--                               yet, group/course come from the inviter's
+--                               pending_group_creations (one row per creation)
+--   kind = 'change_request'  -> pending group_meeting_change_requests of the
+--                               groups the user is an approved member of
+-- The request handler (approve/reject by group, course, day and time) reads
+-- the user's rows once and matches them in memory (app/pending_actions.py).
+-- Without this view the backend builds the same rows with a few batched queries.
+-- =====================================================
+
+CREATE OR REPLACE VIEW user_pending_actions AS
+SELECT
+    'invitation'::TEXT              AS kind,
+    gi.id                           AS id,
+    gi.invitee_user_id              AS user_id,
+    gi.status::TEXT                 AS status,
+    gi.group_id                     AS group_id,
+    gi.inviter_id                   AS inviter_id,
+    COALESCE(sg.group_name, pgc.group_name)::TEXT   AS group_name,
+    COALESCE(sg.course_id, pgc.course_id)::TEXT     AS course_number,
+    COALESCE(sg.course_name, pgc.course_name)::TEXT AS course_name,
+    NULL::DATE                      AS week_start,
+    NULL::TEXT                      AS request_type,
+    NULL::INTEGER                   AS original_day_of_week,
+    NULL::TIME                      AS original_start_time,
+    NULL::TIME                      AS original_end_time,
+    NULL::INTEGER                   AS original_duration_hours,
+    NULL::INTEGER                   AS proposed_day_of_week,
+    NULL::TIME                      AS proposed_start_time,
+    NULL::TIME                      AS proposed_end_time,
+    NULL::INTEGER                   AS proposed_duration_hours,
+    gi.created_at                   AS created_at
+  FROM group_invitations gi
+  LEFT JOIN study_groups sg
+         ON sg.id = gi.group_id
+  LEFT JOIN pending_group_creations pgc
+         ON gi.group_id IS NULL
+        AND pgc.inviter_id = gi.inviter_id
+ WHERE gi.status = 'pending'
+    OR (gi.status = 'accepted' AND gi.group_id IS NULL)
+
+UNION ALL
+
+SELECT
+    'change_request'::TEXT          AS kind,
+    cr.id                           AS id,
+    gm.user_id                      AS user_id,
+    cr.status::TEXT                 AS status,
+    cr.group_id                     AS group_id,
+    NULL::UUID                      AS inviter_id,
+    sg.group_name::TEXT             AS group_name,
+    sg.course_id::TEXT              AS course_number,
+    sg.course_name::TEXT            AS course_name,
+    cr.week_start                   AS week_start,
+    cr.request_type::TEXT           AS request_type,
+    cr.original_day_of_week         AS original_day_of_week,
+    cr.original_start_time          AS original_start_time,
+    cr.original_end_time            AS original_end_time,
+    cr.original_duration_hours      AS original_duration_hours,
+    cr.proposed_day_of_week         AS proposed_day_of_week,
+    cr.proposed_start_time          AS proposed_start_time,
+    cr.proposed_end_time            AS proposed_end_time,
+    cr.proposed_duration_hours      AS proposed_duration_hours,
+    cr.created_at                   AS created_at
+  FROM group_meeting_change_requests cr
+  JOIN group_members gm
+    ON gm.group_id = cr.group_id
+   AND gm.status = 'approved'
+  JOIN study_groups sg
+    ON sg.id = cr.group_id
+ WHERE cr.status = 'pending';
+
+-- Only the backend (service_role) reads it; it spans other users' groups
+REVOKE ALL ON user_pending_actions FROM PUBLIC, anon, authenticated;
+GRANT SELECT ON user_pending_actions TO service_role;
+
+-- Lookups used by the view (per user)
+CREATE INDEX IF NOT EXISTS idx_group_invitations_invitee_status ON group_invitations(invitee_user_id, status);
+CREATE INDEX IF NOT EXISTS idx_group_members_user_status ON group_members(user_id, status);
+CREATE INDEX IF NOT EXISTS idx_change_requests_group_status ON group_meeting_change_requests(group_id, status);
+CREATE INDEX IF NOT EXISTS idx_pending_group_creations_inviter ON pending_group_creations(inviter_id);
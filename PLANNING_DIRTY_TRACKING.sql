@@ -0,0 +1,122 @@
+-- =====================================================
+-- PLANNING DIRTY TRACKING (incremental weekly replanning)
+-- =====================================================
+-- Records which users changed planning inputs since the last weekly run.
+-- Triggers mark a user dirty whenever their courses, constraints, weekly
+-- constraints, semester schedule items, course time preferences or group
+-- membership change (and all approved members when group preferences change).
+--
+-- POST /api/weekly-plan/run-immediately?incremental=true replans only the dirty
+-- users plus everyone connected to them through study groups, then clears the
+-- marks it consumed. A full weekly run clears all marks.
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS planning_dirty_users (
+    user_id UUID PRIMARY KEY REFERENCES user_profiles(id) ON DELETE CASCADE,
+    reasons TEXT[] NOT NULL DEFAULT '{}',
+    first_marked_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    last_marked_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+ALTER TABLE planning_dirty_users ENABLE ROW LEVEL SECURITY;
+-- No policies: only the backend (service_role) reads/clears this table
+
+CREATE OR REPLACE FUNCTION mark_planning_dirty(p_user_id UUID, p_reason TEXT)
+RETURNS VOID
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    IF p_user_id IS NULL THEN
+        RETURN;
+    END IF;
+    INSERT INTO planning_dirty_users (user_id, reasons)
+    VALUES (p_user_id, ARRAY[p_reason])
+    ON CONFLICT (user_id) DO UPDATE
+        SET reasons = CASE
+                WHEN p_reason = ANY(planning_dirty_users.reasons) THEN planning_dirty_users.reasons
+                ELSE array_append(planning_dirty_users.reasons, p_reason)
+            END,
+            last_marked_at = NOW();
+END;
+$$;
+
+-- Row trigger for tables with a user_id column
+CREATE OR REPLACE FUNCTION trg_mark_planning_dirty()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM mark_planning_dirty(OLD.user_id, TG_TABLE_NAME);
+        RETURN OLD;
+    END IF;
+    PERFORM mark_planning_dirty(NEW.user_id, TG_TABLE_NAME);
+    IF TG_OP = 'UPDATE' AND OLD.user_id IS DISTINCT FROM NEW.user_id THEN
+        PERFORM mark_planning_dirty(OLD.user_id, TG_TABLE_NAME);
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+-- Group-level trigger: group preferences affect every approved member
+CREATE OR REPLACE FUNCTION trg_mark_group_members_dirty()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_group_id UUID;
+    v_member UUID;
+BEGIN
+    v_group_id := CASE WHEN TG_OP = 'DELETE' THEN OLD.group_id ELSE NEW.group_id END;
+    FOR v_member IN
+        SELECT user_id FROM group_members WHERE group_id = v_group_id AND status = 'approved'
+    LOOP
+        PERFORM mark_planning_dirty(v_member, TG_TABLE_NAME);
+    END LOOP;
+    RETURN CASE WHEN TG_OP = 'DELETE' THEN OLD ELSE NEW END;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS planning_dirty_courses ON courses;
+CREATE TRIGGER planning_dirty_courses
+    AFTER INSERT OR UPDATE OR DELETE ON courses
+    FOR EACH ROW EXECUTE FUNCTION trg_mark_planning_dirty();
+
+DROP TRIGGER IF EXISTS planning_dirty_constraints ON constraints;
+CREATE TRIGGER planning_dirty_constraints
+    AFTER INSERT OR UPDATE OR DELETE ON constraints
+    FOR EACH ROW EXECUTE FUNCTION trg_mark_planning_dirty();
+
+DROP TRIGGER IF EXISTS planning_dirty_weekly_constraints ON weekly_constraints;
+CREATE TRIGGER planning_dirty_weekly_constraints
+    AFTER INSERT OR UPDATE OR DELETE ON weekly_constraints
+    FOR EACH ROW EXECUTE FUNCTION trg_mark_planning_dirty();
+
+DROP TRIGGER IF EXISTS planning_dirty_semester_items ON semester_schedule_items;
+CREATE TRIGGER planning_dirty_semester_items
+    AFTER INSERT OR UPDATE OR DELETE ON semester_schedule_items
+    FOR EACH ROW EXECUTE FUNCTION trg_mark_planning_dirty();
+
+DROP TRIGGER IF EXISTS planning_dirty_course_time_preferences ON course_time_preferences;
+CREATE TRIGGER planning_dirty_course_time_preferences
+    AFTER INSERT OR UPDATE OR DELETE ON course_time_preferences
+    FOR EACH ROW EXECUTE FUNCTION trg_mark_planning_dirty();
+
+DROP TRIGGER IF EXISTS planning_dirty_group_members ON group_members;
+CREATE TRIGGER planning_dirty_group_members
+    AFTER INSERT OR UPDATE OR DELETE ON group_members
+    FOR EACH ROW EXECUTE FUNCTION trg_mark_planning_dirty();
+
+DROP TRIGGER IF EXISTS planning_dirty_group_preferences ON group_preferences;
+CREATE TRIGGER planning_dirty_group_preferences
+    AFTER INSERT OR UPDATE OR DELETE ON group_preferences
+    FOR EACH ROW EXECUTE FUNCTION trg_mark_group_members_dirty();
+
+CREATE INDEX IF NOT EXISTS idx_group_members_user_status ON group_members(user_id, status);
+CREATE INDEX IF NOT EXISTS idx_group_members_group_status ON group_members(group_id, status);
@@ -0,0 +1,94 @@
+-- =====================================================
+-- PLANNING JOB QUEUE (weekly planner workers)
+-- =====================================================
+-- Weekly planning runs as jobs processed by `python -m app.planning_worker`
+-- (see app/planning_queue.py). A "week" job fans out into one "component"
+-- job per study-group connected component. Workers lease jobs with
+-- claim_planning_jobs(); an expired lease makes the job claimable again until
+-- max_attempts is reached.
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS planning_jobs (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    run_id UUID NOT NULL DEFAULT gen_random_uuid(),
+    kind TEXT NOT NULL CHECK (kind IN ('week', 'component')),
+    week_start DATE NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}'::jsonb,
+    status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'leased', 'done', 'failed')),
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    available_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    leased_by TEXT,
+    lease_expires_at TIMESTAMP WITH TIME ZONE,
+    progress JSONB NOT NULL DEFAULT '{}'::jsonb,
+    last_error TEXT,
+    dedup_key TEXT UNIQUE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    finished_at TIMESTAMP WITH TIME ZONE
+);
+
+ALTER TABLE planning_jobs ENABLE ROW LEVEL SECURITY;
+-- No policies: only the backend and workers (service_role) use this table
+
+CREATE INDEX IF NOT EXISTS idx_planning_jobs_runnable ON planning_jobs(status, available_at, priority DESC, created_at);
+CREATE INDEX IF NOT EXISTS idx_planning_jobs_run ON planning_jobs(run_id);
+
+CREATE OR REPLACE FUNCTION trg_planning_jobs_updated_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.updated_at := NOW();
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS planning_jobs_updated_at ON planning_jobs;
+CREATE TRIGGER planning_jobs_updated_at
+    BEFORE UPDATE ON planning_jobs
+    FOR EACH ROW EXECUTE FUNCTION trg_planning_jobs_updated_at();
+
+-- Lease up to p_limit runnable jobs for p_worker
+CREATE OR REPLACE FUNCTION claim_planning_jobs(
+    p_worker TEXT,
+    p_limit INTEGER DEFAULT 1,
+    p_lease_seconds INTEGER DEFAULT 300
+)
+RETURNS SETOF planning_jobs
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    -- Expired leases that used up their attempts are failed, not reclaimed
+    UPDATE planning_jobs
+       SET status = 'failed',
+           last_error = COALESCE(last_error, 'lease expired'),
+           finished_at = NOW()
+     WHERE status = 'leased'
+       AND lease_expires_at < NOW()
+       AND attempts >= max_attempts;
+
+    RETURN QUERY
+    UPDATE planning_jobs j
+       SET status = 'leased',
+           leased_by = p_worker,
+           lease_expires_at = NOW() + make_interval(secs => p_lease_seconds),
+           attempts = j.attempts + 1
+     WHERE j.id IN (
+            SELECT id
+              FROM planning_jobs
+             WHERE (status = 'queued' AND available_at <= NOW())
+                OR (status = 'leased' AND lease_expires_at < NOW())
+             ORDER BY priority DESC, created_at
+             LIMIT p_limit
+             FOR UPDATE SKIP LOCKED
+           )
+    RETURNING j.*;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION claim_planning_jobs(TEXT, INTEGER, INTEGER) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION claim_planning_jobs(TEXT, INTEGER, INTEGER) TO service_role;
@@ -0,0 +1,10 @@
+-- =====================================================
+-- PREFERENCES SUMMARY HASH (memoized LLM summaries)
+-- =====================================================
+-- Stores the hash of (study_preferences_raw, schedule_change_notes,
+-- summarizer version) that study_preferences_summary was built from.
+-- Planning and preference updates skip the LLM summarizer when the current
+-- inputs hash to the stored value. Without this column every call summarizes.
+-- =====================================================
+
+ALTER TABLE user_profiles ADD COLUMN IF NOT EXISTS study_preferences_summary_hash TEXT;
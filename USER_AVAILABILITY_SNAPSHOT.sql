@@ -0,0 +1,217 @@
+-- =====================================================
+-- USER WEEKLY AVAILABILITY SNAPSHOT
+-- =====================================================
+-- One row per (user, week) with the user's busy intervals for that week,
+-- parsed once from constraints, weekly_constraints, semester_schedule_items
+-- and weekly_plan_blocks (see app/availability.py for the interval format).
+--
+-- Triggers below delete the affected snapshot rows whenever an input changes;
+-- the backend rebuilds a missing snapshot on the next read.
+--
+-- The rebuild reads several tables and stores the result afterwards, so the
+-- triggers also bump user_input_versions for the user. The backend reads the
+-- versions before building and stores through store_availability_snapshots(),
+-- which skips users whose version moved meanwhile (a write that landed between
+-- the reads and the store would otherwise leave a stale snapshot behind).
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS user_weekly_availability (
+    user_id UUID NOT NULL REFERENCES user_profiles(id) ON DELETE CASCADE,
+    week_start DATE NOT NULL,
+    intervals JSONB NOT NULL DEFAULT '[]'::jsonb,
+    computed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (user_id, week_start)
+);
+
+ALTER TABLE user_weekly_availability ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view their availability snapshots"
+    ON user_weekly_availability FOR SELECT
+    USING (auth.uid() = user_id);
+
+-- Keep computed_at fresh on upsert
+CREATE OR REPLACE FUNCTION trg_availability_computed_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.computed_at := NOW();
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS availability_computed_at ON user_weekly_availability;
+CREATE TRIGGER availability_computed_at
+    BEFORE INSERT OR UPDATE ON user_weekly_availability
+    FOR EACH ROW EXECUTE FUNCTION trg_availability_computed_at();
+
+-- -----------------------------------------------------
+-- Input versions (shared with USER_WEEKLY_SCHEDULE.sql)
+-- -----------------------------------------------------
+
+CREATE TABLE IF NOT EXISTS user_input_versions (
+    user_id UUID PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    changed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+-- Backend only (service_role bypasses RLS)
+ALTER TABLE user_input_versions ENABLE ROW LEVEL SECURITY;
+
+CREATE OR REPLACE FUNCTION bump_user_input_version(p_user_id UUID)
+RETURNS VOID
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    IF p_user_id IS NULL THEN
+        RETURN;
+    END IF;
+    INSERT INTO user_input_versions (user_id, version, changed_at)
+    VALUES (p_user_id, 1, NOW())
+    ON CONFLICT (user_id) DO UPDATE
+       SET version = user_input_versions.version + 1,
+           changed_at = NOW();
+END;
+$$;
+
+REVOKE ALL ON FUNCTION bump_user_input_version(UUID) FROM PUBLIC, anon, authenticated;
+
+-- -----------------------------------------------------
+-- Invalidation
+-- -----------------------------------------------------
+
+-- Week-independent inputs (permanent constraints, semester items): all weeks of the user
+CREATE OR REPLACE FUNCTION trg_invalidate_availability_user()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_user_input_version(OLD.user_id);
+        DELETE FROM user_weekly_availability WHERE user_id = OLD.user_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM bump_user_input_version(NEW.user_id);
+        DELETE FROM user_weekly_availability WHERE user_id = NEW.user_id;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Weekly constraints and plans: only that week
+CREATE OR REPLACE FUNCTION trg_invalidate_availability_week()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_user_input_version(OLD.user_id);
+        DELETE FROM user_weekly_availability WHERE user_id = OLD.user_id AND week_start = OLD.week_start;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM bump_user_input_version(NEW.user_id);
+        DELETE FROM user_weekly_availability WHERE user_id = NEW.user_id AND week_start = NEW.week_start;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Plan blocks: the week of the block's plan (all weeks if the plan is already gone)
+CREATE OR REPLACE FUNCTION trg_invalidate_availability_block()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_row weekly_plan_blocks%ROWTYPE;
+    v_week DATE;
+BEGIN
+    v_row := CASE WHEN TG_OP = 'DELETE' THEN OLD ELSE NEW END;
+    PERFORM bump_user_input_version(v_row.user_id);
+    SELECT week_start INTO v_week FROM weekly_plans WHERE id = v_row.plan_id;
+    IF v_week IS NULL THEN
+        DELETE FROM user_weekly_availability WHERE user_id = v_row.user_id;
+    ELSE
+        DELETE FROM user_weekly_availability WHERE user_id = v_row.user_id AND week_start = v_week;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS availability_constraints ON constraints;
+CREATE TRIGGER availability_constraints
+    AFTER INSERT OR UPDATE OR DELETE ON constraints
+    FOR EACH ROW EXECUTE FUNCTION trg_invalidate_availability_user();
+
+DROP TRIGGER IF EXISTS availability_semester_items ON semester_schedule_items;
+CREATE TRIGGER availability_semester_items
+    AFTER INSERT OR UPDATE OR DELETE ON semester_schedule_items
+    FOR EACH ROW EXECUTE FUNCTION trg_invalidate_availability_user();
+
+DROP TRIGGER IF EXISTS availability_weekly_constraints ON weekly_constraints;
+CREATE TRIGGER availability_weekly_constraints
+    AFTER INSERT OR UPDATE OR DELETE ON weekly_constraints
+    FOR EACH ROW EXECUTE FUNCTION trg_invalidate_availability_week();
+
+DROP TRIGGER IF EXISTS availability_weekly_plans ON weekly_plans;
+CREATE TRIGGER availability_weekly_plans
+    AFTER INSERT OR UPDATE OR DELETE ON weekly_plans
+    FOR EACH ROW EXECUTE FUNCTION trg_invalidate_availability_week();
+
+DROP TRIGGER IF EXISTS availability_weekly_plan_blocks ON weekly_plan_blocks;
+CREATE TRIGGER availability_weekly_plan_blocks
+    AFTER INSERT OR UPDATE OR DELETE ON weekly_plan_blocks
+    FOR EACH ROW EXECUTE FUNCTION trg_invalidate_availability_block();
+
+-- -----------------------------------------------------
+-- Guarded store
+-- -----------------------------------------------------
+-- p_rows -> [{"user_id": "<uuid>", "intervals": [...], "version": 3}, ...]
+--           version = the user's user_input_versions.version read before the
+--           snapshot was built (0 if the user had no row)
+-- Stores only the rows whose version is unchanged; returns how many were stored.
+CREATE OR REPLACE FUNCTION store_availability_snapshots(p_week_start DATE, p_rows JSONB)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_users UUID[];
+    v_stored INTEGER;
+BEGIN
+    SELECT array_agg(DISTINCT (r->>'user_id')::UUID) INTO v_users
+      FROM jsonb_array_elements(COALESCE(p_rows, '[]'::jsonb)) r;
+    IF v_users IS NULL THEN
+        RETURN 0;
+    END IF;
+
+    -- Lock the users' version rows: an input write still in flight holds its row
+    -- until commit, so we wait for it and the check below sees its bump
+    INSERT INTO user_input_versions (user_id)
+    SELECT unnest(v_users)
+    ON CONFLICT (user_id) DO NOTHING;
+    PERFORM 1 FROM user_input_versions WHERE user_id = ANY(v_users) ORDER BY user_id FOR SHARE;
+
+    INSERT INTO user_weekly_availability (user_id, week_start, intervals)
+    SELECT r.user_id, p_week_start, COALESCE(r.intervals, '[]'::jsonb)
+      FROM jsonb_to_recordset(p_rows) AS r(user_id UUID, intervals JSONB, version BIGINT)
+      JOIN user_input_versions v
+        ON v.user_id = r.user_id
+       AND v.version = r.version
+    ON CONFLICT (user_id, week_start) DO UPDATE
+       SET intervals = EXCLUDED.intervals;
+    GET DIAGNOSTICS v_stored = ROW_COUNT;
+    RETURN v_stored;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION store_availability_snapshots(DATE, JSONB) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION store_availability_snapshots(DATE, JSONB) TO service_role;
@@ -0,0 +1,265 @@
+-- =====================================================
+-- USER WEEKLY SCHEDULE READ MODEL
+-- =====================================================
+-- One row per (user, week) with everything the schedule views show for that
+-- week, already joined (see app/schedule_view.py for the row format):
+--   plan            -> the week's weekly_plans row
+--   blocks          -> weekly_plan_blocks of the week's plans (group blocks
+--                      carry the group_id of the matching group_plan_blocks)
+--   semester_blocks -> semester_schedule_items expanded per day
+--   constraints     -> permanent + weekly constraints as display items
+-- GET /api/weekly-plan and the schedule retriever read it with one query.
+--
+-- Triggers below delete the affected rows whenever an input changes;
+-- the backend rebuilds a missing row on the next read.
+--
+-- They also bump user_input_versions for the affected users. The backend
+-- reads the versions before rebuilding and stores through
+-- store_weekly_schedules(), which skips users whose version moved meanwhile,
+-- so a write between the rebuild's reads and its store cannot leave a stale
+-- row behind.
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS user_weekly_schedule (
+    user_id UUID NOT NULL REFERENCES user_profiles(id) ON DELETE CASCADE,
+    week_start DATE NOT NULL,
+    plan JSONB,
+    blocks JSONB NOT NULL DEFAULT '[]'::jsonb,
+    semester_blocks JSONB NOT NULL DEFAULT '[]'::jsonb,
+    constraints JSONB NOT NULL DEFAULT '[]'::jsonb,
+    built_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (user_id, week_start)
+);
+
+ALTER TABLE user_weekly_schedule ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Users can view their weekly schedule"
+    ON user_weekly_schedule FOR SELECT
+    USING (auth.uid() = user_id);
+
+-- Keep built_at fresh on upsert
+CREATE OR REPLACE FUNCTION trg_schedule_built_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.built_at := NOW();
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS schedule_built_at ON user_weekly_schedule;
+CREATE TRIGGER schedule_built_at
+    BEFORE INSERT OR UPDATE ON user_weekly_schedule
+    FOR EACH ROW EXECUTE FUNCTION trg_schedule_built_at();
+
+-- -----------------------------------------------------
+-- Input versions (same as in USER_AVAILABILITY_SNAPSHOT.sql; either file can
+-- be installed first)
+-- -----------------------------------------------------
+
+CREATE TABLE IF NOT EXISTS user_input_versions (
+    user_id UUID PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    changed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+ALTER TABLE user_input_versions ENABLE ROW LEVEL SECURITY;
+
+CREATE OR REPLACE FUNCTION bump_user_input_version(p_user_id UUID)
+RETURNS VOID
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    IF p_user_id IS NULL THEN
+        RETURN;
+    END IF;
+    INSERT INTO user_input_versions (user_id, version, changed_at)
+    VALUES (p_user_id, 1, NOW())
+    ON CONFLICT (user_id) DO UPDATE
+       SET version = user_input_versions.version + 1,
+           changed_at = NOW();
+END;
+$$;
+
+REVOKE ALL ON FUNCTION bump_user_input_version(UUID) FROM PUBLIC, anon, authenticated;
+
+-- -----------------------------------------------------
+-- Invalidation
+-- -----------------------------------------------------
+
+-- Week-independent inputs (permanent constraints, semester items, courses,
+-- group memberships): all weeks of the user
+CREATE OR REPLACE FUNCTION trg_invalidate_schedule_user()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_user_input_version(OLD.user_id);
+        DELETE FROM user_weekly_schedule WHERE user_id = OLD.user_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM bump_user_input_version(NEW.user_id);
+        DELETE FROM user_weekly_schedule WHERE user_id = NEW.user_id;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Weekly constraints and plans: only that week
+CREATE OR REPLACE FUNCTION trg_invalidate_schedule_week()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_user_input_version(OLD.user_id);
+        DELETE FROM user_weekly_schedule WHERE user_id = OLD.user_id AND week_start = OLD.week_start;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM bump_user_input_version(NEW.user_id);
+        DELETE FROM user_weekly_schedule WHERE user_id = NEW.user_id AND week_start = NEW.week_start;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Plan blocks: the week of the block's plan (all weeks if the plan is already gone)
+CREATE OR REPLACE FUNCTION trg_invalidate_schedule_block()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_row weekly_plan_blocks%ROWTYPE;
+    v_week DATE;
+BEGIN
+    v_row := CASE WHEN TG_OP = 'DELETE' THEN OLD ELSE NEW END;
+    PERFORM bump_user_input_version(v_row.user_id);
+    SELECT week_start INTO v_week FROM weekly_plans WHERE id = v_row.plan_id;
+    IF v_week IS NULL THEN
+        DELETE FROM user_weekly_schedule WHERE user_id = v_row.user_id;
+    ELSE
+        DELETE FROM user_weekly_schedule WHERE user_id = v_row.user_id AND week_start = v_week;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Group meetings: that week of every approved member (group_id annotation)
+CREATE OR REPLACE FUNCTION trg_invalidate_schedule_group_block()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_row group_plan_blocks%ROWTYPE;
+BEGIN
+    v_row := CASE WHEN TG_OP = 'DELETE' THEN OLD ELSE NEW END;
+    PERFORM bump_user_input_version(gm.user_id)
+       FROM group_members gm
+      WHERE gm.group_id = v_row.group_id
+        AND gm.status = 'approved';
+    DELETE FROM user_weekly_schedule s
+     USING group_members gm
+     WHERE gm.group_id = v_row.group_id
+       AND gm.status = 'approved'
+       AND s.user_id = gm.user_id
+       AND s.week_start = v_row.week_start;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS schedule_constraints ON constraints;
+CREATE TRIGGER schedule_constraints
+    AFTER INSERT OR UPDATE OR DELETE ON constraints
+    FOR EACH ROW EXECUTE FUNCTION trg_invalidate_schedule_user();
+
+DROP TRIGGER IF EXISTS schedule_semester_items ON semester_schedule_items;
+CREATE TRIGGER schedule_semester_items
+    AFTER INSERT OR UPDATE OR DELETE ON semester_schedule_items
+    FOR EACH ROW EXECUTE FUNCTION trg_invalidate_schedule_user();
+
+DROP TRIGGER IF EXISTS schedule_courses ON courses;
+CREATE TRIGGER schedule_courses
+    AFTER INSERT OR UPDATE OR DELETE ON courses
+    FOR EACH ROW EXECUTE FUNCTION trg_invalidate_schedule_user();
+
+DROP TRIGGER IF EXISTS schedule_group_members ON group_members;
+CREATE TRIGGER schedule_group_members
+    AFTER INSERT OR UPDATE OR DELETE ON group_members
+    FOR EACH ROW EXECUTE FUNCTION trg_invalidate_schedule_user();
+
+DROP TRIGGER IF EXISTS schedule_weekly_constraints ON weekly_constraints;
+CREATE TRIGGER schedule_weekly_constraints
+    AFTER INSERT OR UPDATE OR DELETE ON weekly_constraints
+    FOR EACH ROW EXECUTE FUNCTION trg_invalidate_schedule_week();
+
+DROP TRIGGER IF EXISTS schedule_weekly_plans ON weekly_plans;
+CREATE TRIGGER schedule_weekly_plans
+    AFTER INSERT OR UPDATE OR DELETE ON weekly_plans
+    FOR EACH ROW EXECUTE FUNCTION trg_invalidate_schedule_week();
+
+DROP TRIGGER IF EXISTS schedule_weekly_plan_blocks ON weekly_plan_blocks;
+CREATE TRIGGER schedule_weekly_plan_blocks
+    AFTER INSERT OR UPDATE OR DELETE ON weekly_plan_blocks
+    FOR EACH ROW EXECUTE FUNCTION trg_invalidate_schedule_block();
+
+DROP TRIGGER IF EXISTS schedule_group_plan_blocks ON group_plan_blocks;
+CREATE TRIGGER schedule_group_plan_blocks
+    AFTER INSERT OR UPDATE OR DELETE ON group_plan_blocks
+    FOR EACH ROW EXECUTE FUNCTION trg_invalidate_schedule_group_block();
+
+-- -----------------------------------------------------
+-- Guarded store
+-- -----------------------------------------------------
+-- p_rows -> [{"week_start": "2026-10-18", "plan": {...}, "blocks": [...],
+--             "semester_blocks": [...], "constraints": [...]}, ...]
+-- p_version -> the user's user_input_versions.version read before the rows
+--              were built (0 if the user had no row)
+-- Stores the rows only if the version is unchanged; returns how many were stored.
+CREATE OR REPLACE FUNCTION store_weekly_schedules(p_user_id UUID, p_version BIGINT, p_rows JSONB)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_current BIGINT;
+    v_stored INTEGER;
+BEGIN
+    -- Lock the user's version row: an input write still in flight holds it until
+    -- commit, so we wait for it and then see its bump
+    INSERT INTO user_input_versions (user_id) VALUES (p_user_id)
+    ON CONFLICT (user_id) DO NOTHING;
+    SELECT version INTO v_current FROM user_input_versions WHERE user_id = p_user_id FOR SHARE;
+    IF v_current IS DISTINCT FROM p_version THEN
+        RETURN 0;
+    END IF;
+
+    INSERT INTO user_weekly_schedule (user_id, week_start, plan, blocks, semester_blocks, constraints)
+    SELECT p_user_id, r.week_start, r.plan,
+           COALESCE(r.blocks, '[]'::jsonb), COALESCE(r.semester_blocks, '[]'::jsonb), COALESCE(r.constraints, '[]'::jsonb)
+      FROM jsonb_to_recordset(COALESCE(p_rows, '[]'::jsonb))
+           AS r(week_start DATE, plan JSONB, blocks JSONB, semester_blocks JSONB, constraints JSONB)
+    ON CONFLICT (user_id, week_start) DO UPDATE
+       SET plan = EXCLUDED.plan,
+           blocks = EXCLUDED.blocks,
+           semester_blocks = EXCLUDED.semester_blocks,
+           constraints = EXCLUDED.constraints;
+    GET DIAGNOSTICS v_stored = ROW_COUNT;
+    RETURN v_stored;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION store_weekly_schedules(UUID, BIGINT, JSONB) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION store_weekly_schedules(UUID, BIGINT, JSONB) TO service_role;
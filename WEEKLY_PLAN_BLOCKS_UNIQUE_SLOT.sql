@@ -0,0 +1,30 @@
+-- =====================================================
+-- WEEKLY PLAN BLOCKS: UNIQUE SLOT KEY
+-- =====================================================
+-- Lets the backend fan out synchronized group blocks to all members with one
+-- upsert (ON CONFLICT DO NOTHING) instead of per-member select + insert.
+-- Without this index the backend falls back to one select + one insert.
+-- Block moves update rows one at a time; app/plan_blocks.move_blocks() orders
+-- them so a row never lands on a slot another moved row still holds
+-- (10-12 -> 11-13 moves the 11:00 row first).
+-- =====================================================
+
+-- 1) Remove duplicate slots (keep the oldest row per slot)
+DELETE FROM weekly_plan_blocks b
+USING (
+    SELECT id,
+           ROW_NUMBER() OVER (
+               PARTITION BY plan_id, day_of_week, start_time, course_number, work_type
+               ORDER BY created_at, id
+           ) AS rn
+      FROM weekly_plan_blocks
+) d
+WHERE b.id = d.id
+  AND d.rn > 1;
+
+-- 2) One block per (plan, day, start, course, work type)
+CREATE UNIQUE INDEX IF NOT EXISTS uq_weekly_plan_blocks_slot
+    ON weekly_plan_blocks(plan_id, day_of_week, start_time, course_number, work_type);
+
+-- 3) Member plan lookup used by the fan-out (week + list of members)
+CREATE INDEX IF NOT EXISTS idx_weekly_plans_week_user ON weekly_plans(week_start, user_id);
@@ -0,0 +1,31 @@
+-- =====================================================
+-- WEEKLY PLAN BLOCKS: ROW VERSION (optimistic concurrency)
+-- =====================================================
+-- Every block carries a version that is bumped on each UPDATE. Edits made by
+-- the backend (app/plan_blocks.py) are conditional:
+--   UPDATE weekly_plan_blocks SET ... WHERE id = ? AND version = ?
+-- so a block changed by another edit (or by the weekly run) since it was read
+-- is detected by the write itself and reported as 409 Conflict.
+-- The API exposes the version as ETag '"<block id>:<version>"' (If-Match).
+-- Without this column the backend writes without a version check.
+-- =====================================================
+
+ALTER TABLE weekly_plan_blocks ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
+
+CREATE OR REPLACE FUNCTION bump_weekly_plan_block_version()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.version := OLD.version + 1;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_weekly_plan_blocks_version ON weekly_plan_blocks;
+CREATE TRIGGER trg_weekly_plan_blocks_version
+    BEFORE UPDATE ON weekly_plan_blocks
+    FOR EACH ROW
+    EXECUTE FUNCTION bump_weekly_plan_block_version();
+
+-- Conditional updates filter on (id, version); id is the primary key, so no extra index is needed.
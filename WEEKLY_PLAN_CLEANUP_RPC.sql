@@ -0,0 +1,73 @@
+-- =====================================================
+-- WEEKLY PLAN CLEANUP (set-based, one round trip)
+-- =====================================================
+-- Clears a week before re-planning in a single transaction and returns counts.
+-- Called by the backend via supabase.rpc("cleanup_week_plans", {...}); if the
+-- function is not installed the backend falls back to batched in_() deletes.
+--
+-- p_user_id NULL          -> all users (global weekly run)
+-- p_include_group_blocks  -> also delete group_plan_blocks for the week
+-- p_include_notifications -> also delete plan_ready notifications for the week
+-- =====================================================
+
+CREATE OR REPLACE FUNCTION cleanup_week_plans(
+    p_week_start DATE,
+    p_user_id UUID DEFAULT NULL,
+    p_include_group_blocks BOOLEAN DEFAULT FALSE,
+    p_include_notifications BOOLEAN DEFAULT FALSE
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    v_plan_ids UUID[];
+    v_blocks INTEGER := 0;
+    v_plans INTEGER := 0;
+    v_group_blocks INTEGER := 0;
+    v_notifications INTEGER := 0;
+BEGIN
+    SELECT COALESCE(array_agg(id), '{}')
+      INTO v_plan_ids
+      FROM weekly_plans
+     WHERE week_start = p_week_start
+       AND (p_user_id IS NULL OR user_id = p_user_id);
+
+    -- Blocks first (ON DELETE CASCADE would also remove them, but we want the count)
+    DELETE FROM weekly_plan_blocks WHERE plan_id = ANY(v_plan_ids);
+    GET DIAGNOSTICS v_blocks = ROW_COUNT;
+
+    DELETE FROM weekly_plans WHERE id = ANY(v_plan_ids);
+    GET DIAGNOSTICS v_plans = ROW_COUNT;
+
+    IF p_include_group_blocks THEN
+        DELETE FROM group_plan_blocks WHERE week_start = p_week_start;
+        GET DIAGNOSTICS v_group_blocks = ROW_COUNT;
+    END IF;
+
+    IF p_include_notifications THEN
+        DELETE FROM notifications
+         WHERE type = 'plan_ready'
+           AND link LIKE '%week=' || p_week_start::TEXT || '%'
+           AND (p_user_id IS NULL OR user_id = p_user_id);
+        GET DIAGNOSTICS v_notifications = ROW_COUNT;
+    END IF;
+
+    RETURN jsonb_build_object(
+        'plans', v_plans,
+        'blocks', v_blocks,
+        'group_blocks', v_group_blocks,
+        'notifications', v_notifications
+    );
+END;
+$$;
+
+-- Only the backend (service_role) should be able to wipe a week
+REVOKE ALL ON FUNCTION cleanup_week_plans(DATE, UUID, BOOLEAN, BOOLEAN) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION cleanup_week_plans(DATE, UUID, BOOLEAN, BOOLEAN) TO service_role;
+
+-- Speeds up the week lookup used by cleanup and by the planner
+CREATE INDEX IF NOT EXISTS idx_weekly_plans_week_user ON weekly_plans(week_start, user_id);
+CREATE INDEX IF NOT EXISTS idx_weekly_plan_blocks_plan_id ON weekly_plan_blocks(plan_id);
+CREATE INDEX IF NOT EXISTS idx_group_plan_blocks_week_start ON group_plan_blocks(week_start);
@@ -0,0 +1,11 @@
+-- =====================================================
+-- WEEKLY PLAN INPUT FINGERPRINT (idempotent re-runs)
+-- =====================================================
+-- generate_weekly_plan stores a SHA-256 of the planning inputs (courses,
+-- constraints, preferences, groups and group blocks for the week) on the plan
+-- it creates. A later call with identical inputs returns that plan without
+-- cleanup or LLM calls (pass force=true to replan anyway).
+-- Without this column the backend always replans.
+-- =====================================================
+
+ALTER TABLE weekly_plans ADD COLUMN IF NOT EXISTS input_fingerprint TEXT;
@@ -6,6 +6,9 @@ import logging
 from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
 from app.supabase_client import supabase, supabase_admin
+from app.notifications import notification_row, send_notifications
+from app.course_catalog import COURSE_MATCH_MIN_MARGIN, course_name_for, find_course
+from app.schedule_view import invalidate_schedules
 from fastapi import HTTPException
 
 logger = logging.getLogger(__name__)
@@ -34,6 +37,17 @@ def _minutes_to_time(minutes: int) -> str:
 
 
 class BlockCreator:
+    routing_description = "Create a NEW study block that does not exist yet."
+    routing_params = {
+        "course_name": "str",
+        "course_number": "str",
+        "day_of_week!": "0-6",
+        "start_time!": "HH:MM",
+        "duration": "hours (default 1)",
+        "work_type": "personal|group (default personal)",
+        "week_start": "YYYY-MM-DD",
+    }
+
     def __init__(self):
         self.module_name = "block_creator"
 
@@ -109,11 +123,7 @@ class BlockCreator:
             # Get course name if not provided
             if not course_name:
                 if course_number:
-                    catalog_result = client.table("course_catalog").select("course_name").eq("course_number", course_number).limit(1).execute()
-                    if catalog_result.data:
-                        course_name = catalog_result.data[0].get("course_name", course_number)
-                    else:
-                        course_name = course_number
+                    course_name = course_name_for(client, course_number) or course_number
                 else:
                     course_name = "Study Block"
             
@@ -121,9 +131,9 @@ class BlockCreator:
             # If group_name is provided, we'll get course_number from the group later
             if not course_number and not group_name:
                 if course_name:
-                    catalog_result = client.table("course_catalog").select("course_number").ilike("course_name", f"%{course_name}%").limit(1).execute()
-                    if catalog_result.data:
-                        course_number = catalog_result.data[0].get("course_number")
+                    catalog_course = find_course(client, course_name, min_margin=COURSE_MATCH_MIN_MARGIN)
+                    if catalog_course:
+                        course_number = catalog_course.get("course_number")
                     else:
                         # Check user's courses
                         user_courses = client.table("courses").select("course_number").eq("user_id", user_id).ilike("course_name", f"%{course_name}%").limit(1).execute()
@@ -162,57 +172,20 @@ class BlockCreator:
             # Check for conflicts
             conflict_reasons = []
             
-            # Check 1: Weekly hard constraints
-            weekly_constraints = client.table("weekly_constraints").select("*").eq("user_id", user_id).eq("week_start", week_start).execute()
-            for constraint in (weekly_constraints.data or []):
-                if not constraint.get("is_hard", True):
-                    continue
-                days_array = constraint.get("days", [])
-                if isinstance(days_array, str):
-                    try:
-                        import json
-                        days_array = json.loads(days_array)
-                    except:
-                        days_array = []
-                if day_of_week in days_array:
-                    c_start = _time_to_minutes(constraint.get("start_time", "00:00"))
-                    c_end = _time_to_minutes(constraint.get("end_time", "00:00"))
-                    block_start = _time_to_minutes(start_time_normalized)
-                    block_end = _time_to_minutes(end_time)
-                    if block_start < c_end and block_end > c_start:
-                        conflict_reasons.append(f"Weekly hard constraint: {constraint.get('title', 'Constraint')} ({constraint.get('start_time')}-{constraint.get('end_time')})")
-            
-            # Check 2: Permanent hard constraints
-            permanent_constraints = client.table("constraints").select("*").eq("user_id", user_id).execute()
-            import json
-            for constraint in (permanent_constraints.data or []):
-                if not constraint.get("is_hard", True):
+            # Check 1-3: hard constraints and existing blocks, from the availability snapshot
+            from app.availability import get_user_availability, overlapping_intervals
+            snapshot = get_user_availability(client, user_id, week_start)
+            conflict_labels = {
+                "weekly_constraint": "Weekly hard constraint",
+                "constraint": "Permanent hard constraint",
+                "block": "Existing block",
+            }
+            for item in overlapping_intervals(snapshot, day_of_week, start_time_normalized, end_time, kinds=tuple(conflict_labels)):
+                if item["kind"] != "block" and not item.get("hard", True):
                     continue
-                days_array = constraint.get("days", [])
-                if isinstance(days_array, str):
-                    try:
-                        days_array = json.loads(days_array)
-                    except:
-                        days_array = []
-                elif not isinstance(days_array, list):
-                    days_array = []
-                if day_of_week in days_array:
-                    c_start = _time_to_minutes(constraint.get("start_time", "00:00"))
-                    c_end = _time_to_minutes(constraint.get("end_time", "00:00"))
-                    block_start = _time_to_minutes(start_time_normalized)
-                    block_end = _time_to_minutes(end_time)
-                    if block_start < c_end and block_end > c_start:
-                        conflict_reasons.append(f"Permanent hard constraint: {constraint.get('title', 'Constraint')} ({constraint.get('start_time')}-{constraint.get('end_time')})")
-            
-            # Check 3: Existing blocks
-            existing_blocks = client.table("weekly_plan_blocks").select("id, course_name, start_time, end_time").eq("plan_id", plan_id).eq("day_of_week", day_of_week).execute()
-            block_start = _time_to_minutes(start_time_normalized)
-            block_end = _time_to_minutes(end_time)
-            for block in (existing_blocks.data or []):
-                b_start = _time_to_minutes(block.get("start_time", "00:00"))
-                b_end = _time_to_minutes(block.get("end_time", "00:00"))
-                if block_start < b_end and block_end > b_start:
-                    conflict_reasons.append(f"Existing block: {block.get('course_name', 'Course')} ({block.get('start_time')}-{block.get('end_time')})")
+                conflict_reasons.append(
+                    f"{conflict_labels[item['kind']]}: {item.get('label')} ({_minutes_to_time(item['start'])}-{_minutes_to_time(item['end'])})"
+                )
             
             # Check if it's a group block
             if work_type == "group":
@@ -355,19 +328,18 @@ class BlockCreator:
                 if reason:
                     message += f" Reason: {reason}"
                 
-                # Send notifications to all members
-                for member_id in member_ids:
-                    try:
-                        client.table("notifications").insert({
-                            "user_id": member_id,
-                            "type": "group_change_request",
-                            "title": title,
-                            "message": message,
-                            "link": f"/schedule?change_request={request_id}",
-                            "read": False
-                        }).execute()
-                    except Exception as notif_err:
-                        logger.error(f"Failed to notify member {member_id}: {notif_err}")
+                # Notify all members (one bulk write)
+                try:
+                    send_notifications(client, [
+                        notification_row(
+                            member_id, "group_change_request", title, message,
+                            link=f"/schedule?change_request={request_id}",
+                            dedup_key=f"group_change_request:{request_id}",
+                        )
+                        for member_id in member_ids
+                    ])
+                except Exception as notif_err:
+                    logger.error(f"Failed to notify members: {notif_err}")
                 
                 logger.info(f"✅ Created group change request {request_id} for group {group_id}")
                 
@@ -415,6 +387,7 @@ class BlockCreator:
             
             if new_blocks:
                 insert_result = client.table("weekly_plan_blocks").insert(new_blocks).execute()
+                invalidate_schedules([user_id], week_start)
                 logger.info(f"✅ Created {len(new_blocks)} new block(s)")
             
             # Update course_time_preferences based on ALL blocks in the plan
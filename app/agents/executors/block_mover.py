@@ -7,6 +7,8 @@ import json
 from typing import Dict, Any, Optional
 from datetime import datetime
 from app.supabase_client import supabase, supabase_admin
+from app.notifications import notification_row, send_notifications
+from app.plan_blocks import BlockVersionConflict, block_columns, move_blocks
 from fastapi import HTTPException
 
 logger = logging.getLogger(__name__)
@@ -36,6 +38,22 @@ class BlockMover:
     Moves study blocks
     """
     
+    routing_description = "Move an existing study block to another day/time (group blocks create a change request)."
+    routing_params = {
+        "block_id": "uuid",
+        "course_name": "str",
+        "course_number": "str",
+        "original_day": "0-6",
+        "original_start_time": "HH:MM",
+        "new_day": "0-6",
+        "new_start_time!": "HH:MM",
+        "new_end_time": "HH:MM",
+        "week_start": "YYYY-MM-DD",
+        "specific_hours": "bool",
+        "work_type": "personal|group",
+        "user_prompt": "str",
+    }
+
     def __init__(self):
         self.module_name = "block_mover"
     
@@ -424,19 +442,18 @@ class BlockMover:
                 if reason:
                     message += f" Reason: {reason}"
                 
-                # Send notifications to all members
-                for member_id in member_ids:
-                    try:
-                        client.table("notifications").insert({
-                            "user_id": member_id,
-                            "type": "group_change_request",
-                            "title": title,
-                            "message": message,
-                            "link": f"/schedule?change_request={request_id}",
-                            "read": False
-                        }).execute()
-                    except Exception as notif_err:
-                        logger.error(f"Failed to notify member {member_id}: {notif_err}")
+                # Notify all members (one bulk write)
+                try:
+                    send_notifications(client, [
+                        notification_row(
+                            member_id, "group_change_request", title, message,
+                            link=f"/schedule?change_request={request_id}",
+                            dedup_key=f"group_change_request:{request_id}",
+                        )
+                        for member_id in member_ids
+                    ])
+                except Exception as notif_err:
+                    logger.error(f"Failed to notify members: {notif_err}")
                 
                 logger.info(f"✅ Created group change request {request_id} for group {group_id}")
                 
@@ -461,7 +478,7 @@ class BlockMover:
             
             # Find all consecutive blocks for the same course and work_type
             # Get all blocks for this plan/course/day/work_type to find consecutive ones
-            all_blocks_for_move = client.table("weekly_plan_blocks").select("id, start_time, end_time").eq("plan_id", block["plan_id"]).eq("course_number", course_number).eq("work_type", work_type).eq("day_of_week", original_day).order("start_time").execute()
+            all_blocks_for_move = client.table("weekly_plan_blocks").select(block_columns(client, "id, start_time, end_time")).eq("plan_id", block["plan_id"]).eq("course_number", course_number).eq("work_type", work_type).eq("day_of_week", original_day).order("start_time").execute()
             
             consecutive_blocks = []
             
@@ -555,51 +572,34 @@ class BlockMover:
                 new_start_idx = closest_idx
                 new_start_time = time_slots[new_start_idx]  # Normalize to time slot
             
-            # Update all consecutive blocks
-            updated_count = 0
+            # Update all consecutive blocks, each conditional on the version read above; a block
+            # changed or deleted meanwhile (another edit, the weekly run) undoes the whole move
+            blocks_by_id = {b["id"]: b for b in consecutive_blocks}
+            blocks_by_id.setdefault(block_id_actual, block)
+            moves = []
             for i, block_id_to_move in enumerate(blocks_to_move_ids):
                 if new_start_idx + i < len(time_slots):
                     new_time = time_slots[new_start_idx + i]
                     new_end = time_slots[new_start_idx + i + 1] if (new_start_idx + i + 1) < len(time_slots) else "23:00"
-                    
-                    update_result = client.table("weekly_plan_blocks").update({
+                    moves.append((blocks_by_id[block_id_to_move], {
                         "day_of_week": new_day,
                         "start_time": new_time,
                         "end_time": new_end,
                         "source": "manual"
-                    }).eq("id", block_id_to_move).execute()
-                    
-                    if update_result.data:
-                        updated_count += 1
-                        logger.info(f"✅ Updated block {block_id_to_move} to day {new_day}, {new_time}-{new_end}")
-                    else:
-                        logger.warning(f"⚠️ Failed to update block {block_id_to_move} - block may have been deleted")
-                        # If update failed, try to create a new block instead
-                        try:
-                            # Get block details from the original block
-                            original_block = consecutive_blocks[i] if i < len(consecutive_blocks) else block
-                            new_block_data = {
-                                "plan_id": block["plan_id"],
-                                "user_id": user_id,
-                                "course_number": course_number,
-                                "course_name": course_name,
-                                "work_type": work_type,
-                                "day_of_week": new_day,
-                                "start_time": new_time,
-                                "end_time": new_end,
-                                "source": "manual"
-                            }
-                            insert_result = client.table("weekly_plan_blocks").insert(new_block_data).execute()
-                            if insert_result.data:
-                                updated_count += 1
-                                logger.info(f"✅ Created new block at day {new_day}, {new_time}-{new_end} (original block was deleted)")
-                            else:
-                                logger.error(f"❌ Failed to create new block at day {new_day}, {new_time}-{new_end}")
-                        except Exception as create_err:
-                            logger.error(f"❌ Error creating new block: {create_err}")
-            
-            if updated_count == 0:
+                    }))
+            try:
+                moved = move_blocks(client, moves)
+            except BlockVersionConflict as conflict:
+                logger.warning(f"⚠️ Move aborted: {conflict}")
+                raise HTTPException(
+                    status_code=409,
+                    detail="The block was changed in the meantime (another edit or the weekly plan run). Please check the schedule and try again."
+                )
+            
+            if not moved:
                 raise HTTPException(status_code=500, detail="Failed to move any blocks - all updates failed")
+            for updated in moved:
+                logger.info(f"✅ Updated block {updated['id']} to day {new_day}, {updated.get('start_time')}-{updated.get('end_time')}")
             
             logger.info(f"✅ Successfully moved {num_hours_to_move} consecutive block(s) to day {new_day}, {new_start_time}-{new_end_time}")
             
@@ -852,7 +852,7 @@ class BlockMover:
             # The summary is saved to study_preferences_summary and used when generating schedules
             try:
                 # Import the LLM summarization function
-                from app.main import _summarize_user_preferences_with_llm
+                from app.main import _summarize_user_preferences_with_llm, _preferences_summary_hash, _save_preferences_summary
                 
                 logger.info(f"🔄 [BLOCK_MOVER] Calling LLM for classification - course: {block.get('course_number')}, explanation: {user_prompt[:100] if user_prompt else 'none'}")
                 summary = await _summarize_user_preferences_with_llm(current_prefs, current_notes)
@@ -860,9 +860,9 @@ class BlockMover:
                 if summary:
                     # ALWAYS save the LLM summary to study_preferences_summary
                     # This is what we use when generating schedules (not the raw notes)
-                    update_result = client.table("user_profiles").update({
-                        "study_preferences_summary": summary
-                    }).eq("id", user_id).execute()
+                    update_result = _save_preferences_summary(
+                        client, user_id, summary, _preferences_summary_hash(current_prefs, current_notes)
+                    )
                     
                     if update_result.data:
                         logger.info(f"💾 [BLOCK_MOVER] ✅ Successfully saved study_preferences_summary to database")
@@ -3,10 +3,12 @@ Block Resizer Executor
 Resizes study blocks (changes duration)
 """
 import logging
-import json
 from typing import Dict, Any, Optional
 from datetime import datetime
 from app.supabase_client import supabase, supabase_admin
+from app.notifications import notification_row, send_notifications
+from app.availability import get_user_availability, overlapping_intervals
+from app.plan_blocks import BlockVersionConflict, block_columns, replace_blocks
 from fastapi import HTTPException
 
 logger = logging.getLogger(__name__)
@@ -35,6 +37,20 @@ def _minutes_to_time(minutes: int) -> str:
 
 
 class BlockResizer:
+    routing_description = "Change the duration of an EXISTING block (group blocks create a change request; personal blocks update course_time_preferences)."
+    routing_params = {
+        "block_id": "uuid",
+        "course_name": "str",
+        "course_number": "str",
+        "day_of_week": "0-6",
+        "start_time": "HH:MM",
+        "new_start_time": "HH:MM",
+        "new_duration!": "hours",
+        "week_start": "YYYY-MM-DD",
+        "work_type": "personal|group",
+        "user_prompt": "str",
+    }
+
     def __init__(self):
         self.module_name = "block_resizer"
 
@@ -282,23 +298,22 @@ class BlockResizer:
                 proposed_end_minutes = proposed_start_minutes + (new_duration * 60)
                 proposed_end_time = _minutes_to_time(proposed_end_minutes)
                 
-                # Send notifications to all other members
-                for member_id in member_ids:
-                    try:
-                        if proposed_start_time != original_start:
-                            message = f"Request to change meeting from {original_start}-{original_end} ({original_duration}h) to {proposed_start_time}-{proposed_end_time} ({new_duration}h). Approval from all members required."
-                        else:
-                            message = f"Request to change meeting duration from {original_duration} hours to {new_duration} hours. Approval from all members required."
-                        client.table("notifications").insert({
-                            "user_id": member_id,
-                            "type": "group_change_request",
-                            "title": f"Request to change meeting duration: {group_name}",
-                            "message": message,
-                            "link": f"/schedule?change_request={request_id}",
-                            "read": False
-                        }).execute()
-                    except Exception as notif_err:
-                        logger.error(f"Failed to notify member {member_id}: {notif_err}")
+                # Notify all other members (one bulk write)
+                if proposed_start_time != original_start:
+                    message = f"Request to change meeting from {original_start}-{original_end} ({original_duration}h) to {proposed_start_time}-{proposed_end_time} ({new_duration}h). Approval from all members required."
+                else:
+                    message = f"Request to change meeting duration from {original_duration} hours to {new_duration} hours. Approval from all members required."
+                try:
+                    send_notifications(client, [
+                        notification_row(
+                            member_id, "group_change_request", f"Request to change meeting duration: {group_name}", message,
+                            link=f"/schedule?change_request={request_id}",
+                            dedup_key=f"group_change_request:{request_id}",
+                        )
+                        for member_id in member_ids
+                    ])
+                except Exception as notif_err:
+                    logger.error(f"Failed to notify members: {notif_err}")
                 
                 logger.info(f"✅ Created group resize change request {request_id} for group {group_id}")
                 
@@ -318,7 +333,7 @@ class BlockResizer:
             time_slots = ["00:00", "01:00", "02:00", "03:00", "04:00", "05:00", "06:00", "07:00", "08:00", "09:00", "10:00", "11:00", "12:00", "13:00", "14:00", "15:00", "16:00", "17:00", "18:00", "19:00", "20:00", "21:00", "22:00", "23:00"]
             
             # Find all consecutive blocks for the same course and work_type starting from original_start
-            all_blocks_for_resize = client.table("weekly_plan_blocks").select("id, start_time, end_time").eq("plan_id", plan_id).eq("course_number", course_number).eq("work_type", work_type).eq("day_of_week", original_day).order("start_time").execute()
+            all_blocks_for_resize = client.table("weekly_plan_blocks").select(block_columns(client, "id, start_time, end_time")).eq("plan_id", plan_id).eq("course_number", course_number).eq("work_type", work_type).eq("day_of_week", original_day).order("start_time").execute()
             
             # Find the starting block and all consecutive blocks
             consecutive_blocks = []
@@ -359,73 +374,36 @@ class BlockResizer:
                     # Manual calculation when original_start is beyond time_slots
                     new_end_time = _minutes_to_time(new_start_minutes + (new_duration * 60))
                 
-                new_end_minutes = _time_to_minutes(new_end_time)
-                
-                # Check conflicts with constraints
+                # Check conflicts with hard constraints and other blocks, from the availability snapshot
                 conflict_reasons = []
-                
-                # Check weekly constraints
+                # Blocks we're about to delete (and the rest of this course's blocks) are not conflicts
+                blocks_to_delete_ids = [b["id"] for b in consecutive_blocks] if consecutive_blocks else []
+                conflict_labels = {
+                    "weekly_constraint": "Weekly hard constraint",
+                    "constraint": "Permanent hard constraint",
+                    "block": "Existing block",
+                }
                 if week_start:
-                    weekly_constraints = client.table("weekly_constraints").select("*").eq("user_id", user_id).eq("week_start", week_start).execute()
-                    for constraint in (weekly_constraints.data or []):
-                        if not constraint.get("is_hard", True):
+                    snapshot = get_user_availability(client, user_id, week_start)
+                    for item in overlapping_intervals(snapshot, original_day, original_start, new_end_time, kinds=tuple(conflict_labels)):
+                        if item["kind"] == "block":
+                            if item.get("block_id") in blocks_to_delete_ids:
+                                continue
+                            if item.get("course_number") == course_number and item.get("work_type") == work_type:
+                                continue
+                        elif not item.get("hard", True):
                             continue
-                        days_array = constraint.get("days", [])
-                        if isinstance(days_array, str):
-                            try:
-                                days_array = json.loads(days_array)
-                            except:
-                                days_array = []
-                        if original_day in days_array:
-                            c_start = _time_to_minutes(constraint.get("start_time", "00:00"))
-                            c_end = _time_to_minutes(constraint.get("end_time", "00:00"))
-                            if new_start_minutes < c_end and new_end_minutes > c_start:
-                                conflict_reasons.append(f"Weekly hard constraint: {constraint.get('title', 'Constraint')} ({constraint.get('start_time')}-{constraint.get('end_time')})")
-                
-                # Check permanent constraints
-                permanent_constraints = client.table("constraints").select("*").eq("user_id", user_id).execute()
-                for constraint in (permanent_constraints.data or []):
-                    if not constraint.get("is_hard", True):
-                        continue
-                    days_array = constraint.get("days", [])
-                    if isinstance(days_array, str):
-                        try:
-                            days_array = json.loads(days_array)
-                        except:
-                            days_array = []
-                    if original_day in days_array:
-                        c_start = _time_to_minutes(constraint.get("start_time", "00:00"))
-                        c_end = _time_to_minutes(constraint.get("end_time", "00:00"))
-                        if new_start_minutes < c_end and new_end_minutes > c_start:
-                            conflict_reasons.append(f"Permanent hard constraint: {constraint.get('title', 'Constraint')} ({constraint.get('start_time')}-{constraint.get('end_time')})")
-                
-                # Check conflicts with other blocks (different courses)
-                # Get IDs of blocks we're about to delete (to skip them in conflict check)
-                blocks_to_delete_ids = [b["id"] for b in consecutive_blocks] if consecutive_blocks else []
-                
-                all_blocks = client.table("weekly_plan_blocks").select("id, course_name, course_number, work_type, start_time, end_time").eq("plan_id", plan_id).eq("day_of_week", original_day).execute()
-                for existing_block in (all_blocks.data or []):
-                    # Skip blocks we're resizing (same course and work_type, or blocks we're about to delete)
-                    if existing_block["id"] in blocks_to_delete_ids:
-                        continue
-                    if existing_block.get("course_number") == course_number and existing_block.get("work_type") == work_type:
-                        continue
-                    block_start_minutes = _time_to_minutes(existing_block.get("start_time", "00:00"))
-                    block_end_minutes = _time_to_minutes(existing_block.get("end_time", "00:00"))
-                    if new_start_minutes < block_end_minutes and new_end_minutes > block_start_minutes:
-                        conflict_reasons.append(f"Existing block: {existing_block.get('course_name', 'Course')} ({existing_block.get('start_time')}-{existing_block.get('end_time')})")
+                        conflict_reasons.append(
+                            f"{conflict_labels[item['kind']]}: {item.get('label')} ({_minutes_to_time(item['start'])}-{_minutes_to_time(item['end'])})"
+                        )
+                else:
+                    logger.warning(f"⚠️ No week found for block {block.get('id')}, skipping the conflict check")
                 
                 if conflict_reasons:
                     conflict_message = "Cannot resize block - conflicts detected:\n" + "\n".join(conflict_reasons)
                     raise HTTPException(status_code=400, detail=conflict_message)
             
-            # Delete old blocks
-            if consecutive_blocks:
-                for b in consecutive_blocks:
-                    client.table("weekly_plan_blocks").delete().eq("id", b["id"]).execute()
-                logger.info(f"✅ Deleted {len(consecutive_blocks)} old blocks")
-            
-            # Create new blocks
+            # New blocks (written together with the delete of the old ones below)
             new_blocks = []
             if original_start in time_slots:
                 # Use time_slots approach
@@ -466,9 +444,17 @@ class BlockResizer:
                         "source": "manual"
                     })
             
-            if new_blocks:
-                insert_result = client.table("weekly_plan_blocks").insert(new_blocks).execute()
-                logger.info(f"✅ Created {len(new_blocks)} new blocks")
+            # The delete is conditional on the versions read above: if a block was changed or
+            # deleted meanwhile (another edit, the weekly run), nothing is replaced
+            try:
+                replace_blocks(client, consecutive_blocks, new_blocks)
+            except BlockVersionConflict as conflict:
+                logger.warning(f"⚠️ Resize aborted: {conflict}")
+                raise HTTPException(
+                    status_code=409,
+                    detail="The block was changed in the meantime (another edit or the weekly plan run). Please check the schedule and try again."
+                )
+            logger.info(f"✅ Replaced {len(consecutive_blocks)} old block(s) with {len(new_blocks)} new block(s)")
             
             # Update course_time_preferences based on the change (Y) and existing value (X)
             # Formula: 80% * X + 20% * (X + Y)
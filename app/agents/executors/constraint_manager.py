@@ -7,26 +7,14 @@ import json
 from typing import Dict, Any, Optional, List
 from datetime import datetime, timedelta
 from app.supabase_client import supabase, supabase_admin
+from app.availability import get_user_availability, overlapping_intervals
+from app.intervals import to_hhmm
+from app.schedule_view import invalidate_schedules
 from fastapi import HTTPException
 
 logger = logging.getLogger(__name__)
 
 
-def _time_to_minutes(time_str: str) -> int:
-    """Convert time string (HH:MM) to minutes since midnight"""
-    if not time_str:
-        return 0
-    parts = time_str.split(":")
-    if len(parts) < 2:
-        return 0
-    try:
-        hours = int(parts[0])
-        minutes = int(parts[1])
-        return hours * 60 + minutes
-    except:
-        return 0
-
-
 def _get_week_start(date_str: Optional[str] = None) -> str:
     """Get week start date (Sunday) for a given date or today"""
     if date_str:
@@ -63,6 +51,21 @@ def _get_week_start(date_str: Optional[str] = None) -> str:
 
 
 class ConstraintManager:
+    routing_description = "Add or delete a permanent or one-time (hard) constraint; conflicts with constraints are rejected, with the schedule only warned."
+    routing_params = {
+        "action": "add|delete (default add)",
+        "title!": "str",
+        "start_time": "HH:MM",
+        "end_time": "HH:MM",
+        "days": "list[0-6]",
+        "day_of_week": "0-6",
+        "is_permanent": "bool (default false)",
+        "date": "YYYY-MM-DD",
+        "week_start": "YYYY-MM-DD",
+        "description": "str",
+        "constraint_id": "uuid",
+    }
+
     def __init__(self):
         self.module_name = "constraint_manager"
 
@@ -191,94 +194,25 @@ class ConstraintManager:
                         week_start = week_start.replace("/", "-")
                     logger.info(f"📅 Using specified week_start: {week_start}")
             
-            # Check for conflicts with existing constraints
+            # Check for conflicts with existing constraints and the existing schedule, from the
+            # availability snapshot (permanent constraints: current week's schedule as an example,
+            # the constraint will apply to all weeks)
+            snapshot = get_user_availability(client, user_id, _get_week_start() if is_permanent else week_start)
+            constraint_kind = "constraint" if is_permanent else "weekly_constraint"
+            constraint_label = "Existing permanent constraint" if is_permanent else "Existing weekly constraint"
             conflict_reasons = []
-            
-            if is_permanent:
-                # Check permanent constraints
-                existing_permanent = client.table("constraints").select("*").eq("user_id", user_id).execute()
-                for existing in (existing_permanent.data or []):
-                    existing_days = []
-                    if isinstance(existing.get("days"), str):
-                        try:
-                            existing_days = json.loads(existing["days"])
-                        except:
-                            existing_days = []
-                    elif isinstance(existing.get("days"), list):
-                        existing_days = existing["days"]
-                    
-                    # Check if days overlap
-                    if any(day in existing_days for day in constraint_days):
-                        # Check time overlap
-                        existing_start = _time_to_minutes(existing.get("start_time", "00:00"))
-                        existing_end = _time_to_minutes(existing.get("end_time", "00:00"))
-                        new_start = _time_to_minutes(start_time)
-                        new_end = _time_to_minutes(end_time)
-                        
-                        if new_start < existing_end and new_end > existing_start:
-                            conflict_reasons.append(f"Existing permanent constraint: {existing.get('title', 'Constraint')} ({existing.get('start_time')}-{existing.get('end_time')})")
-            else:
-                # Check weekly constraints for the same week
-                existing_weekly = client.table("weekly_constraints").select("*").eq("user_id", user_id).eq("week_start", week_start).execute()
-                for existing in (existing_weekly.data or []):
-                    existing_days = []
-                    if isinstance(existing.get("days"), str):
-                        try:
-                            existing_days = json.loads(existing["days"])
-                        except:
-                            existing_days = []
-                    elif isinstance(existing.get("days"), list):
-                        existing_days = existing["days"]
-                    
-                    # Check if days overlap
-                    if any(day in existing_days for day in constraint_days):
-                        # Check time overlap
-                        existing_start = _time_to_minutes(existing.get("start_time", "00:00"))
-                        existing_end = _time_to_minutes(existing.get("end_time", "00:00"))
-                        new_start = _time_to_minutes(start_time)
-                        new_end = _time_to_minutes(end_time)
-                        
-                        if new_start < existing_end and new_end > existing_start:
-                            conflict_reasons.append(f"Existing weekly constraint: {existing.get('title', 'Constraint')} ({existing.get('start_time')}-{existing.get('end_time')})")
-            
-            # Check for conflicts with existing schedule (weekly_plan_blocks)
             # This is the ONLY case where we allow both constraint and schedule to coexist (with warning)
             schedule_conflicts = []
-            
-            # Check blocks for the relevant week(s)
-            if not is_permanent:
-                # Check blocks for the specific week
-                user_plan = client.table("weekly_plans").select("id").eq("user_id", user_id).eq("week_start", week_start).limit(1).execute()
-                if user_plan.data:
-                    plan_id = user_plan.data[0]["id"]
-                    existing_blocks = client.table("weekly_plan_blocks").select("*").eq("plan_id", plan_id).execute()
-                    
-                    for block in (existing_blocks.data or []):
-                        if block.get("day_of_week") in constraint_days:
-                            block_start = _time_to_minutes(block.get("start_time", "00:00"))
-                            block_end = _time_to_minutes(block.get("end_time", "00:00"))
-                            new_start = _time_to_minutes(start_time)
-                            new_end = _time_to_minutes(end_time)
-                            
-                            if new_start < block_end and new_end > block_start:
-                                schedule_conflicts.append(f"Existing schedule block: {block.get('course_name', 'Course')} ({block.get('start_time')}-{block.get('end_time')})")
-            else:
-                # For permanent constraints, check current week as example (will apply to all weeks)
-                current_week = _get_week_start()
-                user_plan = client.table("weekly_plans").select("id").eq("user_id", user_id).eq("week_start", current_week).limit(1).execute()
-                if user_plan.data:
-                    plan_id = user_plan.data[0]["id"]
-                    existing_blocks = client.table("weekly_plan_blocks").select("*").eq("plan_id", plan_id).execute()
-                    
-                    for block in (existing_blocks.data or []):
-                        if block.get("day_of_week") in constraint_days:
-                            block_start = _time_to_minutes(block.get("start_time", "00:00"))
-                            block_end = _time_to_minutes(block.get("end_time", "00:00"))
-                            new_start = _time_to_minutes(start_time)
-                            new_end = _time_to_minutes(end_time)
-                            
-                            if new_start < block_end and new_end > block_start:
-                                schedule_conflicts.append(f"Existing schedule block: {block.get('course_name', 'Course')} ({block.get('start_time')}-{block.get('end_time')})")
+            for day in constraint_days:
+                for item in overlapping_intervals(snapshot, day, start_time, end_time, kinds=(constraint_kind, "block")):
+                    span = f"{item.get('label')} ({to_hhmm(item['start'])}-{to_hhmm(item['end'])})"
+                    if item["kind"] == "block":
+                        schedule_conflicts.append(f"Existing schedule block: {span}")
+                    else:
+                        conflict_reasons.append(f"{constraint_label}: {span}")
+            # A constraint on several of the days is reported once
+            conflict_reasons = list(dict.fromkeys(conflict_reasons))
+            schedule_conflicts = list(dict.fromkeys(schedule_conflicts))
             
             # If there are constraint conflicts, reject
             if conflict_reasons:
@@ -307,6 +241,7 @@ class ConstraintManager:
                 }
                 
                 response = client.table("constraints").insert(constraint_dict).execute()
+                invalidate_schedules([user_id])
                 if not response.data:
                     raise HTTPException(status_code=500, detail="Failed to create constraint")
                 
@@ -333,6 +268,7 @@ class ConstraintManager:
                 }
                 
                 response = client.table("weekly_constraints").insert(constraint_dict).execute()
+                invalidate_schedules([user_id])
                 if not response.data:
                     raise HTTPException(status_code=500, detail="Failed to create weekly constraint")
                 
@@ -376,6 +312,7 @@ class ConstraintManager:
                 existing = client.table("constraints").select("id").eq("id", constraint_id).eq("user_id", user_id).execute()
                 if existing.data:
                     client.table("constraints").delete().eq("id", constraint_id).execute()
+                    invalidate_schedules([user_id])
                     logger.info(f"✅ Deleted permanent constraint {constraint_id}")
                     return {
                         "status": "success",
@@ -387,6 +324,7 @@ class ConstraintManager:
                 existing = client.table("weekly_constraints").select("id").eq("id", constraint_id).eq("user_id", user_id).execute()
                 if existing.data:
                     client.table("weekly_constraints").delete().eq("id", constraint_id).execute()
+                    invalidate_schedules([user_id])
                     logger.info(f"✅ Deleted weekly constraint {constraint_id}")
                     return {
                         "status": "success",
@@ -416,6 +354,7 @@ class ConstraintManager:
                     if len(permanent_constraints.data) == 1:
                         constraint_id = permanent_constraints.data[0]["id"]
                         client.table("constraints").delete().eq("id", constraint_id).execute()
+                        invalidate_schedules([user_id])
                         logger.info(f"✅ Deleted permanent constraint by title: {title}")
                         return {
                             "status": "success",
@@ -435,6 +374,7 @@ class ConstraintManager:
                     if len(weekly_constraints.data) == 1:
                         constraint_id = weekly_constraints.data[0]["id"]
                         client.table("weekly_constraints").delete().eq("id", constraint_id).execute()
+                        invalidate_schedules([user_id])
                         logger.info(f"✅ Deleted weekly constraint by title: {title}")
                         return {
                             "status": "success",
@@ -456,6 +396,7 @@ class ConstraintManager:
                     raise HTTPException(status_code=400, detail=f"Multiple permanent constraints found with title '{title}'. Please specify constraint_id.")
                 constraint_id = permanent_constraints.data[0]["id"]
                 client.table("constraints").delete().eq("id", constraint_id).execute()
+                invalidate_schedules([user_id])
                 logger.info(f"✅ Deleted permanent constraint by title: {title}")
                 return {
                     "status": "success",
@@ -475,6 +416,7 @@ class ConstraintManager:
                     raise HTTPException(status_code=400, detail=f"Multiple one-time constraints found with title '{title}'. Please specify constraint_id or week_start.")
                 constraint_id = weekly_constraints.data[0]["id"]
                 client.table("weekly_constraints").delete().eq("id", constraint_id).execute()
+                invalidate_schedules([user_id])
                 logger.info(f"✅ Deleted weekly constraint by title: {title}")
                 return {
                     "status": "success",
@@ -5,6 +5,8 @@ Manages adding courses to user's course list
 import logging
 from typing import Dict, Any, Optional
 from app.supabase_client import supabase, supabase_admin
+from app.course_catalog import get_catalog
+from app.schedule_view import invalidate_schedules
 from fastapi import HTTPException
 
 logger = logging.getLogger(__name__)
@@ -29,15 +31,14 @@ class CourseManager:
                 raise HTTPException(status_code=500, detail="Supabase client not configured")
 
             logger.info(f"🔍 Checking if course {course_number} exists in catalog")
-            catalog_result = client.table("course_catalog").select("*").eq("course_number", course_number).execute()
+            course_catalog = get_catalog(client).get(course_number)
 
-            if not catalog_result.data or len(catalog_result.data) == 0:
+            if not course_catalog:
                 raise HTTPException(
                     status_code=404,
                     detail=f"Course with number {course_number} not found in catalog. Please verify the course number is correct."
                 )
 
-            course_catalog = catalog_result.data[0]
             catalog_course_name = course_catalog.get("course_name", course_number)
             credit_points = course_catalog.get("credit_points")
 
@@ -81,6 +82,7 @@ class CourseManager:
                 raise HTTPException(status_code=500, detail="Failed to add course")
 
             added_course = result.data[0]
+            invalidate_schedules([user_id])
             logger.info(f"✅ Successfully added course {course_number} to user {user_id}")
 
             # Create course_time_preferences entry with default values based on credit points
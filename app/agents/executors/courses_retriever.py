@@ -11,6 +11,9 @@ logger = logging.getLogger(__name__)
 
 
 class CoursesRetriever:
+    routing_description = "List the courses the user takes this semester."
+    routing_params = {}
+
     def __init__(self):
         self.module_name = "courses_retriever"
 
@@ -5,12 +5,23 @@ Manages study groups - creates groups and invites members
 import logging
 from typing import Dict, Any, Optional, List
 from app.supabase_client import supabase, supabase_admin
+from app.notifications import notification_row, send_notifications
+from app.course_catalog import course_name_for
 from fastapi import HTTPException
 
 logger = logging.getLogger(__name__)
 
 
 class GroupManager:
+    routing_description = "Create a study group and invite members (only registered users enrolled in the course; at least one other user; not yourself)."
+    routing_params = {
+        "course_number!": "str",
+        "group_name!": "str",
+        "invite_emails!": "list[email]",
+        "course_name": "str",
+        "description": "str",
+    }
+
     def __init__(self):
         self.module_name = "group_manager"
 
@@ -67,11 +78,7 @@ class GroupManager:
             
             # Get course name if not provided
             if not course_name:
-                catalog_result = client.table("course_catalog").select("course_name").eq("course_number", course_number).limit(1).execute()
-                if catalog_result.data:
-                    course_name = catalog_result.data[0].get("course_name", course_number)
-                else:
-                    course_name = course_number
+                course_name = course_name_for(client, course_number) or course_number
             
             # Filter out current user's email and empty emails
             filtered_emails = []
@@ -372,14 +379,14 @@ class GroupManager:
                             if group_id:
                                 notification_link = f"/my-courses?group={group_id}&invitation={invitation_id}"
                             
-                            client.table("notifications").insert({
-                                "user_id": user_check.id,
-                                "type": "group_invitation",
-                                "title": f"Study group invitation: {group_name}",
-                                "message": f"{user_email} invited you to join a study group for course {course_name}",
-                                "link": notification_link,
-                                "read": False
-                            }).execute()
+                            send_notifications(client, [notification_row(
+                                user_check.id,
+                                "group_invitation",
+                                f"Study group invitation: {group_name}",
+                                f"{user_email} invited you to join a study group for course {course_name}",
+                                link=notification_link,
+                                dedup_key=f"group_invitation:{invitation_id}",
+                            )])
                         except Exception as notif_error:
                             logger.warning(f"Failed to create notification for {email}: {notif_error}")
                     else:
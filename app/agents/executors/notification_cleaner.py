@@ -11,6 +11,11 @@ logger = logging.getLogger(__name__)
 
 
 class NotificationCleaner:
+    routing_description = "Clean/delete notifications."
+    routing_params = {
+        "notification_id": "str",
+    }
+
     def __init__(self):
         self.module_name = "notification_cleaner"
 
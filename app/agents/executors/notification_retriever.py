@@ -11,6 +11,9 @@ logger = logging.getLogger(__name__)
 
 
 class NotificationRetriever:
+    routing_description = "Get new (unread) notifications."
+    routing_params = {}
+
     def __init__(self):
         self.module_name = "notification_retriever"
 
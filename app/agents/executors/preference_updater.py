@@ -11,6 +11,11 @@ logger = logging.getLogger(__name__)
 
 
 class PreferenceUpdater:
+    routing_description = "Update the user's study preferences from natural language (saves raw text and an LLM summary)."
+    routing_params = {
+        "preferences_text!": "str (or user_prompt)",
+    }
+
     def __init__(self):
         self.module_name = "preference_updater"
 
@@ -139,16 +144,27 @@ class PreferenceUpdater:
             
             # Generate LLM summary of preferences + schedule notes
             # Import the function from main.py
-            from app.main import _summarize_user_preferences_with_llm
+            from app.main import (
+                _summarize_user_preferences_with_llm,
+                _preferences_summary_hash,
+                _get_cached_preferences_summary,
+                _save_preferences_summary,
+            )
             
             logger.info(f"   Generating/updating LLM summary...")
             logger.info(f"   - Combined preferences length: {len(combined_preferences)} chars")
             logger.info(f"   - Schedule notes count: {len(schedule_notes)}")
             logger.info(f"   - Existing summary keys: {list(existing_summary.keys()) if existing_summary else 'none'}")
             
-            # Get new summary from LLM (it will merge with existing if needed)
+            # Get new summary from LLM (it will merge with existing if needed), unless the stored
+            # summary was already built from exactly these preferences and notes
+            summary_hash = _preferences_summary_hash(combined_preferences, schedule_notes)
             try:
-                new_summary = await _summarize_user_preferences_with_llm(combined_preferences, schedule_notes, existing_summary)
+                new_summary = _get_cached_preferences_summary(client, user_id, summary_hash)
+                if new_summary:
+                    logger.info(f"   Stored summary is up to date - skipping LLM")
+                else:
+                    new_summary = await _summarize_user_preferences_with_llm(combined_preferences, schedule_notes, existing_summary)
                 summary_generated = new_summary is not None
                 logger.info(f"   - LLM call result: summary_generated={summary_generated}")
                 if new_summary:
@@ -181,9 +197,7 @@ class PreferenceUpdater:
                 logger.info(f"   - Merged summary preview: {str(merged_summary)[:300]}")
                 
                 try:
-                    summary_update_result = client.table("user_profiles").update({
-                        "study_preferences_summary": merged_summary
-                    }).eq("id", user_id).execute()
+                    summary_update_result = _save_preferences_summary(client, user_id, merged_summary, summary_hash)
                     
                     logger.info(f"   Summary update result: {summary_update_result}")
                     logger.info(f"   - Update result.data: {summary_update_result.data}")
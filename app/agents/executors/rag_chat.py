@@ -8,6 +8,9 @@ import os
 import json
 from typing import Dict, Any, Optional, List
 from dotenv import load_dotenv
+from app.tracing import trace_span
+from app.agents.step_log import lazy_detail
+from app.single_flight import get_single_flight
 
 load_dotenv()
 
@@ -37,6 +40,9 @@ from app.rag.config import (
 
 
 class RAGChatExecutor:
+    routing_description = "DEFAULT. Answer any informational/procedural question about Technion academics, regulations, courses or advice that needs no action. The question is passed as-is."
+    routing_params = {}
+
     def __init__(self):
         self.module_name = "rag_chat"
         self.embedding_client = None
@@ -140,10 +146,11 @@ class RAGChatExecutor:
             # Use the model that was set during initialization
             model_to_use = getattr(self, 'embedding_model', EMBEDDING_MODEL)
             logger.info(f"CHAT: 🔍 Embedding query with model: {model_to_use}")
-            response = self.embedding_client.embeddings.create(
-                input=[query],
-                model=model_to_use
-            )
+            with trace_span("embedding", model=model_to_use):
+                response = self.embedding_client.embeddings.create(
+                    input=[query],
+                    model=model_to_use
+                )
             embedding = response.data[0].embedding
             logger.info(f"CHAT: ✅ Query embedded successfully (dimension: {len(embedding)})")
             return embedding
@@ -167,11 +174,12 @@ class RAGChatExecutor:
         top_k = top_k or TOP_K
         try:
             logger.info(f"CHAT: 🔍 Querying Pinecone with top_k={top_k} (no score filtering)")
-            results = self.pinecone_index.query(
-                vector=query_embedding,
-                top_k=top_k,
-                include_metadata=True
-            )
+            with trace_span("vector.query", index=PINECONE_INDEX_NAME, top_k=top_k):
+                results = self.pinecone_index.query(
+                    vector=query_embedding,
+                    top_k=top_k,
+                    include_metadata=True
+                )
             logger.info(f"CHAT: 📊 Pinecone returned {len(results.matches)} matches")
             
             chunks = []
@@ -288,68 +296,16 @@ class RAGChatExecutor:
                     "steps": steps
                 }
 
-            # Step 1: Embed query
-            logger.info(f"CHAT: 🔍 Step 1: Embedding query: {query[:100]}...")
-            query_embedding = self._embed_query(query)
-            if not query_embedding:
-                logger.error("CHAT: ❌ Embedding failed - RAG cannot continue")
-                return {
-                    "status": "error",
-                    "error": "Failed to embed query",
-                    "response": "מצטער, אבל לא הצלחתי לעבד את השאלה שלך. אנא נסה שוב מאוחר יותר.",
-                    "steps": steps
-                }
-
-            # Step 2: Retrieve relevant context from Pinecone
-            logger.info(f"CHAT: 🔍 Step 2: Retrieving context from Pinecone (top_k={TOP_K}, no score filtering)...")
-            context_chunks = self._retrieve_context(query_embedding, top_k=TOP_K)
-            
-            logger.info(f"CHAT: 📊 Retrieval results: {len(context_chunks)} chunks retrieved")
-            if context_chunks:
-                scores = [c.get("score", 0) for c in context_chunks]
-                logger.info(f"CHAT: 📊 Score range: min={min(scores):.3f}, max={max(scores):.3f}, avg={sum(scores)/len(scores):.3f}")
-                logger.info(f"CHAT: 📊 Scores: {[f'{s:.3f}' for s in scores]}")
-                sources = list(set([c.get("source_type", "unknown") for c in context_chunks]))
-                logger.info(f"CHAT: 📊 Sources found: {sources}")
-            else:
-                logger.warning(f"CHAT: ⚠️ No chunks retrieved from Pinecone!")
-            
-            retrieval_step = {
-                "module": "rag_retrieval",
-                "prompt": {
-                    "query": query,
-                    "top_k": TOP_K
-                },
-                "response": {
-                    "chunks_retrieved": len(context_chunks),
-                    "scores": [c.get("score", 0) for c in context_chunks],
-                    "sources": list(set([c.get("source_type", "unknown") for c in context_chunks])),
-                    "chunks": [{"source_type": c.get("source_type", "unknown"), "text": c.get("text", ""), "score": c.get("score", 0)} for c in context_chunks]
-                }
-            }
-            steps.append(retrieval_step)
-
-            # Step 3: Generate response - RAG only, chunks are required
-            if not context_chunks:
-                logger.warning(f"CHAT: ⚠️ No chunks retrieved from Pinecone")
-                return {
-                    "status": "error",
-                    "error": "No context chunks retrieved",
-                    "response": "מצטער, אבל לא מצאתי מידע רלוונטי במסמכי הטכניון כדי לענות על השאלה שלך. אנא נסה לנסח את השאלה מחדש או פנה למזכירות האקדמית לקבלת סיוע.",
-                    "steps": steps
-                }
-            
-            logger.info(f"CHAT: ✅ Step 3: Using {len(context_chunks)} context chunks from documents")
-            response_text = await self._generate_response_with_fallback(
-                query, context_chunks, user_context, steps
+            # Identical concurrent questions share one embedding/retrieval/LLM round trip;
+            # the answer does not depend on the user, so joiners get the same result
+            flight_key = (llm_client.model, " ".join(query.split()).casefold())
+            result, shared = await get_single_flight("rag_chat").do(
+                flight_key, lambda: self._answer_query(query, user_context)
             )
-
-            return {
-                "status": "success",
-                "response": response_text,
-                "steps": steps,
-                "context_used": len(context_chunks) > 0
-            }
+            result = {**result, "steps": list(result.get("steps", []))}
+            if shared:
+                result["coalesced"] = True
+            return result
 
         except Exception as e:
             logger.error(f"CHAT: ❌ Error in RAG chat executor: {e}")
@@ -362,6 +318,77 @@ class RAGChatExecutor:
                 "steps": steps
             }
 
+    async def _answer_query(
+        self,
+        query: str,
+        user_context: Optional[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Embed, retrieve and answer one query (run once per single-flight key)"""
+        steps = []
+
+        # Step 1: Embed query
+        logger.info(f"CHAT: 🔍 Step 1: Embedding query: {query[:100]}...")
+        query_embedding = self._embed_query(query)
+        if not query_embedding:
+            logger.error("CHAT: ❌ Embedding failed - RAG cannot continue")
+            return {
+                "status": "error",
+                "error": "Failed to embed query",
+                "response": "מצטער, אבל לא הצלחתי לעבד את השאלה שלך. אנא נסה שוב מאוחר יותר.",
+                "steps": steps
+            }
+
+        # Step 2: Retrieve relevant context from Pinecone
+        logger.info(f"CHAT: 🔍 Step 2: Retrieving context from Pinecone (top_k={TOP_K}, no score filtering)...")
+        context_chunks = self._retrieve_context(query_embedding, top_k=TOP_K)
+        
+        logger.info(f"CHAT: 📊 Retrieval results: {len(context_chunks)} chunks retrieved")
+        if context_chunks:
+            scores = [c.get("score", 0) for c in context_chunks]
+            logger.info(f"CHAT: 📊 Score range: min={min(scores):.3f}, max={max(scores):.3f}, avg={sum(scores)/len(scores):.3f}")
+            logger.info(f"CHAT: 📊 Scores: {[f'{s:.3f}' for s in scores]}")
+            sources = list(set([c.get("source_type", "unknown") for c in context_chunks]))
+            logger.info(f"CHAT: 📊 Sources found: {sources}")
+        else:
+            logger.warning(f"CHAT: ⚠️ No chunks retrieved from Pinecone!")
+        
+        retrieval_step = {
+            "module": "rag_retrieval",
+            "prompt": {
+                "query": query,
+                "top_k": TOP_K
+            },
+            "response": {
+                "chunks_retrieved": len(context_chunks),
+                "scores": [c.get("score", 0) for c in context_chunks],
+                "sources": list(set([c.get("source_type", "unknown") for c in context_chunks])),
+                "chunks": lazy_detail(lambda: [{"source_type": c.get("source_type", "unknown"), "text": c.get("text", ""), "score": c.get("score", 0)} for c in context_chunks])
+            }
+        }
+        steps.append(retrieval_step)
+
+        # Step 3: Generate response - RAG only, chunks are required
+        if not context_chunks:
+            logger.warning(f"CHAT: ⚠️ No chunks retrieved from Pinecone")
+            return {
+                "status": "error",
+                "error": "No context chunks retrieved",
+                "response": "מצטער, אבל לא מצאתי מידע רלוונטי במסמכי הטכניון כדי לענות על השאלה שלך. אנא נסה לנסח את השאלה מחדש או פנה למזכירות האקדמית לקבלת סיוע.",
+                "steps": steps
+            }
+        
+        logger.info(f"CHAT: ✅ Step 3: Using {len(context_chunks)} context chunks from documents")
+        response_text = await self._generate_response_with_fallback(
+            query, context_chunks, user_context, steps
+        )
+
+        return {
+            "status": "success",
+            "response": response_text,
+            "steps": steps,
+            "context_used": len(context_chunks) > 0
+        }
+
     async def _generate_response_with_fallback(
         self,
         query: str,
@@ -435,17 +462,18 @@ Please answer the user's question based ONLY on the Technion documents context p
             model_name = self.llm_client.model.lower()
             temperature = 1.0 if "gpt-5" in model_name else 0.7
 
-            response = await loop.run_in_executor(
-                None,
-                lambda: self.llm_client.client.chat.completions.create(
-                    model=self.llm_client.model,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    temperature=temperature
+            with trace_span("llm.rag_answer", model=self.llm_client.model, context_length=len(context_text)):
+                response = await loop.run_in_executor(
+                    None,
+                    lambda: self.llm_client.client.chat.completions.create(
+                        model=self.llm_client.model,
+                        messages=[
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_prompt}
+                        ],
+                        temperature=temperature
+                    )
                 )
-            )
 
             llm_response_text = response.choices[0].message.content or ""
 
@@ -456,11 +484,11 @@ Please answer the user's question based ONLY on the Technion documents context p
                     "has_context": bool(context_text),
                     "context_length": len(context_text),
                     "chunks_used": len(context_chunks),
-                    "system_prompt": system_prompt,
-                    "user_prompt": user_prompt
+                    "system_prompt": lazy_detail(lambda: system_prompt),
+                    "user_prompt": lazy_detail(lambda: user_prompt)
                 },
                 "response": {
-                    "full_response": llm_response_text,
+                    "full_response": lazy_detail(lambda: llm_response_text),
                     "response_length": len(llm_response_text),
                     "model": self.llm_client.model
                 }
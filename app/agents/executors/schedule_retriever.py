@@ -2,11 +2,12 @@
 Schedule Retriever Executor
 Retrieves and formats weekly schedules (blocks + constraints)
 """
-import json
 import logging
 from typing import Dict, Any, Optional, List
 from datetime import datetime, timedelta
 from app.supabase_client import supabase, supabase_admin
+from app.intervals import merge_blocks, sort_blocks, to_minutes
+from app.schedule_view import get_user_schedule, iter_user_schedules, to_columns, week_starts
 from fastapi import HTTPException
 
 logger = logging.getLogger(__name__)
@@ -15,12 +16,25 @@ logger = logging.getLogger(__name__)
 DAY_NAMES = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
 DAY_NAMES_HEBREW = ["ראשון", "שני", "שלישי", "רביעי", "חמישי", "שישי", "שבת"]
 
+# Columns of the compact per-week block arrays in range mode
+RANGE_COLUMNS = ("id", "day_of_week", "start_time", "end_time", "course_number", "course_name", "work_type")
+
 
 class ScheduleRetriever:
     """
     Retrieves weekly schedule for user
     """
     
+    routing_description = (
+        "Get the user's weekly schedule (defaults to the current week), "
+        "or an overview of several weeks / the semester (end_date or weeks)."
+    )
+    routing_params = {
+        "date": "YYYY-MM-DD|YYYY/MM/DD",
+        "end_date": "YYYY-MM-DD|YYYY/MM/DD (range mode)",
+        "weeks": "int (range mode, e.g. 15 for a semester)",
+    }
+
     def __init__(self):
         self.module_name = "schedule_retriever"
     
@@ -46,174 +60,12 @@ class ScheduleRetriever:
         
         raise ValueError(f"Invalid date format: {date_str}. Expected YYYY-MM-DD or YYYY/MM/DD")
     
-    def _time_to_minutes(self, time_str: str) -> int:
-        """Convert time string (HH:MM) to minutes since midnight"""
-        try:
-            # Handle HH:MM:SS or HH:MM
-            parts = time_str.split(":")
-            hours = int(parts[0])
-            minutes = int(parts[1]) if len(parts) > 1 else 0
-            return hours * 60 + minutes
-        except:
-            return 0
-    
-    def _merge_consecutive_blocks(self, blocks: List[Dict]) -> List[Dict]:
-        """
-        Merge consecutive blocks on the same day, same course, and same work_type into single blocks
-        Also removes duplicate blocks (identical day, course, work_type, start_time, end_time)
-        Example: 13:00-14:00, 14:00-15:00, 15:00-16:00 (same course, same work_type) -> 13:00-16:00
-        Only merges if all blocks have the same course_number AND same work_type
-        """
-        if not blocks:
-            return []
-        
-        # First, remove exact duplicates (same day, course, work_type, start_time, end_time)
-        seen_blocks = set()
-        unique_blocks = []
-        for block in blocks:
-            # Create a unique key for the block
-            block_key = (
-                block.get("day_of_week", 0),
-                block.get("course_number", ""),
-                block.get("work_type", "personal"),
-                block.get("start_time", "00:00"),
-                block.get("end_time", "00:00")
-            )
-            if block_key not in seen_blocks:
-                seen_blocks.add(block_key)
-                unique_blocks.append(block)
-        
-        logger.info(f"📋 Removed duplicates: {len(blocks)} -> {len(unique_blocks)} unique blocks")
-        
-        # Group blocks by day_of_week, course_number, and work_type
-        grouped = {}
-        for block in unique_blocks:
-            day = block.get("day_of_week", 0)
-            course_num = block.get("course_number", "")
-            work_type = block.get("work_type", "personal")
-            key = (day, course_num, work_type)
-            
-            if key not in grouped:
-                grouped[key] = []
-            grouped[key].append(block)
-        
-        merged_blocks = []
-        
-        for (day, course_num, work_type), day_blocks in grouped.items():
-            # Sort by start_time
-            day_blocks.sort(key=lambda b: self._time_to_minutes(b.get("start_time", "00:00")))
-            
-            # Merge consecutive blocks (only if same course and same work_type)
-            # Keep the first block's ID when merging
-            current_block = None
-            for block in day_blocks:
-                if current_block is None:
-                    current_block = block.copy()
-                    # Preserve block_id for UI interactions (use "id" field from database)
-                    if "id" not in current_block:
-                        # Try to get from block_id if it exists
-                        current_block["id"] = block.get("block_id") or block.get("id")
-                else:
-                    # Check if this block is consecutive to current_block
-                    current_end = self._time_to_minutes(current_block.get("end_time", "00:00"))
-                    block_start = self._time_to_minutes(block.get("start_time", "00:00"))
-                    
-                    # Only merge if consecutive AND same course AND same work_type
-                    if (block_start == current_end and 
-                        current_block.get("course_number") == block.get("course_number") and
-                        current_block.get("work_type") == block.get("work_type")):
-                        # Merge: extend end_time (keep first block's ID)
-                        current_block["end_time"] = block.get("end_time")
-                        # Keep the first block's ID when merging
-                    else:
-                        # Not consecutive or different course/work_type, save current and start new
-                        merged_blocks.append(current_block)
-                        current_block = block.copy()
-                        # Preserve block_id
-                        if "id" not in current_block:
-                            current_block["id"] = block.get("block_id") or block.get("id")
-            
-            if current_block:
-                merged_blocks.append(current_block)
-        
-        # Sort merged blocks chronologically by day_of_week and start_time
-        merged_blocks.sort(key=lambda b: (b.get("day_of_week", 0), self._time_to_minutes(b.get("start_time", "00:00"))))
-        
-        return merged_blocks
-    
-    def _constraints_to_display_items(
-        self, client, user_id: str, week_start_str: str
-    ) -> List[Dict]:
-        """Fetch permanent and weekly constraints and convert to block-like items for display."""
-        items = []
-        # Permanent constraints (apply to every week)
-        try:
-            perm_res = client.table("constraints").select("title, days, start_time, end_time").eq("user_id", user_id).execute()
-            for c in (perm_res.data or []):
-                days_raw = c.get("days")
-                if isinstance(days_raw, str):
-                    try:
-                        days_list = json.loads(days_raw)
-                    except Exception:
-                        days_list = []
-                else:
-                    days_list = list(days_raw) if days_raw else []
-                start_t = (c.get("start_time") or "").strip()
-                end_t = (c.get("end_time") or "").strip()
-                title = (c.get("title") or "Constraint").strip()
-                for d in days_list:
-                    try:
-                        day_int = int(d) if d is not None else None
-                        if day_int is not None and 0 <= day_int <= 6 and start_t and end_t:
-                            items.append({
-                                "day_of_week": day_int,
-                                "start_time": start_t,
-                                "end_time": end_t,
-                                "course_name": title,
-                                "work_type": "constraint",
-                            })
-                    except (ValueError, TypeError):
-                        continue
-        except Exception as e:
-            logger.warning(f"Could not load permanent constraints: {e}")
-        # Weekly constraints for this week
-        try:
-            weekly_res = client.table("weekly_constraints").select("title, days, start_time, end_time").eq("user_id", user_id).eq("week_start", week_start_str).execute()
-            for c in (weekly_res.data or []):
-                days_raw = c.get("days")
-                if isinstance(days_raw, str):
-                    try:
-                        days_list = json.loads(days_raw)
-                    except Exception:
-                        days_list = []
-                else:
-                    days_list = list(days_raw) if days_raw else []
-                start_t = (c.get("start_time") or "").strip()
-                end_t = (c.get("end_time") or "").strip()
-                title = (c.get("title") or "Constraint").strip()
-                for d in days_list:
-                    try:
-                        day_int = int(d) if d is not None else None
-                        if day_int is not None and 0 <= day_int <= 6 and start_t and end_t:
-                            items.append({
-                                "day_of_week": day_int,
-                                "start_time": start_t,
-                                "end_time": end_t,
-                                "course_name": title,
-                                "work_type": "constraint",
-                            })
-                    except (ValueError, TypeError):
-                        continue
-        except Exception as e:
-            logger.warning(f"Could not load weekly constraints: {e}")
-        return items
-    
     def _format_schedule_display(self, blocks: List[Dict], week_start: str) -> str:
         """Format schedule blocks into a readable display (chronologically sorted, no IDs)"""
         if not blocks:
             return f"No schedule blocks found for week starting {week_start}."
         
-        # Blocks are already sorted chronologically by _merge_consecutive_blocks
+        # Blocks are already sorted chronologically by merge_blocks / sort_blocks
         # Group by day for display
         by_day = {}
         for block in blocks:
@@ -236,7 +88,7 @@ class ScheduleRetriever:
             lines.append(f"\n{day_name}:")
             
             # Sort day blocks by start_time (should already be sorted, but just in case)
-            day_blocks = sorted(by_day[day], key=lambda b: self._time_to_minutes(b.get("start_time", "00:00")))
+            day_blocks = sort_blocks(by_day[day])
             
             for block in day_blocks:
                 start_time = block.get("start_time", "00:00")
@@ -253,18 +105,58 @@ class ScheduleRetriever:
         
         return "\n".join(lines)
     
+    def _range_overview(self, client, user_id: str, week_list: List[str]) -> Dict[str, Any]:
+        """Several weeks at once: batched reads, one merge over all weeks, compact columnar blocks"""
+        schedules = list(iter_user_schedules(client, user_id, week_list))
+        tagged = [dict(b, week_start=sch["week_start"]) for sch in schedules for b in sch["blocks"]]
+        by_week: Dict[str, List[Dict]] = {w: [] for w in week_list}
+        for block in merge_blocks(tagged):
+            by_week[block["week_start"]].append(block)
+
+        lines = [f"Weeks {week_list[0]} - {week_list[-1]}", "=" * 60]
+        weeks = []
+        for sch in schedules:
+            week = sch["week_start"]
+            blocks = by_week[week]
+            if not sch["plan"]:
+                lines.append(f"{week}: no plan")
+            else:
+                hours = sum(to_minutes(b.get("end_time")) - to_minutes(b.get("start_time")) for b in blocks) / 60
+                personal = sum(1 for b in blocks if b.get("work_type") == "personal")
+                group = sum(1 for b in blocks if b.get("work_type") == "group")
+                lines.append(f"{week}: {len(blocks)} sessions, {hours:g}h (personal {personal}, group {group})")
+            weeks.append({
+                "week_start": week,
+                "has_plan": bool(sch["plan"]),
+                "blocks": to_columns(blocks, RANGE_COLUMNS),
+            })
+        schedule_display = "\n".join(lines)
+        return {
+            "status": "success",
+            "message": schedule_display,
+            "start": week_list[0],
+            "end": week_list[-1],
+            "schedule_display": schedule_display,
+            "weeks": weeks,
+            "total_blocks": sum(len(w["blocks"]["id"]) for w in weeks),
+        }
+
     async def execute(
         self,
         user_id: str,
         date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        weeks: Optional[int] = None,
         **kwargs
     ) -> Dict[str, Any]:
         """
-        Retrieve weekly schedule for a specific week
+        Retrieve weekly schedule for a specific week, or an overview of a range of weeks
         
         Args:
             user_id: User ID
             date: Date in YYYY-MM-DD or YYYY/MM/DD format (defaults to today)
+            end_date: Last date of a range (range mode)
+            weeks: Number of weeks from date (range mode)
             **kwargs: Additional parameters
         
         Returns:
@@ -275,6 +167,14 @@ class ScheduleRetriever:
             if not client:
                 raise HTTPException(status_code=500, detail="Supabase client not configured")
             
+            if end_date or weeks:
+                try:
+                    week_list = week_starts(date or datetime.now(), end_date, int(weeks) if weeks else None)
+                except ValueError as e:
+                    raise HTTPException(status_code=400, detail=f"Invalid range: {str(e)}")
+                logger.info(f"📅 Retrieving {len(week_list)} weeks {week_list[0]}..{week_list[-1]}")
+                return self._range_overview(client, user_id, week_list)
+            
             # Parse date
             if date:
                 try:
@@ -309,16 +209,13 @@ class ScheduleRetriever:
             
             logger.info(f"📅 Retrieving schedule for week starting {week_start_str} (requested date: {date or 'today'})")
             
-            # Get weekly plan
-            logger.info(f"🔍 Searching for weekly_plan: user_id={user_id}, week_start={week_start_str}")
-            plan_result = client.table("weekly_plans").select("*").eq("user_id", user_id).eq("week_start", week_start_str).execute()
-            
-            logger.info(f"📊 Plan query result: found {len(plan_result.data) if plan_result.data else 0} plans")
+            # One read of the schedule read model: plan, its blocks and the week's constraints
+            schedule = get_user_schedule(client, user_id, week_start_str)
+            constraint_items = schedule["constraints"]
             
             # If no plan found, still show constraints for the week
-            if not plan_result.data or len(plan_result.data) == 0:
+            if not schedule["plan"]:
                 logger.warning(f"⚠️ No weekly plan found for week starting {week_start_str}")
-                constraint_items = self._constraints_to_display_items(client, user_id, week_start_str)
                 schedule_display = self._format_schedule_display(constraint_items, week_start_str) if constraint_items else f"No schedule found for week starting {week_start_str}"
                 all_plans = client.table("weekly_plans").select("week_start").eq("user_id", user_id).order("week_start", desc=True).limit(10).execute()
                 available_plans = [p.get('week_start') for p in all_plans.data] if all_plans.data else []
@@ -332,31 +229,17 @@ class ScheduleRetriever:
                     "available_plans": available_plans
                 }
             
-            plan = plan_result.data[0]
-            plan_id = plan["id"]
-            logger.info(f"✅ Found plan: id={plan_id}")
-            
-            # Get plan blocks
-            logger.info(f"🔍 Searching for blocks: plan_id={plan_id}")
-            blocks_result = client.table("weekly_plan_blocks").select("*").eq("plan_id", plan_id).order("day_of_week").order("start_time").execute()
-            
-            raw_blocks = blocks_result.data if blocks_result.data else []
-            
-            logger.info(f"📋 Found {len(raw_blocks)} raw blocks for week {week_start_str}")
-            if raw_blocks:
-                logger.info(f"   First raw block sample: {raw_blocks[0]}")
+            raw_blocks = schedule["blocks"]
+            logger.info(f"📋 Found {len(raw_blocks)} raw blocks for week {week_start_str} (plan {schedule['plan'].get('id')})")
             
             # Merge consecutive blocks
-            merged_blocks = self._merge_consecutive_blocks(raw_blocks)
+            # Dedup + merge back-to-back blocks of the same course and work type (integer minutes)
+            merged_blocks = merge_blocks(raw_blocks)
             
             logger.info(f"✅ Merged to {len(merged_blocks)} blocks after grouping consecutive ones")
-            if merged_blocks:
-                logger.info(f"   First merged block sample: {merged_blocks[0]}")
             
             # Add constraints (permanent + weekly) for this week
-            constraint_items = self._constraints_to_display_items(client, user_id, week_start_str)
-            combined = merged_blocks + constraint_items
-            combined.sort(key=lambda b: (b.get("day_of_week", 0), self._time_to_minutes(b.get("start_time", "00:00"))))
+            combined = sort_blocks(merged_blocks + constraint_items)
             
             # Format for display (blocks + constraints)
             schedule_display = self._format_schedule_display(combined, week_start_str)
@@ -59,6 +59,12 @@ class WeeklyPlannerExecutor:
     Allowed only for week_start >= May 2026.
     """
 
+    routing_description = "Generate weekly study plans for all users (e.g. run weekly plan, תכנון לוז שבועי). Only weeks from May 2026 onwards."
+    routing_params = {
+        "week_start": "YYYY-MM-DD (Sunday)",
+        "date": "any date in the week",
+    }
+
     def __init__(self):
         self.module_name = "weekly_planner"
 
@@ -7,6 +7,8 @@ import json
 from typing import Dict, Any, Optional
 from dotenv import load_dotenv
 import asyncio
+from app.tracing import trace_span
+from app.debug_log import debug_log
 
 load_dotenv()
 
@@ -19,244 +21,18 @@ except ImportError:
     HAS_OPENAI = False
     logger.warning("OpenAI library not installed. Install with: pip install openai")
 
-# Helper function for debug logging
-def _write_debug_log(session_id, run_id, hypothesis_id, location, message, data):
-    """Write debug log to file"""
-    import json
-    import os as os_module
-    try:
-        log_dir = r'c:\DS\AcademicPlanner\ds_project\.cursor'
-        os_module.makedirs(log_dir, exist_ok=True)
-        log_file = os_module.path.join(log_dir, 'debug.log')
-        with open(log_file, 'a', encoding='utf-8') as f:
-            f.write(json.dumps({
-                "sessionId": session_id,
-                "runId": run_id,
-                "hypothesisId": hypothesis_id,
-                "location": location,
-                "message": message,
-                "data": data,
-                "timestamp": int(__import__('time').time()*1000)
-            })+'\n')
-    except Exception as log_err:
-        logger.warning(f"Failed to write debug log: {log_err}")
 
-
-class LLMClient:
-    def __init__(self):
-        self.client = None
-        self.model = None
-        self._initialize_client()
-
-    def _initialize_client(self):
-        _write_debug_log("debug-session", "init", "A", "llm_client.py:_initialize_client", "Initializing LLM client", {"has_openai": HAS_OPENAI})
-
-        logger.info("🔧 Initializing LLM client...")
-
-        if not HAS_OPENAI:
-            logger.warning("❌ OpenAI library not available. LLM routing will be disabled.")
-            logger.warning("   Install with: pip install openai")
-            _write_debug_log("debug-session", "init", "B", "llm_client.py:_initialize_client", "OpenAI library not available", {})
-            return
-
-        llmod_api_key = os.getenv("LLMOD_API_KEY")
-        if not llmod_api_key:
-            llmod_api_key = os.getenv("LLM_API_KEY")
-
-        # Check if EMBEDDING_BASE_URL is set to llmod.ai - if so, we should use LLMod.ai
-        embedding_base_url = os.getenv("EMBEDDING_BASE_URL")
-        use_llmod_base = False
-        if embedding_base_url and "llmod" in embedding_base_url.lower():
-            use_llmod_base = True
-            logger.info(f"   EMBEDDING_BASE_URL points to LLMod.ai: {embedding_base_url}")
-            # If LLMOD_API_KEY is not set but OPENAI_API_KEY is, use OPENAI_API_KEY with LLMod base_url
-            if not llmod_api_key:
-                openai_key_temp = os.getenv("OPENAI_API_KEY")
-                if openai_key_temp:
-                    logger.info("   LLMOD_API_KEY not found, but OPENAI_API_KEY found - will use it with LLMod.ai base_url")
-                    llmod_api_key = openai_key_temp
-
-        if llmod_api_key:
-            logger.info(f"   Found LLMod API key (length: {len(llmod_api_key)}, starts with: {llmod_api_key[:10]}...)")
-            if llmod_api_key == "your_llmod_api_key_here":
-                logger.error("   ⚠️ LLM_API_KEY is still set to placeholder 'your_llmod_api_key_here'!")
-                logger.error("   Please replace it with your actual LLMod.ai API key in .env file")
-                llmod_api_key = None
-        else:
-            logger.warning("   ⚠️ No LLMod API key found (checked LLMOD_API_KEY and LLM_API_KEY)")
-
-        llmod_base_url = os.getenv("LLMOD_BASE_URL") or os.getenv("LLM_BASE_URL")
-        if not llmod_base_url and use_llmod_base:
-            # If EMBEDDING_BASE_URL points to llmod.ai, use it as base_url
-            llmod_base_url = embedding_base_url
-        if not llmod_base_url:
-            llmod_base_url = "https://api.llmod.ai/v1"
-
-        if llmod_base_url and not llmod_base_url.endswith("/v1"):
-            if llmod_base_url.endswith("/"):
-                llmod_base_url = llmod_base_url + "v1"
-            else:
-                llmod_base_url = llmod_base_url + "/v1"
-
-        env_vars_checked = {
-            "LLMOD_API_KEY": bool(os.getenv("LLMOD_API_KEY")),
-            "LLM_API_KEY": bool(os.getenv("LLM_API_KEY")),
-            "LLMOD_BASE_URL": bool(os.getenv("LLMOD_BASE_URL")),
-            "LLM_BASE_URL": bool(os.getenv("LLM_BASE_URL")),
-            "OPENAI_API_KEY": bool(os.getenv("OPENAI_API_KEY"))
-        }
-        _write_debug_log("debug-session", "init", "C", "llm_client.py:_initialize_client", "Checking LLMod keys", {
-            "has_llmod_key": bool(llmod_api_key),
-            "llmod_key_length": len(llmod_api_key) if llmod_api_key else 0,
-            "llmod_base_url": llmod_base_url,
-            "env_vars_found": env_vars_checked
-        })
-
-        openai_api_key = os.getenv("OPENAI_API_KEY")
-
-        _write_debug_log("debug-session", "init", "D", "llm_client.py:_initialize_client", "Checking OpenAI key", {"has_openai_key": bool(openai_api_key), "openai_key_length": len(openai_api_key) if openai_api_key else 0})
-
-        logger.info(f"   Checking for LLMOD_API_KEY: {'Found' if llmod_api_key else 'Not found'}")
-        logger.info(f"   Checking for OPENAI_API_KEY: {'Found' if openai_api_key else 'Not found'}")
-
-        try:
-            if llmod_api_key:
-                logger.info(f"   Using LLMod.ai with base_url: {llmod_base_url}")
-                self.client = OpenAI(
-                    api_key=llmod_api_key,
-                    base_url=llmod_base_url
-                )
-                self.model = os.getenv("LLMOD_MODEL") or os.getenv("LLM_MODEL") or "gpt-3.5-turbo"
-                logger.info(f"✅ Initialized LLMod.ai client with model: {self.model}")
-                _write_debug_log("debug-session", "init", "E", "llm_client.py:_initialize_client", "LLMod.ai client initialized", {"model": self.model, "base_url": llmod_base_url})
-            elif openai_api_key:
-                logger.info("   Using OpenAI")
-                self.client = OpenAI(api_key=openai_api_key)
-                self.model = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
-                logger.info(f"✅ Initialized OpenAI client with model: {self.model}")
-                _write_debug_log("debug-session", "init", "F", "llm_client.py:_initialize_client", "OpenAI client initialized", {"model": self.model})
-            else:
-                logger.warning("⚠️ No LLM API key found. Set LLMOD_API_KEY or OPENAI_API_KEY in .env")
-                logger.warning("   LLM routing will be disabled, using fallback pattern matching")
-                _write_debug_log("debug-session", "init", "G", "llm_client.py:_initialize_client", "No API key found", {})
-        except Exception as e:
-            logger.error(f"❌ Failed to initialize LLM client: {e}")
-            import traceback
-            logger.error(f"   Traceback: {traceback.format_exc()}")
-            _write_debug_log("debug-session", "init", "H", "llm_client.py:_initialize_client", "Initialization error", {"error": str(e), "error_type": type(e).__name__})
-
-    async def route_task(
-        self,
-        user_prompt: str
-    ) -> Dict[str, Any]:
-        _write_debug_log("debug-session", "route", "I", "llm_client.py:route_task", "Route task called", {"user_prompt": user_prompt, "has_client": bool(self.client), "model": self.model})
-
-        if not self.client:
-            logger.warning("⚠️ LLM client not available, falling back to pattern matching")
-            _write_debug_log("debug-session", "route", "J", "llm_client.py:route_task", "No LLM client available", {})
-            return {"executor_name": None, "executor_params": {}, "error": "LLM client not initialized"}
-
-        logger.info(f"🤖 Calling LLM with model: {self.model}")
-        logger.info(f"   User prompt: {user_prompt}")
-
-        routing_prompt = self._create_routing_prompt(user_prompt)
-
-        _write_debug_log("debug-session", "route", "K", "llm_client.py:route_task", "Before LLM call", {"model": self.model, "system_prompt_length": len(routing_prompt["system"]), "user_prompt_length": len(routing_prompt["user"])})
-
-        try:
-            logger.info(f"   Sending request to LLM...")
-            import asyncio
-            loop = asyncio.get_event_loop()
-
-            # Determine temperature based on model
-            temperature_setting = 0.1
-            if self.model and "gpt-5" in self.model.lower():
-                temperature_setting = 1.0
-                logger.info(f"   Using temperature={temperature_setting} for gpt-5 model: {self.model}")
-
-            response = await loop.run_in_executor(
-                None,
-                lambda: self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": routing_prompt["system"]
-                        },
-                        {
-                            "role": "user",
-                            "content": routing_prompt["user"]
-                        }
-                    ],
-                    temperature=temperature_setting,
-                    response_format={"type": "json_object"}
-                )
-            )
-
-            _write_debug_log("debug-session", "route", "L", "llm_client.py:route_task", "LLM call succeeded", {"has_response": bool(response), "choices_count": len(response.choices) if response and hasattr(response, 'choices') else 0})
-
-            llm_response = response.choices[0].message.content
-            logger.info(f"   LLM raw response: {llm_response[:200]}...")
-
-            _write_debug_log("debug-session", "route", "M", "llm_client.py:route_task", "LLM response received", {"response_length": len(llm_response) if llm_response else 0, "response_preview": llm_response[:200] if llm_response else None})
-
-            routing_result = json.loads(llm_response)
-
-            _write_debug_log("debug-session", "route", "N", "llm_client.py:route_task", "Routing result parsed", {"executor_name": routing_result.get("executor_name"), "params_keys": list(routing_result.get("executor_params", {}).keys()), "course_number": routing_result.get("executor_params", {}).get("course_number")})
-
-            logger.info(f"✅ LLM routing result: executor={routing_result.get('executor_name')}, params={routing_result.get('executor_params')}")
-
-            return {
-                "executor_name": routing_result.get("executor_name"),
-                "executor_params": routing_result.get("executor_params", {}),
-                "llm_response": llm_response,
-                "reasoning": routing_result.get("reasoning", "")
-            }
-
-        except Exception as e:
-            error_str = str(e)
-            error_type = type(e).__name__
-
-            if "401" in error_str or "invalid_api_key" in error_str or "AuthenticationError" in error_type:
-                logger.error(f"❌ LLM Authentication Error: Invalid API key")
-                logger.error(f"   Please check your API key in .env file")
-                logger.error(f"   For LLMod.ai: Set LLMOD_API_KEY or LLM_API_KEY")
-                logger.error(f"   For OpenAI: Set OPENAI_API_KEY with a valid key")
-                logger.error(f"   Falling back to pattern matching...")
-            else:
-                logger.error(f"❌ Error in LLM routing: {e}")
-                import traceback
-                logger.error(f"Traceback: {traceback.format_exc()}")
-
-            _write_debug_log("debug-session", "route", "O", "llm_client.py:route_task", "LLM call error", {"error": error_str, "error_type": error_type, "is_auth_error": "401" in error_str or "invalid_api_key" in error_str})
-            return {"executor_name": None, "executor_params": {}, "error": error_str}
-
-    def _create_routing_prompt(self, user_prompt: str) -> Dict[str, str]:
-        system_prompt = """You are a task router for an academic planner system. Your job is to analyze user requests and determine:
+# ----- Routing prompt -----
+# The routing system prompt is identical for every request, so it is assembled once per
+# executor set and reused. Keeping it byte-for-byte stable (and first in the message list)
+# lets providers with automatic prompt caching (OpenAI, LLMod) serve it from cache.
+_ROUTING_PREAMBLE = """You are a task router for an academic planner system. Your job is to analyze user requests and determine:
 1. Which executor should handle the task
 2. What parameters to extract from the user's request
 
-Available executors:
-- rag_chat: Answer questions about Technion academic information, procedures, regulations, courses, and general academic advice. Use this for ANY informational question, procedural question, or general inquiry that doesn't require a specific action (like adding courses, moving blocks, etc.). This is the default executor for chat/informational queries. No parameters needed - just pass the user's question as-is.
-- schedule_retriever: Get weekly schedule. Optional: date (YYYY-MM-DD or YYYY/MM/DD format). If no date is provided, default to the current week.
-- group_manager: Create study groups and invite members. Use this when the user wants to create a new study group or invite people to a group. Requires: course_number (string, e.g., "10403"), group_name (string), invite_emails (list of email addresses). Optional: course_name (string), description (string). Validations: Only registered users enrolled in the course can be invited. At least one other user (besides the creator) must be invited. Cannot invite yourself.
-- notification_retriever: Get new notifications. No parameters needed
-- notification_cleaner: Clean/delete notifications. Optional: notification_id
-- courses_retriever: Get all courses the user is taking this semester. No parameters needed. Use this when the user wants to see their courses list.
-- request_handler: Approve/reject requests (group invitations or change requests). Use this when the user wants to approve/accept or reject/decline an invitation or change request. Requires: action ("accept"/"approve" or "reject"/"decline"). Optional: request_id (if not provided, will search by group_name or course_number for invitations), group_name (string, e.g., "קבוצת לימוד - רשתות מחשבים"), course_number (string, e.g., "10403"), date (YYYY-MM-DD or YYYY/MM/DD format to find requests for a specific week), week_start (YYYY-MM-DD format, Sunday of the week), day_of_week (0-6, where 0=Sunday, to filter by day), time_of_day ("morning", "afternoon", "evening", "night" to filter by time). The handler will find the pending invitation or change request automatically. IMPORTANT: For change requests, extract date/day_of_week/time_of_day from the user's prompt to help find the correct request (e.g., "approve request for Friday evening on 13/2/26" → date="2026-02-13", day_of_week=5, time_of_day="evening").
-- preference_updater: Update user study preferences from natural language. Use this when the user wants to update their study preferences (e.g., "I prefer to study in the morning", "I like to study late at night", "I work better in short sessions"). Requires: preferences_text or user_prompt (the user's preference description). This updates the user's study_preferences_raw and generates a summary using LLM.
-- block_mover: Move study blocks. Requires: block_id, new_day, new_start_time, new_end_time. Optional: user_prompt (original user prompt for preference extraction)
-- block_resizer: Resize study blocks (change duration). Use this when the user wants to INCREASE or DECREASE the duration of an EXISTING block (e.g., "change from 3 hours to 2 hours", "reduce to 2 hours", "increase to 4 hours", "2 hours is sufficient so change it to 13-15"). Requires: block_id (optional), course_name or course_number, day_of_week, start_time, new_duration, week_start (optional). If block_id not provided, use course_name/course_number + day_of_week + start_time + week_start to find the block. For group blocks, creates a change request. For personal blocks, updates directly and updates course_time_preferences.personal_hours_per_week.
-- IMPORTANT: If user says "from X:00 to Y:00" and wants to change it to "from X:00 to Z:00" where Z < Y (or Z > Y), this is a RESIZE (changing duration), not a move. Choose block_resizer, not block_mover.
-- block_creator: Create a NEW study block and add it to the schedule. Use this when the user wants to ADD a new block that doesn't exist yet (e.g., "add a 2-hour block for אלגוריתמים on Monday at 10:00", "create a new study session for course 10403 on Wednesday 14:00", "add 3 hours for מבני נתונים on Thursday starting at 08:00"). Requires: course_name or course_number, day_of_week (0-6, where 0=Sunday), start_time (HH:MM format). Optional: duration (default 1 hour), work_type ("personal" or "group", default "personal"), week_start (YYYY-MM-DD format, defaults to current week). This creates a NEW block, not moving or resizing an existing one.
-- constraint_manager: Add or delete constraints to/from user's schedule (permanent or one-time). Use this when the user wants to add a constraint (e.g., "I have training on Monday 18:00-20:00", "I work every Tuesday 14:00-16:00", "I have a meeting on Wednesday 10:00-11:00 this week") or delete a constraint (e.g., "delete my training constraint", "remove the work constraint", "delete the supermarket constraint"). For adding: Requires: action="add" (default), title (constraint name, e.g., "אימון", "עבודה"), start_time (HH:MM format), end_time (HH:MM format), days (list of days 0-6) or day_of_week (single day 0-6). Optional: description, is_permanent (True for permanent/recurring constraint, False for one-time, default: False if not specified), week_start (YYYY-MM-DD format for one-time constraints, defaults to current week), date (specific date YYYY-MM-DD for one-time constraints, will be converted to week_start). All constraints are hard constraints (always True). If user doesn't specify "permanent" or "recurring", it's one-time. The system will check for conflicts with existing constraints (rejects) and existing schedule (warns but allows). For deleting: Requires: action="delete", constraint_id (optional, UUID) or title (constraint name to find and delete). Optional: is_permanent (True for permanent, False for one-time, if not specified will search both), week_start (for one-time constraints), date (specific date for one-time constraints, will be converted to week_start). If multiple constraints match the title, constraint_id must be provided.
-- weekly_planner: Generate weekly study plans for all users (system-style). Use when the user asks to run/generate weekly planning, build the weekly schedule, or "תכנון לוז שבועי" / "הרץ תכנון שבועי". Optional: week_start (YYYY-MM-DD, Sunday of the week) or date (any date in the week – will be normalized to that week's Sunday). Only weeks from May 2026 onwards are allowed; earlier dates will return an error. Extract date from phrases like "for week starting 03/05/26", "שבוע שמתחיל ב-03/05/26", "2026-05-03".
-
-IMPORTANT: When extracting parameters for block_mover, also analyze the user_prompt for any preferences or explanations:
-- If the user mentions preferences like "I prefer to study late", "I like morning study", "I don't like studying on day X", etc., include the full user_prompt in executor_params so the backend can extract and save these preferences.
-- Examples of preference indicators: "because", "prefer", "like", "don't like", "better", "instead", "I usually", "I find it easier", etc.
+Available executors (name: purpose params{name: type}; "!" marks a required parameter, missing required values are null):"""
 
-Return your response as JSON with this exact structure:
+_ROUTING_RULES = """Return your response as JSON with this exact structure:
 {
   "executor_name": "executor_name_here",
   "executor_params": {
@@ -266,7 +42,13 @@ Return your response as JSON with this exact structure:
   "reasoning": "brief explanation of why this executor was chosen"
 }
 
-Extract all relevant parameters from the user's request. If a parameter is missing but required, set it to null.
+Extract all relevant parameters from the user's request. If a parameter is missing but required, set it to null. Parameter names are given without the "!" marker.
+
+IMPORTANT: If user says "from X:00 to Y:00" and wants to change it to "from X:00 to Z:00" where Z < Y (or Z > Y), this is a RESIZE (changing duration), not a move. Choose block_resizer, not block_mover.
+
+IMPORTANT: When extracting parameters for block_mover, also analyze the user_prompt for any preferences or explanations:
+- If the user mentions preferences like "I prefer to study late", "I like morning study", "I don't like studying on day X", etc., include the full user_prompt in executor_params so the backend can extract and save these preferences.
+- Examples of preference indicators: "because", "prefer", "like", "don't like", "better", "instead", "I usually", "I find it easier", etc.
 
 For schedule_retriever:
 - Extract date (optional) - look for YYYY-MM-DD or YYYY/MM/DD format. Examples: "2026-02-08", "2026/02/08". If not provided, assume current week.
@@ -416,6 +198,291 @@ If the user writes "104043", you MUST extract "104043" with all 6 digits.
 Do NOT extract "10404" or any shorter version.
 The course number must be an exact match to what appears in the user's text."""
 
+# Cache of assembled system prompts keyed by executor catalog (Supervisor is built per request)
+_routing_prompt_cache: Dict[str, str] = {}
+
+# Token usage per routed executor, accumulated for the lifetime of the process
+_routing_token_stats: Dict[str, Dict[str, int]] = {}
+
+
+def build_executor_catalog(executors: Dict[str, Any]) -> str:
+    """
+    Render a compact, one-line-per-executor catalog from the executors' routing metadata.
+    Every executor class that the supervisor may route to declares two class attributes:
+
+    - routing_description: one sentence on what the executor does (executors without it are
+      not listed, so the LLM never routes to them)
+    - routing_params: parameter name -> expected format ("str", "uuid", "0-6", "HH:MM", ...);
+      a trailing "!" on the name ("start_time!") marks a parameter the router must always extract
+    """
+    lines = []
+    for name, executor in executors.items():
+        description = getattr(executor, "routing_description", None)
+        if not description:
+            continue
+        params = getattr(executor, "routing_params", None) or {}
+        spec = ", ".join(f"{param}: {kind}" for param, kind in params.items())
+        lines.append(f"- {name}: {description} params{{{spec}}}")
+    return "\n".join(lines)
+
+
+def _get_routing_system_prompt(executors: Dict[str, Any]) -> str:
+    catalog = build_executor_catalog(executors)
+    prompt = _routing_prompt_cache.get(catalog)
+    if prompt is None:
+        prompt = f"{_ROUTING_PREAMBLE}\n{catalog}\n\n{_ROUTING_RULES}"
+        _routing_prompt_cache[catalog] = prompt
+    return prompt
+
+
+def _extract_usage(response: Any) -> Dict[str, int]:
+    """Read token usage (including provider-side cached prompt tokens) from a chat completion"""
+    usage = getattr(response, "usage", None)
+    if not usage:
+        return {}
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "cached_prompt_tokens": (getattr(details, "cached_tokens", 0) or 0) if details else 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+    }
+
+
+def _record_routing_usage(executor_name: Optional[str], usage: Dict[str, int]) -> None:
+    stats = _routing_token_stats.setdefault(executor_name or "unrouted", {
+        "calls": 0,
+        "prompt_tokens": 0,
+        "cached_prompt_tokens": 0,
+        "completion_tokens": 0,
+    })
+    stats["calls"] += 1
+    for key in ("prompt_tokens", "cached_prompt_tokens", "completion_tokens"):
+        stats[key] += usage.get(key, 0)
+
+
+def get_routing_token_stats() -> Dict[str, Dict[str, Any]]:
+    """Per-route prompt token totals and averages since process start"""
+    report = {}
+    for executor_name, stats in _routing_token_stats.items():
+        calls = stats["calls"] or 1
+        report[executor_name] = {
+            **stats,
+            "avg_prompt_tokens": round(stats["prompt_tokens"] / calls, 1),
+            "cache_hit_ratio": round(stats["cached_prompt_tokens"] / stats["prompt_tokens"], 3) if stats["prompt_tokens"] else 0.0,
+        }
+    return report
+
+
+class LLMClient:
+    def __init__(self):
+        self.client = None
+        self.model = None
+        self._routing_system_prompt: Optional[str] = None
+        self._initialize_client()
+
+    def _initialize_client(self):
+        debug_log("A", "llm_client.py:_initialize_client", "Initializing LLM client", {"has_openai": HAS_OPENAI}, run_id="init")
+
+        logger.info("🔧 Initializing LLM client...")
+
+        if not HAS_OPENAI:
+            logger.warning("❌ OpenAI library not available. LLM routing will be disabled.")
+            logger.warning("   Install with: pip install openai")
+            debug_log("B", "llm_client.py:_initialize_client", "OpenAI library not available", {}, run_id="init")
+            return
+
+        llmod_api_key = os.getenv("LLMOD_API_KEY")
+        if not llmod_api_key:
+            llmod_api_key = os.getenv("LLM_API_KEY")
+
+        # Check if EMBEDDING_BASE_URL is set to llmod.ai - if so, we should use LLMod.ai
+        embedding_base_url = os.getenv("EMBEDDING_BASE_URL")
+        use_llmod_base = False
+        if embedding_base_url and "llmod" in embedding_base_url.lower():
+            use_llmod_base = True
+            logger.info(f"   EMBEDDING_BASE_URL points to LLMod.ai: {embedding_base_url}")
+            # If LLMOD_API_KEY is not set but OPENAI_API_KEY is, use OPENAI_API_KEY with LLMod base_url
+            if not llmod_api_key:
+                openai_key_temp = os.getenv("OPENAI_API_KEY")
+                if openai_key_temp:
+                    logger.info("   LLMOD_API_KEY not found, but OPENAI_API_KEY found - will use it with LLMod.ai base_url")
+                    llmod_api_key = openai_key_temp
+
+        if llmod_api_key:
+            logger.info(f"   Found LLMod API key (length: {len(llmod_api_key)}, starts with: {llmod_api_key[:10]}...)")
+            if llmod_api_key == "your_llmod_api_key_here":
+                logger.error("   ⚠️ LLM_API_KEY is still set to placeholder 'your_llmod_api_key_here'!")
+                logger.error("   Please replace it with your actual LLMod.ai API key in .env file")
+                llmod_api_key = None
+        else:
+            logger.warning("   ⚠️ No LLMod API key found (checked LLMOD_API_KEY and LLM_API_KEY)")
+
+        llmod_base_url = os.getenv("LLMOD_BASE_URL") or os.getenv("LLM_BASE_URL")
+        if not llmod_base_url and use_llmod_base:
+            # If EMBEDDING_BASE_URL points to llmod.ai, use it as base_url
+            llmod_base_url = embedding_base_url
+        if not llmod_base_url:
+            llmod_base_url = "https://api.llmod.ai/v1"
+
+        if llmod_base_url and not llmod_base_url.endswith("/v1"):
+            if llmod_base_url.endswith("/"):
+                llmod_base_url = llmod_base_url + "v1"
+            else:
+                llmod_base_url = llmod_base_url + "/v1"
+
+        env_vars_checked = {
+            "LLMOD_API_KEY": bool(os.getenv("LLMOD_API_KEY")),
+            "LLM_API_KEY": bool(os.getenv("LLM_API_KEY")),
+            "LLMOD_BASE_URL": bool(os.getenv("LLMOD_BASE_URL")),
+            "LLM_BASE_URL": bool(os.getenv("LLM_BASE_URL")),
+            "OPENAI_API_KEY": bool(os.getenv("OPENAI_API_KEY"))
+        }
+        debug_log("C", "llm_client.py:_initialize_client", "Checking LLMod keys", lambda: {
+            "has_llmod_key": bool(llmod_api_key),
+            "llmod_key_length": len(llmod_api_key) if llmod_api_key else 0,
+            "llmod_base_url": llmod_base_url,
+            "env_vars_found": env_vars_checked
+        }, run_id="init")
+
+        openai_api_key = os.getenv("OPENAI_API_KEY")
+
+        debug_log("D", "llm_client.py:_initialize_client", "Checking OpenAI key", lambda: {"has_openai_key": bool(openai_api_key), "openai_key_length": len(openai_api_key) if openai_api_key else 0}, run_id="init")
+
+        logger.info(f"   Checking for LLMOD_API_KEY: {'Found' if llmod_api_key else 'Not found'}")
+        logger.info(f"   Checking for OPENAI_API_KEY: {'Found' if openai_api_key else 'Not found'}")
+
+        try:
+            if llmod_api_key:
+                logger.info(f"   Using LLMod.ai with base_url: {llmod_base_url}")
+                self.client = OpenAI(
+                    api_key=llmod_api_key,
+                    base_url=llmod_base_url
+                )
+                self.model = os.getenv("LLMOD_MODEL") or os.getenv("LLM_MODEL") or "gpt-3.5-turbo"
+                logger.info(f"✅ Initialized LLMod.ai client with model: {self.model}")
+                debug_log("E", "llm_client.py:_initialize_client", "LLMod.ai client initialized", {"model": self.model, "base_url": llmod_base_url}, run_id="init")
+            elif openai_api_key:
+                logger.info("   Using OpenAI")
+                self.client = OpenAI(api_key=openai_api_key)
+                self.model = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+                logger.info(f"✅ Initialized OpenAI client with model: {self.model}")
+                debug_log("F", "llm_client.py:_initialize_client", "OpenAI client initialized", {"model": self.model}, run_id="init")
+            else:
+                logger.warning("⚠️ No LLM API key found. Set LLMOD_API_KEY or OPENAI_API_KEY in .env")
+                logger.warning("   LLM routing will be disabled, using fallback pattern matching")
+                debug_log("G", "llm_client.py:_initialize_client", "No API key found", {}, run_id="init")
+        except Exception as e:
+            logger.error(f"❌ Failed to initialize LLM client: {e}")
+            import traceback
+            logger.error(f"   Traceback: {traceback.format_exc()}")
+            debug_log("H", "llm_client.py:_initialize_client", "Initialization error", lambda: {"error": str(e), "error_type": type(e).__name__}, run_id="init")
+
+    async def route_task(
+        self,
+        user_prompt: str
+    ) -> Dict[str, Any]:
+        debug_log("I", "llm_client.py:route_task", "Route task called", lambda: {"user_prompt": user_prompt, "has_client": bool(self.client), "model": self.model}, run_id="route")
+
+        if not self.client:
+            logger.warning("⚠️ LLM client not available, falling back to pattern matching")
+            debug_log("J", "llm_client.py:route_task", "No LLM client available", {}, run_id="route")
+            return {"executor_name": None, "executor_params": {}, "error": "LLM client not initialized"}
+
+        if not self._routing_system_prompt:
+            logger.warning("⚠️ No executors registered for routing, falling back to pattern matching")
+            return {"executor_name": None, "executor_params": {}, "error": "No executors registered for routing"}
+
+        logger.info(f"🤖 Calling LLM with model: {self.model}")
+        logger.info(f"   User prompt: {user_prompt}")
+
+        routing_prompt = self._create_routing_prompt(user_prompt)
+
+        debug_log("K", "llm_client.py:route_task", "Before LLM call", lambda: {"model": self.model, "system_prompt_length": len(routing_prompt["system"]), "user_prompt_length": len(routing_prompt["user"])}, run_id="route")
+
+        try:
+            logger.info(f"   Sending request to LLM...")
+            import asyncio
+            loop = asyncio.get_event_loop()
+
+            # Determine temperature based on model
+            temperature_setting = 0.1
+            if self.model and "gpt-5" in self.model.lower():
+                temperature_setting = 1.0
+                logger.info(f"   Using temperature={temperature_setting} for gpt-5 model: {self.model}")
+
+            with trace_span("llm.route", model=self.model) as span:
+                response = await loop.run_in_executor(
+                    None,
+                    lambda: self.client.chat.completions.create(
+                        model=self.model,
+                        messages=[
+                            {
+                                "role": "system",
+                                "content": routing_prompt["system"]
+                            },
+                            {
+                                "role": "user",
+                                "content": routing_prompt["user"]
+                            }
+                        ],
+                        temperature=temperature_setting,
+                        response_format={"type": "json_object"}
+                    )
+                )
+                if span:
+                    span.attributes.update(_extract_usage(response))
+
+            debug_log("L", "llm_client.py:route_task", "LLM call succeeded", lambda: {"has_response": bool(response), "choices_count": len(response.choices) if response and hasattr(response, 'choices') else 0}, run_id="route")
+
+            llm_response = response.choices[0].message.content
+            logger.info(f"   LLM raw response: {llm_response[:200]}...")
+            usage = _extract_usage(response)
+
+            debug_log("M", "llm_client.py:route_task", "LLM response received", lambda: {"response_length": len(llm_response) if llm_response else 0, "response_preview": llm_response[:200] if llm_response else None}, run_id="route")
+
+            routing_result = json.loads(llm_response)
+
+            debug_log("N", "llm_client.py:route_task", "Routing result parsed", lambda: {"executor_name": routing_result.get("executor_name"), "params_keys": list(routing_result.get("executor_params", {}).keys()), "course_number": routing_result.get("executor_params", {}).get("course_number")}, run_id="route")
+
+            logger.info(f"✅ LLM routing result: executor={routing_result.get('executor_name')}, params={routing_result.get('executor_params')}")
+
+            _record_routing_usage(routing_result.get("executor_name"), usage)
+            if usage:
+                logger.info(f"   Routing tokens: prompt={usage['prompt_tokens']} (cached={usage['cached_prompt_tokens']}), completion={usage['completion_tokens']}")
+
+            return {
+                "executor_name": routing_result.get("executor_name"),
+                "executor_params": routing_result.get("executor_params", {}),
+                "llm_response": llm_response,
+                "reasoning": routing_result.get("reasoning", ""),
+                "usage": usage
+            }
+
+        except Exception as e:
+            error_str = str(e)
+            error_type = type(e).__name__
+
+            if "401" in error_str or "invalid_api_key" in error_str or "AuthenticationError" in error_type:
+                logger.error(f"❌ LLM Authentication Error: Invalid API key")
+                logger.error(f"   Please check your API key in .env file")
+                logger.error(f"   For LLMod.ai: Set LLMOD_API_KEY or LLM_API_KEY")
+                logger.error(f"   For OpenAI: Set OPENAI_API_KEY with a valid key")
+                logger.error(f"   Falling back to pattern matching...")
+            else:
+                logger.error(f"❌ Error in LLM routing: {e}")
+                import traceback
+                logger.error(f"Traceback: {traceback.format_exc()}")
+
+            debug_log("O", "llm_client.py:route_task", "LLM call error", {"error": error_str, "error_type": error_type, "is_auth_error": "401" in error_str or "invalid_api_key" in error_str}, run_id="route")
+            return {"executor_name": None, "executor_params": {}, "error": error_str}
+
+    def register_executors(self, executors: Dict[str, Any]) -> None:
+        """Build (or reuse) the routing system prompt for this set of executors"""
+        self._routing_system_prompt = _get_routing_system_prompt(executors)
+
+    def _create_routing_prompt(self, user_prompt: str) -> Dict[str, str]:
+        # The system prompt is static per executor set; only the user message varies,
+        # so the provider sees an identical prefix on every routing call.
         user_prompt_formatted = f"""User request: "{user_prompt}"
 
 Analyze this request and determine:
@@ -425,6 +492,6 @@ Analyze this request and determine:
 Return JSON response with executor_name and executor_params."""
 
         return {
-            "system": system_prompt,
+            "system": self._routing_system_prompt,
             "user": user_prompt_formatted
         }
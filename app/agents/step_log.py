@@ -0,0 +1,95 @@
+"""
+Step log shaping for /api/execute
+Executors put heavy, rarely-needed step payloads (full prompts, retrieved chunk texts, raw LLM
+output) behind lazy_detail(); they are only built when a client asks for verbosity="full".
+The default "summary" verbosity keeps each step's module and scalar fields, truncated.
+"""
+import json
+from typing import Any, Callable, Dict, List
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+VERBOSITY_SUMMARY = "summary"
+VERBOSITY_FULL = "full"
+VERBOSITY_LEVELS = (VERBOSITY_SUMMARY, VERBOSITY_FULL)
+
+# Summary limits
+_MAX_STRING = 200
+_MAX_LIST_ITEMS = 5
+_MAX_DEPTH = 3
+
+
+class LazyDetail:
+    """A step payload that is only materialized when serialized at full verbosity"""
+    __slots__ = ("_factory",)
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+
+    def resolve(self) -> Any:
+        return self._factory()
+
+
+def lazy_detail(factory: Callable[[], Any]) -> LazyDetail:
+    return LazyDetail(factory)
+
+
+def normalize_verbosity(value: Any) -> str:
+    value = str(value or "").strip().lower()
+    return value if value in VERBOSITY_LEVELS else VERBOSITY_SUMMARY
+
+
+def _summarize(value: Any, depth: int = 0) -> Any:
+    if isinstance(value, str):
+        return value if len(value) <= _MAX_STRING else value[:_MAX_STRING] + "…"
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    if depth >= _MAX_DEPTH:
+        if isinstance(value, dict):
+            return f"{{{len(value)} keys}}"
+        if isinstance(value, (list, tuple)):
+            return f"[{len(value)} items]"
+    if isinstance(value, dict):
+        return {k: _summarize(v, depth + 1) for k, v in value.items() if not isinstance(v, LazyDetail)}
+    if isinstance(value, (list, tuple)):
+        items = [_summarize(v, depth + 1) for v in value[:_MAX_LIST_ITEMS] if not isinstance(v, LazyDetail)]
+        if len(value) > _MAX_LIST_ITEMS:
+            items.append(f"… {len(value) - _MAX_LIST_ITEMS} more")
+        return items
+    if isinstance(value, LazyDetail):
+        return None
+    return type(value).__name__
+
+
+def shape_steps(steps: List[Dict[str, Any]], verbosity: str) -> List[Dict[str, Any]]:
+    """Trim steps for summary verbosity; full verbosity is resolved lazily at serialization"""
+    if verbosity == VERBOSITY_FULL:
+        return steps
+    return [
+        {
+            "module": step.get("module"),
+            "prompt": _summarize(step.get("prompt"), 1),
+            "response": _summarize(step.get("response"), 1),
+        }
+        for step in steps
+    ]
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, LazyDetail):
+        return obj.resolve()
+    if isinstance(obj, (set, tuple)):
+        return list(obj)
+    # Non-serializable objects (clients, executors) are reported by type name
+    return type(obj).__name__
+
+
+def dumps_compact(payload: Dict[str, Any]) -> bytes:
+    """Compact UTF-8 JSON; uses orjson when installed"""
+    if HAS_ORJSON:
+        return orjson.dumps(payload, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
@@ -20,30 +20,12 @@ from app.agents.executors.courses_retriever import CoursesRetriever
 from app.agents.executors.rag_chat import RAGChatExecutor
 from app.agents.executors.weekly_planner import WeeklyPlannerExecutor
 from app.agents.llm_client import LLMClient
+from app.tracing import trace_span
+from app.agents.step_log import lazy_detail
+from app.debug_log import debug_log
 
 logger = logging.getLogger(__name__)
 
-# Helper function for debug logging
-def _write_debug_log(session_id, run_id, hypothesis_id, location, message, data):
-    import json
-    import os as os_module
-    try:
-        log_dir = r'c:\DS\AcademicPlanner\ds_project\.cursor'
-        os_module.makedirs(log_dir, exist_ok=True)
-        log_file = os_module.path.join(log_dir, 'debug.log')
-        with open(log_file, 'a', encoding='utf-8') as f:
-            f.write(json.dumps({
-                "sessionId": session_id,
-                "runId": run_id,
-                "hypothesisId": hypothesis_id,
-                "location": location,
-                "message": message,
-                "data": data,
-                "timestamp": int(__import__('time').time()*1000)
-            })+'\n')
-    except Exception as log_err:
-        logger.warning(f"Failed to write debug log: {log_err}")
-
 
 class Supervisor:
     def __init__(self):
@@ -64,6 +46,7 @@ class Supervisor:
         }
         self.module_name = "supervisor"
         self.llm_client = LLMClient()
+        self.llm_client.register_executors(self.executors)
 
     async def route_task(
         self,
@@ -76,17 +59,20 @@ class Supervisor:
         try:
             # Use LLM for intelligent routing and parameter extraction
             # #region agent log
-            _write_debug_log("debug-session", "supervisor", "P", "supervisor.py:route_task", "Supervisor routing started", {"user_prompt": user_prompt, "has_llm_client": bool(self.llm_client), "llm_client_has_client": bool(self.llm_client.client) if self.llm_client else False, "llm_model": self.llm_client.model if self.llm_client else None})
+            debug_log("P", "supervisor.py:route_task", "Supervisor routing started", lambda: {"user_prompt": user_prompt, "has_llm_client": bool(self.llm_client), "llm_client_has_client": bool(self.llm_client.client) if self.llm_client else False, "llm_model": self.llm_client.model if self.llm_client else None}, run_id="supervisor")
             # #endregion
 
             logger.info(f"🔍 Routing task with LLM: {user_prompt}")
             logger.info(f"   LLM client initialized: {self.llm_client.client is not None}")
             logger.info(f"   LLM model: {self.llm_client.model}")
 
-            llm_routing_result = await self.llm_client.route_task(user_prompt)
+            with trace_span("supervisor.route") as span:
+                llm_routing_result = await self.llm_client.route_task(user_prompt)
+                if span:
+                    span.set_attribute("executor", llm_routing_result.get("executor_name") or "")
 
             # #region agent log
-            _write_debug_log("debug-session", "supervisor", "Q", "supervisor.py:route_task", "LLM routing result received", {"executor_name": llm_routing_result.get("executor_name"), "has_error": bool(llm_routing_result.get("error")), "error": llm_routing_result.get("error"), "params": llm_routing_result.get("executor_params",{})})
+            debug_log("Q", "supervisor.py:route_task", "LLM routing result received", lambda: {"executor_name": llm_routing_result.get("executor_name"), "has_error": bool(llm_routing_result.get("error")), "error": llm_routing_result.get("error"), "params": llm_routing_result.get("executor_params",{})}, run_id="supervisor")
             # #endregion
 
             logger.info(f"   LLM routing result: {llm_routing_result}")
@@ -108,8 +94,9 @@ class Supervisor:
                 "response": {
                     "executor": executor_name,
                     "params": executor_params,
-                    "llm_response": llm_response,
-                    "reasoning": llm_routing_result.get("reasoning")
+                    "llm_response": lazy_detail(lambda: llm_response),
+                    "reasoning": llm_routing_result.get("reasoning"),
+                    "usage": llm_routing_result.get("usage")
                 }
             })
 
@@ -117,7 +104,7 @@ class Supervisor:
             if not executor_name:
                 logger.warning("LLM routing failed, falling back to pattern matching")
                 # #region agent log
-                _write_debug_log("debug-session", "supervisor", "R", "supervisor.py:route_task", "Falling back to pattern matching", {})
+                debug_log("R", "supervisor.py:route_task", "Falling back to pattern matching", {}, run_id="supervisor")
                 # #endregion
                 executor_name, executor_params = self._fallback_pattern_matching(user_prompt)
 
@@ -163,7 +150,8 @@ class Supervisor:
                 else:
                     kwargs_clean = kwargs
                 
-                result = await executor.execute(user_id=user_id, **executor_params, **kwargs_clean)
+                with trace_span(f"executor.{executor_name}"):
+                    result = await executor.execute(user_id=user_id, **executor_params, **kwargs_clean)
 
                 # RAG executor returns its own internal steps (rag_retrieval, rag_answer_generator)
                 # We need to add both: the executor step (like other executors) AND the internal steps
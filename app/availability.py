@@ -0,0 +1,216 @@
+"""
+Per-user weekly availability snapshots
+One row per (user, week) in user_weekly_availability holds the user's busy intervals for that
+week, already parsed from `constraints`, `weekly_constraints`, `semester_schedule_items` and the
+user's `weekly_plan_blocks`. Consumers read the snapshot instead of re-querying and re-parsing
+those tables. Triggers (USER_AVAILABILITY_SNAPSHOT.sql) delete a snapshot whenever one of its
+inputs changes; the next read rebuilds it. Rebuilt snapshots are stored with the
+store_availability_snapshots RPC, which skips users whose inputs changed while the snapshot was
+being built (app/input_versions.py), so a concurrent write never leaves a stale snapshot behind.
+
+Interval format (minutes from midnight, end exclusive):
+    {"day": 0-6, "start": 600, "end": 720, "kind": "constraint" | "weekly_constraint" | "semester" | "block",
+     "hard": bool, "label": str, plus course_number/work_type/block_id for blocks and item_type for
+     semester items}
+"""
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from app.input_versions import is_missing_relation, read_input_versions
+from app.intervals import parse_days, to_minutes
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_TABLE = "user_weekly_availability"
+
+# Kinds that make a slot unavailable for planning (blocks are the plan itself)
+CONSTRAINT_KINDS = ("constraint", "weekly_constraint", "semester")
+
+# Set to False if USER_AVAILABILITY_SNAPSHOT.sql is not installed
+_snapshot_table_available = True
+_store_rpc_available = True
+# Max ids per in_() filter
+_BATCH_SIZE = 200
+
+
+def _interval(day, row: Dict[str, Any], kind: str, hard: bool, label: str, **extra) -> Optional[Dict[str, Any]]:
+    start, end = to_minutes(row.get("start_time")), to_minutes(row.get("end_time"))
+    if end <= start:
+        return None
+    try:
+        day = int(day)
+    except (TypeError, ValueError):
+        return None
+    return {"day": day, "start": start, "end": end, "kind": kind, "hard": hard, "label": label, **extra}
+
+
+def _build_snapshots(client, user_ids: List[str], week_start: str) -> Dict[str, Dict[str, Any]]:
+    """Compute snapshots from the raw tables with one query per table for all users"""
+    intervals: Dict[str, List[Dict[str, Any]]] = {uid: [] for uid in user_ids}
+
+    def fetch(table: str, columns: str, **filters) -> List[Dict[str, Any]]:
+        rows = []
+        for i in range(0, len(user_ids), _BATCH_SIZE):
+            query = client.table(table).select(columns).in_("user_id", user_ids[i:i + _BATCH_SIZE])
+            for column, value in filters.items():
+                query = query.eq(column, value)
+            rows.extend(query.execute().data or [])
+        return rows
+
+    for c in fetch("constraints", "*"):
+        for day in parse_days(c.get("days")):
+            item = _interval(day, c, "constraint", c.get("is_hard", True) is not False, c.get("title") or "Permanent constraint")
+            if item:
+                intervals[c["user_id"]].append(item)
+
+    for c in fetch("weekly_constraints", "*", week_start=week_start):
+        for day in parse_days(c.get("days")):
+            item = _interval(day, c, "weekly_constraint", c.get("is_hard", True) is not False, c.get("title") or "Weekly constraint")
+            if item:
+                intervals[c["user_id"]].append(item)
+
+    try:
+        for s in fetch("semester_schedule_items", "*"):
+            for day in parse_days(s.get("days", [])):
+                item = _interval(day, s, "semester", True, s.get("course_name") or "Semester item", item_type=s.get("type") or "class")
+                if item:
+                    intervals[s["user_id"]].append(item)
+    except Exception as e:
+        # Table may not exist yet
+        logger.warning(f"Could not load semester schedule items for availability: {e}")
+
+    plans = fetch("weekly_plans", "id, user_id", week_start=week_start)
+    plan_owner = {p["id"]: p["user_id"] for p in plans}
+    plan_ids = list(plan_owner)
+    for i in range(0, len(plan_ids), _BATCH_SIZE):
+        blocks = client.table("weekly_plan_blocks").select(
+            "id, plan_id, day_of_week, start_time, end_time, work_type, course_number, course_name"
+        ).in_("plan_id", plan_ids[i:i + _BATCH_SIZE]).execute().data or []
+        for b in blocks:
+            item = _interval(
+                b.get("day_of_week"), b, "block", True, b.get("course_name") or b.get("course_number") or "Block",
+                course_number=b.get("course_number"), work_type=b.get("work_type"), block_id=b.get("id"),
+            )
+            if item:
+                intervals[plan_owner[b["plan_id"]]].append(item)
+
+    for items in intervals.values():
+        items.sort(key=lambda x: (x["day"], x["start"], x["end"]))
+    return {uid: {"user_id": uid, "week_start": week_start, "intervals": items} for uid, items in intervals.items()}
+
+
+def get_users_availability(client, user_ids: Iterable[str], week_start: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Snapshots for many users in O(1) round trips: one read of the snapshot table, and for users
+    without a snapshot one read of their input versions, one query per source table and one
+    store RPC.
+    """
+    global _snapshot_table_available, _store_rpc_available
+    user_ids = [uid for uid in dict.fromkeys(user_ids) if uid]
+    if not user_ids:
+        return {}
+
+    snapshots: Dict[str, Dict[str, Any]] = {}
+    if _snapshot_table_available:
+        try:
+            for i in range(0, len(user_ids), _BATCH_SIZE):
+                rows = client.table(SNAPSHOT_TABLE).select("user_id, week_start, intervals").eq(
+                    "week_start", week_start
+                ).in_("user_id", user_ids[i:i + _BATCH_SIZE]).execute().data or []
+                for row in rows:
+                    snapshots[row["user_id"]] = {"user_id": row["user_id"], "week_start": week_start, "intervals": row.get("intervals") or []}
+        except Exception as e:
+            if is_missing_relation(e, SNAPSHOT_TABLE):
+                _snapshot_table_available = False
+                logger.info(f"Availability snapshot table not available, computing from raw tables: {e}")
+            else:
+                logger.warning(f"Could not read availability snapshots, computing from raw tables: {e}")
+
+    missing = [uid for uid in user_ids if uid not in snapshots]
+    if missing:
+        # Versions are read before the sources: a write after this point makes the store skip the user
+        versions = read_input_versions(client, missing) if _snapshot_table_available and _store_rpc_available else None
+        built = _build_snapshots(client, missing, week_start)
+        snapshots.update(built)
+        if versions is not None:
+            try:
+                client.rpc("store_availability_snapshots", {
+                    "p_week_start": week_start,
+                    "p_rows": [{"user_id": uid, "intervals": snap["intervals"], "version": versions[uid]} for uid, snap in built.items()],
+                }).execute()
+            except Exception as e:
+                if is_missing_relation(e, "store_availability_snapshots"):
+                    _store_rpc_available = False
+                    logger.info("store_availability_snapshots RPC not installed - snapshots are not stored")
+                else:
+                    logger.warning(f"Could not store availability snapshots: {e}")
+    return snapshots
+
+
+def get_user_availability(client, user_id: str, week_start: str) -> Dict[str, Any]:
+    return get_users_availability(client, [user_id], week_start).get(
+        user_id, {"user_id": user_id, "week_start": week_start, "intervals": []}
+    )
+
+
+def invalidate_availability(client, user_id: str, week_start: Optional[str] = None) -> None:
+    """Drop snapshots for a user (one week or all); only needed where triggers are not installed"""
+    if not _snapshot_table_available:
+        return
+    try:
+        query = client.table(SNAPSHOT_TABLE).delete().eq("user_id", user_id)
+        if week_start:
+            query = query.eq("week_start", week_start)
+        query.execute()
+    except Exception as e:
+        logger.warning(f"Could not invalidate availability snapshot for {user_id}: {e}")
+
+
+def blocked_slots(
+    snapshot: Dict[str, Any],
+    time_slots: List[str],
+    kinds: Tuple[str, ...] = CONSTRAINT_KINDS,
+    hard: Optional[bool] = True,
+) -> Set[Tuple[int, str]]:
+    """
+    (day, slot_start) pairs covered by intervals of the given kinds, using the planner's slot rule:
+    a slot is blocked when its start time falls inside [start, end).
+    hard=True/False filters by hardness; hard=None takes both.
+    """
+    slot_minutes = [(t, to_minutes(t)) for t in time_slots]
+    result = set()
+    for item in snapshot.get("intervals") or []:
+        if item.get("kind") not in kinds:
+            continue
+        if hard is not None and bool(item.get("hard", True)) != hard:
+            continue
+        for t, m in slot_minutes:
+            if item["start"] <= m < item["end"]:
+                result.add((item["day"], t))
+    return result
+
+
+def planning_blocked_slots(snapshot: Dict[str, Any], time_slots: List[str]) -> Tuple[Set[Tuple[int, str]], Set[Tuple[int, str]]]:
+    """
+    Planner semantics: (blocked, soft_blocked). Permanent constraints and semester items always
+    block; weekly constraints block when hard and are soft preferences otherwise.
+    """
+    blocked = blocked_slots(snapshot, time_slots, kinds=("constraint", "semester"), hard=None)
+    blocked |= blocked_slots(snapshot, time_slots, kinds=("weekly_constraint",), hard=True)
+    soft_blocked = blocked_slots(snapshot, time_slots, kinds=("weekly_constraint",), hard=False)
+    return blocked, soft_blocked
+
+
+def overlapping_intervals(
+    snapshot: Dict[str, Any],
+    day_of_week: int,
+    start_time: str,
+    end_time: str,
+    kinds: Tuple[str, ...] = CONSTRAINT_KINDS + ("block",),
+) -> List[Dict[str, Any]]:
+    """Intervals of the given kinds that overlap [start_time, end_time) on day_of_week"""
+    start, end = to_minutes(start_time), to_minutes(end_time)
+    return [
+        item for item in (snapshot.get("intervals") or [])
+        if item.get("kind") in kinds and item["day"] == int(day_of_week) and item["start"] < end and item["end"] > start
+    ]
@@ -0,0 +1,188 @@
+"""
+Process-wide course catalog index
+course_catalog is reference data (imported offline, never written by the app), so instead of
+re-reading the whole table or running ilike('%name%') per request, the rows are loaded once per
+process and refreshed after COURSE_CATALOG_TTL_SECONDS:
+
+- by_number / by_id: O(1) dict lookups (course_name_for(), CatalogIndex.get())
+- find_course(): name -> course for free text from the agent or the user, in three steps:
+    1. exact match of the normalized name
+    2. the query as a whole-word sequence inside a name (the direction of the old
+       ilike('%name%')); the name the query covers the most of wins
+    3. trigram similarity (pg_trgm style: words padded, shared / union) over an inverted
+       trigram -> rows index, so only rows sharing a trigram with the query are scored.
+       Names whose numbers differ from the query's are never fuzzy hits ("פיזיקה 2" is not
+       "פיזיקה 1"), and with min_margin the best score must beat the runner-up by that much
+  Callers that write under the resolved course pass min_margin=COURSE_MATCH_MIN_MARGIN, which
+  also refuses a step-2 match that several names share equally.
+  Normalization casefolds, strips Hebrew niqqud / cantillation marks, folds Hebrew final letters
+  (ם -> מ, ...) and turns punctuation (quotes of acronyms like מדמ"ח, dashes) into spaces, so
+  Hebrew and English names match regardless of spelling details.
+
+Rows are shared between callers: do not mutate them. If a refresh fails, the previous index is
+kept and the load is retried on the next call.
+"""
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+COURSE_CATALOG_TTL_SECONDS = float(os.getenv("COURSE_CATALOG_TTL_SECONDS", "600"))
+# Minimal trigram similarity for a fuzzy name match (0..1)
+COURSE_MATCH_MIN_SIMILARITY = float(os.getenv("COURSE_MATCH_MIN_SIMILARITY", "0.35"))
+# Lead of the best fuzzy score over the second best required on write paths
+COURSE_MATCH_MIN_MARGIN = float(os.getenv("COURSE_MATCH_MIN_MARGIN", "0.1"))
+
+_HEBREW_FINALS = str.maketrans("ךםןףץ", "כמנפצ")
+_NON_WORD = re.compile(r"[\W_]+")
+_NUMBER = re.compile(r"\d+")
+
+
+def normalize_name(value: Optional[str]) -> str:
+    """Comparable form of a course name: casefolded, no niqqud, final letters folded, single spaces"""
+    if not value:
+        return ""
+    text = unicodedata.normalize("NFKD", str(value).casefold())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = text.translate(_HEBREW_FINALS)
+    return _NON_WORD.sub(" ", text).strip()
+
+
+def _numbers(normalized: str) -> Tuple[str, ...]:
+    return tuple(sorted(n.lstrip("0") or "0" for n in _NUMBER.findall(normalized)))
+
+
+def trigrams(normalized: str) -> FrozenSet[str]:
+    grams = set()
+    for word in normalized.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(grams)
+
+
+class CatalogIndex:
+    def __init__(self, rows: List[Dict[str, Any]]):
+        self.courses = sorted(rows, key=lambda c: str(c.get("course_number") or ""))
+        self.by_number: Dict[str, Dict[str, Any]] = {}
+        self.by_id: Dict[Any, Dict[str, Any]] = {}
+        self._names: List[str] = []
+        self._grams: List[FrozenSet[str]] = []
+        self._numbers: List[Tuple[str, ...]] = []
+        self._by_name: Dict[str, int] = {}
+        self._by_gram: Dict[str, List[int]] = {}
+        for course in self.courses:
+            number = str(course.get("course_number") or "").strip()
+            if number:
+                self.by_number[number] = course
+            if course.get("id") is not None:
+                self.by_id[course["id"]] = course
+            name = normalize_name(course.get("course_name"))
+            i = len(self._names)
+            self._names.append(name)
+            self._grams.append(trigrams(name))
+            self._numbers.append(_numbers(name))
+            if name:
+                self._by_name.setdefault(name, i)
+            for gram in self._grams[i]:
+                self._by_gram.setdefault(gram, []).append(i)
+
+    def get(self, course_number: Any) -> Optional[Dict[str, Any]]:
+        if course_number is None:
+            return None
+        return self.by_number.get(str(course_number).strip())
+
+    def name_for(self, course_number: Any) -> Optional[str]:
+        course = self.get(course_number)
+        return course.get("course_name") if course else None
+
+    def name_map(self) -> Dict[str, str]:
+        """course_number -> course_name for every catalog course"""
+        return {number: c.get("course_name") for number, c in self.by_number.items()}
+
+    def find(
+        self,
+        name: Optional[str],
+        min_similarity: float = COURSE_MATCH_MIN_SIMILARITY,
+        min_margin: float = 0.0,
+    ) -> Optional[Dict[str, Any]]:
+        query = normalize_name(name)
+        if not query:
+            return None
+        exact = self._by_name.get(query)
+        if exact is not None:
+            return self.courses[exact]
+
+        padded = f" {query} "
+        contained = [i for i, n in enumerate(self._names) if n and padded in f" {n} "]
+        if contained:
+            # Fewest extra words: the query covers the largest part of the name
+            ranked = sorted(contained, key=lambda i: (len(self._names[i].split()), i))
+            if min_margin > 0 and len(ranked) > 1 and len(self._names[ranked[0]].split()) == len(self._names[ranked[1]].split()):
+                return None
+            return self.courses[ranked[0]]
+
+        query_grams = trigrams(query)
+        query_numbers = _numbers(query)
+        shared = Counter(i for gram in query_grams for i in self._by_gram.get(gram, ()))
+        best, best_score, runner_up = None, 0.0, 0.0
+        for i, common in shared.items():
+            if self._numbers[i] != query_numbers:
+                continue
+            score = common / (len(query_grams) + len(self._grams[i]) - common)
+            if score > best_score:
+                best, best_score, runner_up = i, score, best_score
+            elif score > runner_up:
+                runner_up = score
+        if best is None or best_score < min_similarity or best_score - runner_up < min_margin:
+            return None
+        return self.courses[best]
+
+
+_index: Optional[CatalogIndex] = None
+_expires_at = 0.0
+_lock = threading.Lock()
+
+
+def get_catalog(client) -> CatalogIndex:
+    """The catalog index, (re)loaded with one query when missing or older than the TTL"""
+    global _index, _expires_at
+    index = _index
+    if index is not None and time.monotonic() < _expires_at:
+        return index
+    with _lock:
+        # Another thread may have loaded it while we waited
+        if _index is not None and time.monotonic() < _expires_at:
+            return _index
+        try:
+            result = client.table("course_catalog").select("*").execute()
+        except Exception as e:
+            if _index is None:
+                raise
+            logger.warning(f"⚠️ [CATALOG] Refresh failed, keeping {len(_index.courses)} cached courses: {e}")
+            _expires_at = time.monotonic() + min(COURSE_CATALOG_TTL_SECONDS, 30)
+            return _index
+        _index = CatalogIndex(result.data or [])
+        _expires_at = time.monotonic() + COURSE_CATALOG_TTL_SECONDS
+        logger.info(f"📚 [CATALOG] Indexed {len(_index.courses)} courses")
+        return _index
+
+
+def invalidate_catalog() -> None:
+    """Force a reload on the next get_catalog() (e.g. after a catalog import)"""
+    global _expires_at
+    with _lock:
+        _expires_at = 0.0
+
+
+def course_name_for(client, course_number: Any) -> Optional[str]:
+    return get_catalog(client).name_for(course_number)
+
+
+def find_course(client, name: Optional[str], min_margin: float = 0.0) -> Optional[Dict[str, Any]]:
+    return get_catalog(client).find(name, min_margin=min_margin)
@@ -0,0 +1,152 @@
+"""
+Non-blocking debug log sink
+Structured debug events (hypothesis id, location, message, data) are put on a bounded queue
+and written by a background thread, so call sites on the event loop never touch the disk.
+
+Configuration (env):
+- DEBUG_LOG_ENABLED: "1"/"true" to record events (default: off, every call returns immediately)
+- DEBUG_LOG_SINK: file path for JSON lines, or "logging" to forward to the app.debug logger
+  (default: <project>/.cursor/debug.log)
+- DEBUG_LOG_SAMPLE_RATE: fraction of events to keep, 0.0-1.0 (default: 1.0)
+- DEBUG_LOG_QUEUE_SIZE: max pending events; extra events are dropped and counted (default: 10000)
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+_PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+DEBUG_LOG_ENABLED = os.getenv("DEBUG_LOG_ENABLED", "").strip().lower() in ("1", "true", "yes", "on")
+DEBUG_LOG_SINK = os.getenv("DEBUG_LOG_SINK", str(_PROJECT_ROOT / ".cursor" / "debug.log"))
+DEBUG_LOG_SAMPLE_RATE = float(os.getenv("DEBUG_LOG_SAMPLE_RATE", "1.0"))
+DEBUG_LOG_QUEUE_SIZE = int(os.getenv("DEBUG_LOG_QUEUE_SIZE", "10000"))
+
+_queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=DEBUG_LOG_QUEUE_SIZE)
+_writer: Optional[threading.Thread] = None
+_writer_lock = threading.Lock()
+_dropped = 0
+
+DebugData = Union[Dict[str, Any], Callable[[], Dict[str, Any]], None]
+
+
+def debug_log_enabled() -> bool:
+    """True when debug events are recorded; use to skip work that only feeds the debug log"""
+    return DEBUG_LOG_ENABLED
+
+
+def set_debug_log_enabled(enabled: bool) -> None:
+    """Runtime switch (e.g. from an admin endpoint or tests)"""
+    global DEBUG_LOG_ENABLED
+    DEBUG_LOG_ENABLED = enabled
+
+
+def debug_log(
+    hypothesis_id: str,
+    location: str,
+    message: str,
+    data: DebugData = None,
+    session_id: str = "debug-session",
+    run_id: str = "run1",
+) -> None:
+    """
+    Record a debug event without blocking. `data` may be a zero-argument callable so that
+    expensive payloads are only built for events that are actually kept.
+    """
+    global _dropped
+    if not DEBUG_LOG_ENABLED:
+        return
+    if DEBUG_LOG_SAMPLE_RATE < 1.0 and random.random() >= DEBUG_LOG_SAMPLE_RATE:
+        return
+    if callable(data):
+        try:
+            data = data()
+        except Exception as e:
+            data = {"debug_data_error": str(e)}
+    event = {
+        "sessionId": session_id,
+        "runId": run_id,
+        "hypothesisId": hypothesis_id,
+        "location": location,
+        "message": message,
+        "data": data,
+        "timestamp": int(time.time() * 1000),
+    }
+    _ensure_writer()
+    try:
+        _queue.put_nowait(event)
+    except queue.Full:
+        _dropped += 1
+
+
+def _ensure_writer() -> None:
+    global _writer
+    if _writer is not None:
+        return
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_drain, name="debug-log-writer", daemon=True)
+            _writer.start()
+
+
+def _drain() -> None:
+    debug_logger = logging.getLogger("app.debug")
+    while True:
+        event = _queue.get()
+        if event is None:
+            return
+        batch = [event]
+        # Write whatever else is already pending in the same open/append
+        while len(batch) < 500:
+            try:
+                event = _queue.get_nowait()
+            except queue.Empty:
+                break
+            if event is None:
+                _write(batch, debug_logger)
+                return
+            batch.append(event)
+        _write(batch, debug_logger)
+
+
+def _write(batch, debug_logger: logging.Logger) -> None:
+    global _dropped
+    try:
+        lines = [json.dumps(event, ensure_ascii=False, default=str) for event in batch]
+        if _dropped:
+            lines.append(json.dumps({"message": "debug events dropped (queue full)", "count": _dropped, "timestamp": int(time.time() * 1000)}))
+            _dropped = 0
+        if DEBUG_LOG_SINK == "logging":
+            for line in lines:
+                debug_logger.debug(line)
+            return
+        os.makedirs(os.path.dirname(DEBUG_LOG_SINK) or ".", exist_ok=True)
+        with open(DEBUG_LOG_SINK, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+    except Exception as e:
+        logger.warning(f"Failed to write debug log: {e}")
+
+
+def flush_debug_log(timeout: float = 2.0) -> None:
+    """Stop the writer after draining pending events (called at interpreter exit)"""
+    global _writer
+    writer = _writer
+    if writer is None:
+        return
+    try:
+        _queue.put(None, timeout=timeout)
+    except queue.Full:
+        return
+    writer.join(timeout)
+    _writer = None
+
+
+atexit.register(flush_debug_log)
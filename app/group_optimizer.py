@@ -0,0 +1,250 @@
+"""
+Joint placement of group study blocks for one week
+Places every group's weekly quota at once instead of one group at a time in table order.
+Groups are nodes of a conflict graph (an edge when two groups share a member); a slot can be
+used by at most one group per member, so placement is a colouring of group-hours with slots.
+
+1. Greedy: most constrained groups first (least slack between common free hours and quota).
+   Each session is put where it removes the fewest free hours from unplaced neighbour groups,
+   spread over different days and preferring `session_hours` consecutive slots.
+2. Local search: for groups still short of their quota, move a conflicting neighbour session
+   to another slot when that neighbour can be re-placed, then place the freed slot.
+
+Availability is held as one int bitmask per user (7 days x len(time_slots) bits), so a group's
+common free slots are a few ORs; thousands of groups run in well under a second.
+"""
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+
+def _popcount(mask: int) -> int:
+    return bin(mask).count("1")
+
+
+class _Grid:
+    """Bit layout: bit (day * slots_per_day + slot_index) for each (day, time) slot"""
+
+    def __init__(self, time_slots: List[str], days: int = 7):
+        self.time_slots = list(time_slots)
+        self.per_day = len(self.time_slots)
+        self.days = days
+        self.full = (1 << (days * self.per_day)) - 1
+        self.slot_index = {t: i for i, t in enumerate(self.time_slots)}
+        self._sessions: Dict[int, List[Tuple[int, int, int]]] = {}
+
+    def bit(self, day: int, time_str: str) -> int:
+        i = self.slot_index.get(time_str)
+        if i is None or not 0 <= day < self.days:
+            return 0
+        return 1 << (day * self.per_day + i)
+
+    def mask(self, slots) -> int:
+        m = 0
+        for day, t in slots:
+            m |= self.bit(day, t)
+        return m
+
+    def sessions(self, length: int) -> List[Tuple[int, int, int]]:
+        """(day, first_slot_index, mask) for every run of `length` consecutive slots within a day"""
+        if length not in self._sessions:
+            run = (1 << length) - 1
+            self._sessions[length] = [
+                (day, i, run << (day * self.per_day + i))
+                for day in range(self.days)
+                for i in range(self.per_day - length + 1)
+            ]
+        return self._sessions[length]
+
+    def slots(self, mask: int) -> List[Tuple[int, str]]:
+        out = []
+        for day in range(self.days):
+            for i, t in enumerate(self.time_slots):
+                if mask >> (day * self.per_day + i) & 1:
+                    out.append((day, t))
+        return out
+
+
+def plan_group_blocks(
+    groups: List[Dict[str, Any]],
+    blocked_slots: Dict[str, Set[Tuple[int, str]]],
+    time_slots: List[str],
+    session_hours: int = 2,
+    max_moves: Optional[int] = None,
+) -> Tuple[Dict[str, List[Tuple[int, str]]], Dict[str, Any]]:
+    """
+    Place all groups jointly.
+
+    Args:
+        groups: [{"group_id", "member_ids", "quota"}] with quota in hours (one slot = one hour)
+        blocked_slots: user_id -> {(day, "HH:MM")} already unavailable (not modified)
+        time_slots: the planner's hourly slots (see _build_time_slots)
+        session_hours: preferred consecutive hours per session; shorter runs fill the remainder
+        max_moves: cap on local-search relocations (default: 4 per group)
+
+    Returns:
+        (assignments, stats): group_id -> sorted [(day, "HH:MM")], and
+        {"groups", "requested_hours", "placed_hours", "unplaced_hours", "moves", "elapsed_ms"}
+    """
+    started = time.perf_counter()
+    grid = _Grid(time_slots)
+    session_hours = max(1, min(session_hours, grid.per_day))
+
+    hard: Dict[str, int] = {}
+    for g in groups:
+        for uid in g["member_ids"]:
+            if uid not in hard:
+                hard[uid] = grid.mask(blocked_slots.get(uid, ()))
+    placed: Dict[str, int] = {uid: 0 for uid in hard}
+
+    # Conflict graph: groups sharing at least one member
+    user_groups: Dict[str, List[str]] = {}
+    for g in groups:
+        for uid in g["member_ids"]:
+            user_groups.setdefault(uid, []).append(g["group_id"])
+    by_id = {g["group_id"]: g for g in groups}
+    neighbours = {
+        gid: sorted({h for uid in g["member_ids"] for h in user_groups[uid]} - {gid})
+        for gid, g in by_id.items()
+    }
+
+    # group_id -> list of session masks placed for it
+    sessions: Dict[str, List[int]] = {gid: [] for gid in by_id}
+
+    def hard_free(gid: str) -> int:
+        m = 0
+        for uid in by_id[gid]["member_ids"]:
+            m |= hard[uid]
+        return grid.full & ~m
+
+    def free(gid: str) -> int:
+        m = 0
+        for uid in by_id[gid]["member_ids"]:
+            m |= hard[uid] | placed[uid]
+        return grid.full & ~m
+
+    def placed_hours(gid: str) -> int:
+        return sum(_popcount(s) for s in sessions[gid])
+
+    def need(gid: str) -> int:
+        return max(0, int(by_id[gid].get("quota") or 0) - placed_hours(gid))
+
+    def commit(gid: str, mask: int) -> None:
+        sessions[gid].append(mask)
+        for uid in by_id[gid]["member_ids"]:
+            placed[uid] |= mask
+
+    def release(gid: str, mask: int) -> None:
+        sessions[gid].remove(mask)
+        for uid in by_id[gid]["member_ids"]:
+            placed[uid] &= ~mask
+
+    def used_days(gid: str) -> Set[int]:
+        return {((s & -s).bit_length() - 1) // grid.per_day for s in sessions[gid]}
+
+    def best_session(gid: str, free_mask: int, pending: Set[str]) -> Optional[int]:
+        """Cheapest session that fits free_mask; pressure = free hours taken from pending neighbours"""
+        remaining = need(gid)
+        days = used_days(gid)
+        weights = []
+        for h in neighbours[gid]:
+            if h in pending:
+                f = free(h)
+                weights.append((f, 1.0 / (1 + max(0, _popcount(f) - need(h)))))
+        for length in range(min(session_hours, remaining), 0, -1):
+            best = None
+            for day, i, mask in grid.sessions(length):
+                if mask & free_mask != mask:
+                    continue
+                pressure = sum(_popcount(mask & f) * w for f, w in weights)
+                key = (day in days, pressure, day, i)
+                if best is None or key < best[0]:
+                    best = (key, mask)
+            if best:
+                return best[1]
+        return None
+
+    def best_session_of_length(gid: str, length: int, free_mask: int) -> Optional[int]:
+        days = used_days(gid)
+        best = None
+        for day, i, mask in grid.sessions(length):
+            if mask & free_mask == mask:
+                key = (day in days, day, i)
+                if best is None or key < best[0]:
+                    best = (key, mask)
+        return best[1] if best else None
+
+    # 1. Greedy, most constrained first (deterministic order)
+    order = sorted(
+        by_id,
+        key=lambda gid: (_popcount(hard_free(gid)) - need(gid), -len(neighbours[gid]), str(gid)),
+    )
+    pending = set(order)
+    for gid in order:
+        pending.discard(gid)
+        while need(gid) > 0:
+            mask = best_session(gid, free(gid), pending)
+            if mask is None:
+                break
+            commit(gid, mask)
+
+    # 2. Local search: free a slot for a short group by relocating one neighbour session
+    moves = 0
+    move_budget = max_moves if max_moves is not None else 4 * len(by_id)
+    improved = True
+    while improved and moves < move_budget:
+        improved = False
+        for gid in order:
+            if need(gid) == 0 or moves >= move_budget:
+                continue
+            base = hard_free(gid)
+            length = min(session_hours, need(gid))
+            for day, i, mask in grid.sessions(length) + (grid.sessions(1) if length > 1 else []):
+                if mask & base != mask or mask & free(gid) == mask:
+                    continue
+                # Neighbour sessions blocking this candidate
+                blockers = [(h, s) for h in neighbours[gid] for s in sessions[h] if s & mask]
+                if not blockers or len(blockers) > 2:
+                    continue
+                for h, s in blockers:
+                    release(h, s)
+                if mask & free(gid) != mask:
+                    for h, s in blockers:
+                        commit(h, s)
+                    continue
+                commit(gid, mask)
+                relocated = []
+                for h, s in blockers:
+                    new = best_session_of_length(h, _popcount(s), free(h) & ~s)
+                    if new is None:
+                        break
+                    commit(h, new)
+                    relocated.append((h, new))
+                if len(relocated) == len(blockers):
+                    moves += 1
+                    improved = True
+                    break
+                # Revert
+                for h, new in relocated:
+                    release(h, new)
+                release(gid, mask)
+                for h, s in blockers:
+                    commit(h, s)
+
+    assignments = {}
+    requested = placed_total = 0
+    for gid, g in by_id.items():
+        mask = 0
+        for s in sessions[gid]:
+            mask |= s
+        assignments[gid] = grid.slots(mask)
+        requested += int(g.get("quota") or 0)
+        placed_total += _popcount(mask)
+    stats = {
+        "groups": len(by_id),
+        "requested_hours": requested,
+        "placed_hours": placed_total,
+        "unplaced_hours": requested - placed_total,
+        "moves": moves,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+    return assignments, stats
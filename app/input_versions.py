@@ -0,0 +1,62 @@
+"""
+Per-user input versions for the derived per-week rows (see USER_AVAILABILITY_SNAPSHOT.sql)
+Availability snapshots (app/availability.py) are built from several tables with separate reads
+and stored afterwards. A write that lands between the reads and the store would otherwise be
+lost: its trigger finds no row to delete, and the stale row is then stored and kept until the
+next change. So the invalidation triggers also bump user_input_versions.version of every user
+whose inputs change, and builders:
+
+1. read_input_versions() for their users before the first source read
+2. build the rows
+3. store them through an RPC that writes a user's row only if that user's version is still
+   the one read in step 1 (it locks the version rows first, so a write that is still in flight
+   is waited for and then seen)
+
+A user with no version row is at version 0.
+"""
+import logging
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+INPUT_VERSIONS_TABLE = "user_input_versions"
+
+# Set to False if the version table is not installed (nothing is stored without the guard)
+_input_versions_available = True
+# Max ids per in_() filter
+_BATCH_SIZE = 200
+
+
+def is_missing_relation(err: Exception, name: str) -> bool:
+    """True for 'table / function does not exist' errors about `name` (not for network errors, timeouts, ...)"""
+    text = str(err)
+    if name not in text:
+        return False
+    return any(code in text for code in ("42P01", "PGRST205", "PGRST202", "42883", "does not exist", "Could not find"))
+
+
+def read_input_versions(client, user_ids: Iterable[str]) -> Optional[Dict[str, int]]:
+    """
+    user_id -> version for the given users (0 for users without a row).
+    None if the versions could not be read: the caller must not store what it builds.
+    """
+    global _input_versions_available
+    if not _input_versions_available:
+        return None
+    user_ids = [uid for uid in dict.fromkeys(user_ids) if uid]
+    versions = {uid: 0 for uid in user_ids}
+    try:
+        for i in range(0, len(user_ids), _BATCH_SIZE):
+            rows = client.table(INPUT_VERSIONS_TABLE).select("user_id, version").in_(
+                "user_id", user_ids[i:i + _BATCH_SIZE]
+            ).execute().data or []
+            for row in rows:
+                versions[row["user_id"]] = int(row.get("version") or 0)
+    except Exception as e:
+        if is_missing_relation(e, INPUT_VERSIONS_TABLE):
+            _input_versions_available = False
+            logger.info("ℹ️ user_input_versions not installed - derived schedule rows are not stored")
+        else:
+            logger.warning(f"⚠️ Could not read input versions, not storing this build: {e}")
+        return None
+    return versions
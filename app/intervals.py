@@ -0,0 +1,130 @@
+"""
+Interval normalization for schedule formatting
+Blocks carry "HH:MM" / "HH:MM:SS" strings; everything here parses each time once into integer
+minutes since midnight and then sorts / merges plain int tuples:
+
+- to_minutes() / to_hhmm(): conversions (parsing is memoized, there are few distinct times)
+- parse_days(): the `days` column of constraints / semester items (JSON list, "1,3" or a list)
+- merge_ranges(): union of (start, end) minute ranges
+- merge_blocks(): dedup + merge of back-to-back blocks with the same key (course, work type, day,
+  and week for multi-week views) in one sort over all blocks
+- day_range_lines(): "<day> 10:00-12:00, 14:00-15:00" lines for group update messages
+
+merge_blocks() is a single O(n log n) pass, so a semester of blocks is merged as cheaply per
+block as one week.
+"""
+import json
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+DAY_NAMES_HEBREW = ["ראשון", "שני", "שלישי", "רביעי", "חמישי", "שישי", "שבת"]
+
+# Blocks are merged only within the same (week, day, course, work type)
+BLOCK_MERGE_KEY = ("week_start", "day_of_week", "course_number", "work_type")
+
+
+@lru_cache(maxsize=4096)
+def _parse(value: str) -> int:
+    parts = value.split(":")
+    try:
+        return int(parts[0]) * 60 + (int(parts[1]) if len(parts) > 1 else 0)
+    except ValueError:
+        return 0
+
+
+def to_minutes(value: Optional[str]) -> int:
+    """'HH:MM' or 'HH:MM:SS' -> minutes since midnight (0 for empty / malformed)"""
+    if not value or not isinstance(value, str):
+        return 0
+    return _parse(value.strip())
+
+
+def to_hhmm(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def parse_days(value: Any) -> List[int]:
+    """Day indexes from a `days` value: a list, a JSON list string or a comma-separated string"""
+    if isinstance(value, list):
+        return value
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except Exception:
+            return [int(d.strip()) for d in value.split(',') if d.strip().isdigit()]
+    return []
+
+
+def merge_ranges(ranges: Iterable[Tuple[int, int]], merge_adjacent: bool = True) -> List[Tuple[int, int]]:
+    """Sorted union of (start, end) minute ranges; touching ranges are joined unless merge_adjacent=False"""
+    merged: List[List[int]] = []
+    for start, end in sorted(ranges):
+        if merged and (start < merged[-1][1] or (merge_adjacent and start == merged[-1][1])):
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(s, e) for s, e in merged]
+
+
+def merge_blocks(blocks: Sequence[Dict[str, Any]], key_fields: Sequence[str] = BLOCK_MERGE_KEY) -> List[Dict[str, Any]]:
+    """
+    Drop exact duplicates and merge back-to-back blocks (next start == current end) that share
+    key_fields into one block (a copy of the first, with the last block's end_time; its `id` is
+    filled from `block_id` when missing).
+    Overlapping blocks are kept apart. Result is sorted by week, day and start time.
+    """
+    if not blocks:
+        return []
+    starts = [to_minutes(b.get("start_time")) for b in blocks]
+    ends = [to_minutes(b.get("end_time")) for b in blocks]
+    keys = [tuple(str(b.get(f) or "") for f in key_fields) for b in blocks]
+
+    seen = set()
+    unique = []
+    for i in range(len(blocks)):
+        if (keys[i], starts[i], ends[i]) not in seen:
+            seen.add((keys[i], starts[i], ends[i]))
+            unique.append(i)
+    # Stable: blocks with the same start keep their input order
+    unique.sort(key=lambda i: (keys[i], starts[i]))
+
+    merged: List[Dict[str, Any]] = []
+    sort_keys: List[Tuple[str, Any, int]] = []
+    current: Optional[Dict[str, Any]] = None
+    current_key = None
+    current_end = 0
+    for i in unique:
+        if current is not None and keys[i] == current_key and starts[i] == current_end:
+            current["end_time"] = blocks[i].get("end_time")
+            current_end = ends[i]
+            continue
+        current = dict(blocks[i])
+        # The UI acts on merged blocks by id (rows from some views only carry block_id)
+        if "id" not in current:
+            current["id"] = blocks[i].get("block_id")
+        current_key = keys[i]
+        current_end = ends[i]
+        merged.append(current)
+        sort_keys.append((str(blocks[i].get("week_start") or ""), blocks[i].get("day_of_week") or 0, starts[i]))
+
+    return [merged[i] for i in sorted(range(len(merged)), key=sort_keys.__getitem__)]
+
+
+def sort_blocks(blocks: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Chronological order (week, day, start time)"""
+    return sorted(
+        blocks,
+        key=lambda b: (str(b.get("week_start") or ""), b.get("day_of_week") or 0, to_minutes(b.get("start_time"))),
+    )
+
+
+def day_range_lines(blocks: Iterable[Dict[str, Any]], day_names: Sequence[str] = DAY_NAMES_HEBREW) -> List[str]:
+    """One line per day with the merged time ranges of the blocks, e.g. 'שני 10:00-12:00, 14:00-15:00'"""
+    by_day: Dict[int, List[Tuple[int, int]]] = {}
+    for b in blocks:
+        by_day.setdefault(int(b["day_of_week"]), []).append((to_minutes(b.get("start_time")), to_minutes(b.get("end_time"))))
+    return [
+        f"{day_names[day]} " + ", ".join(f"{to_hhmm(s)}-{to_hhmm(e)}" for s, e in merge_ranges(ranges))
+        for day, ranges in sorted(by_day.items())
+    ]
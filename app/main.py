@@ -1,5 +1,5 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Form, Request, Query
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, Response
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.requests import Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
@@ -13,7 +13,7 @@ from jinja2 import Environment, FileSystemLoader
 import os
 import shutil
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, Optional
 
 from app.database import init_db, get_db, User as DBUser, Course as DBCourse
 from app.models import (
@@ -27,12 +27,27 @@ from app.parser import TranscriptParser
 from app.supabase_client import supabase, supabase_admin
 from app.auth import get_current_user, get_optional_user, get_cli_user
 from app.agents.supervisor import Supervisor
+from app.tracing import start_trace, trace_span
+from app.debug_log import debug_log
+from app.agents.step_log import dumps_compact, normalize_verbosity, shape_steps
+from app.single_flight import get_single_flight
+from app.availability import get_user_availability, get_users_availability, overlapping_intervals, planning_blocked_slots
+from app.group_optimizer import plan_group_blocks
+from app.notifications import dedup_keys_available, notification_row, send_notifications
+from app.planning_queue import enqueue_job, queue_available, run_progress
+from app.plan_blocks import BlockVersionConflict, block_columns, block_etag, move_blocks, parse_if_match, replace_blocks, update_block
+from app.schedule_view import get_user_schedule, invalidate_schedules, iter_user_schedules, page_blocks, to_columns, week_starts
+from app.intervals import day_range_lines, parse_days
+from app.course_catalog import get_catalog
 from dotenv import load_dotenv
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.date import DateTrigger
 from datetime import datetime, timedelta, timezone
+from concurrent.futures import ProcessPoolExecutor
 import asyncio
+import hashlib
+import multiprocessing
 import sys
 import logging
 import json
@@ -47,21 +62,15 @@ except ImportError:
 
 # Load environment variables
 # #region agent log
-import json
-try:
-    with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-        f.write(json.dumps({"runId":"run1","hypothesisId":"A","location":"app/main.py:49","message":"BEFORE load_dotenv","data":{"cwd":os.getcwd(),"env_file_exists":os.path.exists('.env')},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-except: pass
+debug_log("A", "app/main.py:49", "BEFORE load_dotenv", lambda: {"cwd":os.getcwd(),"env_file_exists":os.path.exists('.env')})
 # #endregion
 load_dotenv()
 # #region agent log
-try:
-    with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-        llm_key = os.getenv('LLM_API_KEY')
-        llmod_key = os.getenv('LLMOD_API_KEY')
-        openai_key = os.getenv('OPENAI_API_KEY')
-        f.write(json.dumps({"runId":"run1","hypothesisId":"A","location":"app/main.py:49","message":"AFTER load_dotenv","data":{"LLM_API_KEY_exists":bool(llm_key),"LLM_API_KEY_length":len(llm_key) if llm_key else 0,"LLMOD_API_KEY_exists":bool(llmod_key),"LLMOD_API_KEY_length":len(llmod_key) if llmod_key else 0,"OPENAI_API_KEY_exists":bool(openai_key),"OPENAI_API_KEY_length":len(openai_key) if openai_key else 0},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-except: pass
+debug_log("A", "app/main.py:49", "AFTER load_dotenv", lambda: {
+    "LLM_API_KEY_exists": bool(os.getenv('LLM_API_KEY')), "LLM_API_KEY_length": len(os.getenv('LLM_API_KEY') or ""),
+    "LLMOD_API_KEY_exists": bool(os.getenv('LLMOD_API_KEY')), "LLMOD_API_KEY_length": len(os.getenv('LLMOD_API_KEY') or ""),
+    "OPENAI_API_KEY_exists": bool(os.getenv('OPENAI_API_KEY')), "OPENAI_API_KEY_length": len(os.getenv('OPENAI_API_KEY') or ""),
+})
 # #endregion
 
 # Configure logging to both console and file
@@ -163,6 +172,7 @@ def _shutdown_scheduler():
     except Exception:
         pass
 
+
 # Create uploads directory
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
@@ -530,6 +540,8 @@ async def save_user(
                 logging.info(f"   Deleted profile-sourced weekly_plan_blocks for user {user_id} (kept other blocks)")
         except Exception as e:
             logging.warning(f"   Error deleting weekly_plan_blocks: {e}")
+        # Courses, semester items and profile blocks feed the schedule views
+        invalidate_schedules([user_id])
         
         # Insert new courses
         if user_data.courses:
@@ -703,6 +715,8 @@ async def save_user(
                 import traceback
                 logging.error(f"   Traceback: {traceback.format_exc()}")
                 raise HTTPException(status_code=500, detail=f"Error saving courses: {str(e)}")
+            finally:
+                invalidate_schedules([user_id])
         else:
             logging.info(f"   No courses to save for user {user_id}")
         
@@ -792,8 +806,7 @@ async def get_user_data(
         # Load catalog names to normalize display (avoid mojibake from legacy imports)
         catalog_map = {}
         try:
-            catalog_res = client.table("course_catalog").select("course_number,course_name").execute()
-            catalog_map = {c["course_number"]: c["course_name"] for c in (catalog_res.data or [])}
+            catalog_map = get_catalog(client).name_map()
         except Exception as e:
             logging.warning(f"   Could not load course catalog for name normalization: {e}")
         
@@ -984,15 +997,17 @@ async def save_user_preferences(
         if profile_result.data:
             schedule_notes = profile_result.data[0].get("schedule_change_notes", []) or []
         
-        # Generate LLM summary of preferences + schedule notes
-        summary = await _summarize_user_preferences_with_llm(study_preferences_raw, schedule_notes)
-        
+        # Generate LLM summary of preferences + schedule notes (unless already built from the same inputs)
+        summary_hash = _preferences_summary_hash(study_preferences_raw, schedule_notes)
+        summary = _get_cached_preferences_summary(client, user_id, summary_hash)
         if summary:
-            # Save the summary
-            client.table("user_profiles").update({
-                "study_preferences_summary": summary
-            }).eq("id", user_id).execute()
-            logging.info(f"Updated preferences summary for user {user_id}")
+            logging.info(f"Preferences summary for user {user_id} is up to date - skipping LLM")
+        else:
+            summary = await _summarize_user_preferences_with_llm(study_preferences_raw, schedule_notes)
+            if summary:
+                # Save the summary
+                _save_preferences_summary(client, user_id, summary, summary_hash)
+                logging.info(f"Updated preferences summary for user {user_id}")
         
         return JSONResponse(content={
             "message": "Preferences saved successfully",
@@ -1467,6 +1482,7 @@ async def create_constraint(
         }
         
         response = client.table("constraints").insert(constraint_dict).execute()
+        invalidate_schedules([user_id])
         
         if response.data:
             return {"message": "אילוץ נוצר בהצלחה", "constraint": response.data[0]}
@@ -1511,6 +1527,7 @@ async def update_constraint(
         }
         
         response = client.table("constraints").update(update_data).eq("id", constraint_id).execute()
+        invalidate_schedules([user_id])
         
         if response.data:
             return {"message": "אילוץ עודכן בהצלחה", "constraint": response.data[0]}
@@ -1541,6 +1558,7 @@ async def delete_constraint(
             raise HTTPException(status_code=404, detail="Constraint not found")
         
         delete_result = client.table("constraints").delete().eq("id", constraint_id).execute()
+        invalidate_schedules([user_id])
         
         logging.info(f"✅ Constraint {constraint_id} deleted successfully for user {user_id}")
         
@@ -1553,18 +1571,6 @@ async def delete_constraint(
 
 
 # Weekly constraints and weekly plan endpoints
-def _parse_days(value):
-    import json
-    if isinstance(value, list):
-        return value
-    if isinstance(value, str):
-        try:
-            return json.loads(value)
-        except Exception:
-            return [int(d.strip()) for d in value.split(',') if d.strip().isdigit()]
-    return []
-
-
 def _time_to_minutes(time_str: str) -> int:
     if not time_str:
         return 0
@@ -1643,6 +1649,86 @@ def _group_change_request_target_window(change_request: dict):
     return day, start, end
 
 
+def _group_change_snapshot_conflicts(
+    snapshot: dict,
+    *,
+    day_of_week: int,
+    start_time: str,
+    end_time: str,
+    course_number=None,
+    exclusion_ranges=None,
+) -> list:
+    """Conflict reasons for one availability snapshot (see _get_group_change_conflicts_for_user)"""
+    conflicts = []
+    exclusion_ranges = exclusion_ranges or []
+
+    for item in overlapping_intervals(snapshot, day_of_week, start_time, end_time):
+        item_range = f"{_minutes_to_time(item['start'])}-{_minutes_to_time(item['end'])}"
+        kind = item.get("kind")
+        if kind == "weekly_constraint":
+            conflicts.append(f"Weekly constraint: {item.get('label')} ({item_range})")
+        elif kind == "constraint":
+            conflicts.append(f"Permanent constraint: {item.get('label')} ({item_range})")
+        elif kind == "semester":
+            conflicts.append(f"Semester schedule ({item.get('item_type') or 'class'}): {item.get('label')} ({item_range})")
+        elif kind == "block":
+            b_start, b_end = _minutes_to_time(item["start"]), _minutes_to_time(item["end"])
+            # Exclude the group's own blocks that are being replaced/moved/resized (prevents self-conflict).
+            # In some datasets, course_number can be missing/NULL on group blocks; in that case we still
+            # exclude "group" blocks that overlap the exclusion window(s) to avoid false conflicts.
+            if item.get("work_type") == "group" and exclusion_ranges:
+                overlaps_exclusion = any(
+                    int(ex_day) == int(day_of_week) and _overlaps(b_start, b_end, ex_start, ex_end)
+                    for ex_day, ex_start, ex_end in exclusion_ranges
+                )
+                if overlaps_exclusion:
+                    b_course = item.get("course_number")
+                    # If course_number is known, exclude only matching course (or NULL, which we treat as legacy/missing)
+                    if not course_number or b_course is None or str(b_course) == str(course_number):
+                        continue
+            wt = item.get("work_type") or "block"
+            cn = item.get("course_number") or item.get("label") or ""
+            conflicts.append(f"Existing {wt} block: {cn} ({item_range})")
+
+    return conflicts
+
+
+def _get_group_change_conflicts_for_users(
+    client,
+    user_ids: list,
+    week_start: str,
+    *,
+    day_of_week: int,
+    start_time: str,
+    end_time: str,
+    course_number=None,
+    exclusion_ranges=None,
+) -> Dict[str, list]:
+    """
+    _get_group_change_conflicts_for_user for a whole group: every member's constraints, semester items
+    and plan blocks come from one batched availability read, so validating an approval costs the
+    same number of round trips for any group size. Returns user_id -> conflict reasons.
+    """
+    user_ids = [uid for uid in dict.fromkeys(user_ids or []) if uid]
+    try:
+        snapshots = get_users_availability(client, user_ids, week_start)
+    except Exception as e:
+        # If we can't verify availability, we should not apply a change that might overwrite it.
+        return {uid: [f"Could not verify constraints and existing blocks (db error): {e}"] for uid in user_ids}
+
+    return {
+        uid: _group_change_snapshot_conflicts(
+            snapshots.get(uid) or {"intervals": []},
+            day_of_week=day_of_week,
+            start_time=start_time,
+            end_time=end_time,
+            course_number=course_number,
+            exclusion_ranges=exclusion_ranges,
+        )
+        for uid in user_ids
+    }
+
+
 def _get_group_change_conflicts_for_user(
     client,
     user_id: str,
@@ -1661,126 +1747,16 @@ def _get_group_change_conflicts_for_user(
     exclusion_ranges: list of (day_of_week, start_time_hhmm, end_time_hhmm) used to ignore same-course group blocks
                      that are being edited/replaced.
     """
-    conflicts = []
-    exclusion_ranges = exclusion_ranges or []
-
-    # 1) Weekly constraints
-    try:
-        wc_res = (
-            client.table("weekly_constraints")
-            .select("id, title, description, days, start_time, end_time")
-            .eq("user_id", user_id)
-            .eq("week_start", week_start)
-            .execute()
-        )
-        for c in (wc_res.data or []):
-            for d in _parse_days(c.get("days")):
-                if int(d) != int(day_of_week):
-                    continue
-                if _overlaps(start_time, end_time, c.get("start_time"), c.get("end_time")):
-                    title = c.get("title") or "Weekly constraint"
-                    conflicts.append(f"Weekly constraint: {title} ({_norm_hhmm(c.get('start_time'))}-{_norm_hhmm(c.get('end_time'))})")
-                    break
-    except Exception as e:
-        # If we can't verify constraints, we should not apply a change that might overwrite them.
-        conflicts.append(f"Could not verify weekly constraints (db error): {e}")
-
-    # 2) Permanent constraints
-    try:
-        pc_res = (
-            client.table("constraints")
-            .select("id, title, description, days, start_time, end_time")
-            .eq("user_id", user_id)
-            .execute()
-        )
-        for c in (pc_res.data or []):
-            for d in _parse_days(c.get("days")):
-                if int(d) != int(day_of_week):
-                    continue
-                if _overlaps(start_time, end_time, c.get("start_time"), c.get("end_time")):
-                    title = c.get("title") or "Permanent constraint"
-                    conflicts.append(f"Permanent constraint: {title} ({_norm_hhmm(c.get('start_time'))}-{_norm_hhmm(c.get('end_time'))})")
-                    break
-    except Exception as e:
-        conflicts.append(f"Could not verify permanent constraints (db error): {e}")
-
-    # 3) Existing blocks in the user's weekly plan
-    try:
-        plan_res = (
-            client.table("weekly_plans")
-            .select("id")
-            .eq("user_id", user_id)
-            .eq("week_start", week_start)
-            .limit(1)
-            .execute()
-        )
-        if plan_res.data:
-            plan_id = plan_res.data[0]["id"]
-            blocks_res = (
-                client.table("weekly_plan_blocks")
-                .select("id, day_of_week, start_time, end_time, work_type, course_number, course_name, source")
-                .eq("plan_id", plan_id)
-                .eq("day_of_week", day_of_week)
-                .execute()
-            )
-            for b in (blocks_res.data or []):
-                b_start = b.get("start_time")
-                b_end = b.get("end_time")
-                if not b_start or not b_end:
-                    continue
-
-                # Exclude the group's own blocks that are being replaced/moved/resized (prevents self-conflict).
-                # In some datasets, course_number can be missing/NULL on group blocks; in that case we still
-                # exclude "group" blocks that overlap the exclusion window(s) to avoid false conflicts.
-                if (b.get("work_type") == "group") and exclusion_ranges:
-                    overlaps_exclusion = False
-                    for ex_day, ex_start, ex_end in exclusion_ranges:
-                        if int(ex_day) == int(day_of_week) and _overlaps(b_start, b_end, ex_start, ex_end):
-                            overlaps_exclusion = True
-                            break
-
-                    if overlaps_exclusion:
-                        b_course = b.get("course_number")
-                        # If course_number is known, exclude only matching course (or NULL, which we treat as legacy/missing)
-                        if course_number:
-                            if b_course is None or str(b_course) == str(course_number):
-                                continue
-                        else:
-                            # No course_number available -> fail-safe to prevent self-conflict for group changes
-                            # (exclusion window is derived from the request's original/proposed range).
-                            continue
-
-                if _overlaps(start_time, end_time, b_start, b_end):
-                    wt = b.get("work_type") or "block"
-                    cn = b.get("course_number") or b.get("course_name") or ""
-                    conflicts.append(f"Existing {wt} block: {cn} ({_norm_hhmm(b_start)}-{_norm_hhmm(b_end)})")
-    except Exception as e:
-        conflicts.append(f"Could not verify existing blocks (db error): {e}")
-
-    # 4) Semester schedule items (fixed blocks that must never be overwritten)
-    # These are not stored in constraints/weekly_constraints, and may not exist in weekly_plan_blocks.
-    try:
-        sem_res = (
-            client.table("semester_schedule_items")
-            .select("id, course_name, type, days, start_time, end_time")
-            .eq("user_id", user_id)
-            .execute()
-        )
-        for item in (sem_res.data or []):
-            for d in _parse_days(item.get("days")):
-                if int(d) != int(day_of_week):
-                    continue
-                it_start = item.get("start_time")
-                it_end = item.get("end_time")
-                if it_start and it_end and _overlaps(start_time, end_time, it_start, it_end):
-                    cname = item.get("course_name") or "Semester item"
-                    itype = item.get("type") or "class"
-                    conflicts.append(f"Semester schedule ({itype}): {cname} ({_norm_hhmm(it_start)}-{_norm_hhmm(it_end)})")
-                    break
-    except Exception as e:
-        conflicts.append(f"Could not verify semester schedule items (db error): {e}")
-
-    return conflicts
+    return _get_group_change_conflicts_for_users(
+        client,
+        [user_id],
+        week_start,
+        day_of_week=day_of_week,
+        start_time=start_time,
+        end_time=end_time,
+        course_number=course_number,
+        exclusion_ranges=exclusion_ranges,
+    ).get(user_id, [])
 
 
 def _build_time_slots(start_hour: int = 8, end_hour: int = 20, slot_minutes: int = 60):
@@ -1928,16 +1904,22 @@ Return ONLY JSON with the 'group_blocks' array."""
             f"group_id={group_id}, quota={group_quota}, slots={len(common_free_slots)}"
         )
 
-        response = llm_client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            temperature=temperature,
-            max_tokens=2000,
-            response_format={"type": "json_object"},
-        )
+        # Off the event loop so several groups can be planned concurrently
+        loop = asyncio.get_event_loop()
+        with trace_span("llm.group_plan", model=model, group_id=group_id):
+            response = await loop.run_in_executor(
+                None,
+                lambda: llm_client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt},
+                    ],
+                    temperature=temperature,
+                    max_tokens=2000,
+                    response_format={"type": "json_object"},
+                ),
+            )
 
         content = response.choices[0].message.content
         finish_reason = response.choices[0].finish_reason
@@ -2021,6 +2003,120 @@ Return ONLY JSON with the 'group_blocks' array."""
         }
 
 
+# Set to False after the first upsert fails because WEEKLY_PLAN_BLOCKS_UNIQUE_SLOT.sql is not installed
+_member_block_upsert_available = True
+
+
+def _invalidate_group_schedules(client, group_id: str, week_start: str) -> None:
+    """group_plan_blocks annotate every approved member's week: drop their cached schedules"""
+    try:
+        members = client.table("group_members").select("user_id").eq("group_id", group_id).eq("status", "approved").execute()
+        invalidate_schedules([m["user_id"] for m in (members.data or [])], week_start)
+    except Exception as e:
+        logging.warning(f"⚠️ Could not load members of group {group_id}, dropping the week's cached schedules: {e}")
+        invalidate_schedules(None, week_start)
+
+
+def _upsert_plan_blocks(client, rows: list) -> Optional[list]:
+    """
+    Insert weekly_plan_blocks rows in one call, skipping slots that already exist (unique key on
+    (plan_id, day_of_week, start_time, course_number, work_type)). Returns the rows written, or
+    None if WEEKLY_PLAN_BLOCKS_UNIQUE_SLOT.sql is not installed (the caller inserts instead).
+    """
+    global _member_block_upsert_available
+    if not _member_block_upsert_available:
+        return None
+    try:
+        result = client.table("weekly_plan_blocks").upsert(
+            rows,
+            on_conflict="plan_id,day_of_week,start_time,course_number,work_type",
+            ignore_duplicates=True,
+        ).execute()
+        return result.data or []
+    except Exception as upsert_err:
+        # 42P10: no unique constraint matching the ON CONFLICT target
+        if "42P10" in str(upsert_err) or "no unique" in str(upsert_err).lower():
+            _member_block_upsert_available = False
+            logging.info("ℹ️ [BLOCKS] Unique slot key not installed - using plain inserts")
+            return None
+        raise
+
+
+def _fan_out_group_blocks_to_members(
+    client,
+    member_ids: list,
+    week_start: str,
+    group_blocks: list,
+    course_number: str,
+    course_name: str,
+    plan_source: str = "auto",
+    block_source: str = "auto",
+) -> Dict[str, int]:
+    """
+    Copy synchronized group blocks into every member's weekly plan with set-based calls:
+    one select of the members' plans, one insert of the missing plans, one upsert of all member
+    blocks (ignoring slots a member already has, via the unique key on
+    (plan_id, day_of_week, start_time, course_number, work_type)).
+    Returns counts: plans_created, blocks_written.
+    """
+    counts = {"plans_created": 0, "blocks_written": 0}
+    member_ids = list(dict.fromkeys(member_ids or []))
+    if not member_ids or not group_blocks:
+        return counts
+
+    plans_result = client.table("weekly_plans").select("id, user_id").eq("week_start", week_start).in_("user_id", member_ids).execute()
+    plan_by_member = {}
+    for plan in (plans_result.data or []):
+        plan_by_member.setdefault(plan["user_id"], plan["id"])
+
+    missing = [mid for mid in member_ids if mid not in plan_by_member]
+    if missing:
+        created = client.table("weekly_plans").insert([
+            {"user_id": mid, "week_start": week_start, "source": plan_source} for mid in missing
+        ]).execute()
+        for plan in (created.data or []):
+            plan_by_member.setdefault(plan["user_id"], plan["id"])
+        counts["plans_created"] = len(created.data or [])
+        for mid in missing:
+            if mid not in plan_by_member:
+                logging.warning(f"⚠️ [GROUP FAN-OUT] Failed to create weekly_plan for member {mid}, skipping blocks")
+
+    rows = []
+    for member_id, plan_id in plan_by_member.items():
+        for block in group_blocks:
+            rows.append({
+                "plan_id": plan_id,
+                "user_id": member_id,
+                "course_number": course_number,
+                "course_name": course_name,
+                "work_type": "group",
+                "day_of_week": block["day_of_week"],
+                "start_time": block["start_time"],
+                "end_time": block["end_time"],
+                "is_locked": False,
+                "source": block_source,
+            })
+    if not rows:
+        invalidate_schedules(member_ids, week_start)
+        return counts
+
+    written = _upsert_plan_blocks(client, rows)
+    if written is not None:
+        counts["blocks_written"] = len(written)
+        invalidate_schedules(member_ids, week_start)
+        return counts
+
+    # Fallback without the unique key: skip slots members already have, then one insert
+    existing = client.table("weekly_plan_blocks").select("plan_id, day_of_week, start_time").in_("plan_id", list(plan_by_member.values())).eq("work_type", "group").eq("course_number", course_number).execute()
+    existing_slots = {(b["plan_id"], b.get("day_of_week"), b.get("start_time")) for b in (existing.data or [])}
+    rows = [r for r in rows if (r["plan_id"], r["day_of_week"], r["start_time"]) not in existing_slots]
+    if rows:
+        result = client.table("weekly_plan_blocks").insert(rows).execute()
+        counts["blocks_written"] = len(result.data or [])
+    invalidate_schedules(member_ids, week_start)
+    return counts
+
+
 def _ensure_group_blocks_for_week(client, user_id: str, week_start: str, available_slots):
     """
     Create group_plan_blocks once per group per week and post an update to the group.
@@ -2068,31 +2164,9 @@ def _ensure_group_blocks_for_week(client, user_id: str, week_start: str, availab
 
             if created_blocks:
                 client.table("group_plan_blocks").insert(created_blocks).execute()
+                _invalidate_group_schedules(client, group_id, week_start)
                 try:
-                    day_names = ["ראשון", "שני", "שלישי", "רביעי", "חמישי", "שישי", "שבת"]
-                    daily_blocks = {}
-                    for b in created_blocks:
-                        daily_blocks.setdefault(b["day_of_week"], []).append((b["start_time"], b["end_time"]))
-
-                    def _merge_ranges(ranges):
-                        ranges_sorted = sorted(ranges, key=lambda r: r[0])
-                        merged = []
-                        for start, end in ranges_sorted:
-                            if not merged:
-                                merged.append([start, end])
-                                continue
-                            last_start, last_end = merged[-1]
-                            if start <= last_end:
-                                merged[-1][1] = max(last_end, end)
-                            else:
-                                merged.append([start, end])
-                        return merged
-
-                    summary_lines = []
-                    for d in sorted(daily_blocks.keys()):
-                        merged = _merge_ranges(daily_blocks[d])
-                        ranges_str = ", ".join([f"{s}-{e}" for s, e in merged])
-                        summary_lines.append(f"{day_names[d]} {ranges_str}")
+                    summary_lines = day_range_lines(created_blocks)
 
                     try:
                         d_parts = week_start.split('-')
@@ -2161,12 +2235,10 @@ async def _refine_schedule_with_llm(
         dict with 'success', 'blocks' (refined schedule), 'message'
     """
     # #region agent log
-    _debug_log_path = r"c:\DS\AcademicPlanner\ds_project\.cursor\debug.log"
     def _debug_log(hyp, msg, data):
-        import json as _j
-        with open(_debug_log_path, "a", encoding="utf-8") as _f:
-            _f.write(_j.dumps({"hypothesisId": hyp, "location": "main.py:_refine_schedule_with_llm", "message": msg, "data": data, "timestamp": int(__import__("time").time()*1000)}) + "\n")
-    _debug_log("C", "ENTRY: Input params", {"user_id": user_id, "courses_count": len(courses), "available_slots_count": len(available_slots), "skeleton_blocks_count": len(skeleton_blocks), "prefs_len": len(user_preferences_raw or "")})
+        # data is a zero-argument callable: payloads are only built when debug logging is on
+        debug_log(hyp, "main.py:_refine_schedule_with_llm", msg, data)
+    _debug_log("C", "ENTRY: Input params", lambda: {"user_id": user_id, "courses_count": len(courses), "available_slots_count": len(available_slots), "skeleton_blocks_count": len(skeleton_blocks), "prefs_len": len(user_preferences_raw or "")})
     # #endregion
     # Check if OpenAI library is available
     if not HAS_OPENAI:
@@ -2186,10 +2258,7 @@ async def _refine_schedule_with_llm(
         llm_key_check = os.getenv('LLM_API_KEY')
         llmod_key_check = os.getenv('LLMOD_API_KEY')
         openai_key_check = os.getenv('OPENAI_API_KEY')
-        try:
-            with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                f.write(json.dumps({"runId":"run1","hypothesisId":"B","location":"app/main.py:1436","message":"Checking API keys in _refine_schedule_with_llm","data":{"LLM_API_KEY_exists":bool(llm_key_check),"LLM_API_KEY_length":len(llm_key_check) if llm_key_check else 0,"LLMOD_API_KEY_exists":bool(llmod_key_check),"LLMOD_API_KEY_length":len(llmod_key_check) if llmod_key_check else 0,"OPENAI_API_KEY_exists":bool(openai_key_check),"OPENAI_API_KEY_length":len(openai_key_check) if openai_key_check else 0,"cwd":os.getcwd(),"env_file_exists":os.path.exists('.env')},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-        except: pass
+        debug_log("B", "app/main.py:1436", "Checking API keys in _refine_schedule_with_llm", lambda: {"LLM_API_KEY_exists":bool(llm_key_check),"LLM_API_KEY_length":len(llm_key_check) if llm_key_check else 0,"LLMOD_API_KEY_exists":bool(llmod_key_check),"LLMOD_API_KEY_length":len(llmod_key_check) if llmod_key_check else 0,"OPENAI_API_KEY_exists":bool(openai_key_check),"OPENAI_API_KEY_length":len(openai_key_check) if openai_key_check else 0,"cwd":os.getcwd(),"env_file_exists":os.path.exists('.env')})
         # #endregion
         logging.info(f"🔍 [LLM] Checking for API keys:")
         logging.info(f"   LLM_API_KEY: {'✅ Found' if llm_key_check else '❌ Not found'}")
@@ -2260,11 +2329,7 @@ async def _refine_schedule_with_llm(
                         logging.warning(f"Could not load course_time_preferences: Supabase client not available")
                     else:
                         # #region agent log
-                        try:
-                            import json
-                            with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                                f.write(json.dumps({"runId":"run1","hypothesisId":"A","location":"app/main.py:1523","message":"Loading course_time_preferences","data":{"user_id":user_id,"course_number":course_number,"client_type":type(client).__name__,"supabase_client_available":bool(supabase_client)},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-                        except: pass
+                        debug_log("A", "app/main.py:1523", "Loading course_time_preferences", lambda: {"user_id":user_id,"course_number":course_number,"client_type":type(client).__name__,"supabase_client_available":bool(supabase_client)})
                         # #endregion
                         pref_result = supabase_client.table("course_time_preferences").select("personal_hours_per_week").eq("user_id", user_id).eq("course_number", course_number).limit(1).execute()
                     if pref_result.data and pref_result.data[0].get("personal_hours_per_week") is not None:
@@ -2501,19 +2566,19 @@ Return only the JSON with personal_blocks array."""
             f"required_total={required_total}, force_exact={force_exact_count}"
         )
         # #region agent log
-        _debug_log("C", "PRE-LLM: course_requirements", {"required_total": required_total, "course_requirements": course_requirements})
-        _debug_log("D", "PRE-LLM: available_slots sample", {"slots_count": len(available_slots), "first_5": available_slots[:5] if available_slots else []})
+        _debug_log("C", "PRE-LLM: course_requirements", lambda: {"required_total": required_total, "course_requirements": course_requirements})
+        _debug_log("D", "PRE-LLM: available_slots sample", lambda: {"slots_count": len(available_slots), "first_5": available_slots[:5] if available_slots else []})
         # #endregion
 
         # Call LLM (configurable model)
         model = os.getenv("LLM_MODEL") or "gpt-4o-mini"
         base_url = os.getenv("LLM_BASE_URL") or os.getenv("OPENAI_BASE_URL")
         # #region agent log
-        _debug_log("E", "PRE-LLM CALL: API config", {"model": model, "base_url": base_url or "default", "api_key_present": bool(llm_key), "api_key_length": len(llm_key) if llm_key else 0})
+        _debug_log("E", "PRE-LLM CALL: API config", lambda: {"model": model, "base_url": base_url or "default", "api_key_present": bool(llm_key_check), "api_key_length": len(llm_key_check) if llm_key_check else 0})
         # #endregion
         logging.info(f"[LLM] Calling model={model}, base_url={base_url}")
         # #region agent log
-        _debug_log("A", "PRE-API: LLM config", {"model": model, "base_url": base_url, "has_api_key": bool(openai_api_key)})
+        _debug_log("A", "PRE-API: LLM config", lambda: {"model": model, "base_url": base_url, "has_api_key": bool(openai_api_key)})
 
         # gpt-5 family requires temperature=1 with this provider
         temperature = 0.7
@@ -2522,23 +2587,24 @@ Return only the JSON with personal_blocks array."""
         logging.info(f"[LLM] Using temperature={temperature}")
 
         # #region agent log
-        _debug_log("B", "PRE-API: Request params", {"temperature": temperature, "max_tokens": 4000, "response_format": "json_object"})
+        _debug_log("B", "PRE-API: Request params", lambda: {"temperature": temperature, "max_tokens": 4000, "response_format": "json_object"})
         # #endregion
         try:
             logging.info(f"🔄 [LLM] Calling API: model={model}, base_url={base_url or 'default'}")
             logging.info(f"   [LLM] User preferences length: {len(user_preferences_raw or '')} chars")
             logging.info(f"   [LLM] User preferences summary keys: {list(user_preferences_summary.keys()) if user_preferences_summary else 'none'}")
             logging.info(f"   [LLM] Courses count: {len(courses)}, Available slots: {len(available_slots)}")
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=temperature,
-                max_tokens=8000,
-                response_format={"type": "json_object"}
-            )
+            with trace_span("llm.refine_schedule", model=model):
+                response = client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    temperature=temperature,
+                    max_tokens=8000,
+                    response_format={"type": "json_object"}
+                )
             logging.info(f"✅ [LLM] API call successful")
         except Exception as api_err:
             # #region agent log
@@ -2557,14 +2623,14 @@ Return only the JSON with personal_blocks array."""
             logging.warning(f"⚠️ [LLM] Unexpected finish_reason: {finish_reason} (expected 'stop')")
         logging.info(f"   [LLM] Response preview (first 500 chars): {(content[:500] if content else 'EMPTY')}")
         # #region agent log
-        _debug_log("F", "POST-API: Response metadata", {"content_len": len(content) if content else 0, "finish_reason": finish_reason, "content_preview": (content[:300] if content else "EMPTY")})
-        _debug_log("FULL", "LLM FULL RESPONSE", {"user_id": user_id, "user_prefs": user_preferences_raw, "full_response": content, "required_total": required_total})
+        _debug_log("F", "POST-API: Response metadata", lambda: {"content_len": len(content) if content else 0, "finish_reason": finish_reason, "content_preview": (content[:300] if content else "EMPTY")})
+        _debug_log("FULL", "LLM FULL RESPONSE", lambda: {"user_id": user_id, "user_prefs": user_preferences_raw, "full_response": content, "required_total": required_total})
         # #endregion
         
         # Handle empty content
         if not content or content.strip() == "":
             # #region agent log
-            _debug_log("F", "EMPTY CONTENT", {"finish_reason": finish_reason, "full_response_type": type(response).__name__})
+            _debug_log("F", "EMPTY CONTENT", lambda: {"finish_reason": finish_reason, "full_response_type": type(response).__name__})
             # #endregion
             logging.error(f"[LLM] Empty content returned! finish_reason={finish_reason}")
             return {"success": False, "blocks": [], "message": f"LLM returned empty content (finish_reason={finish_reason})"}
@@ -2624,7 +2690,7 @@ Return only the JSON with personal_blocks array."""
             }
         
         # #region agent log
-        _debug_log("SUCCESS", "LLM SUCCESS", {"group_blocks_count": len(group_blocks), "personal_blocks_count": len(personal_blocks), "required_total": required_total})
+        _debug_log("SUCCESS", "LLM SUCCESS", lambda: {"group_blocks_count": len(group_blocks), "personal_blocks_count": len(personal_blocks), "required_total": required_total})
         # #endregion
         return {
             "success": True,
@@ -2848,16 +2914,17 @@ Extract structured preferences as JSON."""
         logging.info(f"   - User prompt length: {len(user_prompt)}")
         
         try:
-            response = openai_client.chat.completions.create(
-                model=llm_model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=temperature,
-                max_tokens=2000,  # Increased for models with reasoning tokens (gpt-5)
-                response_format={"type": "json_object"}
-            )
+            with trace_span("llm.summarize_preferences", model=llm_model):
+                response = openai_client.chat.completions.create(
+                    model=llm_model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    temperature=temperature,
+                    max_tokens=2000,  # Increased for models with reasoning tokens (gpt-5)
+                    response_format={"type": "json_object"}
+                )
             logging.info(f"✅ [LLM CLASSIFICATION] LLM API call successful")
         except Exception as api_err:
             logging.error(f"❌ [LLM CLASSIFICATION] LLM API call failed: {api_err}")
@@ -2909,6 +2976,92 @@ Extract structured preferences as JSON."""
         return None
 
 
+# Bump when the summarization prompt changes so stored summaries are regenerated
+_PREFERENCES_SUMMARIZER_VERSION = "1"
+# Set to False once a query shows PREFERENCES_SUMMARY_HASH.sql is not installed
+_summary_hash_available = True
+
+
+def _is_missing_column(err: Exception, column: str) -> bool:
+    """Column / table missing (migration not installed), as opposed to a transient failure"""
+    text = str(err)
+    if any(code in text for code in ("42P01", "PGRST205")):
+        return True
+    return column in text and any(code in text for code in ("42703", "PGRST204", "does not exist"))
+
+
+def _preferences_summary_hash(preferences_raw: str, schedule_change_notes: list) -> str:
+    """Hash of the summarizer inputs (raw preferences, change notes, summarizer version)"""
+    payload = {
+        "version": _PREFERENCES_SUMMARIZER_VERSION,
+        "raw": preferences_raw or "",
+        "notes": schedule_change_notes or [],
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _get_cached_preferences_summary(client, user_id: str, input_hash: str) -> Optional[dict]:
+    """The stored study_preferences_summary if it was built from inputs with this hash, else None"""
+    global _summary_hash_available
+    if not _summary_hash_available:
+        return None
+    try:
+        result = client.table("user_profiles").select("study_preferences_summary, study_preferences_summary_hash").eq("id", user_id).limit(1).execute()
+    except Exception as e:
+        if _is_missing_column(e, "study_preferences_summary_hash"):
+            _summary_hash_available = False
+            logging.info(f"user_profiles.study_preferences_summary_hash not available, summaries are not cached: {e}")
+        else:
+            logging.warning(f"⚠️ Could not read cached preferences summary, rebuilding: {e}")
+        return None
+    if result.data and result.data[0].get("study_preferences_summary_hash") == input_hash:
+        return result.data[0].get("study_preferences_summary") or None
+    return None
+
+
+def _save_preferences_summary(client, user_id: str, summary: dict, input_hash: str):
+    """Update study_preferences_summary together with the hash of the inputs it was built from"""
+    global _summary_hash_available
+    if _summary_hash_available:
+        try:
+            return client.table("user_profiles").update({
+                "study_preferences_summary": summary,
+                "study_preferences_summary_hash": input_hash,
+            }).eq("id", user_id).execute()
+        except Exception as e:
+            if not _is_missing_column(e, "study_preferences_summary_hash"):
+                raise
+            _summary_hash_available = False
+            logging.info(f"Could not store preferences summary hash (run PREFERENCES_SUMMARY_HASH.sql): {e}")
+    return client.table("user_profiles").update({
+        "study_preferences_summary": summary
+    }).eq("id", user_id).execute()
+
+
+# Weekly planning through the job queue (PLANNING_JOB_QUEUE.sql + `python -m app.planning_worker`)
+PLANNER_QUEUE_ENABLED = os.getenv("PLANNER_QUEUE_ENABLED", "false").strip().lower() in ("1", "true", "yes")
+
+
+def _enqueue_weekly_run(week_start: Optional[str] = None, dedup: bool = False) -> Optional[dict]:
+    """
+    Queue a "week" job (next week by default). With dedup=True the job is keyed by week so that
+    concurrent schedulers enqueue it once. Returns the job row, or None if already enqueued.
+    """
+    client = supabase_admin if supabase_admin else supabase
+    if not client:
+        raise HTTPException(status_code=500, detail="Supabase client not configured")
+    if not week_start:
+        current_week_start = _get_week_start(datetime.utcnow())
+        week_start = (datetime.strptime(current_week_start, "%Y-%m-%d") + timedelta(days=7)).strftime("%Y-%m-%d")
+    return enqueue_job(
+        client,
+        "week",
+        week_start,
+        dedup_key=f"weekly:{week_start}" if dedup else None,
+        priority=10,
+    )
+
+
 def _run_weekly_auto_for_all_users_sync():
     """
     Sync wrapper for APScheduler (APScheduler can't call async functions directly).
@@ -2918,12 +3071,24 @@ def _run_weekly_auto_for_all_users_sync():
     logging.info("🔄 [SCHEDULER] Weekly auto-plan triggered by scheduler")
     logging.info(f"   Time: {datetime.utcnow().isoformat()} UTC")
     logging.info("=" * 60)
+    if PLANNER_QUEUE_ENABLED and queue_available():
+        try:
+            # Every web worker fires this job; the dedup key leaves exactly one queued run
+            job = _enqueue_weekly_run(dedup=True)
+            logging.info(f"📬 [SCHEDULER] Weekly run enqueued for planner workers: {job.get('run_id') if job else 'already enqueued'}")
+            return
+        except Exception as e:
+            # No in-process fallback: every web worker runs this job, so each one would plan the
+            # whole week. The run can be re-triggered (POST /api/weekly-plan/trigger-now) once
+            # the queue is reachable again.
+            logging.error(f"❌ [SCHEDULER] Could not enqueue weekly run, skipping it (not planning in-process): {e}")
+            return
     try:
         # Create a new event loop in this thread
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
         try:
-            loop.run_until_complete(_run_weekly_auto_for_all_users())
+            loop.run_until_complete(_run_weekly_full())
         finally:
             loop.close()
     except Exception as e:
@@ -2932,13 +3097,447 @@ def _run_weekly_auto_for_all_users_sync():
         logging.error(f"   Traceback: {traceback.format_exc()}")
 
 
-async def _run_weekly_auto_for_all_users(week_start_override: Optional[str] = None):
+# Set to False once a call shows cleanup_week_plans (WEEKLY_PLAN_CLEANUP_RPC.sql) is not installed
+_cleanup_rpc_available = True
+# Max ids per in_() filter (kept well below PostgREST URL length limits)
+_CLEANUP_BATCH_SIZE = 200
+
+
+def _cleanup_week_plans(
+    client,
+    week_start: str,
+    user_id: Optional[str] = None,
+    include_group_blocks: bool = False,
+    include_notifications: bool = False,
+) -> Dict[str, int]:
+    """
+    Delete weekly_plans and their weekly_plan_blocks for week_start (one user, or all users when
+    user_id is None). Optionally also group_plan_blocks and plan_ready notifications for the week.
+    Uses the cleanup_week_plans RPC (single transaction) when installed, otherwise batched in_()
+    deletes. Returns deleted row counts: plans, blocks, group_blocks, notifications.
+    """
+    global _cleanup_rpc_available
+    counts = {"plans": 0, "blocks": 0, "group_blocks": 0, "notifications": 0}
+
+    if _cleanup_rpc_available:
+        try:
+            rpc_result = client.rpc("cleanup_week_plans", {
+                "p_week_start": week_start,
+                "p_user_id": user_id,
+                "p_include_group_blocks": include_group_blocks,
+                "p_include_notifications": include_notifications,
+            }).execute()
+            data = rpc_result.data
+            if isinstance(data, list):
+                data = data[0] if data else {}
+            for key in counts:
+                counts[key] = int((data or {}).get(key) or 0)
+            invalidate_schedules([user_id] if user_id else None, week_start)
+            return counts
+        except Exception as rpc_err:
+            err_text = str(rpc_err)
+            # PGRST202: PostgREST found no such function; 42883: undefined function
+            if "PGRST202" in err_text or "42883" in err_text:
+                _cleanup_rpc_available = False
+                logging.info("ℹ️ [CLEANUP] cleanup_week_plans RPC not installed - using batched deletes")
+            else:
+                logging.warning(f"⚠️ [CLEANUP] cleanup_week_plans RPC failed, using batched deletes: {rpc_err}")
+
+    plans_query = client.table("weekly_plans").select("id").eq("week_start", week_start)
+    if user_id:
+        plans_query = plans_query.eq("user_id", user_id)
+    plan_ids = [p["id"] for p in (plans_query.execute().data or [])]
+
+    for i in range(0, len(plan_ids), _CLEANUP_BATCH_SIZE):
+        batch = plan_ids[i:i + _CLEANUP_BATCH_SIZE]
+        blocks_deleted = client.table("weekly_plan_blocks").delete().in_("plan_id", batch).execute()
+        counts["blocks"] += len(blocks_deleted.data or [])
+        plans_deleted = client.table("weekly_plans").delete().in_("id", batch).execute()
+        counts["plans"] += len(plans_deleted.data or [])
+
+    if include_group_blocks:
+        group_blocks_deleted = client.table("group_plan_blocks").delete().eq("week_start", week_start).execute()
+        counts["group_blocks"] = len(group_blocks_deleted.data or [])
+
+    if include_notifications:
+        notif_query = client.table("notifications").delete().eq("type", "plan_ready").like("link", f"%week={week_start}%")
+        if user_id:
+            notif_query = notif_query.eq("user_id", user_id)
+        counts["notifications"] = len(notif_query.execute().data or [])
+
+    invalidate_schedules([user_id] if user_id else None, week_start)
+    return counts
+
+
+def _cleanup_week_plans_for_users(client, week_start: str, user_ids, group_ids=None) -> Dict[str, int]:
+    """
+    Scoped cleanup for a set of users (incremental runs, shards, queue jobs): their plans, blocks
+    and plan_ready notifications for the week, plus group_plan_blocks of group_ids, with batched
+    in_() deletes instead of one cleanup call per user.
+    """
+    counts = {"plans": 0, "blocks": 0, "group_blocks": 0, "notifications": 0}
+    user_list = list(user_ids or [])
+    for i in range(0, len(user_list), _CLEANUP_BATCH_SIZE):
+        users = user_list[i:i + _CLEANUP_BATCH_SIZE]
+        plan_ids = [p["id"] for p in (client.table("weekly_plans").select("id").eq("week_start", week_start).in_("user_id", users).execute().data or [])]
+        if plan_ids:
+            counts["blocks"] += len(client.table("weekly_plan_blocks").delete().in_("plan_id", plan_ids).execute().data or [])
+            counts["plans"] += len(client.table("weekly_plans").delete().in_("id", plan_ids).execute().data or [])
+        counts["notifications"] += len(
+            client.table("notifications").delete().eq("type", "plan_ready").like("link", f"%week={week_start}%").in_("user_id", users).execute().data or []
+        )
+    group_list = list(group_ids or [])
+    for i in range(0, len(group_list), _CLEANUP_BATCH_SIZE):
+        deleted = client.table("group_plan_blocks").delete().eq("week_start", week_start).in_("group_id", group_list[i:i + _CLEANUP_BATCH_SIZE]).execute()
+        counts["group_blocks"] += len(deleted.data or [])
+    # Group blocks of group_ids annotate members outside user_ids too, so drop the whole week when they went
+    invalidate_schedules(None if group_list else user_list, week_start)
+    return counts
+
+
+def _load_planning_dirty_users(client) -> Optional[Dict[str, str]]:
+    """
+    Users marked dirty by the PLANNING_DIRTY_TRACKING.sql triggers: {user_id: last_marked_at}.
+    Returns None if the table is not installed (callers fall back to a full run).
+    """
+    try:
+        result = client.table("planning_dirty_users").select("user_id, last_marked_at").execute()
+    except Exception as e:
+        logging.warning(f"⚠️ [INCREMENTAL] planning_dirty_users not available: {e}")
+        return None
+    return {row["user_id"]: row.get("last_marked_at") for row in (result.data or [])}
+
+
+def _clear_planning_dirty_users(client, dirty: Dict[str, str]) -> None:
+    """Clear the marks that were consumed; users re-marked during the run stay dirty"""
+    if not dirty:
+        return
+    by_marked_at: Dict[str, list] = {}
+    for uid, marked_at in dirty.items():
+        by_marked_at.setdefault(marked_at, []).append(uid)
+    try:
+        for marked_at, uids in by_marked_at.items():
+            for i in range(0, len(uids), _CLEANUP_BATCH_SIZE):
+                query = client.table("planning_dirty_users").delete().in_("user_id", uids[i:i + _CLEANUP_BATCH_SIZE])
+                if marked_at:
+                    query = query.lte("last_marked_at", marked_at)
+                query.execute()
+    except Exception as e:
+        logging.warning(f"⚠️ [INCREMENTAL] Could not clear planning_dirty_users: {e}")
+
+
+def _expand_to_group_components(client, seed_user_ids) -> tuple:
+    """
+    Close a set of users over approved study-group membership: every group containing one of the
+    users, and every member of those groups, repeatedly. Groups only couple users through shared
+    members, so replanning a closed set never disturbs plans outside it.
+    Returns (user_ids, group_ids).
+    """
+    users = set(seed_user_ids)
+    groups = set()
+    frontier_users = set(users)
+    while frontier_users:
+        new_groups = set()
+        frontier = list(frontier_users)
+        for i in range(0, len(frontier), _CLEANUP_BATCH_SIZE):
+            res = client.table("group_members").select("group_id").eq("status", "approved").in_("user_id", frontier[i:i + _CLEANUP_BATCH_SIZE]).execute()
+            new_groups.update(r["group_id"] for r in (res.data or []))
+        new_groups -= groups
+        if not new_groups:
+            break
+        groups |= new_groups
+        new_users = set()
+        group_list = list(new_groups)
+        for i in range(0, len(group_list), _CLEANUP_BATCH_SIZE):
+            res = client.table("group_members").select("user_id").eq("status", "approved").in_("group_id", group_list[i:i + _CLEANUP_BATCH_SIZE]).execute()
+            new_users.update(r["user_id"] for r in (res.data or []))
+        frontier_users = new_users - users
+        users |= new_users
+    return users, groups
+
+
+def _planning_components(client) -> list:
+    """
+    Connected components of the user/study-group graph (approved memberships), covering every
+    user in user_profiles; users without groups are singleton components. Components can be
+    planned independently (see _expand_to_group_components). Returns [(user_ids, group_ids)],
+    largest first.
+    """
+    parent: Dict[str, str] = {}
+
+    def find(x: str) -> str:
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(a: str, b: str) -> None:
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[rb] = ra
+
+    def fetch_all(table: str, columns: str, **filters) -> list:
+        # PostgREST caps each response, so read in pages
+        rows, page = [], 1000
+        while True:
+            query = client.table(table).select(columns)
+            for column, value in filters.items():
+                query = query.eq(column, value)
+            batch = query.range(len(rows), len(rows) + page - 1).execute().data or []
+            rows.extend(batch)
+            if len(batch) < page:
+                return rows
+
+    for user in fetch_all("user_profiles", "id"):
+        find(f"u:{user['id']}")
+    for gm in fetch_all("group_members", "group_id, user_id", status="approved"):
+        union(f"g:{gm['group_id']}", f"u:{gm['user_id']}")
+
+    components: Dict[str, tuple] = {}
+    for node in list(parent):
+        users, groups = components.setdefault(find(node), (set(), set()))
+        (users if node.startswith("u:") else groups).add(node[2:])
+    return sorted((c for c in components.values() if c[0]), key=lambda c: (-len(c[0]), sorted(c[0])[0]))
+
+
+async def _run_incremental_weekly_replan(week_start_override: Optional[str] = None) -> Dict[str, object]:
+    """
+    Replan only users whose planning inputs changed since the last run (plus their study-group
+    components). Falls back to a full run when dirty tracking is not installed.
+    """
+    client = supabase_admin if supabase_admin else supabase
+    if not client:
+        raise HTTPException(status_code=500, detail="Supabase client not configured")
+
+    dirty = _load_planning_dirty_users(client)
+    if dirty is None:
+        await _run_weekly_full(week_start_override=week_start_override)
+        return {"mode": "full", "reason": "dirty tracking not installed"}
+    if not dirty:
+        logging.info("✅ [INCREMENTAL] No dirty users - nothing to replan")
+        return {"mode": "incremental", "dirty_users": 0, "replanned_users": 0, "replanned_groups": 0}
+
+    user_ids, group_ids = _expand_to_group_components(client, dirty.keys())
+    logging.info(f"🔁 [INCREMENTAL] {len(dirty)} dirty users -> replanning {len(user_ids)} users in {len(group_ids)} groups")
+    await _run_weekly_auto_for_all_users(
+        week_start_override=week_start_override,
+        only_user_ids=user_ids,
+        only_group_ids=group_ids,
+    )
+    _clear_planning_dirty_users(client, dirty)
+    return {
+        "mode": "incremental",
+        "dirty_users": len(dirty),
+        "replanned_users": len(user_ids),
+        "replanned_groups": len(group_ids),
+    }
+
+
+# Processes for a full weekly run (1 = plan in this process). Each process plans a shard of
+# study-group connected components (see _run_weekly_sharded).
+PLANNER_SHARD_PROCESSES = int(os.getenv("PLANNER_SHARD_PROCESSES", "1") or 1)
+
+
+def _shard_components(components: list, shards: int) -> list:
+    """
+    Balance (user_ids, group_ids) components over `shards` by user count: largest component to the
+    least loaded shard (LPT). A component is never split, so shards share no users or groups.
+    """
+    loads = [0] * max(1, shards)
+    result = [(set(), set()) for _ in loads]
+    for users, groups in sorted(components, key=lambda c: -len(c[0])):
+        i = loads.index(min(loads))
+        result[i][0].update(users)
+        result[i][1].update(groups)
+        loads[i] += len(users)
+    return [shard for shard in result if shard[0]]
+
+
+def _plan_shard_in_process(week_start: str, user_ids: list, group_ids: list) -> dict:
+    """ProcessPoolExecutor entry point: scoped weekly run for one shard in a fresh event loop"""
+    return asyncio.run(_run_weekly_auto_for_all_users(
+        week_start_override=week_start,
+        only_user_ids=set(user_ids),
+        only_group_ids=set(group_ids),
+        raise_errors=True,
+    )) or {}
+
+
+async def _run_weekly_sharded(week_start_override: Optional[str] = None, processes: Optional[int] = None) -> dict:
+    """
+    Full weekly run split across processes: clear the week once, shard the connected components of
+    the user/group graph and plan each shard in its own process. Shards share no users or groups,
+    so they write independently; total throughput scales with the number of processes.
+    """
+    client = supabase_admin if supabase_admin else supabase
+    if not client:
+        raise HTTPException(status_code=500, detail="Supabase client not configured")
+    processes = processes or PLANNER_SHARD_PROCESSES or (os.cpu_count() or 1)
+    if week_start_override:
+        week_start = week_start_override
+    else:
+        current_week_start = _get_week_start(datetime.utcnow())
+        week_start = (datetime.strptime(current_week_start, "%Y-%m-%d") + timedelta(days=7)).strftime("%Y-%m-%d")
+
+    dirty = _load_planning_dirty_users(client)
+    # One set-based cleanup for the whole week (also group blocks of groups without members)
+    cleanup_counts = _cleanup_week_plans(client, week_start, include_group_blocks=True, include_notifications=True)
+    shards = _shard_components(_planning_components(client), processes)
+    logging.info(
+        f"🧩 [SHARDED] Week {week_start}: cleanup {cleanup_counts}, {len(shards)} shards "
+        f"({[len(u) for u, _g in shards]} users)"
+    )
+
+    loop = asyncio.get_event_loop()
+    # spawn: the web process runs threads (scheduler, executors) that must not be forked
+    with ProcessPoolExecutor(max_workers=len(shards) or 1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        results = await asyncio.gather(*(
+            loop.run_in_executor(pool, _plan_shard_in_process, week_start, sorted(users), sorted(groups))
+            for users, groups in shards
+        ), return_exceptions=True)
+    # The shards wrote from other processes; their caches are not ours
+    invalidate_schedules(None, week_start)
+
+    failed = 0
+    for (users, _groups), result in zip(shards, results):
+        if isinstance(result, Exception):
+            failed += 1
+            logging.error(f"❌ [SHARDED] Shard with {len(users)} users failed: {result}")
+    if dirty and not failed:
+        _clear_planning_dirty_users(client, dirty)
+    return {"week_start": week_start, "shards": len(shards), "failed_shards": failed, "users": sum(len(u) for u, _g in shards)}
+
+
+async def _run_weekly_full(week_start_override: Optional[str] = None):
+    """Full weekly run, sharded across processes when PLANNER_SHARD_PROCESSES > 1"""
+    if PLANNER_SHARD_PROCESSES > 1:
+        return await _run_weekly_sharded(week_start_override=week_start_override)
+    return await _run_weekly_auto_for_all_users(week_start_override=week_start_override)
+
+
+# "optimizer" (default): place all groups jointly with app/group_optimizer.py.
+# "llm": one _plan_group_blocks_with_llm call per group (honours free-text group preferences).
+GROUP_PLANNER_MODE = os.getenv("GROUP_PLANNER_MODE", "optimizer").strip().lower()
+# Max concurrent LLM calls when GROUP_PLANNER_MODE=llm
+GROUP_PLANNER_CONCURRENCY = max(1, int(os.getenv("GROUP_PLANNER_CONCURRENCY", "8")))
+
+
+def _batch_groups_without_shared_members(group_jobs: list) -> list:
+    """
+    Split group jobs into batches whose groups share no members. A job goes one batch after the
+    latest earlier job it shares a member with, so each group still sees the slots taken by every
+    earlier conflicting group (the serial order's result) while independent groups run together.
+    """
+    user_last_batch = {}
+    batches = []
+    for job in group_jobs:
+        level = 1 + max((user_last_batch.get(mid, -1) for mid in job["member_ids"]), default=-1)
+        if level == len(batches):
+            batches.append([])
+        batches[level].append(job)
+        for mid in job["member_ids"]:
+            user_last_batch[mid] = level
+    return batches
+
+
+async def _place_group_blocks_with_llm(client, job: dict, user_blocked_slots: dict, time_slots) -> list:
+    """
+    LLM placement for one group (GROUP_PLANNER_MODE=llm): common free slots of all members,
+    _plan_group_blocks_with_llm, and deterministic 2-hour blocks if the LLM fails.
+    Returns [(day, "HH:MM")]; the caller marks them as blocked for the members.
+    """
+    group_id = job["group_id"]
+    member_ids = job["member_ids"]
+    group_quota = job["quota"]
+
+    # Calculate common free slots for ALL members
+    all_members_blocked = set()
+    for member_id in member_ids:
+        if member_id in user_blocked_slots:
+            all_members_blocked.update(user_blocked_slots[member_id])
+
+    # Find common free slots (available for ALL members)
+    common_free_slots = [(day, time) for day in range(7) for time in time_slots
+                        if (day, time) not in all_members_blocked]
+
+    if not common_free_slots:
+        logging.warning(f"   ⚠️ [GLOBAL AGENT] No common free slots found for group {group_id} with {len(member_ids)} members, skipping group blocks")
+        return []
+
+    # Load group preferences for LLM
+    group_preferences_raw = ""
+    group_preferences_summary = {}
+    try:
+        group_pref_result = client.table("group_preferences").select("preferences_raw, preferences_summary").eq("group_id", group_id).limit(1).execute()
+        if group_pref_result.data:
+            group_preferences_raw = group_pref_result.data[0].get("preferences_raw", "")
+            group_preferences_summary = group_pref_result.data[0].get("preferences_summary", {})
+    except Exception as gp_err:
+        logging.warning(f"Could not load group_preferences for LLM: {gp_err}")
+
+    slots = []
+    llm_group_result = await _plan_group_blocks_with_llm(
+        group_id=str(group_id),
+        course_number=job["course_number"],
+        course_name=job["course_name"],
+        group_quota=group_quota,
+        common_free_slots=common_free_slots,
+        group_preferences_raw=group_preferences_raw,
+        group_preferences_summary=group_preferences_summary,
+    )
+
+    if llm_group_result.get("success") and llm_group_result.get("group_blocks"):
+        logging.info(
+            f"   ✅ [GLOBAL AGENT][LLM] Planned {len(llm_group_result.get('group_blocks', []))} "
+            f"group blocks for group {group_id}"
+        )
+        for blk in llm_group_result.get("group_blocks", []):
+            day = blk.get("day_index")
+            t = blk.get("start_time")
+            if day is None or not t:
+                continue
+            if (day, t) not in common_free_slots:
+                logging.warning(
+                    f"   ⚠️ [GLOBAL AGENT][LLM] Slot ({day}, {t}) not in common_free_slots, skipping"
+                )
+                continue
+            slots.append((day, t))
+    else:
+        # Fallback: deterministic 2-hour blocks from common_free_slots
+        logging.warning(
+            f"   ⚠️ [GLOBAL AGENT][LLM] LLM planning failed for group {group_id} "
+            f"or returned no blocks. Falling back to deterministic allocation."
+        )
+        for day in range(7):
+            if len(slots) >= group_quota:
+                break
+            for i in range(len(time_slots) - 1):
+                if len(slots) >= group_quota:
+                    break
+                t1, t2 = time_slots[i], time_slots[i+1]
+                if (day, t1) in common_free_slots and (day, t2) in common_free_slots and (day, t1) not in slots:
+                    # Found 2-hour block that all members are free
+                    slots.extend([(day, t1), (day, t2)])
+    return slots
+
+
+async def _run_weekly_auto_for_all_users(
+    week_start_override: Optional[str] = None,
+    only_user_ids: Optional[set] = None,
+    only_group_ids: Optional[set] = None,
+    raise_errors: bool = False,
+):
     """
     Final Refined Global Scheduler Agent:
     1. Clear old data for the week.
     2. Calculate quotas: credits * 3 total. Split 50/50 (remainder to personal).
     3. Global Sync: Find long blocks (2-3h) for group work for ALL members.
     4. Individual Fill: Find long blocks for personal work.
+    Scoped (incremental) mode: with only_user_ids/only_group_ids (a set closed over group
+    membership, see _expand_to_group_components) only those users and groups are cleared and
+    replanned; every other plan for the week is left untouched.
+    raise_errors: re-raise a critical error instead of only logging it (queue workers retry the job).
     """
     try:
         # CRITICAL: Use admin client for cleanup to bypass RLS
@@ -2963,6 +3562,9 @@ async def _run_weekly_auto_for_all_users(week_start_override: Optional[str] = No
             logging.info(f"📅 [GLOBAL AGENT] Auto-calculated next week: {week_start} (current week: {current_week_start})")
         
         logging.info(f"🚀 [GLOBAL AGENT] Starting weekly planning for week {week_start}")
+        scoped = only_user_ids is not None
+        # A full run replans everyone, so it consumes every pending dirty mark
+        consumed_dirty = None if scoped else _load_planning_dirty_users(client)
 
         # 2. Cleanup - Delete ALL existing plans and blocks for this week
         # IMPORTANT: Delete blocks first, then plans, to ensure complete cleanup
@@ -2971,235 +3573,43 @@ async def _run_weekly_auto_for_all_users(week_start_override: Optional[str] = No
         logging.info(f"🧹 [GLOBAL AGENT] Cleaning up ALL old data for week {week_start}")
         logging.info(f"   🔧 Using {'admin' if supabase_admin else 'anon'} client for cleanup")
         try:
-            # Step 1: Find all plans for this week (by week_start - the date the plans are scheduled for)
-            # CRITICAL: Only delete plans for the SPECIFIC week_start, not all plans!
-            logging.info(f"   🔍 Step 1: Finding all plans for week_start={week_start} (ONLY this week, not all weeks!)")
-            
-            # CRITICAL: First, check what plans exist for OTHER weeks to make sure we don't delete them
-            all_plans_all_weeks = client.table("weekly_plans").select("id, week_start, user_id").order("week_start", desc=True).limit(20).execute()
-            if all_plans_all_weeks.data:
-                other_weeks = [p for p in all_plans_all_weeks.data if p.get("week_start") != week_start]
-                logging.info(f"   📊 Found {len(other_weeks)} plans for OTHER weeks (these should NOT be deleted): {[(p.get('id'), p.get('week_start')) for p in other_weeks[:5]]}")
-            
-            all_plans_for_week = client.table("weekly_plans").select("id,week_start,user_id").eq("week_start", week_start).execute()
-            plan_ids_for_week = [p["id"] for p in (all_plans_for_week.data or [])]
-            logging.info(f"   🔍 Query result: {len(plan_ids_for_week)} plans found for week_start={week_start}")
-            
-            # CRITICAL: Verify we're only deleting the correct week
-            if all_plans_for_week.data:
-                sample_weeks = [p.get("week_start") for p in all_plans_for_week.data[:5]]
-                if any(w != week_start for w in sample_weeks if w):
-                    logging.error(f"   ❌ CRITICAL ERROR: Found plans with different week_start! Expected: {week_start}, Found: {sample_weeks}")
-                    raise Exception(f"Cleanup error: Found plans with wrong week_start")
-                logging.info(f"   ✅ Verified: All plans are for week_start={week_start}")
-                # Log user_ids to verify we're deleting plans for all users (this is correct for global cleanup)
-                user_ids_in_plans = list(set([p.get("user_id") for p in all_plans_for_week.data]))
-                logging.info(f"   👥 Plans belong to {len(user_ids_in_plans)} different users (this is correct for global cleanup)")
-            
-            if plan_ids_for_week:
-                logging.info(f"   🗑️ Found {len(plan_ids_for_week)} existing plan(s) to delete (identified by week_start={week_start}): {plan_ids_for_week[:5]}...")
-                # Step 2: Delete all blocks for these plans (by plan_id)
-                # This is the correct way: find plans by week_start, then delete blocks by plan_id
-                total_blocks_deleted = 0
-                for plan_id in plan_ids_for_week:
-                    try:
-                        logging.info(f"   🗑️ Deleting blocks for plan_id={plan_id} (from week_start={week_start})")
-                        blocks_deleted = client.table("weekly_plan_blocks").delete().eq("plan_id", plan_id).execute()
-                        # Note: Supabase delete() may not return data, so we check if it exists
-                        deleted_count = len(blocks_deleted.data) if blocks_deleted.data else 0
-                        total_blocks_deleted += deleted_count
-                        logging.info(f"   🗑️ Deleted {deleted_count} blocks for plan_id {plan_id} (response had data: {blocks_deleted.data is not None})")
-                    except Exception as block_del_err:
-                        logging.error(f"   ❌ Error deleting blocks for plan_id {plan_id}: {block_del_err}", exc_info=True)
-                logging.info(f"   ✅ Total blocks deleted: {total_blocks_deleted} across {len(plan_ids_for_week)} plans")
+            # One set-based cleanup (RPC, or batched in_() deletes) instead of per-plan / per-block
+            # round trips and before/after snapshot queries. Only rows with this exact week_start
+            # are touched, so other weeks cannot be affected.
+            if scoped:
+                cleanup_counts = _cleanup_week_plans_for_users(client, week_start, only_user_ids, only_group_ids)
             else:
-                logging.info(f"   ✅ No existing plans found for week {week_start}")
-            
-            # Step 3: Delete all plans for this week (CASCADE DELETE will also remove blocks, but we already did it explicitly above)
-            # CRITICAL: Only delete plans with the exact week_start - this is safe because we verified above
-            try:
-                logging.info(f"   🗑️ Deleting all plans for week_start={week_start} (ONLY this week, not other weeks!)")
-                # Double-check: Get plans before deletion to verify they're all for the correct week
-                plans_to_delete_check = client.table("weekly_plans").select("id, week_start").eq("week_start", week_start).execute()
-                if plans_to_delete_check.data:
-                    # Verify all plans are for the correct week_start
-                    wrong_weeks = [p for p in plans_to_delete_check.data if p.get("week_start") != week_start]
-                    if wrong_weeks:
-                        logging.error(f"   ❌ CRITICAL ERROR: Found plans with wrong week_start before deletion! Expected: {week_start}, Found: {wrong_weeks}")
-                        raise Exception(f"Cleanup error: Found plans with wrong week_start before deletion")
-                    logging.info(f"   ✅ Verified: All {len(plans_to_delete_check.data)} plans are for week_start={week_start}")
-                
-                # CRITICAL: Before deletion, count plans for OTHER weeks to ensure we don't delete them
-                plans_before_deletion = client.table("weekly_plans").select("id, week_start").order("week_start", desc=True).limit(50).execute()
-                if plans_before_deletion.data:
-                    plans_by_week_before = {}
-                    for p in plans_before_deletion.data:
-                        ws = p.get("week_start")
-                        plans_by_week_before[ws] = plans_by_week_before.get(ws, 0) + 1
-                    logging.info(f"   📊 Plans count BEFORE deletion (by week): {plans_by_week_before}")
-                
-                plans_deleted = client.table("weekly_plans").delete().eq("week_start", week_start).execute()
-                deleted_count = len(plans_deleted.data) if plans_deleted.data else 0
-                logging.info(f"   ✅ Deleted {deleted_count} weekly_plans for week {week_start} (response had data: {plans_deleted.data is not None})")
-                
-                # CRITICAL: After deletion, verify that plans for OTHER weeks were NOT deleted
-                plans_after_deletion = client.table("weekly_plans").select("id, week_start").order("week_start", desc=True).limit(50).execute()
-                if plans_after_deletion.data:
-                    plans_by_week_after = {}
-                    for p in plans_after_deletion.data:
-                        ws = p.get("week_start")
-                        plans_by_week_after[ws] = plans_by_week_after.get(ws, 0) + 1
-                    logging.info(f"   📊 Plans count AFTER deletion (by week): {plans_by_week_after}")
-                    
-                    # Check if any plans from other weeks were deleted
-                    for ws in plans_by_week_before:
-                        if ws != week_start:
-                            before_count = plans_by_week_before.get(ws, 0)
-                            after_count = plans_by_week_after.get(ws, 0)
-                            if after_count < before_count:
-                                logging.error(f"   ❌ CRITICAL ERROR: Plans for week {ws} were deleted! Before: {before_count}, After: {after_count}")
-                                raise Exception(f"Cleanup error: Plans for week {ws} were incorrectly deleted!")
-                            elif after_count == before_count:
-                                logging.info(f"   ✅ Verified: Plans for week {ws} were NOT deleted (count: {after_count})")
-                
-                # Verify deletion - check if any plans still exist for this week
-                remaining_plans_check = client.table("weekly_plans").select("id, week_start").eq("week_start", week_start).execute()
-                if remaining_plans_check.data:
-                    logging.warning(f"   ⚠️ WARNING: {len(remaining_plans_check.data)} plans still exist after deletion! This might indicate a problem.")
-                else:
-                    logging.info(f"   ✅ Verified: No plans remain for week_start={week_start}")
-            except Exception as plan_del_err:
-                logging.error(f"   ❌ Error deleting weekly_plans: {plan_del_err}", exc_info=True)
-            
-            # Step 3.5: Delete ALL orphaned blocks for this week (blocks without valid plan_id)
-            # This catches blocks that were left behind if plans were manually deleted
-            # IMPORTANT: This is a safety measure to ensure complete cleanup
-            # CRITICAL: Only delete blocks that belong to THIS week_start, not other weeks!
-            try:
-                logging.info(f"   🔍 Step 3.5: Finding and deleting orphaned blocks for week_start={week_start} ONLY")
-                # Get all plan_ids that exist for this week_start (should be empty after deletion above, but check anyway)
-                valid_plans = client.table("weekly_plans").select("id").eq("week_start", week_start).execute()
-                valid_plan_ids = {p["id"] for p in (valid_plans.data or [])}
-                
-                # CRITICAL: Only check blocks that reference the deleted plan_ids for THIS week
-                # We must NOT check blocks from other weeks!
-                orphaned_block_ids = []
-                
-                # Only check blocks that reference the deleted plan_ids (if any still exist)
-                # These plan_ids are guaranteed to be from this week_start (we verified above)
-                if plan_ids_for_week:
-                    remaining_blocks_check = client.table("weekly_plan_blocks").select("id, plan_id").in_("plan_id", plan_ids_for_week).execute()
-                    if remaining_blocks_check.data:
-                        orphaned_block_ids.extend([b["id"] for b in remaining_blocks_check.data])
-                        logging.info(f"   🗑️ Found {len(orphaned_block_ids)} blocks still referencing deleted plan_ids for week {week_start}")
-                else:
-                    logging.info(f"   ℹ️ No plan_ids_for_week to check for orphaned blocks (this is normal if no plans existed)")
-                
-                # CRITICAL: Do NOT check blocks from other weeks!
-                # We only delete blocks that reference plan_ids we know belong to this week_start
-                # This prevents accidentally deleting blocks from other weeks
-                
-                # Delete orphaned blocks in batch
-                if orphaned_block_ids:
-                    logging.info(f"   🗑️ Found {len(orphaned_block_ids)} orphaned blocks to delete (all verified to belong to week {week_start})")
-                    # Delete in batches to avoid overwhelming the database
-                    batch_size = 50
-                    for i in range(0, len(orphaned_block_ids), batch_size):
-                        batch = orphaned_block_ids[i:i+batch_size]
-                        for block_id in batch:
-                            try:
-                                client.table("weekly_plan_blocks").delete().eq("id", block_id).execute()
-                            except Exception as orphan_del_err:
-                                logging.warning(f"   ⚠️ Could not delete orphaned block {block_id}: {orphan_del_err}")
-                    logging.info(f"   ✅ Deleted {len(orphaned_block_ids)} orphaned blocks")
-                else:
-                    logging.info(f"   ✅ No orphaned blocks found")
-            except Exception as orphan_err:
-                logging.warning(f"   ⚠️ Could not check for orphaned blocks: {orphan_err}")
-            
-            # Step 3.6: Final sweep - Delete ALL blocks that might reference non-existent plans for this week
-            # This is a safety measure to catch any blocks that slipped through
-            # CRITICAL: This step is now redundant since we already deleted all plans above
-            # But we keep it as a safety check - it should find 0 plans since we deleted them all
-            try:
-                logging.info(f"   🔍 Step 3.6: Final sweep - checking for any remaining plans for week_start={week_start}")
-                # Get all remaining plan_ids for this week (should be none after deletion above)
-                remaining_plans = client.table("weekly_plans").select("id, week_start").eq("week_start", week_start).execute()
-                remaining_plan_ids = [p["id"] for p in (remaining_plans.data or [])]
-                
-                if remaining_plan_ids:
-                    logging.warning(f"   ⚠️ Found {len(remaining_plan_ids)} plans still remaining after deletion! This shouldn't happen.")
-                    # Verify these are actually for the correct week_start
-                    for p in remaining_plans.data:
-                        if p.get("week_start") != week_start:
-                            logging.error(f"   ❌ CRITICAL: Found plan {p.get('id')} with wrong week_start! Expected: {week_start}, Found: {p.get('week_start')}")
-                            raise Exception(f"Final sweep found plan with wrong week_start: {p.get('week_start')} != {week_start}")
-                    # Only delete blocks for plans we verified belong to this week
-                    for plan_id in remaining_plan_ids:
-                        try:
-                            client.table("weekly_plan_blocks").delete().eq("plan_id", plan_id).execute()
-                        except Exception as block_del_err:
-                            logging.warning(f"   ⚠️ Could not delete blocks for plan {plan_id}: {block_del_err}")
-                    logging.info(f"   🗑️ Final sweep: Deleted blocks for {len(remaining_plan_ids)} remaining plans")
-                else:
-                    logging.info(f"   ✅ Final sweep: No remaining plans found (as expected after deletion)")
-            except Exception as final_sweep_err:
-                logging.warning(f"   ⚠️ Final sweep error: {final_sweep_err}")
-            
-            # Step 4: Delete all group_plan_blocks for this week
-            # CRITICAL: This must happen BEFORE creating new plans to avoid conflicts
-            try:
-                logging.info(f"   🗑️ Deleting all group_plan_blocks for week_start={week_start}")
-                group_blocks_deleted = client.table("group_plan_blocks").delete().eq("week_start", week_start).execute()
-                deleted_count = len(group_blocks_deleted.data) if group_blocks_deleted.data else 0
-                logging.info(f"   ✅ Deleted {deleted_count} group_plan_blocks for week {week_start} (response had data: {group_blocks_deleted.data is not None})")
-                
-                # Verify deletion - check if any group_plan_blocks still exist for this week
-                verify_group_blocks = client.table("group_plan_blocks").select("id").eq("week_start", week_start).execute()
-                if verify_group_blocks.data and len(verify_group_blocks.data) > 0:
-                    logging.warning(f"   ⚠️ WARNING: {len(verify_group_blocks.data)} group_plan_blocks still exist after deletion! Force deleting...")
-                    # Force delete any remaining group_plan_blocks
-                    for block in verify_group_blocks.data:
-                        try:
-                            client.table("group_plan_blocks").delete().eq("id", block["id"]).execute()
-                        except:
-                            pass
-                    logging.info(f"   ✅ Force deleted remaining group_plan_blocks")
-                else:
-                    logging.info(f"   ✅ Verified: No group_plan_blocks found after deletion")
-            except Exception as group_del_err:
-                logging.error(f"   ❌ Error deleting group_plan_blocks: {group_del_err}", exc_info=True)
-            
-            # Step 5: Also clear notifications for this week to avoid duplicates
-            try:
-                notifications_deleted = client.table("notifications").delete().eq("type", "plan_ready").like("link", f"%week={week_start}%").execute()
-                deleted_count = len(notifications_deleted.data) if notifications_deleted.data else 0
-                logging.info(f"   ✅ Deleted {deleted_count} notifications for week {week_start}")
-            except Exception as notif_del_err:
-                logging.error(f"   ❌ Error deleting notifications: {notif_del_err}")
-            
-            logging.info(f"✅ [GLOBAL AGENT] Cleanup complete for week {week_start}")
-        except Exception as cleanup_err:
-            logging.error(f"❌ [GLOBAL AGENT] Cleanup ERROR: {cleanup_err}", exc_info=True)
-            # Don't fail the entire operation if cleanup fails, but log it
-
-        # 3. Get all users and their active courses (from Supabase only)
-        users_result = client.table("user_profiles").select("id").execute()
-        users = users_result.data or []
-        user_ids = [u["id"] for u in users]
-        
-        # user_id -> set of (day, time) that are BLOCKED
-        user_blocked_slots = {uid: set() for uid in user_ids}
-        # user_id -> set of active course_numbers
-        user_active_courses = {uid: set() for uid in user_ids}
-        time_slots = _build_time_slots()
-        
-        # Get valid catalog courses
-        catalog_res = client.table("course_catalog").select("course_number").execute()
-        valid_course_numbers = {c["course_number"] for c in (catalog_res.data or [])}
-
-        for u in users:
-            uid = u["id"]
+                cleanup_counts = _cleanup_week_plans(
+                    client, week_start, include_group_blocks=True, include_notifications=True
+                )
+            logging.info(f"✅ [GLOBAL AGENT] Cleanup complete for week {week_start}: {cleanup_counts}")
+            invalidate_schedules(only_user_ids, week_start)
+        except Exception as cleanup_err:
+            logging.error(f"❌ [GLOBAL AGENT] Cleanup ERROR: {cleanup_err}", exc_info=True)
+            # Don't fail the entire operation if cleanup fails, but log it
+
+        # 3. Get all users and their active courses (from Supabase only)
+        users_result = client.table("user_profiles").select("id").execute()
+        users = users_result.data or []
+        if scoped:
+            users = [u for u in users if u["id"] in only_user_ids]
+        user_ids = [u["id"] for u in users]
+        
+        # user_id -> set of (day, time) that are BLOCKED
+        user_blocked_slots = {uid: set() for uid in user_ids}
+        # user_id -> set of active course_numbers
+        user_active_courses = {uid: set() for uid in user_ids}
+        time_slots = _build_time_slots()
+        
+        # Get valid catalog courses
+        catalog = get_catalog(client)
+        valid_course_numbers = set(catalog.by_number)
+
+        # One snapshot read for all users instead of 3 constraint queries per user
+        availability = get_users_availability(client, user_ids, week_start)
+
+        for u in users:
+            uid = u["id"]
             
             # Fetch user's courses
             courses_res = client.table("courses").select("*").eq("user_id", uid).execute()
@@ -3214,50 +3624,20 @@ async def _run_weekly_auto_for_all_users(week_start_override: Optional[str] = No
             
             logging.info(f"   👤 User {uid}: {len(user_active_courses[uid])} VALID courses available for planning")
             
-            # Permanent constraints (FETCH THEM HERE!)
-            pc_res = client.table("constraints").select("*").eq("user_id", uid).execute()
-            for c in (pc_res.data or []):
-                for day in _parse_days(c.get("days")):
-                    for t in time_slots:
-                        if _time_to_minutes(t) >= _time_to_minutes(c["start_time"]) and _time_to_minutes(t) < _time_to_minutes(c["end_time"]):
-                            user_blocked_slots[uid].add((day, t))
-            
-            # Weekly constraints
-            wc_res = client.table("weekly_constraints").select("*").eq("user_id", uid).eq("week_start", week_start).execute()
-            for c in (wc_res.data or []):
-                if c.get("is_hard", True):
-                    for day in _parse_days(c.get("days")):
-                        for t in time_slots:
-                            if _time_to_minutes(t) >= _time_to_minutes(c["start_time"]) and _time_to_minutes(t) < _time_to_minutes(c["end_time"]):
-                                user_blocked_slots[uid].add((day, t))
-            
-            # Semester schedule items (fixed lectures/tutorials - always hard constraints)
-            try:
-                semester_res = client.table("semester_schedule_items").select("*").eq("user_id", uid).execute()
-                for item in (semester_res.data or []):
-                    days_array = item.get("days", [])
-                    if isinstance(days_array, str):
-                        try:
-                            import json
-                            days_array = json.loads(days_array)
-                        except:
-                            days_array = []
-                    for day in _parse_days(days_array):
-                        for t in time_slots:
-                            if _time_to_minutes(t) >= _time_to_minutes(item["start_time"]) and _time_to_minutes(t) < _time_to_minutes(item["end_time"]):
-                                user_blocked_slots[uid].add((day, t))
-            except Exception as e:
-                # If table doesn't exist yet, just log and continue
-                logging.warning(f"Could not load semester schedule items for user {uid}: {e}")
+            # Hard constraints (permanent, hard weekly, semester items) from the availability snapshot
+            user_blocked_slots[uid], _soft = planning_blocked_slots(availability.get(uid, {}), time_slots)
 
         # 4. Phase 2: Global Group Synchronization
         groups_res = client.table("study_groups").select("*").execute()
         groups = groups_res.data or []
+        if scoped:
+            groups = [g for g in groups if g["id"] in (only_group_ids or set())]
         
         # Load catalog for proper course names
-        catalog_res_for_groups = client.table("course_catalog").select("course_number,course_name").execute()
-        catalog_name_map = {str(c["course_number"]).strip(): c["course_name"] for c in (catalog_res_for_groups.data or [])}
+        catalog_name_map = catalog.name_map()
         
+        # Pass 1: members and quota per group; the slots are chosen below for all groups at once
+        group_jobs = []
         for group in groups:
             group_id = group["id"]
             course_number = group.get("course_id") # Note: This field is expected to be the course_number
@@ -3321,63 +3701,13 @@ async def _run_weekly_auto_for_all_users(week_start_override: Optional[str] = No
             if existing_gb.data and len(existing_gb.data) > 0:
                 logging.info(f"   ✅ [GLOBAL AGENT] Group blocks already exist for group {group_id}, using existing blocks")
                 # Ensure all members have weekly_plan_blocks for these existing group blocks
-                for member_id in member_ids:
-                    try:
-                        member_plan_result = client.table("weekly_plans").select("id").eq("user_id", member_id).eq("week_start", week_start).limit(1).execute()
-                        if not member_plan_result.data:
-                            plan_result = client.table("weekly_plans").insert({
-                                "user_id": member_id,
-                                "week_start": week_start,
-                                "source": "auto"
-                            }).execute()
-                            if plan_result.data:
-                                member_plan_id = plan_result.data[0]["id"]
-                            else:
-                                continue
-                        else:
-                            member_plan_id = member_plan_result.data[0]["id"]
-                        
-                        # Check if this member already has these group blocks
-                        existing_member_blocks = client.table("weekly_plan_blocks").select("id").eq("plan_id", member_plan_id).eq("work_type", "group").eq("course_number", course_number).execute()
-                        existing_slots = {(b.get("day_of_week"), b.get("start_time")) for b in (existing_member_blocks.data or [])}
-                        
-                        # Create weekly_plan_blocks for this member (only if they don't exist)
-                        member_blocks = []
-                        for block in existing_gb.data:
-                            slot_key = (block["day_of_week"], block["start_time"])
-                            if slot_key not in existing_slots:
-                                member_blocks.append({
-                                    "plan_id": member_plan_id,
-                                    "user_id": member_id,
-                                    "course_number": course_number,
-                                    "course_name": course_name,
-                                    "work_type": "group",
-                                    "day_of_week": block["day_of_week"],
-                                    "start_time": block["start_time"],
-                                    "end_time": block["end_time"],
-                                    "is_locked": False,
-                                    "source": "auto"
-                                })
-                        
-                        if member_blocks:
-                            client.table("weekly_plan_blocks").insert(member_blocks).execute()
-                            logging.info(f"   ✅ [GLOBAL AGENT] Created {len(member_blocks)} weekly_plan_blocks for member {member_id} (from existing group_plan_blocks)")
-                    except Exception as member_err:
-                        logging.error(f"   ❌ [GLOBAL AGENT] Error creating blocks for member {member_id}: {member_err}", exc_info=True)
-                continue
-            
-            # Calculate common free slots for ALL members
-            all_members_blocked = set()
-            for member_id in member_ids:
-                if member_id in user_blocked_slots:
-                    all_members_blocked.update(user_blocked_slots[member_id])
-            
-            # Find common free slots (available for ALL members)
-            common_free_slots = [(day, time) for day in range(7) for time in time_slots 
-                                if (day, time) not in all_members_blocked]
-            
-            if not common_free_slots:
-                logging.warning(f"   ⚠️ [GLOBAL AGENT] No common free slots found for group {group_id} with {len(member_ids)} members, skipping group blocks")
+                try:
+                    fan_out = _fan_out_group_blocks_to_members(
+                        client, member_ids, week_start, existing_gb.data, course_number, course_name
+                    )
+                    logging.info(f"   ✅ [GLOBAL AGENT] Fan-out from existing group_plan_blocks for group {group_id}: {fan_out}")
+                except Exception as member_err:
+                    logging.error(f"   ❌ [GLOBAL AGENT] Error creating member blocks for group {group_id}: {member_err}", exc_info=True)
                 continue
             
             # CRITICAL: Ensure group_quota is at least 1 if group exists (even if no preferences)
@@ -3385,92 +3715,72 @@ async def _run_weekly_auto_for_all_users(week_start_override: Optional[str] = No
             if group_quota <= 0:
                 logging.warning(f"   ⚠️ [GLOBAL AGENT] group_quota is {group_quota} for group {group_id}, setting to default 2h")
                 group_quota = 2  # Default minimum for any group
-            
-            # Load group preferences for LLM
-            group_preferences_raw = ""
-            group_preferences_summary = {}
-            try:
-                group_pref_result = client.table("group_preferences").select("preferences_raw, preferences_summary").eq("group_id", group_id).limit(1).execute()
-                if group_pref_result.data:
-                    group_preferences_raw = group_pref_result.data[0].get("preferences_raw", "")
-                    group_preferences_summary = group_pref_result.data[0].get("preferences_summary", {})
-            except Exception as gp_err:
-                logging.warning(f"Could not load group_preferences for LLM: {gp_err}")
-            
-            # Use LLM to plan group blocks (same as generate_weekly_plan)
-            created_group_blocks = []
-            llm_group_result = await _plan_group_blocks_with_llm(
-                group_id=str(group_id),
-                course_number=course_number,
-                course_name=course_name,
-                group_quota=group_quota,
-                common_free_slots=common_free_slots,
-                group_preferences_raw=group_preferences_raw,
-                group_preferences_summary=group_preferences_summary,
+
+            group_jobs.append({
+                "group_id": group_id,
+                "course_number": course_number,
+                "course_name": course_name,
+                "member_ids": member_ids,
+                "quota": group_quota,
+            })
+
+        # Pass 2: choose slots. The optimizer places every group jointly (members shared between
+        # groups no longer depend on table order); GROUP_PLANNER_MODE=llm keeps one LLM call per group.
+        if GROUP_PLANNER_MODE == "llm":
+            # Groups in one batch share no members, so they are planned concurrently; a group
+            # waits only for earlier groups it shares members with (same result as serial order)
+            semaphore = asyncio.Semaphore(GROUP_PLANNER_CONCURRENCY)
+
+            async def place(job):
+                async with semaphore:
+                    return await _place_group_blocks_with_llm(client, job, user_blocked_slots, time_slots)
+
+            batches = _batch_groups_without_shared_members(group_jobs)
+            logging.info(
+                f"🧩 [GLOBAL AGENT] LLM group planning: {len(group_jobs)} groups in {len(batches)} batches "
+                f"(concurrency {GROUP_PLANNER_CONCURRENCY})"
             )
-            
-            if llm_group_result.get("success") and llm_group_result.get("group_blocks"):
-                logging.info(
-                    f"   ✅ [GLOBAL AGENT][LLM] Planned {len(llm_group_result.get('group_blocks', []))} "
-                    f"group blocks for group {group_id}"
-                )
-                for blk in llm_group_result.get("group_blocks", []):
-                    day = blk.get("day_index")
-                    t = blk.get("start_time")
-                    if day is None or not t:
-                        continue
-                    if (day, t) not in common_free_slots:
-                        logging.warning(
-                            f"   ⚠️ [GLOBAL AGENT][LLM] Slot ({day}, {t}) not in common_free_slots, skipping"
-                        )
-                        continue
-                    created_group_blocks.append({
-                        "group_id": group_id,
-                        "week_start": week_start,
-                        "course_number": course_number,
-                        "day_of_week": day,
-                        "start_time": t,
-                        "end_time": _minutes_to_time(_time_to_minutes(t) + 60),
-                        "created_by": member_ids[0]
-                    })
-                    # Mark as blocked for all members
-                    for mid in member_ids:
+            for batch in batches:
+                results = await asyncio.gather(*(place(job) for job in batch), return_exceptions=True)
+                for job, result in zip(batch, results):
+                    if isinstance(result, Exception):
+                        logging.error(f"❌ [GLOBAL AGENT] Group planning failed for group {job['group_id']}: {result}")
+                        result = []
+                    job["slots"] = result
+                    for mid in job["member_ids"]:
                         if mid in user_blocked_slots:
-                            user_blocked_slots[mid].add((day, t))
-            else:
-                # Fallback: deterministic 2-hour blocks from common_free_slots
-                logging.warning(
-                    f"   ⚠️ [GLOBAL AGENT][LLM] LLM planning failed for group {group_id} "
-                    f"or returned no blocks. Falling back to deterministic allocation."
-                )
-                allocated_hours = 0
-                for day in range(7):
-                    if allocated_hours >= group_quota:
-                        break
-                    for i in range(len(time_slots) - 1):
-                        if allocated_hours >= group_quota:
-                            break
-                        t1, t2 = time_slots[i], time_slots[i+1]
-                        if (day, t1) in common_free_slots and (day, t2) in common_free_slots:
-                            # Found 2-hour block that all members are free
-                            for t in [t1, t2]:
-                                created_group_blocks.append({
-                                    "group_id": group_id,
-                                    "week_start": week_start,
-                                    "course_number": course_number,
-                                    "day_of_week": day,
-                                    "start_time": t,
-                                    "end_time": _minutes_to_time(_time_to_minutes(t) + 60),
-                                    "created_by": member_ids[0]
-                                })
-                                # Mark as blocked for all members
-                                for mid in member_ids:
-                                    if mid in user_blocked_slots:
-                                        user_blocked_slots[mid].add((day, t))
-                                allocated_hours += 1
-            
-            # Track daily ranges for message (only if we created new blocks)
-            daily_ranges = {}
+                            user_blocked_slots[mid].update(job["slots"])
+        else:
+            assignments, optimizer_stats = plan_group_blocks(group_jobs, user_blocked_slots, time_slots)
+            logging.info(f"🧩 [GLOBAL AGENT] Group optimizer: {optimizer_stats}")
+            for job in group_jobs:
+                job["slots"] = assignments.get(job["group_id"], [])
+                # Mark as blocked for all members
+                for mid in job["member_ids"]:
+                    if mid in user_blocked_slots:
+                        user_blocked_slots[mid].update(job["slots"])
+
+        # Pass 3: persist, fan out to members and announce
+        for job in group_jobs:
+            group_id = job["group_id"]
+            course_number = job["course_number"]
+            course_name = job["course_name"]
+            member_ids = job["member_ids"]
+            created_group_blocks = [
+                {
+                    "group_id": group_id,
+                    "week_start": week_start,
+                    "course_number": course_number,
+                    "day_of_week": day,
+                    "start_time": t,
+                    "end_time": _minutes_to_time(_time_to_minutes(t) + 60),
+                    "created_by": member_ids[0]
+                }
+                for day, t in job["slots"]
+            ]
+
+            # Blocks to announce in the group update (only if we created new blocks)
+            announced_blocks = []
             
             if created_group_blocks:
                 # Insert group_plan_blocks
@@ -3478,67 +3788,27 @@ async def _run_weekly_auto_for_all_users(week_start_override: Optional[str] = No
                 if insert_result.data:
                     logging.info(f"   ✅ [GLOBAL AGENT] Created {len(created_group_blocks)} synchronized group_plan_blocks for group {group_id}")
                     
+                    announced_blocks = created_group_blocks
+                    
                     # CRITICAL: Create weekly_plan_blocks for ALL members of the group
                     # This ensures the blocks appear in each user's weekly plan
-                    for member_id in member_ids:
-                        try:
-                            # Get or create plan for this member
-                            member_plan_result = client.table("weekly_plans").select("id").eq("user_id", member_id).eq("week_start", week_start).limit(1).execute()
-                            if not member_plan_result.data:
-                                plan_result = client.table("weekly_plans").insert({
-                                    "user_id": member_id,
-                                    "week_start": week_start,
-                                    "source": "auto"
-                                }).execute()
-                                if plan_result.data:
-                                    member_plan_id = plan_result.data[0]["id"]
-                                else:
-                                    logging.warning(f"⚠️ [GLOBAL AGENT] Failed to create weekly_plan for member {member_id}, skipping blocks")
-                                    continue
-                            else:
-                                member_plan_id = member_plan_result.data[0]["id"]
-                            
-                            # Create weekly_plan_blocks for this member
-                            member_blocks = []
-                            for block in created_group_blocks:
-                                member_blocks.append({
-                                    "plan_id": member_plan_id,
-                                    "user_id": member_id,
-                                    "course_number": course_number,
-                                    "course_name": course_name,
-                                    "work_type": "group",
-                                    "day_of_week": block["day_of_week"],
-                                    "start_time": block["start_time"],
-                                    "end_time": block["end_time"],
-                                    "is_locked": False,
-                                    "source": "auto"
-                                })
-                                
-                                # Track for message (only once per unique slot)
-                                day = block["day_of_week"]
-                                if day not in daily_ranges:
-                                    daily_ranges[day] = []
-                                slot_str = f"{block['start_time']}-{block['end_time']}"
-                                if slot_str not in daily_ranges[day]:
-                                    daily_ranges[day].append(slot_str)
-                            
-                            if member_blocks:
-                                client.table("weekly_plan_blocks").insert(member_blocks).execute()
-                                logging.info(f"✅ [GLOBAL AGENT] Created {len(member_blocks)} weekly_plan_blocks for member {member_id} (group {group_id})")
-                        except Exception as member_block_err:
-                            logging.error(f"❌ [GLOBAL AGENT] Error creating weekly_plan_blocks for member {member_id}: {member_block_err}", exc_info=True)
+                    try:
+                        fan_out = _fan_out_group_blocks_to_members(
+                            client, member_ids, week_start, created_group_blocks, course_number, course_name
+                        )
+                        logging.info(f"✅ [GLOBAL AGENT] Fan-out for group {group_id}: {fan_out} ({len(member_ids)} members)")
+                    except Exception as member_block_err:
+                        logging.error(f"❌ [GLOBAL AGENT] Error creating weekly_plan_blocks for members of group {group_id}: {member_block_err}", exc_info=True)
                 else:
                     logging.error(f"   ❌ [GLOBAL AGENT] Failed to insert group_plan_blocks for group {group_id}")
             else:
                 logging.warning(f"   ⚠️ [GLOBAL AGENT] Could not create group blocks for group {group_id} - no suitable slots found")
 
             # Post ONE consolidated update if any NEW blocks were scheduled
-            if daily_ranges:
+            if announced_blocks:
                 try:
-                    day_names = ["ראשון", "שני", "שלישי", "רביעי", "חמישי", "שישי", "שבת"]
-                    summary_lines = []
-                    for d in sorted(daily_ranges.keys()):
-                        summary_lines.append(f"{day_names[d]} {', '.join(daily_ranges[d])}")
+                    # Back-to-back hours are announced as one range (10:00-12:00)
+                    summary_lines = day_range_lines(announced_blocks)
                     
                     # Formatting week start date to DD/MM
                     try:
@@ -3586,6 +3856,7 @@ async def _run_weekly_auto_for_all_users(week_start_override: Optional[str] = No
 
         # 5. Phase 3: Individual User Planning
         logging.info(f"👤 [GLOBAL AGENT] Starting individual planning for {len(user_ids)} users")
+        plan_ready_rows = []
         for uid in user_ids:
             try:
                 # Check if user has any active courses before planning
@@ -3594,47 +3865,49 @@ async def _run_weekly_auto_for_all_users(week_start_override: Optional[str] = No
                     continue
 
                 # #region agent log
-                try:
-                    import json
-                    with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                        f.write(json.dumps({"sessionId":"debug-session","runId":"run1","hypothesisId":"G","location":"app/main.py:1951","message":"_run_weekly_auto: calling generate_weekly_plan","data":{"user_id":uid,"week_start":week_start},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-                except: pass
+                debug_log("G", "app/main.py:1951", "_run_weekly_auto: calling generate_weekly_plan", {"user_id":uid,"week_start":week_start})
                 # #endregion
                 fake_user = {"id": uid, "sub": uid}
-                plan_res = await generate_weekly_plan(week_start, fake_user, notify=False, user_id=uid)
+                plan_res = await generate_weekly_plan(week_start, fake_user, notify=False, user_id=uid, use_fingerprint=False)
                 # #region agent log
-                try:
-                    import json
-                    with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                        f.write(json.dumps({"sessionId":"debug-session","runId":"run1","hypothesisId":"G","location":"app/main.py:1952","message":"_run_weekly_auto: generate_weekly_plan returned","data":{"user_id":uid,"week_start":week_start,"plan_res_message":plan_res.get("message") if plan_res else None,"has_plan_id":bool(plan_res.get("plan_id") if plan_res else False),"blocks_count":len(plan_res.get("blocks", [])) if plan_res else 0},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-                except: pass
+                debug_log("G", "app/main.py:1952", "_run_weekly_auto: generate_weekly_plan returned", lambda: {"user_id":uid,"week_start":week_start,"plan_res_message":plan_res.get("message") if plan_res else None,"has_plan_id":bool(plan_res.get("plan_id") if plan_res else False),"blocks_count":len(plan_res.get("blocks", [])) if plan_res else 0})
                 # #endregion
                 
                 # Only notify if a plan was actually created (even if no blocks were found, but courses exist)
                 if plan_res and (plan_res.get("plan_id") or plan_res.get("blocks") is not None):
-                    # Notify user that their plan is ready
-                    try:
-                        notif_data = {
-                            "user_id": uid,
-                            "type": "plan_ready",
-                            "title": "Your weekly schedule is ready! 📅",
-                            "message": f"The agent has finished planning your schedule for next week ({week_start}). Feel free to review and update!",
-                            "link": f"/schedule?week={week_start}",
-                            "read": False
-                        }
-                        logging.info(f"   🔔 Sending plan_ready notification to user {uid}")
-                        client.table("notifications").insert(notif_data).execute()
-                    except Exception as notif_err:
-                        logging.warning(f"⚠️ Failed to notify user {uid} about plan ready: {notif_err}")
+                    # Notify user that their plan is ready (sent in bulk after the loop)
+                    plan_ready_rows.append(notification_row(
+                        uid,
+                        "plan_ready",
+                        "Your weekly schedule is ready! 📅",
+                        f"The agent has finished planning your schedule for next week ({week_start}). Feel free to review and update!",
+                        link=f"/schedule?week={week_start}",
+                        dedup_key=f"plan_ready:{week_start}",
+                    ))
                 else:
                     logging.info(f"   ⏭️ No plan created for user {uid}: {plan_res.get('message') if plan_res else 'Unknown'}")
                     
             except Exception as e:
                 logging.error(f"❌ [GLOBAL AGENT] Individual plan failed for {uid}: {e}")
 
+        if plan_ready_rows:
+            try:
+                sent = send_notifications(client, plan_ready_rows)
+                logging.info(f"🔔 [GLOBAL AGENT] Sent {sent} plan_ready notification(s)")
+            except Exception as notif_err:
+                logging.warning(f"⚠️ Failed to send plan_ready notifications: {notif_err}")
+
+        if consumed_dirty:
+            _clear_planning_dirty_users(client, consumed_dirty)
+        invalidate_schedules(only_user_ids, week_start)
         logging.info(f"✅ [GLOBAL AGENT] Weekly planning complete")
+        return {"week_start": week_start, "users": len(user_ids), "groups": len(group_jobs)}
     except Exception as e:
         logging.error(f"💥 [GLOBAL AGENT] CRITICAL ERROR: {e}")
+        # The week may be half rebuilt: drop what readers cached meanwhile
+        invalidate_schedules(only_user_ids)
+        if raise_errors:
+            raise
 
 
 @app.get("/api/weekly-constraints")
@@ -3651,7 +3924,7 @@ async def get_weekly_constraints(
         weekly_constraints_list = []
         for constraint in (weekly_response.data or []):
             constraint_copy = constraint.copy()
-            constraint_copy["days"] = _parse_days(constraint.get("days"))
+            constraint_copy["days"] = parse_days(constraint.get("days"))
             constraint_copy["is_permanent"] = False  # Mark as weekly (not permanent)
             weekly_constraints_list.append(constraint_copy)
         
@@ -3708,6 +3981,7 @@ async def create_weekly_constraint(
             "is_hard": True
         }
         response = client.table("weekly_constraints").insert(constraint_dict).execute()
+        invalidate_schedules([user_id], constraint_data.week_start)
         if response.data:
             return {"message": "אילוץ שבועי נוצר בהצלחה", "constraint": response.data[0]}
         raise HTTPException(status_code=400, detail="Failed to create weekly constraint")
@@ -3726,10 +4000,11 @@ async def delete_weekly_constraint(
     try:
         user_id = current_user.get("id") or current_user.get("sub")
         client = supabase_admin if supabase_admin else supabase
-        existing = client.table("weekly_constraints").select("id").eq("id", constraint_id).eq("user_id", user_id).execute()
+        existing = client.table("weekly_constraints").select("id, week_start").eq("id", constraint_id).eq("user_id", user_id).execute()
         if not existing.data:
             raise HTTPException(status_code=404, detail="Weekly constraint not found")
         client.table("weekly_constraints").delete().eq("id", constraint_id).execute()
+        invalidate_schedules([user_id], existing.data[0].get("week_start"))
         return {"message": "אילוץ שבועי נמחק בהצלחה", "deleted": True}
     except HTTPException:
         raise
@@ -3764,6 +4039,8 @@ async def update_weekly_constraint(
             "is_hard": True
         }
         response = client.table("weekly_constraints").update(update_data).eq("id", constraint_id).execute()
+        # The week itself may have changed
+        invalidate_schedules([user_id])
         if response.data:
             return {"message": "אילוץ שבועי עודכן בהצלחה", "constraint": response.data[0]}
         raise HTTPException(status_code=400, detail="Failed to update weekly constraint")
@@ -3889,6 +4166,7 @@ async def create_semester_schedule_item(
         }
         
         response = client.table("semester_schedule_items").insert(new_item).execute()
+        invalidate_schedules([user_id])
         
         if response.data:
             created_item = response.data[0]
@@ -4017,6 +4295,7 @@ async def update_semester_schedule_item(
         update_data["updated_at"] = "now()"
         
         response = client.table("semester_schedule_items").update(update_data).eq("id", item_id).execute()
+        invalidate_schedules([user_id])
         
         if response.data:
             updated_item = response.data[0]
@@ -4068,6 +4347,7 @@ async def delete_semester_schedule_item(
             raise HTTPException(status_code=404, detail="Semester schedule item not found")
         
         client.table("semester_schedule_items").delete().eq("id", item_id).execute()
+        invalidate_schedules([user_id])
         return {"message": "פריט מערכת סמסטרית נמחק בהצלחה", "deleted": True}
     except HTTPException:
         raise
@@ -4076,462 +4356,96 @@ async def delete_semester_schedule_item(
         raise HTTPException(status_code=500, detail=f"Error deleting semester schedule item: {str(e)}")
 
 
+def _schedule_response(request: Request, content: Any, etag: Optional[str]) -> Response:
+    """JSON schedule payload with an ETag; 304 without a body when the client already has it"""
+    if not etag:
+        return JSONResponse(content=content)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if_none_match = request.headers.get("if-none-match") or ""
+    if etag in [t.strip().removeprefix("W/") for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=content, headers=headers)
+
+
 @app.get("/api/weekly-plan")
 async def get_weekly_plan(
     week_start: str,
+    request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     try:
-        # #region agent log
-        import json
-        try:
-            with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                f.write(json.dumps({"sessionId":"debug-session","runId":"run1","hypothesisId":"D","location":"app/main.py:2093","message":"get_weekly_plan entry","data":{"user_id_from_auth":current_user.get("id") or current_user.get("sub"),"week_start":week_start},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-        except: pass
-        # #endregion
         user_id = current_user.get("id") or current_user.get("sub")
-        # #region agent log
-        try:
-            with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                f.write(json.dumps({"sessionId":"debug-session","runId":"run1","hypothesisId":"D","location":"app/main.py:2094","message":"user_id extracted","data":{"user_id":user_id},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-        except: pass
-        # #endregion
         client = supabase_admin if supabase_admin else supabase
-        # #region agent log
-        try:
-            # Check ALL plans for this user to see what week_start values exist
-            all_plans_check = client.table("weekly_plans").select("id, week_start").eq("user_id", user_id).order("week_start", desc=True).limit(10).execute()
-            # Also check group_plan_blocks for this week
-            group_blocks_check = client.table("group_plan_blocks").select("id, group_id, week_start").eq("week_start", week_start).execute()
-            # Get user's groups
-            user_groups_check = client.table("group_members").select("group_id").eq("user_id", user_id).eq("status", "approved").execute()
-            user_group_ids_check = [g["group_id"] for g in (user_groups_check.data or [])]
-            user_group_blocks = [gb for gb in (group_blocks_check.data or []) if gb.get("group_id") in user_group_ids_check]
-            with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                f.write(json.dumps({"sessionId":"debug-session","runId":"run1","hypothesisId":"H","location":"app/main.py:2108","message":"ALL plans and group_plan_blocks for user","data":{"all_plans":all_plans_check.data if all_plans_check.data else [],"requested_week_start":week_start,"total_group_blocks_for_week":len(group_blocks_check.data) if group_blocks_check.data else 0,"user_group_blocks_count":len(user_group_blocks),"user_group_ids":user_group_ids_check},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-        except Exception as e:
-            try:
-                with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                    f.write(json.dumps({"sessionId":"debug-session","runId":"run1","hypothesisId":"H","location":"app/main.py:2108","message":"ERROR checking all plans and group blocks","data":{"error":str(e)},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-            except: pass
-        # #endregion
-        # Get all plan_ids for this user and week_start
-        # #region agent log
-        try:
-            import json
-            with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                f.write(json.dumps({"runId":"run1","hypothesisId":"FILTER","location":"app/main.py:2913","message":"BEFORE plans_for_week query","data":{"week_start":week_start,"user_id":user_id,"using_admin_client":bool(supabase_admin)},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-        except: pass
-        # #endregion
-        
-        # Query plans - try both with and without user_id filter to debug
-        plans_for_week = client.table("weekly_plans").select("id, user_id, week_start").eq("user_id", user_id).eq("week_start", week_start).execute()
-        plan_ids_for_week = [p["id"] for p in (plans_for_week.data or [])]
-        
-        # Debug: Also check what plans exist for this week_start (without user_id filter)
-        all_plans_for_week_debug = client.table("weekly_plans").select("id, user_id, week_start").eq("week_start", week_start).execute()
-        
-        # #region agent log
-        try:
-            import json
-            # Also check ALL plans for this user to see what exists
-            all_plans_check = client.table("weekly_plans").select("id, user_id, week_start").eq("user_id", user_id).order("week_start", desc=True).limit(10).execute()
-            with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                f.write(json.dumps({"runId":"run1","hypothesisId":"FILTER","location":"app/main.py:2914","message":"plans_for_week query result","data":{"plans_count":len(plans_for_week.data) if plans_for_week.data else 0,"plan_ids":plan_ids_for_week,"week_start":week_start,"user_id":user_id,"all_plans_for_user":all_plans_check.data if all_plans_check.data else [],"all_plans_for_week_debug":all_plans_for_week_debug.data if all_plans_for_week_debug.data else []},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-        except: pass
-        # #endregion
-        
-        # If no plans found but we know they exist, log detailed debug info
-        if not plan_ids_for_week:
-            logging.warning(f"⚠️ [GET_WEEKLY_PLAN] No plans found for user {user_id} and week {week_start}")
-            logging.warning(f"   But found {len(all_plans_for_week_debug.data or [])} plans for week_start={week_start} (all users)")
-            if all_plans_for_week_debug.data:
-                for p in all_plans_for_week_debug.data:
-                    if p.get("user_id") == user_id:
-                        logging.warning(f"   ⚠️ FOUND PLAN FOR THIS USER BUT QUERY MISSED IT! plan_id={p.get('id')}, week_start={p.get('week_start')}")
-                        # Add it manually
-                        plan_ids_for_week.append(p.get("id"))
-                        logging.warning(f"   ✅ Manually added plan_id {p.get('id')} to plan_ids_for_week")
-        
-        # CRITICAL FIX: Also check if the specific plan_id exists (direct query by ID)
-        # This handles cases where the .eq() filter might fail due to RLS or data type issues
-        if not plan_ids_for_week:
-            logging.warning(f"⚠️ [GET_WEEKLY_PLAN] Still no plans found. Trying direct query by week_start only...")
-            # Try querying without user_id filter first
-            all_plans_by_week = client.table("weekly_plans").select("id, user_id, week_start").eq("week_start", week_start).execute()
-            if all_plans_by_week.data:
-                logging.warning(f"   Found {len(all_plans_by_week.data)} plans for week_start={week_start} (all users)")
-                for p in all_plans_by_week.data:
-                    # Compare user_id as strings to avoid type mismatch
-                    p_user_id = str(p.get("user_id", ""))
-                    req_user_id = str(user_id)
-                    if p_user_id == req_user_id:
-                        logging.warning(f"   ✅ FOUND MATCHING PLAN! plan_id={p.get('id')}, user_id={p_user_id}, week_start={p.get('week_start')}")
-                        if p.get("id") not in plan_ids_for_week:
-                            plan_ids_for_week.append(p.get("id"))
-                            logging.warning(f"   ✅ Added plan_id {p.get('id')} to plan_ids_for_week")
-                    else:
-                        logging.debug(f"   ⏭️ Skipping plan {p.get('id')}: user_id mismatch ({p_user_id} != {req_user_id})")
-        
-        # Get the first plan for response (or None if no plan)
-        plan = plans_for_week.data[0] if plans_for_week.data else None
-        
-        # Fetch blocks for ALL plans of this week
-        # CRITICAL: Query directly by plan_ids - this is the simplest and most reliable method
-        blocks = []
-        if plan_ids_for_week:
-            # Try with admin client first (to bypass RLS), then fallback to regular client
-            blocks_client = supabase_admin if supabase_admin else client
-            
-            logging.info(f"📋 [GET_WEEKLY_PLAN] Querying blocks directly by plan_ids: {plan_ids_for_week}")
-            logging.info(f"   Using {'admin' if blocks_client == supabase_admin else 'regular'} client")
-            
-            # PRIMARY METHOD: Query directly by plan_ids AND user_id - this gets ALL blocks for this user's plans
-            try:
-                blocks_result = blocks_client.table("weekly_plan_blocks").select("*").in_("plan_id", plan_ids_for_week).eq("user_id", user_id).order("day_of_week").order("start_time").execute()
-                blocks = blocks_result.data or []
-                logging.info(f"✅ [GET_WEEKLY_PLAN] Found {len(blocks)} blocks via plan_ids + user_id query (using {'admin' if supabase_admin else 'regular'} client)")
-            except Exception as e:
-                logging.error(f"❌ [GET_WEEKLY_PLAN] Error querying blocks by plan_ids + user_id: {e}")
-                blocks = []
-            
-            # If query returned empty but we have plan_ids, try alternative query method (query each plan_id individually)
-            if not blocks and plan_ids_for_week:
-                logging.warning(f"⚠️ [GET_WEEKLY_PLAN] Query returned 0 blocks but plan_ids exist: {plan_ids_for_week}")
-                logging.warning(f"   Trying alternative query method: querying each plan_id individually with user_id...")
-                all_blocks = []
-                for pid in plan_ids_for_week:
-                    try:
-                        individual_query = blocks_client.table("weekly_plan_blocks").select("*").eq("plan_id", pid).eq("user_id", user_id).order("day_of_week").order("start_time").execute()
-                        individual_blocks = individual_query.data or []
-                        if individual_blocks:
-                            logging.info(f"   ✅ Plan {pid}: Found {len(individual_blocks)} blocks via individual query (user_id={user_id})")
-                            all_blocks.extend(individual_blocks)
-                        else:
-                            logging.warning(f"   ⚠️ Plan {pid}: 0 blocks found via individual query (user_id={user_id})")
-                    except Exception as e:
-                        logging.error(f"   ❌ Error querying plan {pid}: {e}")
-                
-                if all_blocks:
-                    logging.info(f"   ✅ Alternative method found {len(all_blocks)} total blocks! Using these instead.")
-                    blocks = all_blocks
-                else:
-                    logging.warning(f"   ❌ Alternative method also found 0 blocks. Blocks may not exist or RLS is blocking.")
-            
-            # Initialize blocks as empty list if no blocks found
-            if blocks is None:
-                blocks = []
-            
-            # #region agent log
-            try:
-                import json
-                # Log the results
-                filtered_plan_ids = list(set([b.get("plan_id") for b in blocks]))
-                with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                    f.write(json.dumps({"sessionId":"debug-session","runId":"run1","hypothesisId":"B","location":"app/main.py:2150","message":"blocks fetched for week","data":{"blocks_count":len(blocks),"plan_ids_count":len(plan_ids_for_week),"week_start":week_start,"plan_ids":plan_ids_for_week,"using_admin_client":bool(supabase_admin),"filtered_plan_ids":filtered_plan_ids,"sample_blocks":blocks[:3] if blocks else []},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-            except: pass
-            # #endregion
-        else:
-            logging.warning(f"⚠️ [GET_WEEKLY_PLAN] No plan_ids found for user {user_id} and week {week_start}")
-        
-        # FALLBACK: Also check for blocks directly by user_id (only if primary query found no blocks)
-        # This is a safety fallback to ensure we don't miss any blocks if plan_ids query failed
-        if not blocks and plan_ids_for_week:
-            logging.warning(f"⚠️ [GET_WEEKLY_PLAN] Primary query found 0 blocks, trying fallback: query by user_id and filter by plan_ids...")
-            direct_blocks_result = client.table("weekly_plan_blocks").select("*").eq("user_id", user_id).order("day_of_week").order("start_time").execute()
-            all_user_blocks = direct_blocks_result.data or []
-            
-            if all_user_blocks:
-                logging.info(f"   Found {len(all_user_blocks)} total blocks for user, filtering by plan_ids...")
-                # Filter to only blocks that belong to plans with the requested week_start
-                direct_blocks_for_week = []
-                for b in all_user_blocks:
-                    block_plan_id = b.get("plan_id")
-                    if block_plan_id and block_plan_id in plan_ids_for_week:
-                        direct_blocks_for_week.append(b)
-                        logging.info(f"   ✅ Found block: {b.get('course_name')} ({b.get('work_type')}), day={b.get('day_of_week')}, time={b.get('start_time')}, plan_id={block_plan_id}")
-                
-                if direct_blocks_for_week:
-                    blocks = direct_blocks_for_week
-                    logging.info(f"✅ [GET_WEEKLY_PLAN] Fallback method found {len(blocks)} blocks")
-            else:
-                    logging.warning(f"⚠️ [GET_WEEKLY_PLAN] Fallback method found blocks but none matched plan_ids {plan_ids_for_week}")
-        
-        # CRITICAL: Initialize blocks list if it doesn't exist (for cases where no plan exists yet)
-        if blocks is None:
-            blocks = []
-        
-        # Add blocks from semester_schedule_items (same as מערכת סמסטרית) so weekly view shows profile course hours
-        # CRITICAL: Always add semester blocks, even if there's no weekly plan - they are hard constraints
-        # NOTE: Semester blocks are added AFTER all other blocks to ensure they appear in the weekly view
-        try:
-            sem_res = client.table("semester_schedule_items").select("id, course_name, type, days, start_time, end_time, location").eq("user_id", user_id).execute()
-            courses_res = client.table("courses").select("course_number, course_name").eq("user_id", user_id).execute()
-            course_name_to_number = {}
-            for c in (courses_res.data or []):
-                name = (c.get("course_name") or "").strip()
-                if name:
-                    course_name_to_number[name] = c.get("course_number") or ""
-            
-            semester_blocks_added = 0
-            for item in (sem_res.data or []):
-                days_raw = item.get("days")
-                if isinstance(days_raw, str):
-                    try:
-                        days_list = json.loads(days_raw)
-                    except Exception:
-                        days_list = []
-                else:
-                    days_list = list(days_raw) if days_raw else []
-                if not days_list:
-                    continue
-                
-                start_t = (item.get("start_time") or "").strip()
-                end_t = (item.get("end_time") or "").strip()
-                if not start_t or not end_t:
-                    continue
-                course_name = (item.get("course_name") or "").strip()
-                course_number = course_name_to_number.get(course_name, "")
-                
-                # CRITICAL: Create a block for EACH day in days_list, not just the first one!
-                # This ensures all semester schedule items are displayed correctly
-                for day_value in days_list:
-                    try:
-                        day_int = int(day_value) if day_value is not None else None
-                        if day_int is None or day_int < 0 or day_int > 6:
-                            continue
-                        
-                        virtual_block = {
-                            "id": f"semester-{item.get('id')}-day-{day_int}",
-                            "plan_id": plan_ids_for_week[0] if plan_ids_for_week else None,
-                            "user_id": user_id,
-                            "course_number": str(course_number) if course_number else "",
-                            "course_name": course_name,
-                            "work_type": "semester",  # Changed from "group" to "semester" to distinguish from study groups
-                            "day_of_week": day_int,
-                            "start_time": start_t,
-                            "end_time": end_t,
-                            "source": "semester",
-                            "type": item.get("type", ""),  # Include type (lecture/tutorial) for display
-                            "location": item.get("location", ""),  # Include location if available
-                            "semester_item_id": item.get("id")  # Include original semester_schedule_items id for reference
-                        }
-                        blocks.append(virtual_block)
-                        semester_blocks_added += 1
-                    except (ValueError, TypeError) as e:
-                        logging.warning(f"   ⚠️ Error parsing day_value {day_value} for semester item {item.get('id')}: {e}")
-                        continue
-            
-            if semester_blocks_added > 0:
-                logging.info(f"📋 [GET_WEEKLY_PLAN] Added {semester_blocks_added} semester blocks from {len(sem_res.data or [])} semester_schedule_items")
-            elif sem_res.data:
-                logging.warning(f"⚠️ [GET_WEEKLY_PLAN] Found {len(sem_res.data)} semester_schedule_items but added 0 blocks (check days/start_time/end_time)")
-        except Exception as sem_err:
-            logging.error(f"❌ [GET_WEEKLY_PLAN] Could not add semester items to weekly plan: {sem_err}", exc_info=True)
-        
-        # Remove duplicates (in case same block was found both ways)
-        # CRITICAL: Use a composite key for semester blocks since they may have the same id pattern
-        # For semester blocks, use (day_of_week, start_time, course_number, work_type) as unique key
-        seen_ids = set()
-        seen_semester_keys = set()  # Track semester blocks separately
-        unique_blocks = []
-        for b in blocks:
-            block_id = b.get("id")
-            work_type = b.get("work_type", "")
-            
-            # For semester blocks, use composite key to avoid false duplicates
-            if work_type == "semester":
-                semester_key = (b.get("day_of_week"), b.get("start_time"), b.get("course_number"), work_type)
-                if semester_key not in seen_semester_keys:
-                    seen_semester_keys.add(semester_key)
-                    unique_blocks.append(b)
-            elif block_id and block_id not in seen_ids:
-                seen_ids.add(block_id)
-                unique_blocks.append(b)
-            elif not block_id:
-                # Blocks without id should still be included (shouldn't happen, but safety)
-                unique_blocks.append(b)
-        
-        blocks = unique_blocks
-        semester_count_after = len([b for b in blocks if b.get("work_type") == "semester"])
-        logging.info(f"📊 [GET_WEEKLY_PLAN] After deduplication: {len(blocks)} unique blocks (semester blocks: {semester_count_after})")
-        
-        # Remove profile-sourced "group" blocks that duplicate semester schedule (lectures/tutorials).
-        # Those show as 👥 in the UI; we want only the injected semester blocks to represent course meetings.
-        # Real study-group blocks have work_type "group" but source != "profile" (they come from group_plan_blocks).
-        blocks = [
-            b for b in blocks
-            if not (b.get("source") == "profile" and b.get("work_type") == "group")
-        ]
-        logging.info(f"📋 [GET_WEEKLY_PLAN] After removing profile-sourced group dupes: {len(blocks)} blocks")
-        
-        # If no blocks found via plan_ids, check directly by user_id (fallback)
-        if not blocks:
-            logging.warning(f"⚠️ No blocks found via plan_ids for user {user_id} and week {week_start}, checking directly")
-            # Check if there are any blocks for this user and week (regardless of plan_id)
-            all_user_blocks = client.table("weekly_plan_blocks").select("*").eq("user_id", user_id).execute()
-            # Filter by week_start by checking if blocks belong to plans with this week_start
-            # CRITICAL: Use plan_ids_for_week directly instead of comparing week_start strings
-            # This avoids issues with date format/type mismatches
-            all_plans = client.table("weekly_plans").select("id, week_start").eq("user_id", user_id).eq("week_start", week_start).execute()
-            plan_ids_for_week_fallback = [p["id"] for p in (all_plans.data or [])]
-            blocks_for_week = [b for b in (all_user_blocks.data or []) if b.get("plan_id") in plan_ids_for_week_fallback]
-            if blocks_for_week:
-                logging.warning(f"⚠️ Found {len(blocks_for_week)} blocks for week {week_start} but no plan - using these blocks anyway")
-                blocks = blocks_for_week
-                # Create a dummy plan for response
-                if not plan:
-                    plan = {"id": None, "user_id": user_id, "week_start": week_start, "source": "orphaned_blocks"}
-        
-        # For group STUDY blocks, add group_id by looking up group_plan_blocks (batch query for performance)
-        # IMPORTANT:
-        # - We only want to match "real" group study sessions (from weekly_plan_blocks / planner),
-        #   NOT the semester_schedule_items that we inject as virtual blocks with source="semester"
-        #   and work_type="group" just for display.
-        # - Those semester blocks often have half-hour times (e.g., 09:30, 11:30) and should NOT be
-        #   bound to study_groups / group_plan_blocks.
-        group_blocks = [
-            b for b in blocks
-            if b.get("work_type") == "group" and b.get("source") != "semester"
-        ]
-        # #region agent log
-        try:
-            with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                f.write(json.dumps({"sessionId":"debug-session","runId":"run1","hypothesisId":"C","location":"app/main.py:2103","message":"group blocks identified","data":{"group_blocks_count":len(group_blocks),"total_blocks":len(blocks)},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-        except: pass
-        # #endregion
-        if group_blocks:
-            # Get all unique day/time combinations
-            day_time_pairs = [(b["day_of_week"], b["start_time"]) for b in group_blocks]
-            unique_pairs = list(set(day_time_pairs))
-            
-            # Batch fetch all group_plan_blocks for this week
-            all_group_blocks = client.table("group_plan_blocks").select("group_id, course_number, day_of_week, start_time").eq("week_start", week_start).execute()
-            # #region agent log
-            try:
-                with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                    f.write(json.dumps({"sessionId":"debug-session","runId":"run1","hypothesisId":"C","location":"app/main.py:2110","message":"all_group_blocks fetched","data":{"all_group_blocks_count":len(all_group_blocks.data) if all_group_blocks.data else 0,"week_start":week_start},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-            except: pass
-            # #endregion
-            
-            # Get all group IDs and batch fetch study_groups
-            group_ids_to_check = list(set([gb.get("group_id") for gb in (all_group_blocks.data or [])]))
-            groups_map = {}
-            if group_ids_to_check:
-                groups_result = client.table("study_groups").select("id, course_id").in_("id", group_ids_to_check).execute()
-                groups_map = {g["id"]: g.get("course_id") for g in (groups_result.data or [])}
-            
-            # Match blocks to groups
-            # First, get user's group IDs to filter only relevant group_plan_blocks
-            user_groups = client.table("group_members").select("group_id").eq("user_id", user_id).eq("status", "approved").execute()
-            user_group_ids = [g["group_id"] for g in (user_groups.data or [])]
-            
-            # Filter group_plan_blocks to only those belonging to user's groups
-            relevant_group_blocks = [gb for gb in (all_group_blocks.data or []) if gb.get("group_id") in user_group_ids]
-            
-            matched_count = 0
-            for block in group_blocks:
-                matched = False
-                block_course = str(block.get("course_number")).strip()
-                block_day = block.get("day_of_week")
-                block_start = block.get("start_time")
-                
-                # Normalize time format (remove seconds if present)
-                def normalize_time(time_str):
-                    if not time_str:
-                        return None
-                    # Remove seconds if present (HH:MM:SS -> HH:MM)
-                    if isinstance(time_str, str) and len(time_str) > 5:
-                        return time_str[:5]
-                    return time_str
-                
-                block_start_normalized = normalize_time(block_start)
-                
-                # Try exact match first (with normalized time)
-                for gb in relevant_group_blocks:
-                    gb_start_normalized = normalize_time(gb.get("start_time"))
-                    if (gb.get("day_of_week") == block_day and 
-                        gb_start_normalized == block_start_normalized):
-                        group_course = groups_map.get(gb.get("group_id"))
-                        if group_course and str(group_course).strip() == block_course:
-                            block["group_id"] = gb.get("group_id")
-                            matched = True
-                            matched_count += 1
-                            break
-                
-                # If no exact match, try matching by course_number and day only (for same group)
-                if not matched:
-                    for gb in relevant_group_blocks:
-                        group_course = groups_map.get(gb.get("group_id"))
-                        if group_course and str(group_course).strip() == block_course and gb.get("day_of_week") == block_day:
-                            # Check if this group_id already has blocks on this day - if so, this block belongs to it
-                            block["group_id"] = gb.get("group_id")
-                            matched = True
-                            matched_count += 1
-                            logging.info(f"✅ Matched group block by course and day: course={block_course}, day={block_day}, group_id={gb.get('group_id')}")
-                            break
-                
-                # #region agent log
-                if not matched:
-                    try:
-                        with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                            f.write(json.dumps({"sessionId":"debug-session","runId":"run1","hypothesisId":"C","location":"app/main.py:2127","message":"group block NOT matched","data":{"block_course":block_course,"block_day":block_day,"block_time":block_start,"block_time_normalized":block_start_normalized,"relevant_group_blocks_count":len(relevant_group_blocks)},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-                    except: pass
-                    logging.warning(f"⚠️ Could not match group block: course={block_course}, day={block_day}, time={block_start} (normalized: {block_start_normalized})")
-                # #endregion
-        
-        # Log detailed info about blocks before returning
+        # One read of the user's schedule (cache, else the read model, else rebuilt from the raw tables)
+        schedule = get_user_schedule(client, user_id, week_start)
+        plan = schedule["plan"]
+        blocks = page_blocks(schedule)
         logging.info(f"📊 [GET_WEEKLY_PLAN] Returning {len(blocks)} blocks for user {user_id}, week {week_start}")
-        if blocks:
-            group_count = len([b for b in blocks if b.get("work_type") == "group"])
-            personal_count = len([b for b in blocks if b.get("work_type") == "personal"])
-            semester_count = len([b for b in blocks if b.get("work_type") == "semester"])
-            other_count = len([b for b in blocks if b.get("work_type") not in ["group", "personal", "semester"]])
-            logging.info(f"   - Group blocks: {group_count}, Personal blocks: {personal_count}, Semester blocks: {semester_count}, Other: {other_count}")
-            logging.info(f"   - Total breakdown: {group_count + personal_count + semester_count + other_count} blocks")
-            # Log ALL blocks (not just sample) for debugging
-            logging.info(f"   📋 ALL {len(blocks)} blocks:")
-            for i, b in enumerate(blocks, 1):
-                work_type = b.get('work_type', 'unknown')
-                source = b.get('source', 'unknown')
-                logging.info(f"      {i}. {b.get('course_name', 'N/A')} ({work_type}, source={source}), day={b.get('day_of_week')}, time={b.get('start_time')}")
-        else:
-            logging.warning(f"⚠️ [GET_WEEKLY_PLAN] No blocks found for user {user_id}, week {week_start}")
-            # Double-check: query directly from Supabase
-            direct_check = client.table("weekly_plan_blocks").select("id, course_name, work_type, day_of_week, start_time, plan_id").eq("user_id", user_id).limit(20).execute()
-            if direct_check.data:
-                logging.warning(f"   But found {len(direct_check.data)} blocks for this user in total (not filtered by week)")
-                # Check which plans these blocks belong to
-                all_plan_ids = list(set([b.get("plan_id") for b in direct_check.data if b.get("plan_id")]))
-                if all_plan_ids:
-                    plans_check = client.table("weekly_plans").select("id, week_start").in_("id", all_plan_ids).execute()
-                    logging.warning(f"   These blocks belong to plans: {[(p.get('id'), p.get('week_start')) for p in (plans_check.data or [])]}")
-        
-        # Log semester blocks count
-        semester_blocks_count = len([b for b in blocks if b.get("work_type") == "semester"])
-        if semester_blocks_count > 0:
-            logging.info(f"   📚 Returning {semester_blocks_count} semester blocks for week {week_start}")
-        
-        # #region agent log
-        try:
-            import json
-            with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                f.write(json.dumps({"runId":"run1","hypothesisId":"UI","location":"app/main.py:3070","message":"get_weekly_plan RETURNING","data":{"blocks_count":len(blocks),"week_start":week_start,"user_id":user_id,"has_plan":plan is not None,"plan_id":plan.get("id") if plan else None,"group_blocks":len([b for b in blocks if b.get("work_type") == "group"]),"personal_blocks":len([b for b in blocks if b.get("work_type") == "personal"]),"semester_blocks":semester_blocks_count},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-        except: pass
-        # #endregion
-        
         # #region agent log
-        try:
-            with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                f.write(json.dumps({"sessionId":"debug-session","runId":"run1","hypothesisId":"ALL","location":"app/main.py:2129","message":"returning result","data":{"blocks_count":len(blocks),"plan_id":plan.get("id") if plan else None,"group_blocks":len([b for b in blocks if b.get("work_type") == "group"]),"personal_blocks":len([b for b in blocks if b.get("work_type") == "personal"])},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-        except: pass
+        debug_log("UI", "app/main.py:3070", "get_weekly_plan RETURNING", lambda: {"blocks_count":len(blocks),"week_start":week_start,"user_id":user_id,"has_plan":plan is not None,"plan_id":plan.get("id") if plan else None,"group_blocks":len([b for b in blocks if b.get("work_type") == "group"]),"personal_blocks":len([b for b in blocks if b.get("work_type") == "personal"]),"semester_blocks":len(schedule["semester_blocks"])})
         # #endregion
-        return {"plan": plan, "blocks": blocks}
+        return _schedule_response(request, {"plan": plan, "blocks": blocks}, schedule["etag"])
     except Exception as e:
         logging.error(f"Error fetching weekly plan: {e}")
         raise HTTPException(status_code=500, detail=f"Error fetching weekly plan: {str(e)}")
 
 
+def _range_week_payload(schedule: Dict[str, Any], fmt: str) -> Dict[str, Any]:
+    blocks = page_blocks(schedule)
+    if fmt == "columns":
+        plan = schedule["plan"]
+        return {"week_start": schedule["week_start"], "plan_id": plan.get("id") if plan else None, "blocks": to_columns(blocks)}
+    return {"week_start": schedule["week_start"], "plan": schedule["plan"], "blocks": blocks}
+
+
+@app.get("/api/weekly-plan/range")
+async def get_weekly_plan_range(
+    start: str,
+    request: Request,
+    end: Optional[str] = None,
+    weeks: Optional[int] = None,
+    format: str = "rows",
+    stream: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Weekly plans for several weeks (e.g. a whole semester) in one request: start..end, or `weeks`
+    weeks from start. Same blocks per week as GET /api/weekly-plan, read in batches of weeks.
+    format=columns returns each week's blocks as column arrays (see BLOCK_COLUMNS).
+    stream=true answers NDJSON, one line per week, sent as soon as its batch is read.
+    """
+    if format not in ("rows", "columns"):
+        raise HTTPException(status_code=400, detail="format must be 'rows' or 'columns'")
+    try:
+        week_list = week_starts(start, end, weeks)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid range: {e}")
+    user_id = current_user.get("id") or current_user.get("sub")
+    client = supabase_admin if supabase_admin else supabase
+
+    if stream:
+        def _lines():
+            for schedule in iter_user_schedules(client, user_id, week_list):
+                yield json.dumps(_range_week_payload(schedule, format), ensure_ascii=False, default=str) + "\n"
+        # A sync generator is iterated in the threadpool, so the batched reads do not block the loop
+        return StreamingResponse(_lines(), media_type="application/x-ndjson")
+
+    try:
+        schedules = list(iter_user_schedules(client, user_id, week_list))
+        logging.info(f"📊 [WEEKLY_PLAN_RANGE] {len(schedules)} weeks ({week_list[0]}..{week_list[-1]}) for user {user_id}")
+        content = {
+            "start": week_list[0],
+            "end": week_list[-1],
+            "format": format,
+            "weeks": [_range_week_payload(schedule, format) for schedule in schedules],
+        }
+        etag = '"' + hashlib.sha1((format + "".join(sch["etag"] for sch in schedules)).encode()).hexdigest()[:20] + '"'
+        return _schedule_response(request, content, etag)
+    except Exception as e:
+        logging.error(f"Error fetching weekly plan range: {e}")
+        raise HTTPException(status_code=500, detail=f"Error fetching weekly plan range: {str(e)}")
+
+
 @app.get("/api/weekly-plan/llm-status")
 async def get_weekly_plan_llm_status(
     week_start: str,
@@ -4586,13 +4500,17 @@ async def get_weekly_plan_llm_status(
 
 @app.get("/api/weekly-schedule")
 async def get_weekly_schedule(
+    request: Request,
     date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    weeks: Optional[int] = None,
     current_user: dict = Depends(get_current_user)
 ):
     """
     Get weekly schedule for terminal/CLI usage
     Uses schedule_retriever executor
-    Returns schedule data for a specific week (defaults to current week)
+    Returns schedule data for a specific week (defaults to current week), or an overview of
+    several weeks with end_date or weeks
     """
     try:
         user_id = current_user.get("id") or current_user.get("sub")
@@ -4602,9 +4520,14 @@ async def get_weekly_schedule(
         # Use schedule_retriever executor
         from app.agents.executors.schedule_retriever import ScheduleRetriever
         retriever = ScheduleRetriever()
-        result = await retriever.execute(user_id=user_id, date=date)
+        result = await retriever.execute(user_id=user_id, date=date, end_date=end_date, weeks=weeks)
         
-        return JSONResponse(content=result)
+        etag = None
+        if result.get("status") == "success" and result.get("week_start"):
+            # The retriever just read this week, so this is a cache hit
+            client = supabase_admin if supabase_admin else supabase
+            etag = get_user_schedule(client, user_id, result["week_start"])["etag"]
+        return _schedule_response(request, result, etag)
         
     except HTTPException:
         raise
@@ -4632,6 +4555,10 @@ async def execute_agent(
     Main agent execution endpoint for terminal/CLI usage and chat
     Routes user prompt to appropriate executor via supervisor
     תמיד עובד עם משתמש העל (super user) - UUID: 56a2597d-62fc-49b3-9f98-1b852941b5ef
+    Optional: "timings": true in the body adds a span tree (supervisor, executor, Supabase,
+    LLM/embedding calls) as a `timings` field. Set TRACE_EXPORT_FILE to also write OTLP/JSON.
+    Optional: "verbosity": "summary" (default) | "full". Summary steps keep module and scalar
+    fields (strings truncated); full adds prompts, retrieved chunks and raw LLM output.
     """
     chat_logger = logging.getLogger("CHAT")
     try:
@@ -4649,47 +4576,38 @@ async def execute_agent(
         # Get user_context and ui_context from request
         user_context = request_data.get("user_context")
         ui_context = request_data.get("ui_context")
+        verbosity = normalize_verbosity(request_data.get("verbosity"))
         chat_logger.info(f"CHAT: Has user_context: {user_context is not None}, Has ui_context: {ui_context is not None}")
         
         # Initialize supervisor and route task
-        supervisor = Supervisor()
-        chat_logger.info("CHAT: Initializing supervisor and routing task...")
-        result = await supervisor.route_task(
-            user_prompt=user_prompt,
-            user_id=user_id,
-            user_context=user_context,
-            ui_context=ui_context
-        )
+        with start_trace("api.execute", user_id=user_id) as trace:
+            with trace_span("supervisor.init"):
+                supervisor = Supervisor()
+            chat_logger.info("CHAT: Initializing supervisor and routing task...")
+            result = await supervisor.route_task(
+                user_prompt=user_prompt,
+                user_id=user_id,
+                user_context=user_context,
+                ui_context=ui_context
+            )
         chat_logger.info(f"CHAT: ✅ Task routed successfully, status: {result.get('status')}")
         
-        # Clean result to remove any non-serializable objects before JSON serialization
-        def clean_for_json(obj):
-            """Recursively clean object to ensure JSON serializability"""
-            if isinstance(obj, dict):
-                return {k: clean_for_json(v) for k, v in obj.items() 
-                       if k != "llm_client" and not hasattr(v, "__dict__")}
-            elif isinstance(obj, list):
-                return [clean_for_json(item) for item in obj]
-            elif hasattr(obj, "__dict__"):
-                # Skip objects that can't be serialized
-                return str(type(obj).__name__)
-            else:
-                return obj
-        
-        cleaned_result = clean_for_json(result)
-        
         # Normalize to exact spec: status, error, response, steps (error null on success)
+        # Steps are trimmed for "summary"; lazy payloads and non-serializable objects are
+        # handled by the serializer, so the result is not walked twice
         out = {
-            "status": cleaned_result.get("status", "ok"),
-            "error": cleaned_result.get("error"),
-            "response": cleaned_result.get("response"),
-            "steps": cleaned_result.get("steps", []),
+            "status": result.get("status", "ok"),
+            "error": result.get("error"),
+            "response": result.get("response"),
+            "steps": shape_steps(result.get("steps", []), verbosity),
         }
         if out["status"] == "ok":
             out["error"] = None
+        if request_data.get("timings"):
+            out["timings"] = trace.to_timings()
 
         return Response(
-            content=json.dumps(out, indent=2, ensure_ascii=False),
+            content=dumps_compact(out),
             media_type="application/json"
         )
 
@@ -4704,7 +4622,7 @@ async def execute_agent(
         }
         return Response(
             status_code=200,
-            content=json.dumps(body, indent=2, ensure_ascii=False),
+            content=dumps_compact(body),
             media_type="application/json",
         )
     except Exception as e:
@@ -4722,7 +4640,7 @@ async def execute_agent(
         }
         return Response(
             status_code=200,
-            content=json.dumps(body, indent=2, ensure_ascii=False),
+            content=dumps_compact(body),
             media_type="application/json",
         )
 
@@ -4787,7 +4705,7 @@ async def system_generate_weekly_plan(
                 )
         
         logging.info(f"📋 [SYSTEM GENERATE] System function: Generating plans for ALL users (week_start={week_start})")
-        await _run_weekly_auto_for_all_users(week_start_override=week_start)
+        await _run_weekly_full(week_start_override=week_start)
         return {
             "status": "success",
             "message": f"Weekly plans generated for all users (week_start={week_start})",
@@ -4800,12 +4718,111 @@ async def system_generate_weekly_plan(
         raise HTTPException(status_code=500, detail=f"Error generating weekly plans: {str(e)}")
 
 
+# Set to False once a query shows WEEKLY_PLAN_FINGERPRINT.sql is not installed
+_plan_fingerprint_available = True
+# Bump when planning logic changes so existing fingerprints stop matching
+_PLAN_FINGERPRINT_VERSION = "1"
+
+
+def _planning_input_fingerprint(client, user_id: str, week_start: str) -> str:
+    """
+    SHA-256 over everything generate_weekly_plan reads for (user, week): courses, constraints,
+    weekly constraints, semester items, course time preferences, study preferences, approved
+    groups with their preferences and group_plan_blocks for the week.
+    """
+    def rows(table: str, columns: str = "*", **filters) -> list:
+        query = client.table(table).select(columns)
+        for column, value in filters.items():
+            query = query.in_(column, value) if isinstance(value, list) else query.eq(column, value)
+        return sorted(query.execute().data or [], key=lambda r: json.dumps(r, sort_keys=True, default=str))
+
+    group_ids = sorted(
+        gm["group_id"] for gm in rows("group_members", "group_id", user_id=user_id, status="approved")
+    )
+    try:
+        semester_items = rows("semester_schedule_items", user_id=user_id)
+    except Exception:
+        # Table may not exist yet
+        semester_items = []
+    payload = {
+        "version": _PLAN_FINGERPRINT_VERSION,
+        "group_planner": GROUP_PLANNER_MODE,
+        "week_start": week_start,
+        "courses": rows("courses", user_id=user_id),
+        "constraints": rows("constraints", user_id=user_id),
+        "weekly_constraints": rows("weekly_constraints", user_id=user_id, week_start=week_start),
+        "semester_items": semester_items,
+        "course_time_preferences": rows("course_time_preferences", user_id=user_id),
+        "profile": rows("user_profiles", "study_preferences_raw, study_preferences_summary, schedule_change_notes", id=user_id),
+        "groups": group_ids,
+        "group_preferences": rows("group_preferences", group_id=group_ids) if group_ids else [],
+        "group_blocks": rows("group_plan_blocks", group_id=group_ids, week_start=week_start) if group_ids else [],
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _find_plan_with_fingerprint(client, user_id: str, week_start: str, fingerprint: str) -> Optional[dict]:
+    """The user's plan for the week if it was generated from identical inputs, else None"""
+    global _plan_fingerprint_available
+    if not _plan_fingerprint_available:
+        return None
+    try:
+        result = client.table("weekly_plans").select("id, input_fingerprint").eq("user_id", user_id).eq("week_start", week_start).limit(1).execute()
+    except Exception as e:
+        if _is_missing_column(e, "input_fingerprint"):
+            _plan_fingerprint_available = False
+            logging.info(f"weekly_plans.input_fingerprint not available, idempotent re-runs disabled: {e}")
+        else:
+            logging.warning(f"⚠️ Could not read plan fingerprint, regenerating: {e}")
+        return None
+    if result.data and result.data[0].get("input_fingerprint") == fingerprint:
+        return result.data[0]
+    return None
+
+
+def _store_plan_fingerprint(client, plan_id: str, fingerprint: str) -> None:
+    global _plan_fingerprint_available
+    if not _plan_fingerprint_available:
+        return
+    try:
+        client.table("weekly_plans").update({"input_fingerprint": fingerprint}).eq("id", plan_id).execute()
+    except Exception as e:
+        if _is_missing_column(e, "input_fingerprint"):
+            _plan_fingerprint_available = False
+            logging.info(f"Could not store plan fingerprint (run WEEKLY_PLAN_FINGERPRINT.sql): {e}")
+        else:
+            logging.warning(f"⚠️ Could not store plan fingerprint for plan {plan_id}: {e}")
+
+
+def _attach_group_ids(client, user_id: str, week_start: str, blocks: list) -> None:
+    """Add group_id to the user's group blocks (in place) by matching group_plan_blocks slots"""
+    group_blocks = [b for b in blocks if b.get("work_type") == "group"]
+    if not group_blocks:
+        return
+    all_group_blocks = client.table("group_plan_blocks").select("group_id, course_number, day_of_week, start_time").eq("week_start", week_start).execute()
+    user_groups_check = client.table("group_members").select("group_id").eq("user_id", user_id).eq("status", "approved").execute()
+    user_group_ids_check = [g["group_id"] for g in (user_groups_check.data or [])]
+    if user_group_ids_check:
+        groups_result = client.table("study_groups").select("id, course_id").in_("id", user_group_ids_check).execute()
+        groups_map = {g["id"]: g.get("course_id") for g in (groups_result.data or [])}
+        for block in group_blocks:
+            for gb in (all_group_blocks.data or []):
+                if (gb.get("day_of_week") == block["day_of_week"] and 
+                    gb.get("start_time") == block["start_time"]):
+                    group_course = groups_map.get(gb.get("group_id"))
+                    if group_course and str(group_course).strip() == str(block.get("course_number")).strip():
+                        block["group_id"] = gb.get("group_id")
+                        break
+
+
 @app.post("/api/weekly-plan/generate")
 async def generate_weekly_plan(
     week_start: str,
     current_user: dict = Depends(get_cli_user),
     notify: bool = True,
-    user_id: Optional[str] = None
+    user_id: Optional[str] = None,
+    force: bool = False,
+    use_fingerprint: bool = True
 ):
     """
     Generate a weekly plan using hard/soft constraints and course credit points.
@@ -4819,12 +4836,16 @@ async def generate_weekly_plan(
     3. Insert the new plans into Supabase
     
     This ensures a fresh start - old data is completely removed before new planning.
+    If the user's plan for the week was generated from identical inputs (same fingerprint), it is
+    returned as-is without cleanup or LLM calls; pass force=true to replan anyway.
+    use_fingerprint=false skips both the check and storing the fingerprint (the weekly run, which
+    always replans after its own cleanup, so the check could never hit).
     """
     try:
         # If user_id query parameter is not provided, generate for ALL users (system function)
         if user_id is None:
             logging.info(f"📋 [GENERATE] System function: Generating plans for ALL users (week_start={week_start})")
-            await _run_weekly_auto_for_all_users(week_start_override=week_start)
+            await _run_weekly_full(week_start_override=week_start)
             return {"message": f"Weekly plans generated for all users (week_start={week_start})"}
         
         # Single user generation (only if user_id is explicitly provided)
@@ -4841,169 +4862,39 @@ async def generate_weekly_plan(
         
         logging.info(f"📋 [GENERATE] Using {'admin' if supabase_admin else 'anon'} client for user {user_id}")
 
+        # Idempotent re-run: nothing changed since the last plan for this week
+        if use_fingerprint and not force and _plan_fingerprint_available:
+            try:
+                fingerprint = _planning_input_fingerprint(client, user_id, week_start)
+                unchanged_plan = _find_plan_with_fingerprint(client, user_id, week_start, fingerprint)
+            except Exception as fp_err:
+                logging.warning(f"Could not compute plan fingerprint for user {user_id}: {fp_err}")
+                unchanged_plan = None
+            if unchanged_plan:
+                logging.info(f"♻️ [GENERATE] Inputs unchanged for user {user_id}, week {week_start} - returning existing plan {unchanged_plan['id']}")
+                blocks_result = client.table("weekly_plan_blocks").select("*").eq("plan_id", unchanged_plan["id"]).order("day_of_week").order("start_time").execute()
+                final_blocks = blocks_result.data or []
+                _attach_group_ids(client, user_id, week_start, final_blocks)
+                return {"message": "Weekly plan unchanged", "plan_id": unchanged_plan["id"], "blocks": final_blocks, "unchanged": True}
+
         # Clean up existing plans and blocks for this user and week before generating new ones
         # IMPORTANT: Only clean up if plans exist - don't delete blocks from weeks that haven't been planned yet!
         # This ensures no orphaned blocks remain and prevents mixed schedules with old versions
         # CRITICAL: Use admin client for cleanup to bypass RLS
         # #region agent log
-        try:
-            import json
-            with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                f.write(json.dumps({"runId":"run1","hypothesisId":"B","location":"app/main.py:3581","message":"BEFORE cleanup check","data":{"user_id":user_id,"week_start":week_start},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-        except: pass
+        debug_log("B", "app/main.py:3581", "BEFORE cleanup check", {"user_id":user_id,"week_start":week_start})
         # #endregion
         logging.info(f"🧹 [GENERATE] Checking if cleanup needed for user {user_id}, week {week_start}")
         try:
-            # Step 1: Find all existing plans for this user and week (by week_start - the date the plans are scheduled for)
-            logging.info(f"   🔍 Step 1: Finding plans for user {user_id}, week_start={week_start}")
-            existing_plans_to_delete = cleanup_client.table("weekly_plans").select("id,week_start").eq("user_id", user_id).eq("week_start", week_start).execute()
-            plans_found = len(existing_plans_to_delete.data or [])
-            logging.info(f"   🔍 Query result: {plans_found} plans found")
-            
+            # Only this user's plans for this week_start (and their blocks) are deleted; if none
+            # exist nothing is touched.
+            # group_plan_blocks are NOT deleted here: they are shared across group members and
+            # managed by the global agent (_run_weekly_auto_for_all_users).
+            cleanup_counts = _cleanup_week_plans(cleanup_client, week_start, user_id=user_id)
             # #region agent log
-            try:
-                import json
-                with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                    f.write(json.dumps({"runId":"run1","hypothesisId":"B","location":"app/main.py:3586","message":"Cleanup check result","data":{"plans_found":plans_found,"will_cleanup":bool(existing_plans_to_delete.data)},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-            except: pass
+            debug_log("B", "app/main.py:generate_weekly_plan", "Cleanup result", {"user_id":user_id,"week_start":week_start,**cleanup_counts})
             # #endregion
-            
-            # CRITICAL: Only clean up if plans exist - don't delete blocks from weeks that haven't been planned yet!
-            if existing_plans_to_delete.data:
-                logging.info(f"🧹 [GENERATE] Cleaning up {plans_found} existing plan(s) for user {user_id}, week {week_start}")
-                plan_ids = [plan["id"] for plan in existing_plans_to_delete.data]
-                logging.info(f"   🗑️ Found {len(plan_ids)} existing plan(s) to delete (identified by week_start={week_start}): {plan_ids}")
-                
-                # Step 2: Delete all weekly_plan_blocks for these plans (by plan_id)
-                # This is the correct way: find plans by week_start, then delete blocks by plan_id
-                total_blocks_deleted = 0
-                for plan_id in plan_ids:
-                    try:
-                        logging.info(f"   🗑️ Deleting blocks for plan_id={plan_id} (from week_start={week_start})")
-                        blocks_deleted = cleanup_client.table("weekly_plan_blocks").delete().eq("plan_id", plan_id).execute()
-                        # Note: Supabase delete() may not return data, so we check if it exists
-                        deleted_count = len(blocks_deleted.data) if blocks_deleted.data else 0
-                        total_blocks_deleted += deleted_count
-                        logging.info(f"   🗑️ Deleted {deleted_count} blocks for plan_id {plan_id} (response had data: {blocks_deleted.data is not None})")
-                    except Exception as block_del_err:
-                        logging.error(f"   ❌ Error deleting blocks for plan_id {plan_id}: {block_del_err}", exc_info=True)
-                logging.info(f"   ✅ Total blocks deleted: {total_blocks_deleted} across {len(plan_ids)} plans")
-                
-                # Step 3: Also delete blocks by user_id as a safety measure (in case of orphaned blocks)
-                # This catches any blocks that might not have been deleted above
-                # CRITICAL: Only delete blocks that reference the plan_ids we know belong to this week_start!
-                # We use .in_("plan_id", plan_ids) to ensure we only delete blocks for this week's plans
-                try:
-                    # #region agent log
-                    try:
-                        import json
-                        with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                            f.write(json.dumps({"runId":"run1","hypothesisId":"CLEANUP","location":"app/main.py:3644","message":"Step 3: Deleting orphaned blocks","data":{"user_id":user_id,"plan_ids":plan_ids,"plan_ids_count":len(plan_ids)},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-                    except: pass
-                    # #endregion
-                    orphan_blocks_deleted = cleanup_client.table("weekly_plan_blocks").delete().eq("user_id", user_id).in_("plan_id", plan_ids).execute()
-                    deleted_count = len(orphan_blocks_deleted.data) if orphan_blocks_deleted.data else 0
-                    logging.info(f"   🗑️ Deleted {deleted_count} orphaned blocks by user_id (only for plan_ids: {plan_ids})")
-                except Exception as orphan_err:
-                    logging.error(f"   ❌ Error deleting orphaned blocks: {orphan_err}")
-                
-                # Step 4: Delete the plans themselves
-                # This is inside the if block, so it only runs if plans exist
-                try:
-                    logging.info(f"   🗑️ Deleting plans for user {user_id}, week_start={week_start}")
-                    plans_deleted = cleanup_client.table("weekly_plans").delete().eq("user_id", user_id).eq("week_start", week_start).execute()
-                    deleted_count = len(plans_deleted.data) if plans_deleted.data else 0
-                    logging.info(f"   ✅ Deleted {deleted_count} plan(s) (response had data: {plans_deleted.data is not None})")
-                except Exception as plan_del_err:
-                    logging.error(f"   ❌ Error deleting plans: {plan_del_err}", exc_info=True)
-                
-                # Step 4.5: Delete ALL orphaned blocks for this user and week (blocks without valid plan_id)
-                # This catches blocks that were left behind if plans were manually deleted
-                # CRITICAL: Only check blocks that belong to THIS week_start, not other weeks!
-                try:
-                    logging.info(f"   🔍 Step 4.5: Finding and deleting orphaned blocks for user {user_id}, week_start={week_start} ONLY")
-                    # Get all plan_ids that exist for this user and week_start (should be empty after deletion above)
-                    valid_plans = cleanup_client.table("weekly_plans").select("id").eq("user_id", user_id).eq("week_start", week_start).execute()
-                    valid_plan_ids = {p["id"] for p in (valid_plans.data or [])}
-                    
-                    # CRITICAL: Only check blocks that reference the deleted plan_ids for THIS week
-                    # We must NOT check blocks from other weeks!
-                    orphaned_block_ids = []
-                    
-                    # Only check blocks that reference the deleted plan_ids (if any still exist)
-                    # These plan_ids are guaranteed to be from this week_start (we verified above)
-                    if plan_ids:
-                        remaining_blocks_check = cleanup_client.table("weekly_plan_blocks").select("id, plan_id").eq("user_id", user_id).in_("plan_id", plan_ids).execute()
-                        if remaining_blocks_check.data:
-                            orphaned_block_ids.extend([b["id"] for b in remaining_blocks_check.data])
-                            logging.info(f"   🗑️ Found {len(orphaned_block_ids)} blocks still referencing deleted plan_ids for week {week_start}")
-                    else:
-                        logging.info(f"   ℹ️ No plan_ids to check for orphaned blocks (this is normal if no plans existed)")
-                    
-                    # CRITICAL: Do NOT check blocks from other weeks!
-                    # We only delete blocks that reference plan_ids we know belong to this week_start
-                    # This prevents accidentally deleting blocks from other weeks
-                    
-                    # Delete orphaned blocks
-                    if orphaned_block_ids:
-                        logging.info(f"   🗑️ Found {len(orphaned_block_ids)} orphaned blocks to delete (all verified to belong to week {week_start})")
-                        for block_id in orphaned_block_ids:
-                            try:
-                                cleanup_client.table("weekly_plan_blocks").delete().eq("id", block_id).execute()
-                            except Exception as orphan_del_err:
-                                logging.warning(f"   ⚠️ Could not delete orphaned block {block_id}: {orphan_del_err}")
-                        logging.info(f"   ✅ Deleted {len(orphaned_block_ids)} orphaned blocks")
-                    else:
-                        logging.info(f"   ✅ No orphaned blocks found")
-                except Exception as orphan_err:
-                    logging.warning(f"   ⚠️ Could not check for orphaned blocks: {orphan_err}")
-                
-                # Step 4.6: Final sweep - ONLY check blocks that reference the deleted plan_ids (NOT all user blocks!)
-                # CRITICAL: We must NOT query all blocks by user_id - this could delete blocks from other weeks!
-                try:
-                    logging.info(f"   🔍 Step 4.6: Final sweep - checking only blocks for deleted plan_ids (week_start={week_start})")
-                    # Only check blocks that reference the plan_ids we deleted (these are guaranteed to be from this week)
-                    if plan_ids:
-                        final_blocks_check = cleanup_client.table("weekly_plan_blocks").select("id, plan_id").eq("user_id", user_id).in_("plan_id", plan_ids).execute()
-                        if final_blocks_check.data:
-                            # These blocks should have been deleted already, but double-check
-                            for block in final_blocks_check.data:
-                                try:
-                                    cleanup_client.table("weekly_plan_blocks").delete().eq("id", block["id"]).execute()
-                                    logging.info(f"   🗑️ Final sweep: Deleted remaining block {block['id']} (from deleted plan_ids)")
-                                except:
-                                    pass
-                            logging.info(f"   ✅ Final sweep: Cleaned up {len(final_blocks_check.data)} remaining blocks from deleted plan_ids")
-                        else:
-                            logging.info(f"   ✅ Final sweep: No remaining blocks found for deleted plan_ids")
-                    else:
-                        logging.info(f"   ✅ Final sweep: No plan_ids to check (this is normal)")
-                except Exception as final_sweep_err:
-                    logging.warning(f"   ⚠️ Final sweep error: {final_sweep_err}")
-            else:
-                logging.info(f"   ✅ No existing plans found for user {user_id}, week {week_start} - skipping cleanup (no blocks to delete)")
-                # #region agent log
-                try:
-                    import json
-                    with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                        f.write(json.dumps({"runId":"run1","hypothesisId":"B","location":"app/main.py:3739","message":"Skipping cleanup - no plans found","data":{"user_id":user_id,"week_start":week_start},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-                except: pass
-                # #endregion
-                # CRITICAL: Do NOT check for orphaned blocks if no plans exist - this could delete blocks from other weeks!
-                # Only clean up if we actually found plans to delete
-            
-            # Step 5: DO NOT delete group_plan_blocks here!
-            # CRITICAL: group_plan_blocks are created and managed by the global agent (_run_weekly_auto_for_all_users)
-            # They should NOT be deleted by individual user planning, as they are shared across all group members
-            # If we delete them here, we break synchronization between group members
-            # The global agent handles cleanup of group_plan_blocks at the beginning of the weekly planning cycle
-            logging.info(f"   ℹ️ [GENERATE] Skipping group_plan_blocks cleanup - these are managed by global agent and should not be deleted here")
-            # NOTE: We also do NOT delete group weekly_plan_blocks here because:
-            # 1. They are created by the global agent for all members
-            # 2. They will be cleaned up as part of the user's plan cleanup above (if the plan is deleted)
-            # 3. If the plan is not deleted, we preserve the group blocks and restore them to the new plan
-            
-            logging.info(f"✅ [GENERATE] Cleanup complete for user {user_id}, week {week_start}")
+            logging.info(f"✅ [GENERATE] Cleanup complete for user {user_id}, week {week_start}: {cleanup_counts}")
         except Exception as cleanup_err:
             logging.error(f"❌ [GENERATE] Cleanup ERROR: {cleanup_err}", exc_info=True)
             # Don't fail the entire operation if cleanup fails, but log it
@@ -5014,8 +4905,7 @@ async def generate_weekly_plan(
         courses = list(all_courses)
         
         # Validate courses against CATALOG to ensure no "invented" courses are used
-        catalog_res = client.table("course_catalog").select("course_number,course_name").execute()
-        valid_catalog = {c["course_number"]: c["course_name"] for c in (catalog_res.data or [])}
+        valid_catalog = get_catalog(client).name_map()
         
         valid_courses = []
         for c in courses:
@@ -5036,50 +4926,9 @@ async def generate_weekly_plan(
         prefs_result = client.table("course_time_preferences").select("*").eq("user_id", user_id).execute()
         prefs_map = {p["course_number"]: p for p in (prefs_result.data or [])}
 
-        # Load constraints
-        constraints_result = client.table("constraints").select("*").eq("user_id", user_id).execute()
-        permanent_constraints = constraints_result.data or []
-        weekly_constraints_result = client.table("weekly_constraints").select("*").eq("user_id", user_id).eq("week_start", week_start).execute()
-        weekly_constraints = weekly_constraints_result.data or []
-
-        # Build blocked slots (hard constraints only)
+        # Build blocked slots (hard constraints only) from the availability snapshot
         time_slots = _build_time_slots()
-        blocked = set()
-        soft_blocked = set()
-
-        for constraint in permanent_constraints:
-            for day in _parse_days(constraint.get("days")):
-                for time in time_slots:
-                    if _time_to_minutes(time) >= _time_to_minutes(constraint["start_time"]) and _time_to_minutes(time) < _time_to_minutes(constraint["end_time"]):
-                        blocked.add((day, time))
-
-        for constraint in weekly_constraints:
-            for day in _parse_days(constraint.get("days")):
-                for time in time_slots:
-                    if _time_to_minutes(time) >= _time_to_minutes(constraint["start_time"]) and _time_to_minutes(time) < _time_to_minutes(constraint["end_time"]):
-                        if constraint.get("is_hard", True):
-                            blocked.add((day, time))
-                        else:
-                            soft_blocked.add((day, time))
-
-        # Semester schedule items (fixed lectures/tutorials - always hard constraints)
-        try:
-            semester_result = client.table("semester_schedule_items").select("*").eq("user_id", user_id).execute()
-            for item in (semester_result.data or []):
-                days_array = item.get("days", [])
-                if isinstance(days_array, str):
-                    try:
-                        import json
-                        days_array = json.loads(days_array)
-                    except:
-                        days_array = []
-                for day in _parse_days(days_array):
-                    for time in time_slots:
-                        if _time_to_minutes(time) >= _time_to_minutes(item["start_time"]) and _time_to_minutes(time) < _time_to_minutes(item["end_time"]):
-                            blocked.add((day, time))
-        except Exception as e:
-            # If table doesn't exist yet, just log and continue
-            logging.warning(f"Could not load semester schedule items for user {user_id}: {e}")
+        blocked, soft_blocked = planning_blocked_slots(get_user_availability(client, user_id, week_start), time_slots)
 
         # Determine available slots FIRST (before group blocks)
         available_slots = [(day, time) for day in range(7) for time in time_slots if (day, time) not in blocked]
@@ -5152,55 +5001,19 @@ async def generate_weekly_plan(
                             if (day, time) in available_slots:
                                 available_slots.remove((day, time))
                         
-                        # CRITICAL: Also create weekly_plan_blocks for ALL members if they don't exist yet
+                        # CRITICAL: Also create weekly_plan_blocks for ALL other members if they don't exist yet
                         # This ensures all members see the same group blocks even if they didn't run planning
+                        # (the user being planned gets them with the new plan below)
                         group_members_result = client.table("group_members").select("user_id").eq("group_id", group_id).eq("status", "approved").execute()
                         member_ids = [m["user_id"] for m in (group_members_result.data or [])]
                         
-                        for member_id in member_ids:
-                            try:
-                                # Get or create plan for this member
-                                member_plan_result = client.table("weekly_plans").select("id").eq("user_id", member_id).eq("week_start", week_start).limit(1).execute()
-                                if not member_plan_result.data:
-                                    plan_result = client.table("weekly_plans").insert({
-                                        "user_id": member_id,
-                                        "week_start": week_start,
-                                        "source": "auto"
-                                    }).execute()
-                                    if plan_result.data:
-                                        member_plan_id = plan_result.data[0]["id"]
-                                    else:
-                                        continue
-                                else:
-                                    member_plan_id = member_plan_result.data[0]["id"]
-                                
-                                # Check if this member already has these group blocks
-                                existing_member_blocks = client.table("weekly_plan_blocks").select("id").eq("plan_id", member_plan_id).eq("work_type", "group").eq("course_number", course_number).execute()
-                                existing_slots = {(b.get("day_of_week"), b.get("start_time")) for b in (existing_member_blocks.data or [])}
-                                
-                                # Create weekly_plan_blocks for this member (only if they don't exist)
-                                member_blocks = []
-                                for block in existing_gb.data:
-                                    slot_key = (block["day_of_week"], block["start_time"])
-                                    if slot_key not in existing_slots:
-                                        member_blocks.append({
-                                            "plan_id": member_plan_id,
-                                            "user_id": member_id,
-                                            "course_number": course_number,
-                                            "course_name": course_name,
-                                            "work_type": "group",
-                                            "day_of_week": block["day_of_week"],
-                                            "start_time": block["start_time"],
-                                            "end_time": block["end_time"],
-                                            "is_locked": False,
-                                            "source": "auto"
-                                        })
-                                
-                                if member_blocks:
-                                    client.table("weekly_plan_blocks").insert(member_blocks).execute()
-                                    logging.info(f"   ✅ Created {len(member_blocks)} weekly_plan_blocks for member {member_id} (from existing group_plan_blocks)")
-                            except Exception as member_err:
-                                logging.error(f"   ❌ Error creating blocks for member {member_id}: {member_err}", exc_info=True)
+                        try:
+                            fan_out = _fan_out_group_blocks_to_members(
+                                client, [mid for mid in member_ids if mid != user_id], week_start, existing_gb.data, course_number, course_name
+                            )
+                            logging.info(f"   ✅ Fan-out from existing group_plan_blocks for group {group_id}: {fan_out}")
+                        except Exception as member_err:
+                            logging.error(f"   ❌ Error creating member blocks for group {group_id}: {member_err}", exc_info=True)
                         
                         continue
                     
@@ -5220,38 +5033,9 @@ async def generate_weekly_plan(
                     
                     # Check constraints for ALL members to find common free slots
                     all_members_blocked = set()
-                    for member_id in member_ids:
-                        # Get member's constraints
-                        member_constraints = client.table("constraints").select("*").eq("user_id", member_id).execute()
-                        member_weekly_constraints = client.table("weekly_constraints").select("*").eq("user_id", member_id).eq("week_start", week_start).execute()
-                        member_semester = client.table("semester_schedule_items").select("*").eq("user_id", member_id).execute()
-                        
-                        # Build blocked slots for this member
-                        for constraint in (member_constraints.data or []):
-                            for day in _parse_days(constraint.get("days")):
-                                for time in time_slots:
-                                    if _time_to_minutes(time) >= _time_to_minutes(constraint["start_time"]) and _time_to_minutes(time) < _time_to_minutes(constraint["end_time"]):
-                                        all_members_blocked.add((day, time))
-                        
-                        for constraint in (member_weekly_constraints.data or []):
-                            if constraint.get("is_hard", True):
-                                for day in _parse_days(constraint.get("days")):
-                                    for time in time_slots:
-                                        if _time_to_minutes(time) >= _time_to_minutes(constraint["start_time"]) and _time_to_minutes(time) < _time_to_minutes(constraint["end_time"]):
-                                            all_members_blocked.add((day, time))
-                        
-                        for item in (member_semester.data or []):
-                            days_array = item.get("days", [])
-                            if isinstance(days_array, str):
-                                try:
-                                    import json
-                                    days_array = json.loads(days_array)
-                                except:
-                                    days_array = []
-                            for day in _parse_days(days_array):
-                                for time in time_slots:
-                                    if _time_to_minutes(time) >= _time_to_minutes(item["start_time"]) and _time_to_minutes(time) < _time_to_minutes(item["end_time"]):
-                                        all_members_blocked.add((day, time))
+                    for member_snapshot in get_users_availability(client, member_ids, week_start).values():
+                        member_blocked, _soft = planning_blocked_slots(member_snapshot, time_slots)
+                        all_members_blocked |= member_blocked
                     
                     # Find common free slots (available for ALL members)
                     common_free_slots = [(day, time) for day in range(7) for time in time_slots 
@@ -5296,32 +5080,83 @@ async def generate_weekly_plan(
                     group_preferences_summary = group_info.get("preferences_summary", {})
                     created_group_blocks = []
 
-                    llm_group_result = await _plan_group_blocks_with_llm(
-                        group_id=str(group_id),
-                        course_number=course_number,
-                        course_name=course_name or valid_catalog.get(str(course_number).strip(), ""),
-                        group_quota=group_quota,
-                        common_free_slots=common_free_slots,
-                        group_preferences_raw=group_preferences_raw,
-                        group_preferences_summary=group_preferences_summary,
-                    )
+                    if GROUP_PLANNER_MODE == "llm":
+                        llm_group_result = await _plan_group_blocks_with_llm(
+                            group_id=str(group_id),
+                            course_number=course_number,
+                            course_name=course_name or valid_catalog.get(str(course_number).strip(), ""),
+                            group_quota=group_quota,
+                            common_free_slots=common_free_slots,
+                            group_preferences_raw=group_preferences_raw,
+                            group_preferences_summary=group_preferences_summary,
+                        )
 
-                    if llm_group_result.get("success") and llm_group_result.get("group_blocks"):
-                        logging.info(
-                            f"   ✅ [LLM][GROUP] Planned {len(llm_group_result.get('group_blocks', []))} "
-                            f"group blocks for group {group_id}"
+                        if llm_group_result.get("success") and llm_group_result.get("group_blocks"):
+                            logging.info(
+                                f"   ✅ [LLM][GROUP] Planned {len(llm_group_result.get('group_blocks', []))} "
+                                f"group blocks for group {group_id}"
+                            )
+                            for blk in llm_group_result.get("group_blocks", []):
+                                day = blk.get("day_index")
+                                t = blk.get("start_time")
+                                if day is None or not t:
+                                    continue
+                                if (day, t) not in common_free_slots:
+                                    # Should not happen due to validation in helper, but double-check
+                                    logging.warning(
+                                        f"   ⚠️ [LLM][GROUP] Slot ({day}, {t}) not in common_free_slots, skipping"
+                                    )
+                                    continue
+                                created_group_blocks.append({
+                                    "group_id": group_id,
+                                    "week_start": week_start,
+                                    "course_number": course_number,
+                                    "day_of_week": day,
+                                    "start_time": t,
+                                    "end_time": _minutes_to_time(_time_to_minutes(t) + 60),
+                                    "created_by": user_id
+                                })
+                                if (day, t) in available_slots:
+                                    available_slots.remove((day, t))
+                        else:
+                            # Fallback: deterministic 2-hour blocks from common_free_slots
+                            logging.warning(
+                                f"   ⚠️ [LLM][GROUP] LLM planning failed for group {group_id} "
+                                f"or returned no blocks. Falling back to deterministic allocation."
+                            )
+                            allocated_hours = 0
+                            for day in range(7):
+                                if allocated_hours >= group_quota:
+                                    break
+                                for i in range(len(time_slots) - 1):
+                                    if allocated_hours >= group_quota:
+                                        break
+                                    t1, t2 = time_slots[i], time_slots[i+1]
+                                    if (day, t1) in common_free_slots and (day, t2) in common_free_slots:
+                                        # Found 2-hour block that all members are free
+                                        for t in [t1, t2]:
+                                            created_group_blocks.append({
+                                                "group_id": group_id,
+                                                "week_start": week_start,
+                                                "course_number": course_number,
+                                                "day_of_week": day,
+                                                "start_time": t,
+                                                "end_time": _minutes_to_time(_time_to_minutes(t) + 60),
+                                                "created_by": user_id
+                                            })
+                                            if (day, t) in available_slots:
+                                                available_slots.remove((day, t))
+                                            allocated_hours += 1
+                    
+                    else:
+                        # Optimizer: sessions of consecutive hours spread over days, inside common_free_slots
+                        unavailable = {(day, t) for day in range(7) for t in time_slots} - set(common_free_slots)
+                        assignments, _optimizer_stats = plan_group_blocks(
+                            [{"group_id": group_id, "member_ids": [user_id], "quota": group_quota}],
+                            {user_id: unavailable},
+                            time_slots,
                         )
-                        for blk in llm_group_result.get("group_blocks", []):
-                            day = blk.get("day_index")
-                            t = blk.get("start_time")
-                            if day is None or not t:
-                                continue
-                            if (day, t) not in common_free_slots:
-                                # Should not happen due to validation in helper, but double-check
-                                logging.warning(
-                                    f"   ⚠️ [LLM][GROUP] Slot ({day}, {t}) not in common_free_slots, skipping"
-                                )
-                                continue
+                        for day, t in assignments.get(group_id, []):
                             created_group_blocks.append({
                                 "group_id": group_id,
                                 "week_start": week_start,
@@ -5333,36 +5168,7 @@ async def generate_weekly_plan(
                             })
                             if (day, t) in available_slots:
                                 available_slots.remove((day, t))
-                    else:
-                        # Fallback: deterministic 2-hour blocks from common_free_slots
-                        logging.warning(
-                            f"   ⚠️ [LLM][GROUP] LLM planning failed for group {group_id} "
-                            f"or returned no blocks. Falling back to deterministic allocation."
-                        )
-                        allocated_hours = 0
-                        for day in range(7):
-                            if allocated_hours >= group_quota:
-                                break
-                            for i in range(len(time_slots) - 1):
-                                if allocated_hours >= group_quota:
-                                    break
-                                t1, t2 = time_slots[i], time_slots[i+1]
-                                if (day, t1) in common_free_slots and (day, t2) in common_free_slots:
-                                    # Found 2-hour block that all members are free
-                                    for t in [t1, t2]:
-                                        created_group_blocks.append({
-                                            "group_id": group_id,
-                                            "week_start": week_start,
-                                            "course_number": course_number,
-                                            "day_of_week": day,
-                                            "start_time": t,
-                                            "end_time": _minutes_to_time(_time_to_minutes(t) + 60),
-                                            "created_by": user_id
-                                        })
-                                        if (day, t) in available_slots:
-                                            available_slots.remove((day, t))
-                                        allocated_hours += 1
-                    
+
                     if created_group_blocks:
                         # Insert group_plan_blocks
                         insert_result = client.table("group_plan_blocks").insert(created_group_blocks).execute()
@@ -5370,45 +5176,14 @@ async def generate_weekly_plan(
                             synchronized_group_blocks.extend(insert_result.data)
                             logging.info(f"   ✅ Created {len(created_group_blocks)} synchronized group_plan_blocks for group {group_id}")
                             
-                            # Create weekly_plan_blocks for ALL members
-                            for member_id in member_ids:
-                                try:
-                                    # Get or create plan for this member
-                                    member_plan_result = client.table("weekly_plans").select("id").eq("user_id", member_id).eq("week_start", week_start).limit(1).execute()
-                                    if not member_plan_result.data:
-                                        plan_result = client.table("weekly_plans").insert({
-                                            "user_id": member_id,
-                                            "week_start": week_start,
-                                            "source": "auto"
-                                        }).execute()
-                                        if plan_result.data:
-                                            member_plan_id = plan_result.data[0]["id"]
-                                        else:
-                                            continue
-                                    else:
-                                        member_plan_id = member_plan_result.data[0]["id"]
-                                    
-                                    # Create weekly_plan_blocks for this member
-                                    member_blocks = []
-                                    for block in created_group_blocks:
-                                        member_blocks.append({
-                                            "plan_id": member_plan_id,
-                                            "user_id": member_id,
-                                            "course_number": course_number,
-                                            "course_name": course_name,
-                                            "work_type": "group",
-                                            "day_of_week": block["day_of_week"],
-                                            "start_time": block["start_time"],
-                                            "end_time": block["end_time"],
-                                            "is_locked": False,
-                                            "source": "auto"
-                                        })
-                                    
-                                    if member_blocks:
-                                        client.table("weekly_plan_blocks").insert(member_blocks).execute()
-                                        logging.info(f"   ✅ Created {len(member_blocks)} weekly_plan_blocks for member {member_id}")
-                                except Exception as member_err:
-                                    logging.error(f"   ❌ Error creating blocks for member {member_id}: {member_err}", exc_info=True)
+                            # Create weekly_plan_blocks for ALL other members (the user being planned gets them with the new plan below)
+                            try:
+                                fan_out = _fan_out_group_blocks_to_members(
+                                    client, [mid for mid in member_ids if mid != user_id], week_start, created_group_blocks, course_number, course_name
+                                )
+                                logging.info(f"   ✅ Fan-out for group {group_id}: {fan_out}")
+                            except Exception as member_err:
+                                logging.error(f"   ❌ Error creating member blocks for group {group_id}: {member_err}", exc_info=True)
                         else:
                             logging.error(f"   ❌ Failed to insert group_plan_blocks for group {group_id}")
                     else:
@@ -5442,11 +5217,12 @@ async def generate_weekly_plan(
         # Verify cleanup was successful before creating new plan
         logging.info(f"🔍 [GENERATE] Verifying cleanup was successful...")
         verify_cleanup = cleanup_client.table("weekly_plans").select("id").eq("user_id", user_id).eq("week_start", week_start).execute()
+        existing_group_blocks_in_weekly = []
+        restored_slots = set()
         if verify_cleanup.data:
             logging.warning(f"⚠️ [GENERATE] WARNING: Found {len(verify_cleanup.data)} plan(s) still existing after cleanup! Attempting force delete...")
             # CRITICAL: Before deleting, check if there are existing group blocks in weekly_plan_blocks
             # These need to be preserved and added to the new plan
-            existing_group_blocks_in_weekly = []
             for plan in verify_cleanup.data:
                 try:
                     # Check for existing group blocks before deleting
@@ -5473,6 +5249,11 @@ async def generate_weekly_plan(
             logging.info(f"🔄 [GENERATE] Restoring {len(existing_group_blocks_in_weekly)} existing group blocks to new plan")
             restored_blocks = []
             for gb in existing_group_blocks_in_weekly:
+                # One row per slot (the old plans may have held the same group block)
+                slot = (gb.get("day_of_week"), str(gb.get("start_time") or "")[:5], str(gb.get("course_number") or "").strip())
+                if slot in restored_slots:
+                    continue
+                restored_slots.add(slot)
                 # NOTE: group_id is not a column in weekly_plan_blocks, so we don't include it
                 restored_blocks.append({
                     "plan_id": plan_id,
@@ -5490,11 +5271,7 @@ async def generate_weekly_plan(
                 client.table("weekly_plan_blocks").insert(restored_blocks).execute()
                 logging.info(f"✅ [GENERATE] Restored {len(restored_blocks)} group blocks to new plan")
         # #region agent log
-        try:
-            import json
-            with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                f.write(json.dumps({"sessionId":"debug-session","runId":"run1","hypothesisId":"G","location":"app/main.py:2422","message":"generate_weekly_plan: NEW plan created","data":{"plan_id":plan_id,"week_start":week_start},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-        except: pass
+        debug_log("G", "app/main.py:2422", "generate_weekly_plan: NEW plan created", {"plan_id":plan_id,"week_start":week_start})
         # #endregion
 
         # CRITICAL: Check if there are existing group blocks in weekly_plan_blocks for this user
@@ -5548,11 +5325,7 @@ async def generate_weekly_plan(
         
         logging.info(f"📊 [GENERATE] Added {len(plan_blocks)} synchronized group blocks to plan_blocks")
         # #region agent log
-        try:
-            import json
-            with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                f.write(json.dumps({"sessionId":"debug-session","runId":"run1","hypothesisId":"G","location":"app/main.py:4105","message":"generate_weekly_plan: starting to build plan_blocks","data":{"synchronized_group_blocks_count":len(synchronized_group_blocks),"plan_blocks_count":len(plan_blocks),"week_start":week_start,"user_id":user_id},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-        except: pass
+        debug_log("G", "app/main.py:4105", "generate_weekly_plan: starting to build plan_blocks", lambda: {"synchronized_group_blocks_count":len(synchronized_group_blocks),"plan_blocks_count":len(plan_blocks),"week_start":week_start,"user_id":user_id})
         # #endregion
 
         # 2. Load user preferences for LLM refinement (including schedule_change_notes for learning)
@@ -5567,20 +5340,29 @@ async def generate_weekly_plan(
             if not isinstance(schedule_change_notes, list):
                 schedule_change_notes = []
         
-        # If we have schedule_change_notes, use LLM to update preferences summary
+        # If we have schedule_change_notes, use LLM to update preferences summary - unless the stored
+        # summary was already built from exactly these preferences and notes
         if schedule_change_notes:
-            logging.info(f"📋 [GENERATE] Found {len(schedule_change_notes)} schedule change notes - updating preferences summary")
-            updated_summary = await _summarize_user_preferences_with_llm(
-                preferences_raw=user_preferences_raw,
-                schedule_change_notes=schedule_change_notes
-            )
-            if updated_summary:
-                # Merge with existing summary
-                if user_preferences_summary:
-                    user_preferences_summary.update(updated_summary)
-                else:
-                    user_preferences_summary = updated_summary
-                logging.info(f"✅ [GENERATE] Updated preferences summary with schedule change notes")
+            summary_hash = _preferences_summary_hash(user_preferences_raw, schedule_change_notes)
+            if _get_cached_preferences_summary(client, user_id, summary_hash):
+                logging.info(f"📋 [GENERATE] Preferences summary is up to date with {len(schedule_change_notes)} schedule change notes - skipping LLM")
+            else:
+                logging.info(f"📋 [GENERATE] Found {len(schedule_change_notes)} schedule change notes - updating preferences summary")
+                updated_summary = await _summarize_user_preferences_with_llm(
+                    preferences_raw=user_preferences_raw,
+                    schedule_change_notes=schedule_change_notes
+                )
+                if updated_summary:
+                    # Merge with existing summary
+                    if user_preferences_summary:
+                        user_preferences_summary.update(updated_summary)
+                    else:
+                        user_preferences_summary = updated_summary
+                    try:
+                        _save_preferences_summary(client, user_id, user_preferences_summary, summary_hash)
+                    except Exception as save_err:
+                        logging.warning(f"Could not save updated preferences summary for user {user_id}: {save_err}")
+                    logging.info(f"✅ [GENERATE] Updated preferences summary with schedule change notes")
         
         logging.info(f"📋 [GENERATE] User preferences loaded: {len(user_preferences_raw)} chars raw, {len(user_preferences_summary)} keys in summary, {len(schedule_change_notes)} change notes")
         if user_preferences_raw:
@@ -5624,15 +5406,8 @@ async def generate_weekly_plan(
                                     "group_id": group_id  # Keep for plan_blocks reference, will be removed before final insert
                                 }
                                 plan_blocks.append(new_group_block)
-                                # CRITICAL: Also insert this block to DB immediately to ensure synchronization
-                                # Remove group_id before inserting (it's not a column in weekly_plan_blocks)
-                                try:
-                                    db_block = {k: v for k, v in new_group_block.items() if k != "group_id"}
-                                    client.table("weekly_plan_blocks").insert([db_block]).execute()
-                                    logging.info(f"   ✅ Added and inserted missing group block: {course_num}, day={gpb.get('day_of_week')}, time={gpb.get('start_time')}")
-                                except Exception as insert_err:
-                                    logging.error(f"   ❌ Failed to insert group block to DB: {insert_err}")
-                                    logging.info(f"   ⚠️ Block added to plan_blocks but not inserted to DB - will be inserted later with other blocks")
+                                # Written with the other blocks below (inserting it here as well duplicated the slot)
+                                logging.info(f"   ✅ Added missing group block: {course_num}, day={gpb.get('day_of_week')}, time={gpb.get('start_time')}")
                 except Exception as group_check_err:
                     logging.error(f"   ❌ Error checking group blocks for group {group_id}: {group_check_err}")
         
@@ -5700,11 +5475,7 @@ async def generate_weekly_plan(
             )
         
         # #region agent log
-        try:
-            import json
-            with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                f.write(json.dumps({"runId":"run1","hypothesisId":"F","location":"app/main.py:3995","message":"LLM result check","data":{"llm_success":llm_result.get("success"),"llm_message":llm_result.get("message",""),"group_blocks_count":len(llm_result.get('group_blocks',[])),"personal_blocks_count":len(llm_result.get('blocks',[]))},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-        except: pass
+        debug_log("F", "app/main.py:3995", "LLM result check", lambda: {"llm_success":llm_result.get("success"),"llm_message":llm_result.get("message",""),"group_blocks_count":len(llm_result.get('group_blocks',[])),"personal_blocks_count":len(llm_result.get('blocks',[]))})
         # #endregion
         
         if llm_result.get("success"):
@@ -5871,11 +5642,7 @@ async def generate_weekly_plan(
             logging.error(f"   ⚠️ WARNING: User preferences will NOT be used in fallback mode!")
             logging.error(f"   ⚠️ WARNING: This is a basic schedule without personalization!")
             # #region agent log
-            try:
-                import json
-                with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                    f.write(json.dumps({"runId":"run1","hypothesisId":"F","location":"app/main.py:4226","message":"FALLBACK MODE - LLM failed","data":{"llm_success":llm_result.get("success"),"llm_message":llm_result.get("message",""),"llm_blocks_count":len(llm_result.get('blocks',[])),"user_id":user_id,"week_start":week_start},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-            except: pass
+            debug_log("F", "app/main.py:4226", "FALLBACK MODE - LLM failed", lambda: {"llm_success":llm_result.get("success"),"llm_message":llm_result.get("message",""),"llm_blocks_count":len(llm_result.get('blocks',[])),"user_id":user_id,"week_start":week_start})
             # #endregion
             
             # CRITICAL: In fallback mode, group blocks are already created and synchronized above
@@ -6021,11 +5788,7 @@ async def generate_weekly_plan(
             if personal_count == 0:
                 logging.error(f"❌ [FALLBACK] CRITICAL: No personal blocks created in fallback mode!")
         # #region agent log
-        try:
-            import json
-            with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                f.write(json.dumps({"sessionId":"debug-session","runId":"run1","hypothesisId":"G","location":"app/main.py:2656","message":"generate_weekly_plan: BEFORE insert blocks","data":{"plan_blocks_count":len(plan_blocks),"plan_id":plan_id,"week_start":week_start,"has_blocks":len(plan_blocks) > 0},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-        except: pass
+        debug_log("G", "app/main.py:2656", "generate_weekly_plan: BEFORE insert blocks", lambda: {"plan_blocks_count":len(plan_blocks),"plan_id":plan_id,"week_start":week_start,"has_blocks":len(plan_blocks) > 0})
         # #endregion
         
         if not plan_blocks:
@@ -6058,8 +5821,11 @@ async def generate_weekly_plan(
                     slot_check[key] = block['course_name']
             
             # Remove group_id from blocks before insert (it's not a column in weekly_plan_blocks)
+            # Group slots restored into the new plan above are already written: skip them
             blocks_to_insert = []
             for block in plan_blocks:
+                if block.get("work_type") == "group" and (block["day_of_week"], str(block["start_time"])[:5], str(block["course_number"]).strip()) in restored_slots:
+                    continue
                 insert_block = {k: v for k, v in block.items() if k != "group_id"}
                 blocks_to_insert.append(insert_block)
             
@@ -6073,24 +5839,26 @@ async def generate_weekly_plan(
                 logging.info(f"   📋 Sample block structure: {list(blocks_to_insert[0].keys())}")
                 logging.info(f"   📋 Sample block data: {blocks_to_insert[0]}")
             else:
-                logging.error(f"   ❌ blocks_to_insert is EMPTY! This should not happen if plan_blocks had items.")
+                logging.info(f"   ℹ️ All plan blocks were restored group blocks - nothing else to insert")
             
             try:
-                logging.info(f"🔄 [GENERATE] Calling client.table('weekly_plan_blocks').insert()...")
-                insert_result = client.table("weekly_plan_blocks").insert(blocks_to_insert).execute()
+                # Upsert skipping slots the plan already has (unique slot key), plain insert without it
+                logging.info(f"🔄 [GENERATE] Writing blocks to weekly_plan_blocks...")
+                inserted_rows = _upsert_plan_blocks(client, blocks_to_insert) if blocks_to_insert else []
+                if inserted_rows is None:
+                    inserted_rows = client.table("weekly_plan_blocks").insert(blocks_to_insert).execute().data or []
                 logging.info(f"🔄 [GENERATE] Insert call completed. Checking result...")
                 
-                if not insert_result.data:
+                if blocks_to_insert and not inserted_rows:
                     error_msg = f"❌ [GENERATE] INSERT FAILED! Supabase returned no data. plan_id: {plan_id}, blocks_count: {len(blocks_to_insert)}"
                     logging.error(error_msg)
                     # Log first block as sample
                     if blocks_to_insert:
                         logging.error(f"   Sample block: {blocks_to_insert[0]}")
                     # Try to get more info about the error
-                    logging.error(f"   Insert result type: {type(insert_result)}, has data: {hasattr(insert_result, 'data')}")
                     raise Exception(error_msg)
                 
-                inserted_count = len(insert_result.data)
+                inserted_count = len(inserted_rows)
                 if inserted_count != len(blocks_to_insert):
                     logging.warning(f"⚠️ [GENERATE] PARTIAL INSERT! Expected {len(blocks_to_insert)} blocks, got {inserted_count}")
                 else:
@@ -6101,15 +5869,12 @@ async def generate_weekly_plan(
                         logging.info(f"   ✅ Verified plan {plan_id} has week_start: {verify_plan.data[0].get('week_start')}")
                 
                 # Verify inserted blocks have correct plan_id
-                sample_plan_ids = [b.get("plan_id") for b in insert_result.data[:3]]
+                sample_plan_ids = [b.get("plan_id") for b in inserted_rows[:3]]
                 if sample_plan_ids and not all(pid == plan_id for pid in sample_plan_ids):
                     logging.error(f"❌ INSERTED BLOCKS HAVE WRONG plan_id! Expected {plan_id}, got {sample_plan_ids}")
                 
                 # #region agent log
-                try:
-                    with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                        f.write(json.dumps({"sessionId":"debug-session","runId":"run1","hypothesisId":"G","location":"app/main.py:2748","message":"generate_weekly_plan: INSERT SUCCESS","data":{"blocks_inserted":inserted_count,"plan_id":plan_id,"expected_count":len(blocks_to_insert)},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-                except: pass
+                debug_log("G", "app/main.py:2748", "generate_weekly_plan: INSERT SUCCESS", lambda: {"blocks_inserted":inserted_count,"plan_id":plan_id,"expected_count":len(blocks_to_insert)})
                 # #endregion
                 
             except Exception as insert_err:
@@ -6119,20 +5884,13 @@ async def generate_weekly_plan(
                 if blocks_to_insert:
                     logging.error(f"   Sample block structure: {blocks_to_insert[0]}")
                 # #region agent log
-                try:
-                    with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                        f.write(json.dumps({"sessionId":"debug-session","runId":"run1","hypothesisId":"G","location":"app/main.py:2755","message":"generate_weekly_plan: INSERT FAILED","data":{"error":str(insert_err),"plan_id":plan_id,"blocks_count":len(blocks_to_insert)},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-                except: pass
+                debug_log("G", "app/main.py:2755", "generate_weekly_plan: INSERT FAILED", lambda: {"error":str(insert_err),"plan_id":plan_id,"blocks_count":len(blocks_to_insert)})
                 # #endregion
                 raise
         else:
             logging.warning(f"⚠️ [GENERATE] LLM did not return success! llm_result: {llm_result.get('message', 'No message')}")
             # #region agent log
-            try:
-                import json
-                with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                    f.write(json.dumps({"sessionId":"debug-session","runId":"run1","hypothesisId":"G","location":"app/main.py:2668","message":"generate_weekly_plan: LLM FAILED or NO BLOCKS","data":{"plan_id":plan_id,"week_start":week_start,"llm_success":llm_result.get("success"),"llm_message":llm_result.get("message")},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-            except: pass
+            debug_log("G", "app/main.py:2668", "generate_weekly_plan: LLM FAILED or NO BLOCKS", lambda: {"plan_id":plan_id,"week_start":week_start,"llm_success":llm_result.get("success"),"llm_message":llm_result.get("message")})
             # #endregion
 
         # Fetch blocks from DB after insert to return complete data (including group_id for group blocks)
@@ -6154,42 +5912,32 @@ async def generate_weekly_plan(
             logging.info(f"✅ Verified: {len(final_blocks)} blocks found in DB for plan_id {plan_id}")
         
         # Add group_id to group blocks
-        group_blocks = [b for b in final_blocks if b.get("work_type") == "group"]
-        if group_blocks:
-            all_group_blocks = client.table("group_plan_blocks").select("group_id, course_number, day_of_week, start_time").eq("week_start", week_start).execute()
-            user_groups_check = client.table("group_members").select("group_id").eq("user_id", user_id).eq("status", "approved").execute()
-            user_group_ids_check = [g["group_id"] for g in (user_groups_check.data or [])]
-            if user_group_ids_check:
-                groups_result = client.table("study_groups").select("id, course_id").in_("id", user_group_ids_check).execute()
-                groups_map = {g["id"]: g.get("course_id") for g in (groups_result.data or [])}
-                for block in group_blocks:
-                    for gb in (all_group_blocks.data or []):
-                        if (gb.get("day_of_week") == block["day_of_week"] and 
-                            gb.get("start_time") == block["start_time"]):
-                            group_course = groups_map.get(gb.get("group_id"))
-                            if group_course and str(group_course).strip() == str(block.get("course_number")).strip():
-                                block["group_id"] = gb.get("group_id")
-                                break
+        _attach_group_ids(client, user_id, week_start, final_blocks)
+
+        # Fingerprint of the inputs as they stand now (including group blocks created above),
+        # so an identical re-run returns this plan without replanning
+        if use_fingerprint and _plan_fingerprint_available:
+            try:
+                _store_plan_fingerprint(client, plan_id, _planning_input_fingerprint(client, user_id, week_start))
+            except Exception as fp_err:
+                logging.warning(f"Could not compute plan fingerprint for user {user_id}: {fp_err}")
 
         if notify:
             try:
-                # Delete any existing notification for this week to avoid duplicates
-                client.table("notifications").delete().eq("user_id", user_id).eq("type", "plan_ready").like("link", f"%week={week_start}%").execute()
+                # One plan_ready per user and week: replaced via its dedup key, or deleted first
+                # when dedup keys are not installed
+                if not dedup_keys_available():
+                    client.table("notifications").delete().eq("user_id", user_id).eq("type", "plan_ready").like("link", f"%week={week_start}%").execute()
                 
-                notif_data = {
-                    "user_id": user_id,
-                    "type": "plan_ready",
-                    "title": "Your weekly schedule is ready! 📅",
-                    "message": f"The agent has finished planning your schedule for week ({week_start}). Feel free to review and update!",
-                    "link": f"/schedule?week={week_start}",
-                    "read": False
-                }
                 logging.info(f"🔔 Sending plan_ready notification to user {user_id} for week {week_start}")
-                result = client.table("notifications").insert(notif_data).execute()
-                if result.data:
-                    logging.info(f"✅ Notification created successfully: {result.data[0].get('id')}")
-                else:
-                    logging.warning(f"⚠️ Notification insert returned no data")
+                send_notifications(client, [notification_row(
+                    user_id,
+                    "plan_ready",
+                    "Your weekly schedule is ready! 📅",
+                    f"The agent has finished planning your schedule for week ({week_start}). Feel free to review and update!",
+                    link=f"/schedule?week={week_start}",
+                    dedup_key=f"plan_ready:{week_start}",
+                )], replace=True)
             except Exception as notif_err:
                 logging.error(f"⚠️ Failed to notify user {user_id} about plan ready: {notif_err}", exc_info=True)
 
@@ -6199,6 +5947,9 @@ async def generate_weekly_plan(
     except Exception as e:
         logging.error(f"Error generating weekly plan: {e}")
         raise HTTPException(status_code=500, detail=f"Error generating weekly plan: {str(e)}")
+    finally:
+        if user_id is not None:
+            invalidate_schedules([user_id], week_start)
 
 
 @app.post("/api/weekly-plan/auto")
@@ -6252,13 +6003,23 @@ async def trigger_weekly_plan_now(
 
 
 @app.post("/api/weekly-plan/run-immediately")
-async def run_weekly_plan_immediately(week_start: Optional[str] = None):
+async def run_weekly_plan_immediately(week_start: Optional[str] = None, incremental: bool = False):
     """
     Run the weekly auto plan immediately (not scheduled).
     Bypasses APScheduler to avoid misfire issues.
+    incremental=true replans only users whose courses/constraints/preferences/groups changed
+    since the last run (see PLANNING_DIRTY_TRACKING.sql) and the study groups they belong to.
+    With PLANNER_QUEUE_ENABLED the full run is queued for planner workers and the run_id is
+    returned (progress: GET /api/system/planning-jobs/{run_id}).
     """
     try:
-        await _run_weekly_auto_for_all_users(week_start_override=week_start)
+        if incremental:
+            summary = await _run_incremental_weekly_replan(week_start_override=week_start)
+            return {"message": "Incremental weekly replan executed", **summary}
+        if PLANNER_QUEUE_ENABLED and queue_available():
+            job = _enqueue_weekly_run(week_start)
+            return {"message": "Weekly auto plan queued for planner workers", "run_id": job["run_id"] if job else None}
+        await _run_weekly_full(week_start_override=week_start)
         if week_start:
             return {"message": f"Weekly auto plan executed immediately for all users (week_start={week_start})"}
         return {"message": "Weekly auto plan executed immediately for all users"}
@@ -6267,6 +6028,19 @@ async def run_weekly_plan_immediately(week_start: Optional[str] = None):
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
+@app.get("/api/system/planning-jobs/{run_id}")
+async def get_planning_run_progress(run_id: str):
+    """Progress of a queued weekly run: job counts by status and failed jobs"""
+    client = supabase_admin if supabase_admin else supabase
+    if not client:
+        raise HTTPException(status_code=500, detail="Supabase client not configured")
+    try:
+        return run_progress(client, run_id)
+    except Exception as e:
+        logging.error(f"Error loading planning run {run_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
 @app.get("/api/system/scheduler/status")
 async def get_scheduler_status():
     """Check scheduler status and next run time"""
@@ -6323,15 +6097,55 @@ async def llm_health_check():
         logging.error(f"LLM health check failed: {e}")
         return JSONResponse(status_code=500, content={"ok": False, "error": str(e)})
 
+
+@app.get("/api/llm/routing-stats")
+async def llm_routing_stats():
+    """
+    Prompt/completion token usage of supervisor routing calls, per routed executor.
+    cached_prompt_tokens is reported by providers that support prompt caching.
+    """
+    from app.agents.llm_client import get_routing_token_stats
+    return {"routes": get_routing_token_stats()}
+
+def _block_conflict_response(conflict: BlockVersionConflict) -> JSONResponse:
+    """409 for an edit of a block that changed (or was deleted) since the client/agent read it"""
+    headers = {}
+    etag = block_etag(conflict.current)
+    if etag:
+        headers["ETag"] = etag
+    return JSONResponse(
+        status_code=409,
+        content={
+            "error": "version_conflict",
+            "message": "The block was changed in the meantime. Reload the schedule and try again.",
+            "block": conflict.current,
+        },
+        headers=headers,
+    )
+
+
+def _body_version(value: Any) -> Optional[int]:
+    """Block version sent in a request body (None if absent); 400 if it is not a number"""
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="version must be an integer")
+
+
 @app.put("/api/weekly-plan-blocks/{block_id}")
 async def update_weekly_plan_block(
     block_id: str,
     update_data: dict,
+    request: Request,
     current_user: dict = Depends(get_current_user)
 ):
     """
     Update a weekly plan block (used when user edits the plan).
     Also updates course time preferences based on current plan distribution.
+    The write is conditional on the block version: If-Match header or "version" in the body
+    (the version read here if neither is sent); a stale version answers 409.
     """
     try:
         user_id = current_user.get("id") or current_user.get("sub")
@@ -6347,9 +6161,13 @@ async def update_weekly_plan_block(
         if not update_payload:
             raise HTTPException(status_code=400, detail="No valid fields to update")
 
-        update_result = client.table("weekly_plan_blocks").update(update_payload).eq("id", block_id).execute()
-        if not update_result.data:
-            raise HTTPException(status_code=400, detail="Failed to update plan block")
+        expected_version = parse_if_match(request.headers.get("if-match"))
+        if expected_version is None:
+            expected_version = _body_version(update_data.get("version", block.get("version")))
+        try:
+            updated_block = update_block(client, block_id, update_payload, expected_version)
+        except BlockVersionConflict as conflict:
+            return _block_conflict_response(conflict)
 
         # Update course time preferences based on all blocks in this plan
         plan_id = block["plan_id"]
@@ -6383,7 +6201,11 @@ async def update_weekly_plan_block(
                     "group_hours_per_week": group_hours
                 }, on_conflict="user_id,course_number").execute()
 
-        return {"message": "Plan block updated", "block": update_result.data[0]}
+        etag = block_etag(updated_block)
+        return JSONResponse(
+            content={"message": "Plan block updated", "block": updated_block},
+            headers={"ETag": etag} if etag else None,
+        )
     except HTTPException:
         raise
     except Exception as e:
@@ -6547,6 +6369,13 @@ async def move_schedule_block(
         if block["user_id"] != user_id:
             raise HTTPException(status_code=403, detail="Not authorized to move this block")
         
+        # Client-side version (If-Match / body): reject a move based on a stale schedule
+        client_version = parse_if_match(request.headers.get("if-match"))
+        if client_version is None:
+            client_version = _body_version(body.get("version"))
+        if client_version is not None and block.get("version") is not None and client_version != block["version"]:
+            return _block_conflict_response(BlockVersionConflict(block_id, client_version, block))
+        
         # Check if it's a group block
         if block.get("work_type") == "group":
             # Cannot move group blocks directly - need to create change request
@@ -6584,7 +6413,7 @@ async def move_schedule_block(
             num_hours_to_move = duration_hours
             
             # Get all blocks for this plan/course/day to find the sub-range
-            all_blocks_for_conflict = client.table("weekly_plan_blocks").select("id, start_time, end_time").eq("plan_id", block["plan_id"]).eq("course_number", course_number).eq("work_type", work_type).eq("day_of_week", original_day).order("start_time").execute()
+            all_blocks_for_conflict = client.table("weekly_plan_blocks").select(block_columns(client, "id, start_time, end_time")).eq("plan_id", block["plan_id"]).eq("course_number", course_number).eq("work_type", work_type).eq("day_of_week", original_day).order("start_time").execute()
             
             # Find blocks in the sub-range
             consecutive_blocks = []
@@ -6603,7 +6432,7 @@ async def move_schedule_block(
         else:
             # No sub-range specified - move all consecutive blocks (original behavior)
             # Get all blocks for this plan/course/day to find consecutive ones
-            all_blocks_for_conflict = client.table("weekly_plan_blocks").select("id, start_time, end_time").eq("plan_id", block["plan_id"]).eq("course_number", course_number).eq("work_type", work_type).eq("day_of_week", original_day).order("start_time").execute()
+            all_blocks_for_conflict = client.table("weekly_plan_blocks").select(block_columns(client, "id, start_time, end_time")).eq("plan_id", block["plan_id"]).eq("course_number", course_number).eq("work_type", work_type).eq("day_of_week", original_day).order("start_time").execute()
             
             # Find consecutive blocks
             consecutive_blocks = []
@@ -6756,21 +6585,26 @@ async def move_schedule_block(
         if new_start_time not in time_slots:
             new_start_time = time_slots[new_start_idx]  # Use the closest slot
         
-        # Update all consecutive blocks
+        # Update all consecutive blocks, each conditional on the version read above
+        # (all or nothing: a block changed meanwhile undoes the move and answers 409)
+        blocks_by_id = {b["id"]: b for b in consecutive_blocks}
+        blocks_by_id.setdefault(block_id, block)
+        moves = []
         for i, block_id_to_move in enumerate(blocks_to_move_ids):
             if new_start_idx + i < len(time_slots):
                 new_time = time_slots[new_start_idx + i]
                 new_end = time_slots[new_start_idx + i + 1] if (new_start_idx + i + 1) < len(time_slots) else "21:00"
-                
-                update_result = client.table("weekly_plan_blocks").update({
+                moves.append((blocks_by_id[block_id_to_move], {
                     "day_of_week": new_day,
                     "start_time": new_time,
                     "end_time": new_end,
                     "source": "manual"  # Mark as manually edited
-                }).eq("id", block_id_to_move).execute()
-                
-                if not update_result.data:
-                    logging.warning(f"⚠️ Failed to update block {block_id_to_move}")
+                }))
+        try:
+            moved_blocks = move_blocks(client, moves)
+        except BlockVersionConflict as conflict:
+            logging.warning(f"⚠️ Move of block {block_id} aborted: {conflict}")
+            return _block_conflict_response(conflict)
         
         logging.info(f"✅ User {user_id} moved {len(blocks_to_move_ids)} consecutive personal blocks from day {original_day} {original_start} to day {new_day} {new_start_time}")
         
@@ -6804,6 +6638,7 @@ async def move_schedule_block(
                 # The summary is saved to study_preferences_summary and used when generating schedules
                 try:
                     logging.info(f"🔄 [MOVE BLOCK] Calling LLM for classification - course: {block.get('course_number')}, explanation: {explanation[:100] if explanation else 'none'}")
+                    summary_hash = _preferences_summary_hash(current_prefs, current_notes)
                     summary = await _summarize_user_preferences_with_llm(current_prefs, current_notes)
                     if summary:
                         update_type = summary.get("update_type", "general_preferences")
@@ -6914,9 +6749,7 @@ async def move_schedule_block(
                         # This is what we use when generating schedules (not the raw notes)
                         # The summary contains the classification (update_type) and extracted preferences
                         try:
-                            update_result = client.table("user_profiles").update({
-                                "study_preferences_summary": summary
-                            }).eq("id", user_id).execute()
+                            update_result = _save_preferences_summary(client, user_id, summary, summary_hash)
                             
                             if update_result.data:
                                 logging.info(f"💾 [MOVE BLOCK] ✅ Successfully saved study_preferences_summary to database")
@@ -6953,11 +6786,14 @@ async def move_schedule_block(
             except Exception as pref_err:
                 logging.error(f"Failed to update preferences: {pref_err}")
         
+        moved_block = moved_blocks[-1] if moved_blocks else {}
+        etag = block_etag(moved_block)
         return JSONResponse(content={
             "message": "Block moved successfully",
-            "block": update_result.data[0] if update_result.data else {},
+            "block": moved_block,
+            "blocks": moved_blocks,
             "preferences_updated": preferences_updated
-        })
+        }, headers={"ETag": etag} if etag else None)
         
     except HTTPException:
         raise
@@ -7005,7 +6841,7 @@ async def resize_schedule_block(
         plan_id = plan_result.data[0]["id"]
         
         # Find and delete existing blocks for this course at this time
-        existing = client.table("weekly_plan_blocks").select("id, start_time").eq("plan_id", plan_id).eq("course_number", course_number).eq("day_of_week", day_of_week).eq("work_type", "personal").execute()
+        existing = client.table("weekly_plan_blocks").select(block_columns(client, "id, start_time")).eq("plan_id", plan_id).eq("course_number", course_number).eq("day_of_week", day_of_week).eq("work_type", "personal").execute()
         
         # Find consecutive blocks starting from start_time
         time_slots = ["08:00", "09:00", "10:00", "11:00", "12:00", "13:00", "14:00", "15:00", "16:00", "17:00", "18:00", "19:00", "20:00", "21:00", "22:00", "23:00"]
@@ -7013,11 +6849,13 @@ async def resize_schedule_block(
         start_idx = time_slots.index(start_time_norm) if start_time_norm in time_slots else 0
         
         blocks_to_delete = []
+        old_blocks = []
         for block in (existing.data or []):
             block_start_norm = _norm_hhmm(block["start_time"]) if block.get("start_time") else None
             block_idx = time_slots.index(block_start_norm) if block_start_norm and block_start_norm in time_slots else -1
             if block_idx >= start_idx and block_idx < start_idx + old_duration:
                 blocks_to_delete.append(block["id"])
+                old_blocks.append(block)
         
         # Check for conflicts with hard constraints (both weekly and permanent) before resizing
         conflict_reasons = []
@@ -7119,20 +6957,17 @@ async def resize_schedule_block(
             )
         
         # No conflicts - proceed with resize
-        # Delete old blocks
-        for block_id in blocks_to_delete:
-            client.table("weekly_plan_blocks").delete().eq("id", block_id).execute()
-        
         # Get course name from catalog
-        catalog_result = client.table("course_catalog").select("course_name").eq("course_number", course_number).limit(1).execute()
-        course_name = catalog_result.data[0]["course_name"] if catalog_result.data else course_number
+        course_name = get_catalog(client).name_for(course_number) or course_number
         
-        # Create new blocks with new duration
+        # Replace the old blocks with blocks of the new duration; the delete is conditional on
+        # the versions read above, so a concurrent edit answers 409 instead of being overwritten
+        new_blocks = []
         for i in range(new_duration):
             new_time = time_slots[start_idx + i] if (start_idx + i) < len(time_slots) else None
             if new_time:
                 new_end = time_slots[start_idx + i + 1] if (start_idx + i + 1) < len(time_slots) else "23:00"
-                client.table("weekly_plan_blocks").insert({
+                new_blocks.append({
                     "plan_id": plan_id,
                     "user_id": user_id,
                     "course_number": course_number,
@@ -7141,7 +6976,12 @@ async def resize_schedule_block(
                     "day_of_week": day_of_week,
                     "start_time": new_time,
                     "end_time": new_end
-                }).execute()
+                })
+        try:
+            replace_blocks(client, old_blocks, new_blocks)
+        except BlockVersionConflict as conflict:
+            logging.warning(f"⚠️ Resize of {course_number} day {day_of_week} {start_time} aborted: {conflict}")
+            return _block_conflict_response(conflict)
         
         preferences_updated = False
         
@@ -7223,6 +7063,7 @@ async def resize_schedule_block(
                 # The summary is saved to study_preferences_summary and used when generating schedules
                 try:
                     logging.info(f"🔄 [RESIZE BLOCK] Calling LLM for classification - course: {course_number}, explanation: {explanation[:100] if explanation else 'none'}")
+                    summary_hash = _preferences_summary_hash(current_prefs, current_notes)
                     summary = await _summarize_user_preferences_with_llm(current_prefs, current_notes)
                     if summary:
                         update_type = summary.get("update_type", "general_preferences")
@@ -7292,9 +7133,7 @@ async def resize_schedule_block(
                         # This is what we use when generating schedules (not the raw notes)
                         # The summary contains the classification (update_type) and extracted preferences
                         try:
-                            update_result = client.table("user_profiles").update({
-                                "study_preferences_summary": summary
-                            }).eq("id", user_id).execute()
+                            update_result = _save_preferences_summary(client, user_id, summary, summary_hash)
                             
                             if update_result.data:
                                 logging.info(f"💾 [RESIZE BLOCK] ✅ Successfully saved study_preferences_summary to database")
@@ -7342,50 +7181,39 @@ async def resize_schedule_block(
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
-def _group_change_conflicts_for_member(client, member_id: str, week_start: str, check_day: int, check_start: str, check_duration: float, group_course_number) -> list:
+def _group_change_conflicts_for_members(client, member_ids: list, week_start: str, check_day: int, check_start: str, check_duration: float, group_course_number) -> Dict[str, list]:
     """
-    Check if the proposed slot (check_day, check_start, check_duration) has conflicts for one member.
-    Returns list of conflict reason strings (empty if valid). Used at create and approve.
+    Check if the proposed slot (check_day, check_start, check_duration) has conflicts for each member.
+    All members' constraints and blocks come from one batched availability read, so the number of
+    round trips does not depend on the group size.
+    Returns member_id -> list of conflict reason strings (empty if valid). Used at create and approve.
     Skips blocks that belong to the same group (work_type=group, course_number=group_course_number).
     """
-    reasons = []
-    # Hard constraints (weekly + permanent)
-    for table_name, week_filter in [("weekly_constraints", {"week_start": week_start}), ("constraints", {})]:
-        q = client.table(table_name).select("*").eq("user_id", member_id)
-        for k, v in week_filter.items():
-            q = q.eq(k, v)
-        constraints = q.execute()
-        for c in (constraints.data or []):
-            if not c.get("is_hard", True):
+    member_ids = [mid for mid in dict.fromkeys(member_ids or []) if mid]
+    conflicts = {mid: [] for mid in member_ids}
+    if check_day is None or not member_ids:
+        return conflicts
+
+    p_start = _time_to_minutes(check_start) if check_start else 0
+    p_end = p_start + int((check_duration or 1) * 60)
+    snapshots = get_users_availability(client, member_ids, week_start)
+    for mid in member_ids:
+        snapshot = snapshots.get(mid) or {"intervals": []}
+        # Hard constraints (weekly + permanent) and existing blocks
+        for item in overlapping_intervals(
+            snapshot, check_day, _minutes_to_time(p_start), _minutes_to_time(p_end),
+            kinds=("weekly_constraint", "constraint", "block"),
+        ):
+            item_range = f"{_minutes_to_time(item['start'])}-{_minutes_to_time(item['end'])}"
+            if item["kind"] != "block":
+                if item.get("hard", True):
+                    conflicts[mid].append(f"אילוץ קשיח: {item.get('label') or 'אילוץ'} ({item_range})")
                 continue
-            days = c.get("days", [])
-            if isinstance(days, str):
-                try:
-                    days = json.loads(days) if isinstance(days, str) else []
-                except Exception:
-                    days = []
-            if check_day not in days:
+            # Skip same group's blocks – we're changing that meeting
+            if item.get("work_type") == "group" and str(item.get("course_number")) == str(group_course_number):
                 continue
-            c_start = _time_to_minutes(c.get("start_time", "00:00"))
-            c_end = _time_to_minutes(c.get("end_time", "00:00"))
-            p_start = _time_to_minutes(check_start) if check_start else 0
-            p_end = p_start + int((check_duration or 1) * 60)
-            if p_start < c_end and p_end > c_start:
-                reasons.append(f"אילוץ קשיח: {c.get('title', 'אילוץ')} ({c.get('start_time')}-{c.get('end_time')})")
-    # Existing blocks (skip same group's blocks – we're changing that meeting)
-    plan = client.table("weekly_plans").select("id").eq("user_id", member_id).eq("week_start", week_start).limit(1).execute()
-    if plan.data:
-        blocks = client.table("weekly_plan_blocks").select("*").eq("plan_id", plan.data[0]["id"]).eq("day_of_week", check_day).execute()
-        for b in (blocks.data or []):
-            if b.get("work_type") == "group" and str(b.get("course_number")) == str(group_course_number):
-                continue
-            b_start = _time_to_minutes(b.get("start_time", "00:00"))
-            b_end = _time_to_minutes(b.get("end_time")) if b.get("end_time") else b_start + 60
-            p_start = _time_to_minutes(check_start) if check_start else 0
-            p_end = p_start + int((check_duration or 1) * 60)
-            if p_start < b_end and p_end > b_start:
-                reasons.append(f"לוז קיים: {b.get('course_name', 'קורס')} ({b.get('start_time')}-{b.get('end_time', b.get('start_time'))})")
-    return reasons
+            conflicts[mid].append(f"לוז קיים: {item.get('label') or 'קורס'} ({item_range})")
+    return conflicts
 
 
 @app.post("/api/schedule/group-change-request/create")
@@ -7468,13 +7296,10 @@ async def create_group_change_request(
             members_res = client.table("group_members").select("user_id").eq("group_id", group_id).eq("status", "approved").execute()
             all_member_ids = [m["user_id"] for m in (members_res.data or [])]
             check_duration = proposed_duration if proposed_duration is not None else (original_duration if original_duration is not None else 1)
-            all_conflicts = []
-            for mid in all_member_ids:
-                reasons = _group_change_conflicts_for_member(
-                    client, mid, week_start, proposed_day, proposed_start, check_duration, group_course_number
-                )
-                if reasons:
-                    all_conflicts.extend(reasons)
+            member_conflicts = _group_change_conflicts_for_members(
+                client, all_member_ids, week_start, proposed_day, proposed_start, check_duration, group_course_number
+            )
+            all_conflicts = [reason for mid in all_member_ids for reason in member_conflicts.get(mid, [])]
             if all_conflicts:
                 unique_conflicts = list(dict.fromkeys(all_conflicts))
                 raise HTTPException(
@@ -7552,6 +7377,7 @@ async def create_group_change_request(
                         if to_sync:
                             try:
                                 client.table("group_plan_blocks").insert(to_sync).execute()
+                                _invalidate_group_schedules(client, group_id, week_start)
                                 logging.info(f"Synced {len(to_sync)} group block(s) from weekly_plan_blocks to group_plan_blocks: day={original_day_int}")
                             except Exception as ins_err:
                                 logging.warning(f"Could not sync blocks to group_plan_blocks: {ins_err}")
@@ -7681,19 +7507,18 @@ async def create_group_change_request(
             title = f"Meeting change request: {group_name}"
             message = f"{requester_name} requested to change meeting from {original_time_str} to {proposed_time_str}. Approval from all members required."
         
-        # Send notifications to all members
-        for member_id in member_ids:
-            try:
-                client.table("notifications").insert({
-                    "user_id": member_id,
-                    "type": "group_change_request",
-                    "title": title,
-                    "message": message,
-                    "link": f"/schedule?change_request={request_id}",
-                    "read": False
-                }).execute()
-            except Exception as notif_err:
-                logging.error(f"Failed to notify member {member_id}: {notif_err}")
+        # Notify all members (one bulk write)
+        try:
+            send_notifications(client, [
+                notification_row(
+                    member_id, "group_change_request", title, message,
+                    link=f"/schedule?change_request={request_id}",
+                    dedup_key=f"group_change_request:{request_id}",
+                )
+                for member_id in member_ids
+            ])
+        except Exception as notif_err:
+            logging.error(f"Failed to notify members: {notif_err}")
         
         logging.info(f"✅ Created group change request {request_id} for group {group_id}")
         
@@ -7712,11 +7537,300 @@ async def create_group_change_request(
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
+# Set to False after the first call if apply_group_change (GROUP_CHANGE_APPLY_RPC.sql) is not installed
+_group_change_rpc_available = True
+
+
+def _group_change_hour_slots(start, duration, end=None) -> list:
+    """
+    [(start, end)] hourly slots of a group change starting at `start`. On the planner grid the last
+    slot ends at 21:00 and later slots are dropped; off the grid slots are computed by minutes.
+    `end` clips the final slot.
+    """
+    time_slots = _build_time_slots()
+    duration = int(duration or 0)
+    slots = []
+    if start in time_slots:
+        start_idx = time_slots.index(start)
+        for i in range(duration):
+            if start_idx + i >= len(time_slots):
+                break
+            s = time_slots[start_idx + i]
+            e = time_slots[start_idx + i + 1] if (start_idx + i + 1) < len(time_slots) else "21:00"
+            if end and _time_to_minutes(e) > _time_to_minutes(end):
+                e = _norm_hhmm(end)
+            slots.append((s, e))
+    else:
+        start_minutes = _time_to_minutes(start)
+        for i in range(duration):
+            s = start_minutes + i * 60
+            e = s + 60
+            if end and i == duration - 1 and e > _time_to_minutes(end):
+                e = _time_to_minutes(end)
+            slots.append((_minutes_to_time(s), _minutes_to_time(e)))
+    return slots
+
+
+def _group_change_apply_plan(change_request: dict, member_ids: list, requester_id: str) -> Dict[str, Any]:
+    """
+    The writes of an approved change request, as data (same rules as the table-by-table path of
+    _apply_group_change_request):
+      resize    -> replace the group's blocks on that day with proposed_duration hours
+      new block -> add proposed_duration hours (a move request without an original slot)
+      move      -> clear the original and target windows, add original_duration hours at the target
+    Returns {"kind", "delete_windows", "blocks", "member_ids", "create_missing_plans"}; kind is None
+    when the request changes no blocks (it is only marked approved).
+    """
+    request_type = change_request.get("request_type", "move")
+    proposed_day = change_request.get("proposed_day_of_week")
+    proposed_start = change_request.get("proposed_start_time")
+    proposed_duration = change_request.get("proposed_duration_hours", 1)
+    original_day = change_request.get("original_day_of_week")
+    original_start = change_request.get("original_start_time")
+
+    plan = {
+        "kind": None,
+        "delete_windows": [],
+        "blocks": [],
+        "member_ids": list(dict.fromkeys(member_ids or [])),
+        "create_missing_plans": False,
+    }
+
+    def blocks_on(day, slots):
+        return [{"day_of_week": int(day), "start_time": s, "end_time": e} for s, e in slots]
+
+    if request_type == "resize" and proposed_duration:
+        actual_day = original_day if original_day is not None else proposed_day
+        actual_start = proposed_start if proposed_start and proposed_start != original_start else (original_start if original_start else proposed_start)
+        slots = _group_change_hour_slots(_norm_hhmm(actual_start) or "08:00", proposed_duration)
+        if not slots:
+            raise HTTPException(status_code=400, detail="לא ניתן ליצור בלוקים חדשים עבור resize (זמן התחלה/משך לא חוקיים).")
+        # The requester may be missing from group_members; their plan is updated too
+        if requester_id and requester_id not in plan["member_ids"]:
+            plan["member_ids"].append(requester_id)
+        plan.update({
+            "kind": "resize",
+            "delete_windows": [{"day": int(actual_day), "start_time": None, "end_time": None}],
+            "blocks": blocks_on(actual_day, slots),
+            "create_missing_plans": True,
+        })
+    elif request_type == "move" or (request_type != "resize" and original_day is not None):
+        if original_day is None:
+            if proposed_day is not None and proposed_start:
+                plan["blocks"] = blocks_on(proposed_day, _group_change_hour_slots(proposed_start, proposed_duration))
+            plan.update({"kind": "new", "create_missing_plans": True})
+        else:
+            # Move never changes duration
+            duration = int(change_request.get("original_duration_hours") or 1)
+            if original_start:
+                original_end = _minutes_to_time(_time_to_minutes(original_start) + duration * 60)
+                plan["delete_windows"].append({"day": int(original_day), "start_time": _norm_hhmm(original_start), "end_time": original_end})
+            if proposed_day is not None and proposed_start:
+                proposed_end = _minutes_to_time(_time_to_minutes(proposed_start) + duration * 60)
+                plan["delete_windows"].append({"day": int(proposed_day), "start_time": _norm_hhmm(proposed_start), "end_time": proposed_end})
+                plan["blocks"] = blocks_on(proposed_day, _group_change_hour_slots(proposed_start, duration, proposed_end))
+            # Members without a plan for the week are skipped (as the table-by-table move does)
+            plan["kind"] = "move"
+    return plan
+
+
+def _apply_group_change_atomically(
+    client,
+    request_id: str,
+    group_id: str,
+    week_start: str,
+    course_number,
+    course_name,
+    requester_id: str,
+    plan: Dict[str, Any],
+) -> Optional[Dict[str, Any]]:
+    """
+    Apply `plan` (see _group_change_apply_plan) with the apply_group_change RPC: group blocks, member
+    plans and blocks, request status and notifications in one transaction and one round trip.
+    Returns the RPC result ({"status": "applied" | "already_approved", counts...}), or None when the
+    function is not installed. Other errors propagate; the transaction was rolled back, so nothing
+    was applied and the caller can retry.
+    """
+    global _group_change_rpc_available
+    if not _group_change_rpc_available:
+        return None
+    try:
+        rpc_result = client.rpc("apply_group_change", {
+            "p_request_id": request_id,
+            "p_group_id": group_id,
+            "p_week_start": week_start,
+            "p_course_number": course_number,
+            "p_course_name": course_name,
+            "p_created_by": requester_id,
+            "p_member_ids": plan["member_ids"],
+            "p_delete_windows": plan["delete_windows"],
+            "p_blocks": plan["blocks"],
+            "p_create_missing_plans": plan["create_missing_plans"],
+            "p_plan_source": "group_update",
+        }).execute()
+    except Exception as rpc_err:
+        err_text = str(rpc_err)
+        if "PGRST202" in err_text or "42883" in err_text or "Could not find the function" in err_text:
+            _group_change_rpc_available = False
+            logging.info("ℹ️ [GROUP CHANGE] apply_group_change RPC not installed - applying table by table")
+            return None
+        raise
+    data = rpc_result.data
+    if isinstance(data, list):
+        data = data[0] if data else {}
+    return data or {}
+
+
+def _update_group_hours_after_resize(
+    client,
+    group_id: str,
+    course_number,
+    member_ids: list,
+    all_member_ids: list,
+    original_day,
+    original_duration,
+    proposed_duration,
+    hours_explanation: str = "",
+) -> None:
+    """Weighted update of group_preferences (with history) and every member's group hours after an approved resize"""
+    try:
+        gp = client.table("group_preferences").select("*").eq("group_id", group_id).limit(1).execute()
+        is_new_block = (original_duration == 0 and original_day is None)
+        
+        if gp.data:
+            current_history = gp.data[0].get("hours_change_history", []) or []
+            if not isinstance(current_history, list):
+                current_history = []
+            
+            history_entry = {
+                "date": datetime.now().isoformat(),
+                "old_hours": original_duration,
+                "new_hours": proposed_duration,
+                "approved_by": member_ids
+            }
+            if hours_explanation:
+                history_entry["reason"] = hours_explanation
+            current_history.append(history_entry)
+            
+            current_hours = gp.data[0].get("preferred_hours_per_week", 4)
+            
+            if is_new_block and current_hours == 0:
+                weighted_hours = proposed_duration
+            else:
+                weighted_hours = int(0.8 * current_hours + 0.2 * proposed_duration)
+            
+            client.table("group_preferences").update({
+                "preferred_hours_per_week": weighted_hours,
+                "hours_change_history": current_history,
+                "updated_at": datetime.now().isoformat()
+            }).eq("group_id", group_id).execute()
+        else:
+            history_entry = {
+                "date": datetime.now().isoformat(),
+                "old_hours": original_duration,
+                "new_hours": proposed_duration,
+                "approved_by": member_ids
+            }
+            if hours_explanation:
+                history_entry["reason"] = hours_explanation
+            
+            client.table("group_preferences").insert({
+                "group_id": group_id,
+                "preferred_hours_per_week": proposed_duration,
+                "hours_change_history": [history_entry]
+            }).execute()
+            weighted_hours = proposed_duration
+        
+        # Update course_time_preferences for all members (including requester)
+        if course_number:
+            for member_id in all_member_ids:
+                try:
+                    member_pref_result = client.table("course_time_preferences").select("personal_hours_per_week, group_hours_per_week").eq("user_id", member_id).eq("course_number", course_number).limit(1).execute()
+                    
+                    if member_pref_result.data:
+                        current_group_hours = float(member_pref_result.data[0].get("group_hours_per_week", 0))
+                        
+                        if is_new_block and current_group_hours == 0:
+                            new_group_hours = float(weighted_hours)
+                        else:
+                            new_group_hours = round(0.8 * current_group_hours + 0.2 * float(weighted_hours), 2)
+                        
+                        client.table("course_time_preferences").update({
+                            "group_hours_per_week": new_group_hours
+                        }).eq("user_id", member_id).eq("course_number", course_number).execute()
+                    else:
+                        course_result = client.table("courses").select("credit_points").eq("user_id", member_id).eq("course_number", course_number).limit(1).execute()
+                        credit_points = course_result.data[0].get("credit_points") if course_result.data else 3
+                        total_hours = credit_points * 3
+                        default_personal_hours = max(1, int(total_hours * 0.5))
+                        
+                        client.table("course_time_preferences").insert({
+                            "user_id": member_id,
+                            "course_number": course_number,
+                            "personal_hours_per_week": default_personal_hours,
+                            "group_hours_per_week": weighted_hours
+                        }).execute()
+                except Exception as member_err:
+                    logging.warning(f"⚠️ Failed to update course_time_preferences for member {member_id}: {member_err}")
+    except Exception as gp_err:
+        logging.error(f"Failed to update group preferences: {gp_err}")
+
+
+def _update_group_hours_after_new_block(client, group_id: str, course_number, member_ids: list, original_day, original_duration, proposed_duration) -> None:
+    """group_preferences and members' course_time_preferences after an approved new group block"""
+    is_new_block = (original_duration == 0 and original_day is None)
+    try:
+        gp = client.table("group_preferences").select("*").eq("group_id", group_id).limit(1).execute()
+        current_hours = gp.data[0].get("preferred_hours_per_week", 0) if gp.data else 0
+        
+        if is_new_block and current_hours == 0:
+            weighted_hours = proposed_duration
+        else:
+            weighted_hours = int(0.8 * current_hours + 0.2 * proposed_duration)
+        
+        if gp.data:
+            client.table("group_preferences").update({
+                "preferred_hours_per_week": weighted_hours
+            }).eq("group_id", group_id).execute()
+        else:
+            client.table("group_preferences").insert({
+                "group_id": group_id,
+                "preferred_hours_per_week": weighted_hours
+            }).execute()
+        
+        # Update course_time_preferences for all members
+        if course_number:
+            for member_id in member_ids:
+                member_pref = client.table("course_time_preferences").select("group_hours_per_week").eq("user_id", member_id).eq("course_number", course_number).limit(1).execute()
+                current_group_hours = float(member_pref.data[0].get("group_hours_per_week", 0)) if member_pref.data else 0.0
+                
+                if is_new_block and current_group_hours == 0:
+                    new_group_hours = float(weighted_hours)
+                else:
+                    new_group_hours = round(0.8 * current_group_hours + 0.2 * float(weighted_hours), 2)
+                
+                if member_pref.data:
+                    client.table("course_time_preferences").update({
+                        "group_hours_per_week": new_group_hours
+                    }).eq("user_id", member_id).eq("course_number", course_number).execute()
+                else:
+                    client.table("course_time_preferences").insert({
+                        "user_id": member_id,
+                        "course_number": course_number,
+                        "personal_hours_per_week": 0,
+                        "group_hours_per_week": new_group_hours
+                    }).execute()
+    except Exception as pref_err:
+        logging.warning(f"⚠️ Failed to update preferences: {pref_err}")
+
+
 async def _apply_group_change_request(request_id: str, client, change_request: dict, group_id: str, member_ids: list, requester_id: str):
     """
     Internal function to apply a group change request after all members approve.
     This is extracted from approve_group_change_request to be reusable.
     Idempotent: if request is already approved, returns without doing anything (safe for retries).
+    With apply_group_change installed the change is applied atomically in one round trip, so a
+    failed attempt leaves nothing half-applied.
     """
     from app.agents.executors.block_creator import _time_to_minutes, _minutes_to_time
     from datetime import datetime, timedelta
@@ -7733,19 +7847,13 @@ async def _apply_group_change_request(request_id: str, client, change_request: d
         # Continue with apply; non-fatal
 
     # #region agent log
-    try:
-        with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-            f.write(json.dumps({"runId":"run1","hypothesisId":"A","location":"app/main.py:_apply_group_change_request","message":"Function entry","data":{"request_id":request_id,"group_id":group_id,"member_ids":member_ids,"requester_id":requester_id,"change_request_keys":list(change_request.keys())},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-    except: pass
+    debug_log("A", "app/main.py:_apply_group_change_request", "Function entry", lambda: {"request_id":request_id,"group_id":group_id,"member_ids":member_ids,"requester_id":requester_id,"change_request_keys":list(change_request.keys())})
     # #endregion
     
     week_start = change_request.get("week_start")
     
     # #region agent log
-    try:
-        with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-            f.write(json.dumps({"runId":"run1","hypothesisId":"A","location":"app/main.py:_apply_group_change_request","message":"week_start from change_request","data":{"week_start":week_start,"date":change_request.get("date")},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-    except: pass
+    debug_log("A", "app/main.py:_apply_group_change_request", "week_start from change_request", lambda: {"week_start":week_start,"date":change_request.get("date")})
     # #endregion
     
     # If week_start is not provided, try to calculate it from date or original_day/proposed_day
@@ -7791,10 +7899,7 @@ async def _apply_group_change_request(request_id: str, client, change_request: d
     hours_explanation = change_request.get("hours_explanation", "")
     
     # #region agent log
-    try:
-        with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-            f.write(json.dumps({"runId":"run1","hypothesisId":"B","location":"app/main.py:_apply_group_change_request","message":"Duration values BEFORE calculation","data":{"original_duration":original_duration,"proposed_duration":proposed_duration,"request_type":request_type},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-    except: pass
+    debug_log("B", "app/main.py:_apply_group_change_request", "Duration values BEFORE calculation", {"original_duration":original_duration,"proposed_duration":proposed_duration,"request_type":request_type})
     # #endregion
     
     # Get course info
@@ -7828,17 +7933,18 @@ async def _apply_group_change_request(request_id: str, client, change_request: d
             if proposed_end_hhmm:
                 exclusion_ranges.append((int(proposed_day), proposed_start_hhmm, proposed_end_hhmm))
 
+        conflicts_by_member = _get_group_change_conflicts_for_users(
+            client,
+            member_ids or [],
+            week_start,
+            day_of_week=int(target_day),
+            start_time=target_start,
+            end_time=target_end,
+            course_number=course_number,
+            exclusion_ranges=exclusion_ranges,
+        )
         for mid in (member_ids or []):
-            member_conflicts = _get_group_change_conflicts_for_user(
-                client,
-                mid,
-                week_start,
-                day_of_week=int(target_day),
-                start_time=target_start,
-                end_time=target_end,
-                course_number=course_number,
-                exclusion_ranges=exclusion_ranges,
-            )
+            member_conflicts = conflicts_by_member.get(mid)
             if member_conflicts:
                 # Reject globally (for everyone) and stop.
                 client.table("group_meeting_change_requests").update({
@@ -7862,7 +7968,29 @@ async def _apply_group_change_request(request_id: str, client, change_request: d
         }).eq("id", request_id).execute()
         logging.warning(f"❌ Rejecting request {request_id}: validation error {validate_err}")
         raise HTTPException(status_code=400, detail=f"Group change request rejected: could not validate conflicts ({validate_err})")
-    
+
+    # All block, plan, status and notification writes in one transaction (GROUP_CHANGE_APPLY_RPC.sql).
+    # The table-by-table path below only runs when the function is not installed.
+    apply_plan = _group_change_apply_plan(change_request, member_ids, requester_id)
+    applied = _apply_group_change_atomically(
+        client, request_id, group_id, week_start, course_number, course_name, requester_id, apply_plan
+    )
+    if applied is not None:
+        if applied.get("status") == "already_approved":
+            logging.info(f"Request {request_id} already approved, skipping apply")
+            return
+        logging.info(f"✅ Applied change request {request_id} ({apply_plan['kind'] or request_type}) in one transaction: {applied}")
+        invalidate_schedules(member_ids, week_start)
+        # Preferences are derived data and were best-effort before; they stay outside the transaction
+        if apply_plan["kind"] == "resize":
+            _update_group_hours_after_resize(
+                client, group_id, course_number, member_ids, apply_plan["member_ids"],
+                original_day, original_duration, proposed_duration, hours_explanation,
+            )
+        elif apply_plan["kind"] == "new":
+            _update_group_hours_after_new_block(client, group_id, course_number, member_ids, original_day, original_duration, proposed_duration)
+        return
+
     if request_type == "resize" and proposed_duration:
         # Handle resize: update duration of group blocks
         # Allow changing start time if proposed_start is different from original_start
@@ -7925,10 +8053,7 @@ async def _apply_group_change_request(request_id: str, client, change_request: d
             logging.info(f"➕ Added requester {requester_id} to member list for block updates")
         
         # #region agent log
-        try:
-            with open(r'c:\DS\AcademicPlanner\ds_project\.cursor\debug.log', 'a', encoding='utf-8') as f:
-                f.write(json.dumps({"runId":"run1","hypothesisId":"G","location":"app/main.py:_apply_group_change_request","message":"Member IDs for block updates","data":{"member_ids":member_ids,"all_member_ids":all_member_ids,"requester_id":requester_id},"timestamp":int(__import__('time').time()*1000)}) + '\n')
-        except: pass
+        debug_log("G", "app/main.py:_apply_group_change_request", "Member IDs for block updates", {"member_ids":member_ids,"all_member_ids":all_member_ids,"requester_id":requester_id})
         # #endregion
         
         logging.info(f"👥 Syncing weekly_plan_blocks from canonical group_plan_blocks for {len(all_member_ids)} members")
@@ -7982,88 +8107,10 @@ async def _apply_group_change_request(request_id: str, client, change_request: d
         }).eq("id", request_id).execute()
         logging.info(f"✅ Marked change request {request_id} as approved")
         
-        # Update group preferences
-        try:
-            gp = client.table("group_preferences").select("*").eq("group_id", group_id).limit(1).execute()
-            is_new_block = (original_duration == 0 and original_day is None)
-            
-            if gp.data:
-                current_history = gp.data[0].get("hours_change_history", []) or []
-                if not isinstance(current_history, list):
-                    current_history = []
-                
-                history_entry = {
-                    "date": datetime.now().isoformat(),
-                    "old_hours": original_duration,
-                    "new_hours": proposed_duration,
-                    "approved_by": member_ids
-                }
-                if hours_explanation:
-                    history_entry["reason"] = hours_explanation
-                current_history.append(history_entry)
-                
-                current_hours = gp.data[0].get("preferred_hours_per_week", 4)
-                
-                if is_new_block and current_hours == 0:
-                    weighted_hours = proposed_duration
-                else:
-                    weighted_hours = int(0.8 * current_hours + 0.2 * proposed_duration)
-                
-                client.table("group_preferences").update({
-                    "preferred_hours_per_week": weighted_hours,
-                    "hours_change_history": current_history,
-                    "updated_at": datetime.now().isoformat()
-                }).eq("group_id", group_id).execute()
-            else:
-                history_entry = {
-                    "date": datetime.now().isoformat(),
-                    "old_hours": original_duration,
-                    "new_hours": proposed_duration,
-                    "approved_by": member_ids
-                }
-                if hours_explanation:
-                    history_entry["reason"] = hours_explanation
-                
-                client.table("group_preferences").insert({
-                    "group_id": group_id,
-                    "preferred_hours_per_week": proposed_duration,
-                    "hours_change_history": [history_entry]
-                }).execute()
-                weighted_hours = proposed_duration
-            
-            # Update course_time_preferences for all members (including requester)
-            if course_number:
-                for member_id in all_member_ids:
-                    try:
-                        member_pref_result = client.table("course_time_preferences").select("personal_hours_per_week, group_hours_per_week").eq("user_id", member_id).eq("course_number", course_number).limit(1).execute()
-                        
-                        if member_pref_result.data:
-                            current_group_hours = float(member_pref_result.data[0].get("group_hours_per_week", 0))
-                            
-                            if is_new_block and current_group_hours == 0:
-                                new_group_hours = float(weighted_hours)
-                            else:
-                                new_group_hours = round(0.8 * current_group_hours + 0.2 * float(weighted_hours), 2)
-                            
-                            client.table("course_time_preferences").update({
-                                "group_hours_per_week": new_group_hours
-                            }).eq("user_id", member_id).eq("course_number", course_number).execute()
-                        else:
-                            course_result = client.table("courses").select("credit_points").eq("user_id", member_id).eq("course_number", course_number).limit(1).execute()
-                            credit_points = course_result.data[0].get("credit_points") if course_result.data else 3
-                            total_hours = credit_points * 3
-                            default_personal_hours = max(1, int(total_hours * 0.5))
-                            
-                            client.table("course_time_preferences").insert({
-                                "user_id": member_id,
-                                "course_number": course_number,
-                                "personal_hours_per_week": default_personal_hours,
-                                "group_hours_per_week": weighted_hours
-                            }).execute()
-                    except Exception as member_err:
-                        logging.warning(f"⚠️ Failed to update course_time_preferences for member {member_id}: {member_err}")
-        except Exception as gp_err:
-            logging.error(f"Failed to update group preferences: {gp_err}")
+        _update_group_hours_after_resize(
+            client, group_id, course_number, member_ids, all_member_ids,
+            original_day, original_duration, proposed_duration, hours_explanation,
+        )
     elif request_type == "move" or (request_type != "resize" and original_day is not None):
         # Handle move or new block
         if original_day is None:
@@ -8125,87 +8172,13 @@ async def _apply_group_change_request(request_id: str, client, change_request: d
                 logging.info(f"✅ Created {len(new_group_blocks)} new group_plan_blocks")
                 
                 # Create weekly_plan_blocks for all members
-                for member_id in member_ids:
-                    # Get or create plan for this member
-                    member_plan = client.table("weekly_plans").select("id").eq("user_id", member_id).eq("week_start", week_start).limit(1).execute()
-                    if not member_plan.data:
-                        # Create new plan if it doesn't exist
-                        plan_result = client.table("weekly_plans").insert({
-                            "user_id": member_id,
-                            "week_start": week_start,
-                            "source": "group_update"
-                        }).execute()
-                        if plan_result.data:
-                            plan_id = plan_result.data[0]["id"]
-                        else:
-                            logging.warning(f"⚠️ Failed to create weekly_plan for member {member_id}, skipping blocks")
-                            continue
-                    else:
-                        plan_id = member_plan.data[0]["id"]
-                    
-                    # Create weekly_plan_blocks for this member
-                    new_member_blocks = []
-                    for block in new_group_blocks:
-                        new_member_blocks.append({
-                            "plan_id": plan_id,
-                            "user_id": member_id,
-                            "course_number": course_number,
-                            "course_name": course_name,
-                            "work_type": "group",
-                            "day_of_week": block["day_of_week"],
-                            "start_time": block["start_time"],
-                            "end_time": block["end_time"],
-                            "source": "group"
-                        })
-                    if new_member_blocks:
-                        client.table("weekly_plan_blocks").insert(new_member_blocks).execute()
-                        logging.info(f"✅ Created {len(new_member_blocks)} weekly_plan_blocks for member {member_id}")
+                fan_out = _fan_out_group_blocks_to_members(
+                    client, member_ids, week_start, new_group_blocks, course_number, course_name,
+                    plan_source="group_update", block_source="group"
+                )
+                logging.info(f"✅ Fan-out of new group blocks to {len(member_ids)} members: {fan_out}")
             
-            # Update preferences (same as in approve_group_change_request for move)
-            is_new_block = (original_duration == 0 and original_day is None)
-            try:
-                gp = client.table("group_preferences").select("*").eq("group_id", group_id).limit(1).execute()
-                current_hours = gp.data[0].get("preferred_hours_per_week", 0) if gp.data else 0
-                
-                if is_new_block and current_hours == 0:
-                    weighted_hours = proposed_duration
-                else:
-                    weighted_hours = int(0.8 * current_hours + 0.2 * proposed_duration)
-                
-                if gp.data:
-                    client.table("group_preferences").update({
-                        "preferred_hours_per_week": weighted_hours
-                    }).eq("group_id", group_id).execute()
-                else:
-                    client.table("group_preferences").insert({
-                        "group_id": group_id,
-                        "preferred_hours_per_week": weighted_hours
-                    }).execute()
-                
-                # Update course_time_preferences for all members
-                if course_number:
-                    for member_id in member_ids:
-                        member_pref = client.table("course_time_preferences").select("group_hours_per_week").eq("user_id", member_id).eq("course_number", course_number).limit(1).execute()
-                        current_group_hours = float(member_pref.data[0].get("group_hours_per_week", 0)) if member_pref.data else 0.0
-                        
-                        if is_new_block and current_group_hours == 0:
-                            new_group_hours = float(weighted_hours)
-                        else:
-                            new_group_hours = round(0.8 * current_group_hours + 0.2 * float(weighted_hours), 2)
-                        
-                        if member_pref.data:
-                            client.table("course_time_preferences").update({
-                                "group_hours_per_week": new_group_hours
-                            }).eq("user_id", member_id).eq("course_number", course_number).execute()
-                        else:
-                            client.table("course_time_preferences").insert({
-                                "user_id": member_id,
-                                "course_number": course_number,
-                                "personal_hours_per_week": 0,
-                                "group_hours_per_week": new_group_hours
-                            }).execute()
-            except Exception as pref_err:
-                logging.warning(f"⚠️ Failed to update preferences: {pref_err}")
+            _update_group_hours_after_new_block(client, group_id, course_number, member_ids, original_day, original_duration, proposed_duration)
         else:
             # This is a move - apply the move logic
             # The move logic is handled in approve_group_change_request, but we need to call it here too
@@ -8498,6 +8471,7 @@ async def _apply_group_change_request(request_id: str, client, change_request: d
             "resolved_at": datetime.now().isoformat()
         }).eq("id", request_id).execute()
         logging.info(f"✅ Marked change request {request_id} as approved")
+    invalidate_schedules(member_ids, week_start)
     
     # Delete notifications for all members
     for member_id in member_ids:
@@ -8570,11 +8544,10 @@ async def approve_group_change_request(
             all_members_approve = client.table("group_members").select("user_id").eq("group_id", group_id).eq("status", "approved").execute()
             member_ids_to_check = [m["user_id"] for m in (all_members_approve.data or [])]
             
-            conflict_reasons = []
-            for check_user_id in member_ids_to_check:
-                conflict_reasons.extend(_group_change_conflicts_for_member(
-                    client, check_user_id, week_start, check_day, check_start, check_duration, group_course_number
-                ))
+            member_conflicts = _group_change_conflicts_for_members(
+                client, member_ids_to_check, week_start, check_day, check_start, check_duration, group_course_number
+            )
+            conflict_reasons = [reason for mid in member_ids_to_check for reason in member_conflicts.get(mid, [])]
             
             # If any member has conflicts, reject this approval and mark request as rejected
             if conflict_reasons:
@@ -8626,14 +8599,14 @@ async def approve_group_change_request(
                         action_text = "move meeting"
                         time_text = f"to {day_names[check_day]} {check_start}"
                     
-                    client.table("notifications").insert({
-                        "user_id": requester_id,
-                        "type": "group_change_rejected",
-                        "title": f"Change request rejected: {group_name}",
-                        "message": f"The request to {action_text} {time_text} was rejected due to a schedule conflict with one of the members.",
-                        "link": f"/schedule?week={week_start}",
-                        "read": False
-                    }).execute()
+                    send_notifications(client, [notification_row(
+                        requester_id,
+                        "group_change_rejected",
+                        f"Change request rejected: {group_name}",
+                        f"The request to {action_text} {time_text} was rejected due to a schedule conflict with one of the members.",
+                        link=f"/schedule?week={week_start}",
+                        dedup_key=f"group_change_rejected:{request_id}",
+                    )])
                 
                 # Format conflict message for better readability
                 conflict_list = conflict_reasons if isinstance(conflict_reasons, list) else [conflict_msg]
@@ -9639,18 +9612,20 @@ async def reject_group_change_request(
         rejector_result = client.table("user_profiles").select("name").eq("id", user_id).limit(1).execute()
         rejector_name = rejector_result.data[0].get("name", "A member") if rejector_result.data else "A member"
         
-        for mid in member_ids:
-            try:
-                client.table("notifications").insert({
-                    "user_id": mid,
-                    "type": "group_change_rejected",
-                    "title": f"Meeting change rejected: {group_name}",
-                    "message": f"{rejector_name} rejected the request to change the meeting time.",
-                    "link": "/schedule",
-                    "read": False
-                }).execute()
-            except Exception as notif_err:
-                logging.error(f"Failed to notify member {mid}: {notif_err}")
+        try:
+            send_notifications(client, [
+                notification_row(
+                    mid,
+                    "group_change_rejected",
+                    f"Meeting change rejected: {group_name}",
+                    f"{rejector_name} rejected the request to change the meeting time.",
+                    link="/schedule",
+                    dedup_key=f"group_change_rejected:{request_id}",
+                )
+                for mid in member_ids
+            ])
+        except Exception as notif_err:
+            logging.error(f"Failed to notify members: {notif_err}")
         
         logging.info(f"❌ User {user_id} rejected change request {request_id}")
         
@@ -10256,15 +10231,15 @@ async def create_study_group(
                         else:
                             link = f"/my-courses?invitation={invitation_id}"
                         
-                        client.table("notifications").insert({
-                            "user_id": user_check.id,
-                            "type": "group_invitation",
-                            "title": f"Study group invitation: {group_data.group_name}",
-                            "message": f"{user_email} invited you to join a study group for course {group_data.course_name}",
-                            "link": link,
-                            "read": False
-                        }).execute()
-                        logging.info(f"✅ Created notification with invitation_id for {email}")
+                        send_notifications(client, [notification_row(
+                            user_check.id,
+                            "group_invitation",
+                            f"Study group invitation: {group_data.group_name}",
+                            f"{user_email} invited you to join a study group for course {group_data.course_name}",
+                            link=link,
+                            dedup_key=f"group_invitation:{invitation_id}",
+                        )])
+                        logging.info(f"✅ Queued notification with invitation_id for {email}")
                     except Exception as notif_error:
                         logging.warning(f"Failed to create notification for {email}: {notif_error}")
                 else:
@@ -12595,8 +12570,15 @@ async def get_course_catalog():
         if not client:
             raise HTTPException(status_code=500, detail="Supabase client not configured")
         
-        # Get all courses from catalog
-        result = client.table("course_catalog").select("*").order("course_number", desc=False).execute()
+        # Get all courses from catalog; concurrent page loads share one query
+        loop = asyncio.get_running_loop()
+        result, _shared = await get_single_flight("course_catalog").do(
+            "all",
+            lambda: loop.run_in_executor(
+                None,
+                lambda: client.table("course_catalog").select("*").order("course_number", desc=False).execute()
+            )
+        )
         
         courses = result.data if result.data else []
         logging.info(f"📚 [CATALOG] Found {len(courses)} courses in catalog")
@@ -12632,15 +12614,10 @@ async def get_assignments():
         logging.info(f"📝 [ASSIGNMENTS] Found {len(assignments)} assignments")
         
         # Get all course catalog entries for mapping (by course_number AND by id)
-        course_catalog_result = client.table("course_catalog").select("*").execute()
-        course_catalog_map_by_id = {}
-        course_catalog_map_by_number = {}
-        if course_catalog_result.data:
-            for course in course_catalog_result.data:
-                course_catalog_map_by_id[course["id"]] = course
-                course_number = course.get("course_number")
-                if course_number:
-                    course_catalog_map_by_number[str(course_number).strip()] = course
+        catalog = get_catalog(client)
+        course_catalog_map_by_id = catalog.by_id
+        course_catalog_map_by_number = catalog.by_number
+        if catalog.courses:
             logging.info(f"📝 [ASSIGNMENTS] Loaded {len(course_catalog_map_by_id)} courses from catalog")
             print(f"📝 [ASSIGNMENTS] Loaded {len(course_catalog_map_by_id)} courses from catalog, {len(course_catalog_map_by_number)} by course_number")
         
@@ -12780,9 +12757,9 @@ async def create_assignment(assignment_data: dict):
         
         if not course_catalog_id and course_number:
             # Find course by course_number
-            course_result = client.table("course_catalog").select("id").eq("course_number", course_number).limit(1).execute()
-            if course_result.data and len(course_result.data) > 0:
-                course_catalog_id = course_result.data[0]["id"]
+            catalog_course = get_catalog(client).get(course_number)
+            if catalog_course:
+                course_catalog_id = catalog_course["id"]
             else:
                 raise HTTPException(status_code=404, detail=f"Course with number {course_number} not found in catalog")
         
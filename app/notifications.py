@@ -0,0 +1,109 @@
+"""
+Notification service
+All notification writes go through here instead of one insert per member:
+
+- send_notifications(client, rows): bulk insert (chunks of NOTIFICATION_BATCH_SIZE rows).
+  Rows with a dedup_key are upserted on (user_id, dedup_key), so a retried or repeated send
+  (e.g. the weekly plan_ready) leaves one notification per user per key.
+  Member fan-outs on request paths (change requests, invitations) call it once, synchronously,
+  so a notification is never lost to a process exit and a retried request does not duplicate it.
+
+Without NOTIFICATION_DEDUP_KEY.sql the dedup_key column is dropped and rows are plain-inserted
+(callers that used to delete the previous notification keep doing so in that case).
+"""
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATIONS_TABLE = "notifications"
+
+NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", "500"))
+
+# Set to False after the first failure if NOTIFICATION_DEDUP_KEY.sql is not installed
+_dedup_key_available = True
+
+
+def dedup_keys_available() -> bool:
+    return _dedup_key_available
+
+
+def notification_row(
+    user_id: str,
+    type: str,
+    title: str,
+    message: str,
+    link: Optional[str] = None,
+    dedup_key: Optional[str] = None,
+) -> Dict[str, Any]:
+    row = {
+        "user_id": user_id,
+        "type": type,
+        "title": title,
+        "message": message,
+        "link": link,
+        "read": False,
+    }
+    if dedup_key:
+        row["dedup_key"] = dedup_key
+    return row
+
+
+def _unique_rows(rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Last row wins per (user_id, dedup_key); rows without a key are kept as is"""
+    out: List[Dict[str, Any]] = []
+    position: Dict[tuple, int] = {}
+    for row in rows:
+        key = (row.get("user_id"), row.get("dedup_key")) if row.get("dedup_key") else None
+        if key in position:
+            out[position[key]] = row
+            continue
+        if key:
+            position[key] = len(out)
+        out.append(row)
+    return out
+
+
+def send_notifications(client, rows: Iterable[Dict[str, Any]], replace: bool = False) -> int:
+    """
+    Write notification rows in bulk. Returns the number of rows sent.
+    replace=True: a row whose (user_id, dedup_key) already exists is overwritten and marked unread
+    (plan_ready after a re-plan); otherwise the existing notification is kept.
+    """
+    global _dedup_key_available
+    rows = _unique_rows(rows)
+    if not rows:
+        return 0
+    if replace:
+        now = datetime.now(timezone.utc).isoformat()
+        rows = [{**row, "read": False, "created_at": now} for row in rows]
+
+    keyed = [r for r in rows if r.get("dedup_key")]
+    plain = [r for r in rows if not r.get("dedup_key")]
+
+    if keyed and _dedup_key_available:
+        try:
+            for i in range(0, len(keyed), NOTIFICATION_BATCH_SIZE):
+                client.table(NOTIFICATIONS_TABLE).upsert(
+                    keyed[i:i + NOTIFICATION_BATCH_SIZE],
+                    on_conflict="user_id,dedup_key",
+                    ignore_duplicates=not replace,
+                ).execute()
+            keyed = []
+        except Exception as e:
+            err_text = str(e)
+            # Column or unique index missing (migration not installed)
+            if "dedup_key" in err_text or "42703" in err_text or "42P10" in err_text or "PGRST204" in err_text:
+                _dedup_key_available = False
+                logger.info("ℹ️ [NOTIFY] notifications.dedup_key not installed - using plain inserts")
+            else:
+                raise
+    if keyed:
+        plain.extend({k: v for k, v in row.items() if k != "dedup_key"} for row in keyed)
+
+    for i in range(0, len(plain), NOTIFICATION_BATCH_SIZE):
+        client.table(NOTIFICATIONS_TABLE).insert(plain[i:i + NOTIFICATION_BATCH_SIZE]).execute()
+    return len(rows)
+
@@ -0,0 +1,315 @@
+"""
+Per-user pending actions (see PENDING_ACTIONS_VIEW.sql)
+Everything a user can approve or reject - group invitations and the pending change requests of
+their groups - as one list with group/course/day/time denormalized. The request handler reads it
+once per approval and resolves "approve the change for Tuesday 10:00 in Algorithms" in memory,
+instead of probing pending_group_creations / group_invitations / group_members / study_groups /
+group_meeting_change_requests one filter variant at a time.
+
+Row format (times as HH:MM):
+    {"kind": "invitation" | "change_request", "id", "user_id", "status", "group_id", "inviter_id",
+     "group_name", "course_number", "course_name", "week_start", "request_type",
+     "original_day_of_week", "original_start_time", "original_end_time", "original_duration_hours",
+     "proposed_day_of_week", "proposed_start_time", "proposed_end_time", "proposed_duration_hours",
+     "created_at"}
+Rows are newest first. An invitation to a group that is not created yet appears once per
+pending_group_creations row of its inviter.
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PENDING_ACTIONS_VIEW = "user_pending_actions"
+
+# Set to False after the first failure if PENDING_ACTIONS_VIEW.sql is not installed
+_view_available = True
+
+TIME_OF_DAY_RANGES = {
+    "morning": ("08:00", "12:00"),
+    "afternoon": ("12:00", "17:00"),
+    "evening": ("17:00", "21:00"),
+    "night": ("20:00", "23:00"),
+}
+
+_TIME_FIELDS = (
+    "original_start_time", "original_end_time",
+    "proposed_start_time", "proposed_end_time",
+)
+
+_CHANGE_REQUEST_COLUMNS = (
+    "id, group_id, week_start, request_type, status, created_at, "
+    "original_day_of_week, original_start_time, original_end_time, original_duration_hours, "
+    "proposed_day_of_week, proposed_start_time, proposed_end_time, proposed_duration_hours"
+)
+
+
+def _hhmm(value: Optional[str]) -> Optional[str]:
+    return value[:5] if value and len(value) > 5 else value
+
+
+def _normalize(row: Dict[str, Any]) -> Dict[str, Any]:
+    for field in _TIME_FIELDS:
+        row[field] = _hhmm(row.get(field))
+    if row.get("week_start"):
+        row["week_start"] = str(row["week_start"])[:10]
+    return row
+
+
+def week_start_for_date(date: Optional[str]) -> Optional[str]:
+    """Sunday of the week of a YYYY-MM-DD / DD-MM-YYYY / DD/MM/YY date (None if unparsable)"""
+    if not date:
+        return None
+    date_normalized = date.replace("/", "-")
+    for fmt in ("%Y-%m-%d", "%d-%m-%Y", "%d-%m-%y"):
+        try:
+            date_obj = datetime.strptime(date_normalized, fmt)
+        except ValueError:
+            continue
+        days_since_sunday = (date_obj.weekday() + 1) % 7
+        return (date_obj - timedelta(days=days_since_sunday)).strftime("%Y-%m-%d")
+    return None
+
+
+def _build_pending_actions(client, user_id: str) -> List[Dict[str, Any]]:
+    """Same rows as the view, from the base tables (one query per table)"""
+    invitations = client.table("group_invitations").select(
+        "id, group_id, inviter_id, status, created_at"
+    ).eq("invitee_user_id", user_id).in_("status", ["pending", "accepted"]).order("created_at", desc=True).execute().data or []
+    # An accepted invitation is only actionable while its group is not created yet
+    invitations = [i for i in invitations if i.get("status") == "pending" or not i.get("group_id")]
+
+    memberships = client.table("group_members").select("group_id").eq("user_id", user_id).eq("status", "approved").execute().data or []
+    member_group_ids = sorted({m["group_id"] for m in memberships if m.get("group_id")})
+
+    group_ids = sorted(set(member_group_ids) | {i["group_id"] for i in invitations if i.get("group_id")})
+    groups: Dict[str, Dict[str, Any]] = {}
+    if group_ids:
+        for g in client.table("study_groups").select("id, group_name, course_id, course_name").in_("id", group_ids).execute().data or []:
+            groups[g["id"]] = g
+
+    pending_inviters = sorted({i["inviter_id"] for i in invitations if not i.get("group_id") and i.get("inviter_id")})
+    creations: Dict[str, List[Dict[str, Any]]] = {}
+    if pending_inviters:
+        for pgc in client.table("pending_group_creations").select("inviter_id, group_name, course_id, course_name").in_("inviter_id", pending_inviters).execute().data or []:
+            creations.setdefault(pgc["inviter_id"], []).append(pgc)
+
+    requests = []
+    if member_group_ids:
+        requests = client.table("group_meeting_change_requests").select(_CHANGE_REQUEST_COLUMNS).in_(
+            "group_id", member_group_ids
+        ).eq("status", "pending").order("created_at", desc=True).execute().data or []
+
+    rows: List[Dict[str, Any]] = []
+    for inv in invitations:
+        base = {
+            "kind": "invitation",
+            "id": inv["id"],
+            "user_id": user_id,
+            "status": inv.get("status"),
+            "group_id": inv.get("group_id"),
+            "inviter_id": inv.get("inviter_id"),
+            "created_at": inv.get("created_at"),
+        }
+        if inv.get("group_id"):
+            g = groups.get(inv["group_id"], {})
+            sources = [{"group_name": g.get("group_name"), "course_id": g.get("course_id"), "course_name": g.get("course_name")}]
+        else:
+            sources = creations.get(inv.get("inviter_id")) or [{}]
+        for src in sources:
+            rows.append({
+                **base,
+                "group_name": src.get("group_name"),
+                "course_number": src.get("course_id"),
+                "course_name": src.get("course_name"),
+            })
+    for req in requests:
+        g = groups.get(req["group_id"], {})
+        rows.append({
+            **req,
+            "kind": "change_request",
+            "user_id": user_id,
+            "inviter_id": None,
+            "group_name": g.get("group_name"),
+            "course_number": g.get("course_id"),
+            "course_name": g.get("course_name"),
+        })
+    rows.sort(key=lambda r: str(r.get("created_at") or ""), reverse=True)
+    return rows
+
+
+def get_pending_actions(client, user_id: str) -> List[Dict[str, Any]]:
+    """All invitations and change requests the user can act on (one view read)"""
+    global _view_available
+    rows = None
+    if _view_available:
+        try:
+            rows = client.table(PENDING_ACTIONS_VIEW).select("*").eq("user_id", user_id).order("created_at", desc=True).execute().data or []
+        except Exception as e:
+            # 42P01 / PGRST205: view missing (migration not installed)
+            if "42P01" in str(e) or "PGRST205" in str(e) or PENDING_ACTIONS_VIEW in str(e):
+                _view_available = False
+                logger.info("ℹ️ [PENDING] user_pending_actions view not installed - using base tables")
+            else:
+                raise
+    if rows is None:
+        rows = _build_pending_actions(client, user_id)
+    return [_normalize(dict(r)) for r in rows]
+
+
+def _contains(value: Optional[str], needle: str) -> bool:
+    return needle.strip().lower() in (value or "").lower()
+
+
+def _group_matches(
+    action: Dict[str, Any],
+    group_name: Optional[str],
+    course_number: Optional[str],
+    course_name: Optional[str],
+) -> bool:
+    if group_name and not _contains(action.get("group_name"), group_name):
+        return False
+    if course_number and str(action.get("course_number") or "") != str(course_number).strip():
+        return False
+    if course_name and not _contains(action.get("course_name"), course_name):
+        return False
+    return True
+
+
+def match_invitation(
+    actions: Iterable[Dict[str, Any]],
+    group_name: Optional[str] = None,
+    course_number: Optional[str] = None,
+    course_name: Optional[str] = None,
+) -> Optional[Dict[str, Any]]:
+    """Newest matching invitation; pending ones before accepted-but-group-not-created ones"""
+    candidates = [
+        a for a in actions
+        if a.get("kind") == "invitation" and _group_matches(a, group_name, course_number, course_name)
+    ]
+    candidates.sort(key=lambda a: a.get("status") != "pending")
+    return candidates[0] if candidates else None
+
+
+def change_requests_for(
+    actions: Iterable[Dict[str, Any]],
+    group_name: Optional[str] = None,
+    course_number: Optional[str] = None,
+    course_name: Optional[str] = None,
+    fall_back_to_all: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Pending change requests of the groups matching the filters. With fall_back_to_all, a search
+    whose group/course filters match none of the user's groups (misspelled course name, ...)
+    considers all the user's pending requests - callers pass it when day/time narrow the match.
+    """
+    requests = [a for a in actions if a.get("kind") == "change_request"]
+    scoped = [a for a in requests if _group_matches(a, group_name, course_number, course_name)]
+    if not scoped and fall_back_to_all:
+        return requests
+    return scoped
+
+
+def infer_slot_from_blocks(
+    blocks: List[Dict[str, Any]],
+    day_of_week: Optional[int],
+    start_time: Optional[str],
+    time_of_day: Optional[str],
+    original_duration: Optional[int],
+) -> Tuple[Optional[str], Optional[int]]:
+    """Fill start_time (from day + time_of_day) and original_duration (from day + start) using the group's blocks"""
+    if day_of_week is None or not blocks:
+        return start_time, original_duration
+    day_blocks = [b for b in blocks if b.get("day_of_week") == day_of_week]
+    if not start_time and time_of_day and time_of_day.lower() in TIME_OF_DAY_RANGES:
+        start_range, end_range = TIME_OF_DAY_RANGES[time_of_day.lower()]
+        in_range = [b for b in day_blocks if start_range <= (_hhmm(b.get("start_time")) or "") < end_range]
+        if in_range:
+            start_time = _hhmm(in_range[0].get("start_time"))
+    if start_time and original_duration is None:
+        for b in day_blocks:
+            if _hhmm(b.get("start_time")) == _hhmm(start_time) and b.get("end_time"):
+                try:
+                    start_dt = datetime.strptime(_hhmm(b["start_time"]), "%H:%M")
+                    end_dt = datetime.strptime(_hhmm(b["end_time"]), "%H:%M")
+                    original_duration = int((end_dt - start_dt).total_seconds() / 3600)
+                except ValueError:
+                    pass
+                break
+    return start_time, original_duration
+
+
+def rank_change_requests(
+    requests: Iterable[Dict[str, Any]],
+    week_start: Optional[str] = None,
+    day_of_week: Optional[int] = None,
+    start_time: Optional[str] = None,
+    time_of_day: Optional[str] = None,
+    original_duration: Optional[int] = None,
+    proposed_duration: Optional[int] = None,
+    request_type: Optional[str] = None,
+    group_blocks: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+) -> List[Tuple[int, Dict[str, Any]]]:
+    """
+    Requests passing every given filter (the day/time may be the original or the proposed one),
+    as (score, request), best first; ties keep the newest first.
+    """
+    start = _hhmm(start_time)
+    tod_range = TIME_OF_DAY_RANGES.get(time_of_day.lower()) if time_of_day else None
+    scored = []
+    for req in requests:
+        if week_start and req.get("week_start") != week_start:
+            continue
+        days = (req.get("proposed_day_of_week"), req.get("original_day_of_week"))
+        if day_of_week is not None and day_of_week not in days:
+            continue
+        starts = (req.get("proposed_start_time"), req.get("original_start_time"))
+        if start and start not in starts:
+            continue
+        req_start = req.get("proposed_start_time") or req.get("original_start_time")
+        if tod_range and not (req_start and tod_range[0] <= req_start < tod_range[1]):
+            continue
+        if original_duration is not None and req.get("original_duration_hours") != original_duration:
+            continue
+        if proposed_duration is not None and req.get("proposed_duration_hours") != proposed_duration:
+            continue
+        if request_type and req.get("request_type") != request_type:
+            continue
+
+        score = 0
+        req_day = req.get("proposed_day_of_week")
+        if req_day is None:
+            req_day = req.get("original_day_of_week")
+        if day_of_week is not None and req_day == day_of_week:
+            score += 10
+        if start and req_start == start:
+            score += 10
+        if original_duration is not None:
+            score += 5
+        if proposed_duration is not None:
+            score += 5
+        if request_type:
+            score += 3
+        # The request refers to a block the group actually has this week
+        for block in (group_blocks or {}).get(req.get("group_id"), []):
+            if block.get("day_of_week") == req.get("original_day_of_week") and _hhmm(block.get("start_time")) == req.get("original_start_time"):
+                score += 8
+                break
+        scored.append((score, req))
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return scored
+
+
+def load_group_blocks(client, group_ids: Iterable[str], week_start: str) -> Dict[str, List[Dict[str, Any]]]:
+    """group_plan_blocks of several groups for one week, by group (one query)"""
+    ids = sorted({g for g in group_ids if g})
+    if not ids or not week_start:
+        return {}
+    rows = client.table("group_plan_blocks").select("group_id, day_of_week, start_time, end_time").in_(
+        "group_id", ids
+    ).eq("week_start", week_start).order("day_of_week").order("start_time").execute().data or []
+    by_group: Dict[str, List[Dict[str, Any]]] = {}
+    for row in rows:
+        by_group.setdefault(row["group_id"], []).append(row)
+    return by_group
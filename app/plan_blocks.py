@@ -0,0 +1,215 @@
+"""
+Weekly plan block mutations with optimistic concurrency (see WEEKLY_PLAN_BLOCKS_VERSION.sql)
+Every weekly_plan_blocks row carries a `version` that a trigger bumps on each update. Edits
+(update / move / resize, from the API and from the agent executors) go through this module:
+
+- update_block(): one conditional UPDATE ... WHERE id = ? AND version = ?
+- move_blocks(): conditional updates of several blocks, ordered so that no block lands on a slot
+  another one still holds (unique slot key); if one of them changed meanwhile (or a write
+  fails), the blocks already moved are put back and the move fails as a whole
+- replace_blocks(): conditional delete of the old blocks + insert of the new ones (resize); the
+  old blocks are put back if the insert fails
+
+A block that was changed or deleted since it was read raises BlockVersionConflict (the API
+answers 409 with the current block), instead of the caller re-reading and verifying.
+block_etag() / parse_if_match() map versions to ETag / If-Match headers.
+Every successful write drops the owners' cached schedules (app/schedule_view.py).
+
+Without the migration the version filter is skipped (last write wins, as before); a block
+that disappeared before the write still raises BlockVersionConflict.
+"""
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.schedule_view import invalidate_schedules
+
+logger = logging.getLogger(__name__)
+
+BLOCKS_TABLE = "weekly_plan_blocks"
+
+# None until the first check; False if WEEKLY_PLAN_BLOCKS_VERSION.sql is not installed
+_block_version_available: Optional[bool] = None
+
+
+class BlockVersionConflict(Exception):
+    """The block was changed (current = its row) or deleted (current = None) since it was read"""
+
+    def __init__(self, block_id: str, expected: Optional[int], current: Optional[Dict[str, Any]] = None):
+        self.block_id = block_id
+        self.expected = expected
+        self.current = current
+        state = f"now at version {current.get('version')}" if current else "deleted"
+        super().__init__(f"block {block_id} was modified concurrently (expected version {expected}, {state})")
+
+
+def _is_missing_column(err: Exception) -> bool:
+    text = str(err)
+    return "version" in text and ("42703" in text or "PGRST204" in text or "does not exist" in text)
+
+
+def block_versions_available(client) -> bool:
+    """Whether weekly_plan_blocks.version exists (checked once per process)"""
+    global _block_version_available
+    if _block_version_available is None:
+        try:
+            client.table(BLOCKS_TABLE).select("version").limit(1).execute()
+            _block_version_available = True
+        except Exception as e:
+            if not _is_missing_column(e):
+                # Unrelated failure (network, ...): decide on the next call
+                logger.warning(f"⚠️ [BLOCKS] Could not check weekly_plan_blocks.version: {e}")
+                return False
+            _block_version_available = False
+            logger.info("ℹ️ [BLOCKS] weekly_plan_blocks.version not installed - edits are not version-checked")
+    return _block_version_available
+
+
+def block_columns(client, columns: str) -> str:
+    """Select list for blocks that are about to be edited (adds `version` when available)"""
+    if columns.strip() == "*" or not block_versions_available(client):
+        return columns
+    return f"{columns}, version"
+
+
+def block_etag(block: Optional[Dict[str, Any]]) -> Optional[str]:
+    if not block or block.get("version") is None:
+        return None
+    return f'"{block["id"]}:{block["version"]}"'
+
+
+def parse_if_match(value: Optional[str]) -> Optional[int]:
+    """Version from an If-Match header ('"<id>:<version>"', W/ prefix or a bare number); None for '*' / missing"""
+    if not value:
+        return None
+    value = value.split(",")[0].strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    value = value.strip('"')
+    if not value or value == "*":
+        return None
+    try:
+        return int(value.rsplit(":", 1)[-1])
+    except ValueError:
+        return None
+
+
+def _current(client, block_id: str) -> Optional[Dict[str, Any]]:
+    rows = client.table(BLOCKS_TABLE).select("*").eq("id", block_id).limit(1).execute().data or []
+    return rows[0] if rows else None
+
+
+def update_block(
+    client,
+    block_id: str,
+    changes: Dict[str, Any],
+    expected_version: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Apply `changes` to one block if it is still at `expected_version` (any version if None).
+    Returns the updated row; raises BlockVersionConflict otherwise.
+    """
+    query = client.table(BLOCKS_TABLE).update(changes).eq("id", block_id)
+    checked = expected_version is not None and block_versions_available(client)
+    if checked:
+        query = query.eq("version", expected_version)
+    rows = query.execute().data or []
+    if rows:
+        invalidate_schedules([rows[0].get("user_id")])
+        return rows[0]
+    # Only the failure path reads the row again, to report what it looks like now
+    raise BlockVersionConflict(block_id, expected_version if checked else None, _current(client, block_id))
+
+
+def _slot(row: Dict[str, Any]) -> Tuple[Any, ...]:
+    """(plan, day, start, course, work type): the unique slot key of WEEKLY_PLAN_BLOCKS_UNIQUE_SLOT.sql"""
+    start = str(row.get("start_time") or "")[:5]
+    return (row.get("plan_id"), row.get("day_of_week"), start, row.get("course_number"), row.get("work_type"))
+
+
+def _free_slot_order(moves: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    """
+    Order the moves so no block is written onto a slot another block of the move still holds
+    (10-12 -> 11-13 moves the 11:00 block first), since the rows are updated one at a time.
+    """
+    pending = list(moves)
+    ordered = []
+    while pending:
+        held = {_slot(block) for block, _ in pending}
+        for i, (block, changes) in enumerate(pending):
+            target = _slot({**block, **changes})
+            if target == _slot(block) or target not in held:
+                break
+        else:
+            i = 0  # cycle (swap of two slots): nothing can go first without a collision
+        ordered.append(pending.pop(i))
+    return ordered
+
+
+def move_blocks(client, moves: Iterable[Tuple[Dict[str, Any], Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Apply (block, changes) pairs, each checked against the version the block was read with.
+    If any update fails (version conflict, constraint violation, network error) the blocks
+    already updated are restored and the error is re-raised, so a move never stays half done.
+    Results are returned in the order of `moves`.
+    """
+    moves = list(moves)
+    done: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+    try:
+        for block, changes in _free_slot_order(moves):
+            updated = update_block(client, block["id"], changes, block.get("version"))
+            done.append((block, updated))
+    except Exception as err:
+        if done:
+            logger.warning(f"⚠️ [BLOCKS] Move failed after {len(done)} block(s), restoring them: {err}")
+        for original, updated in reversed(done):
+            restore = {k: original[k] for k in ("day_of_week", "start_time", "end_time", "source") if k in original}
+            try:
+                update_block(client, updated["id"], restore, updated.get("version"))
+            except Exception as e:
+                logger.error(f"❌ [BLOCKS] Could not restore block {updated['id']} after a failed move: {e}")
+        raise
+    updated_by_id = {block["id"]: updated for block, updated in done}
+    return [updated_by_id[block["id"]] for block, _ in moves]
+
+
+def replace_blocks(
+    client,
+    old_blocks: List[Dict[str, Any]],
+    new_rows: List[Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    """
+    Delete `old_blocks` (as read, with their versions) and insert `new_rows`.
+    If any old block changed or vanished meanwhile, the deleted ones are re-inserted and
+    BlockVersionConflict is raised before anything new is written. If the insert of `new_rows`
+    fails (slot conflict, network error), the deleted blocks are re-inserted and the error re-raised.
+    """
+    deleted: List[Dict[str, Any]] = []
+    if old_blocks:
+        query = client.table(BLOCKS_TABLE).delete()
+        if block_versions_available(client) and all(b.get("version") is not None for b in old_blocks):
+            query = query.or_(",".join(f"and(id.eq.{b['id']},version.eq.{b['version']})" for b in old_blocks))
+        else:
+            query = query.in_("id", [b["id"] for b in old_blocks])
+        deleted = query.execute().data or []
+        if len(deleted) < len(old_blocks):
+            deleted_ids = {row["id"] for row in deleted}
+            missing = next(b for b in old_blocks if b["id"] not in deleted_ids)
+            if deleted:
+                client.table(BLOCKS_TABLE).insert(deleted).execute()
+            raise BlockVersionConflict(missing["id"], missing.get("version"), _current(client, missing["id"]))
+    inserted = []
+    if new_rows:
+        try:
+            inserted = client.table(BLOCKS_TABLE).insert(new_rows).execute().data or []
+        except Exception as err:
+            # Put the old blocks back so a failed resize does not leave the slot empty
+            if deleted:
+                logger.warning(f"⚠️ [BLOCKS] Insert of {len(new_rows)} replacement block(s) failed, restoring {len(deleted)}: {err}")
+                try:
+                    client.table(BLOCKS_TABLE).insert(deleted).execute()
+                except Exception as e:
+                    logger.error(f"❌ [BLOCKS] Could not restore {len(deleted)} block(s) after a failed replace: {e}")
+            raise
+    # Deleted rows come back complete (old_blocks may be read with a few columns only)
+    invalidate_schedules({b.get("user_id") for b in deleted + list(new_rows)})
+    return inserted
@@ -0,0 +1,156 @@
+"""
+Planning job queue (table planning_jobs, see PLANNING_JOB_QUEUE.sql)
+Weekly planning runs as queued jobs processed by separate worker processes
+(`python -m app.planning_worker`) instead of inside the web process:
+
+- "week" job: one per weekly run; the worker that claims it splits the users into
+  study-group connected components and enqueues one "component" job per component.
+- "component" job: plans the users and groups of one component (scoped weekly run).
+
+Workers claim jobs with a lease (claim_planning_jobs RPC, FOR UPDATE SKIP LOCKED) and extend
+it while working. A job whose worker dies is reclaimed after the lease expires, up to
+max_attempts; failures are retried with exponential backoff. Components are independent, so
+a restart only repeats the components that were not finished.
+"""
+import logging
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+QUEUE_TABLE = "planning_jobs"
+
+LEASE_SECONDS = int(os.getenv("PLANNER_JOB_LEASE_SECONDS", "300"))
+MAX_ATTEMPTS = int(os.getenv("PLANNER_JOB_MAX_ATTEMPTS", "3"))
+RETRY_BASE_SECONDS = int(os.getenv("PLANNER_JOB_RETRY_BASE_SECONDS", "30"))
+
+# Set to False after the first failure if PLANNING_JOB_QUEUE.sql is not installed
+_queue_available = True
+
+
+def queue_available() -> bool:
+    return _queue_available
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def enqueue_job(
+    client,
+    kind: str,
+    week_start: str,
+    payload: Optional[Dict[str, Any]] = None,
+    run_id: Optional[str] = None,
+    dedup_key: Optional[str] = None,
+    priority: int = 0,
+) -> Optional[Dict[str, Any]]:
+    """
+    Insert a queued job. With dedup_key, a second enqueue of the same key is a no-op (returns
+    None), so every web worker can enqueue the scheduled weekly run and only one job exists.
+    Raises if the queue table is not installed (after marking the queue unavailable).
+    """
+    global _queue_available
+    row = {
+        "kind": kind,
+        "week_start": week_start,
+        "payload": payload or {},
+        "priority": priority,
+        "max_attempts": MAX_ATTEMPTS,
+    }
+    if run_id:
+        row["run_id"] = run_id
+    if dedup_key:
+        row["dedup_key"] = dedup_key
+    try:
+        result = client.table(QUEUE_TABLE).insert(row).execute()
+    except Exception as e:
+        # 23505: unique_violation on dedup_key - already enqueued
+        if dedup_key and ("23505" in str(e) or "duplicate key" in str(e).lower()):
+            logger.info(f"[QUEUE] Job {dedup_key} already enqueued")
+            return None
+        # 42P01 / PGRST205: table missing (migration not installed)
+        if "42P01" in str(e) or "PGRST205" in str(e):
+            _queue_available = False
+        raise
+    return result.data[0] if result.data else None
+
+
+def enqueue_jobs(client, rows: List[Dict[str, Any]]) -> int:
+    """Bulk insert of prepared job rows (used when a week job fans out into components)"""
+    for row in rows:
+        row.setdefault("max_attempts", MAX_ATTEMPTS)
+    inserted = 0
+    for i in range(0, len(rows), 500):
+        result = client.table(QUEUE_TABLE).insert(rows[i:i + 500]).execute()
+        inserted += len(result.data or [])
+    return inserted
+
+
+def claim_jobs(client, worker_id: str, limit: int = 1, lease_seconds: int = LEASE_SECONDS) -> List[Dict[str, Any]]:
+    """Lease up to `limit` runnable jobs (queued and due, or leased with an expired lease)"""
+    result = client.rpc("claim_planning_jobs", {
+        "p_worker": worker_id,
+        "p_limit": limit,
+        "p_lease_seconds": lease_seconds,
+    }).execute()
+    return result.data or []
+
+
+def heartbeat(
+    client,
+    job_id: str,
+    worker_id: str,
+    progress: Optional[Dict[str, Any]] = None,
+    lease_seconds: int = LEASE_SECONDS,
+) -> bool:
+    """Extend the lease (and record progress). False if the lease was lost to another worker."""
+    update = {"lease_expires_at": (_now() + timedelta(seconds=lease_seconds)).isoformat()}
+    if progress is not None:
+        update["progress"] = progress
+    result = client.table(QUEUE_TABLE).update(update).eq("id", job_id).eq("leased_by", worker_id).eq("status", "leased").execute()
+    return bool(result.data)
+
+
+def complete_job(client, job_id: str, worker_id: str, result: Optional[Dict[str, Any]] = None) -> None:
+    client.table(QUEUE_TABLE).update({
+        "status": "done",
+        "progress": result or {},
+        "lease_expires_at": None,
+        "finished_at": _now().isoformat(),
+    }).eq("id", job_id).eq("leased_by", worker_id).execute()
+
+
+def fail_job(client, job: Dict[str, Any], worker_id: str, error: str) -> str:
+    """Requeue with exponential backoff, or mark failed after max_attempts. Returns the new status."""
+    attempts = int(job.get("attempts") or 1)
+    max_attempts = int(job.get("max_attempts") or MAX_ATTEMPTS)
+    update = {"last_error": error[:2000], "lease_expires_at": None}
+    if attempts >= max_attempts:
+        update.update({"status": "failed", "finished_at": _now().isoformat()})
+    else:
+        delay = RETRY_BASE_SECONDS * (2 ** (attempts - 1))
+        update.update({"status": "queued", "available_at": (_now() + timedelta(seconds=delay)).isoformat()})
+    client.table(QUEUE_TABLE).update(update).eq("id", job["id"]).eq("leased_by", worker_id).execute()
+    return update["status"]
+
+
+def run_progress(client, run_id: str) -> Dict[str, Any]:
+    """Job counts by status (and failed job errors) for one weekly run"""
+    rows = client.table(QUEUE_TABLE).select("id, kind, status, attempts, last_error, progress").eq("run_id", run_id).execute().data or []
+    counts: Dict[str, int] = {}
+    for row in rows:
+        counts[row["status"]] = counts.get(row["status"], 0) + 1
+    return {
+        "run_id": run_id,
+        "jobs": len(rows),
+        "by_status": counts,
+        "done": bool(rows) and all(r["status"] in ("done", "failed") for r in rows),
+        "failed": [{"id": r["id"], "kind": r["kind"], "error": r.get("last_error")} for r in rows if r["status"] == "failed"],
+    }
@@ -0,0 +1,198 @@
+"""
+Weekly planner worker
+Processes planning_jobs (see app/planning_queue.py) outside the web process. Run one or more:
+
+    python -m app.planning_worker            # loop forever
+    python -m app.planning_worker --once     # drain runnable jobs and exit
+
+Each process plans one job at a time and keeps its lease alive with a heartbeat; scale out by
+starting more processes (on any host with the Supabase service role key).
+"""
+import argparse
+import asyncio
+import logging
+import signal
+import threading
+from typing import Any, Dict, Optional
+
+from app.planning_queue import (
+    LEASE_SECONDS,
+    QUEUE_TABLE,
+    claim_jobs,
+    complete_job,
+    default_worker_id,
+    enqueue_jobs,
+    fail_job,
+    heartbeat,
+)
+
+logger = logging.getLogger(__name__)
+
+# Components are packed into component jobs of about this many users
+TARGET_USERS_PER_JOB = 200
+
+
+def _admin_client():
+    from app.main import supabase, supabase_admin
+    client = supabase_admin if supabase_admin else supabase
+    if not client:
+        raise RuntimeError("Supabase client not configured")
+    return client
+
+
+def _pack_components(components: list, target_users: int = TARGET_USERS_PER_JOB) -> list:
+    """First-fit packing of (user_ids, group_ids) components (largest first) into job payloads"""
+    jobs = []
+    for users, groups in components:
+        for job in jobs:
+            if len(job["user_ids"]) + len(users) <= target_users:
+                break
+        else:
+            job = {"user_ids": [], "group_ids": [], "components": 0}
+            jobs.append(job)
+        job["user_ids"].extend(sorted(users))
+        job["group_ids"].extend(sorted(groups))
+        job["components"] += 1
+    return jobs
+
+
+async def _handle_week_job(client, job: Dict[str, Any]) -> Dict[str, Any]:
+    """Split the week into component jobs of the same run"""
+    from app.main import _clear_planning_dirty_users, _load_planning_dirty_users, _planning_components
+
+    # Re-claimed week job (worker died after the split): the component jobs already exist
+    existing = client.table(QUEUE_TABLE).select("id").eq("run_id", job["run_id"]).eq("kind", "component").execute().data or []
+    if existing:
+        return {"component_jobs": len(existing), "resumed": True}
+
+    # A full run replans everyone, so it consumes the pending dirty marks: each component job
+    # carries the marks of its users and clears them once it has planned them, so users of a
+    # failed or abandoned component stay dirty
+    dirty = _load_planning_dirty_users(client) or {}
+    payloads = _pack_components(_planning_components(client))
+    planned = set()
+    for payload in payloads:
+        marks = {uid: dirty[uid] for uid in payload["user_ids"] if uid in dirty}
+        if marks:
+            payload["dirty"] = marks
+        planned.update(payload["user_ids"])
+    rows = [
+        {
+            "run_id": job["run_id"],
+            "kind": "component",
+            "week_start": job["week_start"],
+            "payload": payload,
+        }
+        for payload in payloads
+    ]
+    created = enqueue_jobs(client, rows)
+    # Marks of users no component covers (e.g. deleted profiles) would never be consumed
+    orphaned = {uid: marked_at for uid, marked_at in dirty.items() if uid not in planned}
+    if orphaned:
+        _clear_planning_dirty_users(client, orphaned)
+    logger.info(f"[WORKER] Week {job['week_start']}: {created} component jobs for run {job['run_id']}")
+    return {"component_jobs": created, "users": sum(len(p["user_ids"]) for p in payloads)}
+
+
+async def _handle_component_job(client, job: Dict[str, Any]) -> Dict[str, Any]:
+    from app.main import _clear_planning_dirty_users, _run_weekly_auto_for_all_users
+
+    payload = job.get("payload") or {}
+    summary = await _run_weekly_auto_for_all_users(
+        week_start_override=str(job["week_start"]),
+        only_user_ids=set(payload.get("user_ids") or []),
+        only_group_ids=set(payload.get("group_ids") or []),
+        raise_errors=True,
+    )
+    # Only now are these users replanned (marks set meanwhile are newer and stay)
+    if payload.get("dirty"):
+        _clear_planning_dirty_users(client, payload["dirty"])
+    return summary or {}
+
+
+HANDLERS = {
+    "week": _handle_week_job,
+    "component": _handle_component_job,
+}
+
+
+def _keep_lease(client, job_id: str, worker_id: str, stop: threading.Event, lost: threading.Event) -> None:
+    # A thread, not a task: planning makes blocking Supabase calls that would starve the loop
+    while not stop.wait(max(5, LEASE_SECONDS // 3)):
+        try:
+            if not heartbeat(client, job_id, worker_id):
+                logger.warning(f"[WORKER] Lease lost for job {job_id}")
+                lost.set()
+                return
+        except Exception as e:
+            logger.warning(f"[WORKER] Heartbeat failed for job {job_id}: {e}")
+
+
+async def process_job(client, job: Dict[str, Any], worker_id: str) -> str:
+    """Run one leased job; returns its final status for this attempt"""
+    handler = HANDLERS.get(job.get("kind"))
+    if handler is None:
+        return fail_job(client, {**job, "attempts": job.get("max_attempts")}, worker_id, f"unknown job kind {job.get('kind')!r}")
+
+    stop, lost = threading.Event(), threading.Event()
+    keeper = threading.Thread(target=_keep_lease, args=(client, job["id"], worker_id, stop, lost), daemon=True)
+    keeper.start()
+    try:
+        result = await handler(client, job)
+    except Exception as e:
+        logger.error(f"[WORKER] Job {job['id']} ({job['kind']}) failed: {e}", exc_info=True)
+        return fail_job(client, job, worker_id, str(e))
+    finally:
+        stop.set()
+        keeper.join()
+    if lost.is_set():
+        # Another worker owns the job now; its run supersedes this one
+        return "lost"
+    complete_job(client, job["id"], worker_id, result)
+    logger.info(f"[WORKER] Job {job['id']} ({job['kind']}) done: {result}")
+    return "done"
+
+
+async def run_worker(worker_id: Optional[str] = None, poll_interval: float = 10.0, once: bool = False) -> None:
+    worker_id = worker_id or default_worker_id()
+    client = _admin_client()
+    stopping = asyncio.Event()
+    loop = asyncio.get_event_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stopping.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    logger.info(f"[WORKER] {worker_id} started")
+    while not stopping.is_set():
+        try:
+            jobs = claim_jobs(client, worker_id, limit=1)
+        except Exception as e:
+            logger.error(f"[WORKER] Could not claim jobs: {e}")
+            jobs = []
+        if jobs:
+            # Finish the current job even if asked to stop; the lease would otherwise expire
+            await process_job(client, jobs[0], worker_id)
+            continue
+        if once:
+            break
+        try:
+            await asyncio.wait_for(stopping.wait(), timeout=poll_interval)
+        except asyncio.TimeoutError:
+            pass
+    logger.info(f"[WORKER] {worker_id} stopped")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Weekly planner queue worker")
+    parser.add_argument("--worker-id", default=None)
+    parser.add_argument("--poll-interval", type=float, default=10.0)
+    parser.add_argument("--once", action="store_true", help="exit when no runnable job is left")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    asyncio.run(run_worker(args.worker_id, args.poll_interval, args.once))
+
+
+if __name__ == "__main__":
+    main()
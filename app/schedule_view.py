@@ -0,0 +1,412 @@
+"""
+Per-user weekly schedule read model (see USER_WEEKLY_SCHEDULE.sql)
+One row per (user, week) in user_weekly_schedule holds everything the schedule views show for
+that week, already joined:
+
+    {"user_id", "week_start",
+     "plan": {"id", "user_id", "week_start"} | None,       # first plan of the week
+     "blocks": [...],           # weekly_plan_blocks rows of the week's plans (group blocks carry group_id)
+     "semester_blocks": [...],  # semester_schedule_items expanded to one virtual block per day
+     "constraints": [...]}      # permanent + weekly constraints as display items (work_type "constraint")
+
+The schedule page (GET /api/weekly-plan) and ScheduleRetriever read the row with one query
+instead of rebuilding the week from weekly_plans, weekly_plan_blocks, group_plan_blocks,
+group_members, constraints, weekly_constraints and semester_schedule_items. Triggers delete a
+row whenever one of its inputs changes; the next read rebuilds it (several weeks of one user are
+rebuilt together with one query per source table). Rebuilt rows are stored with the
+store_weekly_schedules RPC, which skips the store if the user's inputs changed while the rows
+were being built (app/input_versions.py), so a concurrent write never leaves a stale row behind.
+
+In front of the table sits an in-process cache per (user, week), so repeated reads of an
+unchanged week do not touch the database at all. Every code path that changes a schedule input
+calls invalidate_schedules() for the users/week it touched; the TTL bounds staleness for writes
+made by other processes (planning workers, other API workers). Each schedule carries an "etag"
+(content hash) for If-None-Match. Cached schedules are shared: callers must not mutate them.
+
+Ranges (semester overview, exports): week_starts() lists the weeks of a date range and
+iter_user_schedules() yields them in order, fetching SCHEDULE_RANGE_CHUNK_WEEKS weeks per batch
+(the same handful of in_() queries per chunk, and well under PostgREST's row limit);
+to_columns() turns a block list into compact column arrays.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from app.input_versions import is_missing_relation, read_input_versions
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_TABLE = "user_weekly_schedule"
+SCHEDULE_CACHE_TTL_SECONDS = float(os.getenv("SCHEDULE_CACHE_TTL_SECONDS", "120"))
+SCHEDULE_CACHE_MAX_ENTRIES = int(os.getenv("SCHEDULE_CACHE_MAX_ENTRIES", "5000"))
+SCHEDULE_RANGE_MAX_WEEKS = int(os.getenv("SCHEDULE_RANGE_MAX_WEEKS", "26"))
+SCHEDULE_RANGE_CHUNK_WEEKS = max(1, int(os.getenv("SCHEDULE_RANGE_CHUNK_WEEKS", "4")))
+
+# Columns of the compact (columnar) block format
+BLOCK_COLUMNS = ("id", "day_of_week", "start_time", "end_time", "course_number", "course_name", "work_type", "source", "group_id")
+
+# Set to False if USER_WEEKLY_SCHEDULE.sql is not installed
+_schedule_table_available = True
+_store_rpc_available = True
+
+# (user_id, week_start) -> (expires_at, schedule), least recently used first
+_cache: "OrderedDict[Tuple[str, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_cache_lock = threading.Lock()
+# Bumped by every invalidation: a read that started before it does not fill the cache
+_generation = 0
+
+
+def _days(value) -> List[int]:
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except Exception:
+            value = [d.strip() for d in value.split(",") if d.strip().isdigit()]
+    days = []
+    for d in value or []:
+        try:
+            day = int(d)
+        except (TypeError, ValueError):
+            continue
+        if 0 <= day <= 6:
+            days.append(day)
+    return days
+
+
+def _hhmm(value: Optional[str]) -> Optional[str]:
+    return value[:5] if isinstance(value, str) and len(value) > 5 else value
+
+
+def _constraint_items(rows: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    items = []
+    for c in rows:
+        start_t = (c.get("start_time") or "").strip()
+        end_t = (c.get("end_time") or "").strip()
+        if not start_t or not end_t:
+            continue
+        title = (c.get("title") or "Constraint").strip()
+        for day in _days(c.get("days")):
+            items.append({
+                "day_of_week": day,
+                "start_time": start_t,
+                "end_time": end_t,
+                "course_name": title,
+                "work_type": "constraint",
+            })
+    return items
+
+
+def _semester_blocks(items: Iterable[Dict[str, Any]], course_numbers: Dict[str, str], user_id: str, plan_id: Optional[str]) -> List[Dict[str, Any]]:
+    blocks = []
+    seen = set()
+    for item in items:
+        start_t = (item.get("start_time") or "").strip()
+        end_t = (item.get("end_time") or "").strip()
+        if not start_t or not end_t:
+            continue
+        course_name = (item.get("course_name") or "").strip()
+        course_number = str(course_numbers.get(course_name) or "")
+        for day in _days(item.get("days")):
+            key = (day, start_t, course_number)
+            if key in seen:
+                continue
+            seen.add(key)
+            blocks.append({
+                "id": f"semester-{item.get('id')}-day-{day}",
+                "plan_id": plan_id,
+                "user_id": user_id,
+                "course_number": course_number,
+                "course_name": course_name,
+                "work_type": "semester",
+                "day_of_week": day,
+                "start_time": start_t,
+                "end_time": end_t,
+                "source": "semester",
+                "type": item.get("type", ""),
+                "location": item.get("location", ""),
+                "semester_item_id": item.get("id"),
+            })
+    return blocks
+
+
+def _attach_group_ids(blocks: List[Dict[str, Any]], group_blocks: List[Dict[str, Any]], group_courses: Dict[str, Any]) -> None:
+    """Group study blocks get the group_id of the user's group meeting at that slot (else same course and day)"""
+    for block in blocks:
+        if block.get("work_type") != "group" or block.get("source") == "semester":
+            continue
+        course = str(block.get("course_number")).strip()
+        day = block.get("day_of_week")
+        start = _hhmm(block.get("start_time"))
+        same_course_day = [
+            gb for gb in group_blocks
+            if gb.get("day_of_week") == day
+            and group_courses.get(gb.get("group_id"))
+            and str(group_courses.get(gb.get("group_id"))).strip() == course
+        ]
+        exact = next((gb for gb in same_course_day if _hhmm(gb.get("start_time")) == start), None)
+        match = exact or (same_course_day[0] if same_course_day else None)
+        if match:
+            block["group_id"] = match.get("group_id")
+
+
+def _build_schedules(client, user_id: str, weeks: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Build the user's schedule for several weeks with one query per source table"""
+    plans = client.table("weekly_plans").select("id, user_id, week_start").eq("user_id", user_id).in_("week_start", weeks).execute().data or []
+    plans_by_week: Dict[str, List[Dict[str, Any]]] = {}
+    for p in plans:
+        plans_by_week.setdefault(str(p["week_start"])[:10], []).append(p)
+    plan_week = {p["id"]: str(p["week_start"])[:10] for p in plans}
+
+    blocks_by_week: Dict[str, List[Dict[str, Any]]] = {w: [] for w in weeks}
+    if plan_week:
+        blocks = client.table("weekly_plan_blocks").select("*").in_("plan_id", list(plan_week)).eq("user_id", user_id).order("day_of_week").order("start_time").execute().data or []
+        seen_ids = set()
+        for b in blocks:
+            if b.get("id") in seen_ids:
+                continue
+            seen_ids.add(b.get("id"))
+            blocks_by_week[plan_week[b["plan_id"]]].append(b)
+
+    semester_items: List[Dict[str, Any]] = []
+    course_numbers: Dict[str, str] = {}
+    try:
+        semester_items = client.table("semester_schedule_items").select("id, course_name, type, days, start_time, end_time, location").eq("user_id", user_id).execute().data or []
+        if semester_items:
+            for c in client.table("courses").select("course_number, course_name").eq("user_id", user_id).execute().data or []:
+                name = (c.get("course_name") or "").strip()
+                if name:
+                    course_numbers[name] = c.get("course_number") or ""
+    except Exception as e:
+        logger.error(f"❌ [SCHEDULE] Could not load semester items for {user_id}: {e}")
+
+    permanent = []
+    weekly_by_week: Dict[str, List[Dict[str, Any]]] = {}
+    try:
+        permanent = _constraint_items(client.table("constraints").select("title, days, start_time, end_time").eq("user_id", user_id).execute().data or [])
+    except Exception as e:
+        logger.warning(f"Could not load permanent constraints: {e}")
+    try:
+        for c in client.table("weekly_constraints").select("title, days, start_time, end_time, week_start").eq("user_id", user_id).in_("week_start", weeks).execute().data or []:
+            weekly_by_week.setdefault(str(c["week_start"])[:10], []).append(c)
+    except Exception as e:
+        logger.warning(f"Could not load weekly constraints: {e}")
+
+    # group_id for group study blocks: the user's groups' meetings in those weeks
+    if any(b.get("work_type") == "group" for week_blocks in blocks_by_week.values() for b in week_blocks):
+        memberships = client.table("group_members").select("group_id").eq("user_id", user_id).eq("status", "approved").execute().data or []
+        group_ids = sorted({m["group_id"] for m in memberships if m.get("group_id")})
+        if group_ids:
+            groups = client.table("study_groups").select("id, course_id").in_("id", group_ids).execute().data or []
+            group_courses = {g["id"]: g.get("course_id") for g in groups}
+            group_rows = client.table("group_plan_blocks").select("group_id, week_start, day_of_week, start_time").in_("group_id", group_ids).in_("week_start", weeks).execute().data or []
+            group_blocks_by_week: Dict[str, List[Dict[str, Any]]] = {}
+            for gb in group_rows:
+                group_blocks_by_week.setdefault(str(gb["week_start"])[:10], []).append(gb)
+            for week, week_blocks in blocks_by_week.items():
+                _attach_group_ids(week_blocks, group_blocks_by_week.get(week, []), group_courses)
+
+    schedules = {}
+    for week in weeks:
+        week_plans = plans_by_week.get(week, [])
+        plan = week_plans[0] if week_plans else None
+        schedules[week] = {
+            "user_id": user_id,
+            "week_start": week,
+            "plan": plan,
+            "blocks": blocks_by_week.get(week, []),
+            "semester_blocks": _semester_blocks(semester_items, course_numbers, user_id, plan["id"] if plan else None),
+            "constraints": permanent + _constraint_items(weekly_by_week.get(week, [])),
+        }
+    return schedules
+
+
+def _with_etag(schedule: Dict[str, Any]) -> Dict[str, Any]:
+    payload = json.dumps(
+        [schedule.get("plan"), schedule.get("blocks"), schedule.get("semester_blocks"), schedule.get("constraints")],
+        sort_keys=True,
+        default=str,
+    )
+    schedule["etag"] = '"' + hashlib.sha1(payload.encode("utf-8")).hexdigest()[:20] + '"'
+    return schedule
+
+
+def _cached(user_id: str, weeks: List[str]) -> Dict[str, Dict[str, Any]]:
+    found = {}
+    now = time.monotonic()
+    with _cache_lock:
+        for week in weeks:
+            entry = _cache.get((user_id, week))
+            if entry is None:
+                continue
+            if entry[0] <= now:
+                del _cache[(user_id, week)]
+                continue
+            _cache.move_to_end((user_id, week))
+            found[week] = entry[1]
+    return found
+
+
+def _remember(user_id: str, schedules: Dict[str, Dict[str, Any]], generation: int) -> None:
+    if SCHEDULE_CACHE_TTL_SECONDS <= 0:
+        return
+    expires_at = time.monotonic() + SCHEDULE_CACHE_TTL_SECONDS
+    with _cache_lock:
+        if generation != _generation:
+            return
+        for week, schedule in schedules.items():
+            _cache[(user_id, week)] = (expires_at, schedule)
+            _cache.move_to_end((user_id, week))
+        while len(_cache) > SCHEDULE_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+
+
+def invalidate_schedules(user_ids: Optional[Iterable[str]] = None, week_start: Optional[str] = None) -> None:
+    """
+    Drop cached schedules after a write: of the given users (all users if None), for one week
+    (all weeks if None). The read-model rows themselves are dropped by the database triggers.
+    """
+    global _generation
+    users = None if user_ids is None else {str(u) for u in user_ids if u}
+    week = str(week_start)[:10] if week_start else None
+    with _cache_lock:
+        _generation += 1
+        for key in [k for k in _cache if (users is None or k[0] in users) and (week is None or k[1] == week)]:
+            del _cache[key]
+
+
+def get_user_schedules(client, user_id: str, weeks: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    The user's schedules for the given weeks: from the cache, else one read of the read model,
+    and for weeks without a row one read of the user's input version, one query per source table
+    (for all of them together) and one store RPC.
+    """
+    global _schedule_table_available, _store_rpc_available
+    weeks = [str(w)[:10] for w in dict.fromkeys(weeks) if w]
+    if not weeks:
+        return {}
+
+    schedules = _cached(user_id, weeks)
+    wanted = [w for w in weeks if w not in schedules]
+    if not wanted:
+        return schedules
+    generation = _generation
+
+    loaded: Dict[str, Dict[str, Any]] = {}
+    if _schedule_table_available:
+        try:
+            rows = client.table(SCHEDULE_TABLE).select("week_start, plan, blocks, semester_blocks, constraints").eq(
+                "user_id", user_id
+            ).in_("week_start", wanted).execute().data or []
+            for row in rows:
+                week = str(row["week_start"])[:10]
+                loaded[week] = {
+                    "user_id": user_id,
+                    "week_start": week,
+                    "plan": row.get("plan"),
+                    "blocks": row.get("blocks") or [],
+                    "semester_blocks": row.get("semester_blocks") or [],
+                    "constraints": row.get("constraints") or [],
+                }
+        except Exception as e:
+            if is_missing_relation(e, SCHEDULE_TABLE):
+                _schedule_table_available = False
+                logger.info(f"Schedule read model not available, building from raw tables: {e}")
+            else:
+                logger.warning(f"Could not read schedule read model for {user_id}, building from raw tables: {e}")
+
+    missing = [w for w in wanted if w not in loaded]
+    if missing:
+        # Read before the sources: a write after this point makes the store skip these rows
+        versions = read_input_versions(client, [user_id]) if _schedule_table_available and _store_rpc_available else None
+        built = _build_schedules(client, user_id, missing)
+        loaded.update(built)
+        if versions is not None:
+            try:
+                client.rpc("store_weekly_schedules", {
+                    "p_user_id": user_id,
+                    "p_version": versions[user_id],
+                    "p_rows": [
+                        {
+                            "week_start": week,
+                            "plan": s["plan"],
+                            "blocks": s["blocks"],
+                            "semester_blocks": s["semester_blocks"],
+                            "constraints": s["constraints"],
+                        }
+                        for week, s in built.items()
+                    ],
+                }).execute()
+            except Exception as e:
+                if is_missing_relation(e, "store_weekly_schedules"):
+                    _store_rpc_available = False
+                    logger.info("store_weekly_schedules RPC not installed - the read model is not stored")
+                else:
+                    logger.warning(f"Could not store schedule read model for {user_id}: {e}")
+
+    for schedule in loaded.values():
+        _with_etag(schedule)
+    _remember(user_id, loaded, generation)
+    schedules.update(loaded)
+    return schedules
+
+
+def get_user_schedule(client, user_id: str, week_start: str) -> Dict[str, Any]:
+    return get_user_schedules(client, user_id, [week_start])[str(week_start)[:10]]
+
+
+def page_blocks(schedule: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Blocks for the weekly plan page: plan blocks then semester blocks, without the profile-sourced
+    "group" blocks that duplicate semester lectures/tutorials
+    """
+    return [
+        b for b in list(schedule.get("blocks") or []) + list(schedule.get("semester_blocks") or [])
+        if not (b.get("source") == "profile" and b.get("work_type") == "group")
+    ]
+
+
+def week_start_of(value) -> str:
+    """Sunday (YYYY-MM-DD) of the week containing a date / 'YYYY-MM-DD' / 'YYYY/MM/DD'"""
+    if isinstance(value, str):
+        value = datetime.strptime(value.strip().replace("/", "-")[:10], "%Y-%m-%d").date()
+    elif isinstance(value, datetime):
+        value = value.date()
+    return (value - timedelta(days=(value.weekday() + 1) % 7)).isoformat()
+
+
+def week_starts(start, end=None, weeks: Optional[int] = None) -> List[str]:
+    """
+    Week starts from the week of `start` to the week of `end` (inclusive), or `weeks` weeks from
+    `start`. Raises ValueError for bad dates, an empty range or more than SCHEDULE_RANGE_MAX_WEEKS.
+    """
+    first = date.fromisoformat(week_start_of(start))
+    if end is not None:
+        count = (date.fromisoformat(week_start_of(end)) - first).days // 7 + 1
+    else:
+        count = weeks if weeks is not None else 1
+    if count < 1:
+        raise ValueError("end is before start")
+    if count > SCHEDULE_RANGE_MAX_WEEKS:
+        raise ValueError(f"range is {count} weeks, at most {SCHEDULE_RANGE_MAX_WEEKS} are allowed")
+    return [(first + timedelta(weeks=i)).isoformat() for i in range(count)]
+
+
+def iter_user_schedules(client, user_id: str, weeks: Sequence[str], chunk_weeks: int = SCHEDULE_RANGE_CHUNK_WEEKS) -> Iterator[Dict[str, Any]]:
+    """The user's schedules for `weeks` in order, fetched chunk_weeks weeks at a time"""
+    for i in range(0, len(weeks), chunk_weeks):
+        chunk = weeks[i:i + chunk_weeks]
+        schedules = get_user_schedules(client, user_id, chunk)
+        for week in chunk:
+            yield schedules[str(week)[:10]]
+
+
+def to_columns(blocks: Iterable[Dict[str, Any]], columns: Sequence[str] = BLOCK_COLUMNS) -> Dict[str, List[Any]]:
+    """Blocks as {column: [values...]} (one array per column instead of one object per block)"""
+    blocks = list(blocks)
+    return {col: [b.get(col) for b in blocks] for col in columns}
@@ -0,0 +1,56 @@
+"""
+Single-flight request coalescing
+Concurrent callers asking for the same key await one in-flight computation instead of each
+running it. Only for idempotent, user-independent work (RAG answers, catalog reads): the
+result is shared by every caller that joined the flight. Nothing is cached after completion.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, "asyncio.Future[Any]"] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run fn() once per key among concurrent callers.
+        Returns (result, shared) where shared is True for callers that joined an existing flight.
+        Exceptions from fn() are raised to every caller of that flight.
+        """
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            logger.info(f"[SINGLE_FLIGHT] {self.name}: joined in-flight call for {key!r}")
+            # shield: a caller that disconnects must not cancel the work for the others
+            return await asyncio.shield(future), True
+
+        self.started += 1
+        future = asyncio.ensure_future(fn())
+        self._inflight[key] = future
+        future.add_done_callback(lambda _f: self._inflight.pop(key, None))
+        return await asyncio.shield(future), False
+
+    def stats(self) -> Dict[str, Any]:
+        return {"started": self.started, "coalesced": self.coalesced, "in_flight": len(self._inflight)}
+
+
+_registry: Dict[str, SingleFlight] = {}
+
+
+def get_single_flight(name: str) -> SingleFlight:
+    """Process-wide SingleFlight group by name (executors are re-created per request)"""
+    group = _registry.get(name)
+    if group is None:
+        group = _registry[name] = SingleFlight(name)
+    return group
+
+
+def single_flight_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: group.stats() for name, group in _registry.items()}
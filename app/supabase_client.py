@@ -5,6 +5,7 @@ import os
 from typing import Optional
 from supabase import create_client, Client
 from dotenv import load_dotenv
+from app.tracing import instrument_postgrest
 
 load_dotenv()
 
@@ -25,3 +26,6 @@ supabase_admin: Optional[Client] = None
 if SUPABASE_SERVICE_ROLE_KEY:
     supabase_admin = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
+# Time every query that runs inside a traced request (see app.tracing)
+instrument_postgrest()
+
@@ -0,0 +1,278 @@
+"""
+Lightweight per-request tracing
+Collects nested timing spans (supervisor, executors, Supabase queries, LLM/embedding calls)
+for one request via contextvars. A finished trace can be returned in the API response as
+`timings` and/or appended to a local file in OTLP/JSON format (one trace per line), which
+OpenTelemetry tooling (e.g. the collector's file receiver) can ingest. Finished traces are put
+on a bounded queue and serialized / written by a background thread (like app/debug_log.py), so
+the request never waits for the file.
+
+Outside of an active trace, trace_span() is a no-op, so instrumented code pays nothing
+for requests that are not traced.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Append finished traces here as OTLP/JSON lines (disabled when unset)
+TRACE_EXPORT_FILE = os.getenv("TRACE_EXPORT_FILE")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "semesteros")
+# Max finished traces waiting for the writer; extra traces are dropped and counted
+TRACE_EXPORT_QUEUE_SIZE = int(os.getenv("TRACE_EXPORT_QUEUE_SIZE", "1000"))
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+_export_queue: "queue.Queue[Optional[Trace]]" = queue.Queue(maxsize=TRACE_EXPORT_QUEUE_SIZE)
+_writer: Optional[threading.Thread] = None
+_writer_lock = threading.Lock()
+_dropped = 0
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "status", "children")
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status = "ok"
+        self.children: List["Span"] = []
+        if parent is not None:
+            parent.children.append(self)
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def end(self) -> None:
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return round((end_ns - self.start_ns) / 1_000_000, 2)
+
+
+class Trace:
+    def __init__(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = secrets.token_hex(16)
+        self.root = Span(name, attributes=attributes)
+
+    def iter_spans(self) -> Iterator[Span]:
+        stack = [self.root]
+        while stack:
+            span = stack.pop()
+            yield span
+            stack.extend(reversed(span.children))
+
+    def to_timings(self) -> Dict[str, Any]:
+        """Nested span tree with durations and offsets (ms) relative to the request start"""
+        origin = self.root.start_ns
+
+        def render(span: Span) -> Dict[str, Any]:
+            node = {
+                "name": span.name,
+                "start_ms": round((span.start_ns - origin) / 1_000_000, 2),
+                "duration_ms": span.duration_ms,
+            }
+            if span.attributes:
+                node["attributes"] = span.attributes
+            if span.status != "ok":
+                node["status"] = span.status
+            if span.children:
+                node["children"] = [render(child) for child in span.children]
+            return node
+
+        return {"trace_id": self.trace_id, "total_ms": self.root.duration_ms, "spans": render(self.root)}
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """OTLP/JSON ExportTraceServiceRequest for this trace"""
+        spans = []
+        for span in self.iter_spans():
+            otlp_span = {
+                "traceId": self.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns or span.start_ns),
+                "attributes": [_otlp_attribute(k, v) for k, v in span.attributes.items()],
+                "status": {"code": 2} if span.status == "error" else {"code": 1},
+            }
+            if span.parent_id:
+                otlp_span["parentSpanId"] = span.parent_id
+            spans.append(otlp_span)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", TRACE_SERVICE_NAME)]},
+                "scopeSpans": [{"scope": {"name": "app.tracing"}, "spans": spans}],
+            }]
+        }
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+def _export(trace: Trace) -> None:
+    """Hand a finished trace to the writer thread without blocking"""
+    global _dropped
+    if not TRACE_EXPORT_FILE:
+        return
+    _ensure_writer()
+    try:
+        _export_queue.put_nowait(trace)
+    except queue.Full:
+        _dropped += 1
+
+
+def _ensure_writer() -> None:
+    global _writer
+    if _writer is not None:
+        return
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_drain, name="trace-export-writer", daemon=True)
+            _writer.start()
+
+
+def _drain() -> None:
+    while True:
+        trace = _export_queue.get()
+        if trace is None:
+            return
+        batch = [trace]
+        # Write whatever else is already pending in the same open/append
+        while len(batch) < 100:
+            try:
+                trace = _export_queue.get_nowait()
+            except queue.Empty:
+                break
+            if trace is None:
+                _write(batch)
+                return
+            batch.append(trace)
+        _write(batch)
+
+
+def _write(batch: List[Trace]) -> None:
+    global _dropped
+    try:
+        lines = [json.dumps(trace.to_otlp(), ensure_ascii=False) for trace in batch]
+        with open(TRACE_EXPORT_FILE, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        if _dropped:
+            logger.warning(f"Dropped {_dropped} trace(s) (export queue full)")
+            _dropped = 0
+    except Exception as e:
+        logger.warning(f"Failed to export {len(batch)} trace(s): {e}")
+
+
+def flush_traces(timeout: float = 2.0) -> None:
+    """Stop the writer after writing pending traces (called at interpreter exit)"""
+    global _writer
+    writer = _writer
+    if writer is None:
+        return
+    try:
+        _export_queue.put(None, timeout=timeout)
+    except queue.Full:
+        return
+    writer.join(timeout)
+    _writer = None
+
+
+atexit.register(flush_traces)
+
+
+@contextmanager
+def start_trace(name: str, **attributes) -> Iterator[Trace]:
+    """Start a new trace for the current request; the root span covers the with-block"""
+    trace = Trace(name, attributes)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(trace.root)
+    try:
+        yield trace
+    except BaseException:
+        trace.root.status = "error"
+        raise
+    finally:
+        trace.root.end()
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        _export(trace)
+
+
+@contextmanager
+def trace_span(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """Time a block as a child of the current span. Yields None when no trace is active."""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    span = Span(name, parent, attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.status = "error"
+        span.attributes["error"] = type(e).__name__
+        raise
+    finally:
+        span.end()
+        _current_span.reset(token)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def instrument_postgrest() -> None:
+    """
+    Wrap postgrest request builders so every Supabase query run inside a trace gets a span
+    (`supabase.<METHOD> <table>`). Safe to call more than once; no-op if postgrest is missing.
+    """
+    try:
+        import postgrest
+    except ImportError:
+        return
+
+    for class_name in ("SyncQueryRequestBuilder", "SyncSingleRequestBuilder", "SyncMaybeSingleRequestBuilder"):
+        builder_cls = getattr(postgrest, class_name, None)
+        original = getattr(builder_cls, "execute", None) if builder_cls else None
+        if original is None or getattr(original, "_traced", False):
+            continue
+
+        def execute(self, *args, _original=original, **kwargs):
+            parent = _current_span.get()
+            # Not traced, or already inside a query span (builders delegate to each other)
+            if parent is None or parent.name.startswith("supabase."):
+                return _original(self, *args, **kwargs)
+            method = getattr(self, "http_method", "") or ""
+            table = str(getattr(self, "path", "") or "").lstrip("/")
+            with trace_span(f"supabase.{method} {table}".strip(), table=table):
+                return _original(self, *args, **kwargs)
+
+        execute._traced = True
+        builder_cls.execute = execute
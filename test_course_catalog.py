@@ -0,0 +1,90 @@
+"""
+Test script for course name matching (app/course_catalog.py)
+Runs offline against an in-memory catalog: python test_course_catalog.py
+Covers the false matches the old ilike('%name%') lookup produced ("IT" inside "Digital",
+"פיזיקה 2" resolving to "פיזיקה 1").
+"""
+
+from app.course_catalog import COURSE_MATCH_MIN_MARGIN, CatalogIndex, normalize_name
+
+CATALOG = [
+    {"id": 1, "course_number": "044252", "course_name": "Digital Systems"},
+    {"id": 2, "course_number": "236000", "course_name": "IT"},
+    {"id": 3, "course_number": "114051", "course_name": "פיזיקה 1"},
+    {"id": 4, "course_number": "114052", "course_name": "פיזיקה 1מ"},
+    {"id": 5, "course_number": "234218", "course_name": "Data Structures 1"},
+    {"id": 6, "course_number": "234247", "course_name": "Algorithms 1"},
+    {"id": 7, "course_number": "094591", "course_name": "Introduction to Algorithms"},
+    {"id": 8, "course_number": "094592", "course_name": "Introduction to Databases"},
+    {"id": 9, "course_number": "104031", "course_name": "חדו\"א 1מ"},
+]
+
+
+def print_section(title):
+    print("\n" + "="*60)
+    print(f"  {title}")
+    print("="*60)
+
+
+def number_of(course):
+    return course["course_number"] if course else None
+
+
+def test_normalize_name():
+    print_section("🔤 Testing normalization")
+    assert normalize_name("  Data-Structures_1 ") == "data structures 1"
+    assert normalize_name("מדמ\"ח") == "מדמ ח"
+    assert normalize_name("שָׁלוֹם") == normalize_name("שלומ")
+    print("✅ Case, punctuation, niqqud and final letters")
+
+
+def test_exact_and_contained():
+    print_section("🎯 Testing exact and whole-word matches")
+    index = CatalogIndex(CATALOG)
+    assert number_of(index.find("digital systems")) == "044252"
+    assert number_of(index.find("IT")) == "236000"
+    print("✅ 'digital systems' and 'IT' resolve to their own courses")
+
+    without_it = CatalogIndex([c for c in CATALOG if c["course_name"] != "IT"])
+    assert without_it.find("IT") is None
+    print("✅ 'IT' does not match inside 'Digital Systems'")
+
+    assert number_of(index.find("digital")) == "044252"
+    assert number_of(index.find("Introduction to")) in ("094591", "094592")
+    print("✅ Query inside a name matches on whole words")
+
+    assert index.find("Algorithms 1 and Data Structures 1") is None
+    print("✅ A name inside the query is not a match")
+
+
+def test_numbers_must_agree():
+    print_section("🔢 Testing course numbers in names")
+    index = CatalogIndex(CATALOG)
+    assert index.find("פיזיקה 2") is None
+    assert index.find("Data Structures 2") is None
+    print("✅ 'פיזיקה 2' and 'Data Structures 2' are not fuzzy hits for the '1' courses")
+
+    assert number_of(index.find("Data Structurs 1")) == "234218"
+    print("✅ A typo with the right number still matches")
+
+
+def test_margin_on_write_paths():
+    print_section("⚖️ Testing min_margin")
+    index = CatalogIndex(CATALOG)
+    assert index.find("Introduction to", min_margin=COURSE_MATCH_MIN_MARGIN) is None
+    print("✅ Ambiguous whole-word match refused with a margin")
+
+    assert number_of(index.find("digital", min_margin=COURSE_MATCH_MIN_MARGIN)) == "044252"
+    assert number_of(index.find("Data Structurs 1", min_margin=COURSE_MATCH_MIN_MARGIN)) == "234218"
+    print("✅ Unambiguous matches still resolve with a margin")
+
+    assert index.find("") is None and index.find(None) is None
+    print("✅ Empty queries return None")
+
+
+if __name__ == "__main__":
+    test_normalize_name()
+    test_exact_and_contained()
+    test_numbers_must_agree()
+    test_margin_on_write_paths()
+    print("\n✅ All course catalog tests passed")
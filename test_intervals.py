@@ -0,0 +1,162 @@
+"""
+Test script for interval merging (app/intervals.py)
+Runs offline (no server or database needed): python test_intervals.py
+merge_blocks() is also compared against a straightforward per-group reference merge on
+random block sets.
+"""
+
+import random
+
+from app.intervals import day_range_lines, merge_blocks, merge_ranges, parse_days, to_hhmm, to_minutes
+
+
+def print_section(title):
+    print("\n" + "="*60)
+    print(f"  {title}")
+    print("="*60)
+
+
+def block(day, start, end, course="104031", work_type="personal", week_start="2026-02-08", **extra):
+    return {"week_start": week_start, "day_of_week": day, "course_number": course,
+            "work_type": work_type, "start_time": start, "end_time": end, **extra}
+
+
+def spans(blocks):
+    return [(b["week_start"], b["day_of_week"], b["course_number"], b["work_type"], b["start_time"], b["end_time"]) for b in blocks]
+
+
+def reference_merge(blocks):
+    """Group, sort and merge back-to-back blocks one group at a time (the old executor logic)"""
+    groups = {}
+    seen = set()
+    for b in blocks:
+        key = (b["week_start"], b["day_of_week"], b["course_number"], b["work_type"])
+        if (key, b["start_time"], b["end_time"]) in seen:
+            continue
+        seen.add((key, b["start_time"], b["end_time"]))
+        groups.setdefault(key, []).append(b)
+    merged = []
+    for key, group in groups.items():
+        group.sort(key=lambda b: to_minutes(b["start_time"]))
+        current = None
+        for b in group:
+            if current and to_minutes(b["start_time"]) == to_minutes(current["end_time"]):
+                current["end_time"] = b["end_time"]
+            else:
+                current = dict(b)
+                merged.append(current)
+    merged.sort(key=lambda b: (b["week_start"], b["day_of_week"], to_minutes(b["start_time"])))
+    return merged
+
+
+def test_conversions():
+    print_section("🕒 Testing time conversions")
+    assert to_minutes("10:30") == 630
+    assert to_minutes("10:30:00") == 630
+    assert to_minutes("") == 0
+    assert to_minutes(None) == 0
+    assert to_minutes("xx:yy") == 0
+    assert to_hhmm(630) == "10:30"
+    print("✅ to_minutes / to_hhmm")
+    assert parse_days([1, 3]) == [1, 3]
+    assert parse_days("[0, 2]") == [0, 2]
+    assert parse_days("1, 4") == [1, 4]
+    assert parse_days(None) == []
+    print("✅ parse_days")
+
+
+def test_merge_ranges():
+    print_section("📏 Testing merge_ranges")
+    assert merge_ranges([]) == []
+    assert merge_ranges([(600, 660), (660, 720)]) == [(600, 720)]
+    assert merge_ranges([(600, 660), (660, 720)], merge_adjacent=False) == [(600, 660), (660, 720)]
+    assert merge_ranges([(700, 800), (600, 720), (900, 960)]) == [(600, 800), (900, 960)]
+    assert merge_ranges([(600, 900), (660, 720)]) == [(600, 900)]
+    print("✅ Adjacent, overlapping, contained and unsorted ranges")
+
+    rng = random.Random(48)
+    for _ in range(500):
+        ranges = []
+        for _ in range(rng.randint(0, 12)):
+            start = rng.randint(0, 40) * 30
+            ranges.append((start, start + rng.randint(1, 6) * 30))
+        # Reference: covered half-hour slots, regrouped into runs
+        covered = sorted({slot for s, e in ranges for slot in range(s, e, 30)})
+        expected = []
+        for slot in covered:
+            if expected and expected[-1][1] == slot:
+                expected[-1][1] = slot + 30
+            else:
+                expected.append([slot, slot + 30])
+        assert merge_ranges(ranges) == [tuple(r) for r in expected], ranges
+    print("✅ 500 random range sets match the slot-coverage reference")
+
+
+def test_merge_blocks():
+    print_section("🧱 Testing merge_blocks")
+    blocks = [
+        block(1, "11:00", "12:00"),
+        block(1, "10:00", "11:00"),
+        block(1, "10:00", "11:00"),  # exact duplicate
+        block(1, "12:00", "13:00", work_type="group"),
+        block(1, "13:00", "14:00", course="234114"),
+        block(1, "10:30", "11:30", course="234114"),  # overlaps, not back-to-back
+    ]
+    merged = merge_blocks(blocks)
+    assert spans(merged) == [
+        ("2026-02-08", 1, "104031", "personal", "10:00", "12:00"),
+        ("2026-02-08", 1, "234114", "personal", "10:30", "11:30"),
+        ("2026-02-08", 1, "104031", "group", "12:00", "13:00"),
+        ("2026-02-08", 1, "234114", "personal", "13:00", "14:00"),
+    ], spans(merged)
+    print("✅ Duplicates dropped, back-to-back merged, other courses / work types kept apart")
+
+    weeks = merge_blocks([block(2, "10:00", "11:00"), block(2, "11:00", "12:00", week_start="2026-02-15")])
+    assert len(weeks) == 2
+    print("✅ Blocks of different weeks are never merged")
+
+    first = block(3, "08:00", "09:00", id="a")
+    merged = merge_blocks([first, block(3, "09:00", "10:00", id="b")])
+    assert merged[0]["id"] == "a" and merged[0]["end_time"] == "10:00"
+    assert first["end_time"] == "09:00"
+    print("✅ Merged block keeps the first block's id and the input is not modified")
+
+    merged = merge_blocks([block(4, "08:00", "09:00", block_id="c"), block(4, "09:00", "10:00", block_id="d")])
+    assert merged[0]["id"] == "c", merged
+    print("✅ Blocks with only a block_id get it as id")
+
+
+def test_merge_blocks_random():
+    print_section("🎲 Comparing merge_blocks with the reference merge")
+    rng = random.Random(2026)
+    for _ in range(300):
+        blocks = []
+        for _ in range(rng.randint(0, 30)):
+            hour = rng.randint(8, 20)
+            blocks.append(block(
+                rng.randint(0, 2),
+                f"{hour:02d}:00",
+                f"{hour + rng.choice([1, 1, 2]):02d}:00",
+                course=rng.choice(["104031", "234114"]),
+                work_type=rng.choice(["personal", "group"]),
+                week_start=rng.choice(["2026-02-08", "2026-02-15"]),
+            ))
+        expected = reference_merge([dict(b) for b in blocks])
+        assert sorted(spans(merge_blocks(blocks))) == sorted(spans(expected)), blocks
+    print("✅ 300 random block sets match")
+
+
+def test_day_range_lines():
+    print_section("🗓️ Testing day_range_lines")
+    lines = day_range_lines([block(1, "10:00", "11:00"), block(1, "11:00", "12:00"), block(0, "14:00", "15:00")])
+    assert lines == ["ראשון 14:00-15:00", "שני 10:00-12:00"], lines
+    print("✅ One line per day with merged ranges")
+
+
+if __name__ == "__main__":
+    test_conversions()
+    test_merge_ranges()
+    test_merge_blocks()
+    test_merge_blocks_random()
+    test_day_range_lines()
+    print("\n✅ All interval tests passed")